@@ -0,0 +1,52 @@
+"""Create the jobs table.
+
+Databases created by Base.metadata.create_all already have it, so the table
+is only created when missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+JOB_STATUSES = ("PENDING", "PROCESSING", "COMPLETED", "FAILED")
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("jobs"):
+        return
+    op.create_table(
+        "jobs",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("status", sa.Enum(*JOB_STATUSES, name="jobstatus"), nullable=False),
+        sa.Column("model_name", sa.String(100), nullable=False),
+        sa.Column("s3_key", sa.String(500), nullable=False),
+        sa.Column("s3_url", sa.String(1000)),
+        sa.Column("original_filename", sa.String(500)),
+        sa.Column("content_type", sa.String(100)),
+        sa.Column("file_size", sa.Integer),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+        sa.Column("started_at", sa.DateTime),
+        sa.Column("completed_at", sa.DateTime),
+        sa.Column("processing_time", sa.Float),
+        sa.Column("worker_id", sa.String(200)),
+        sa.Column("result_data", sa.Text),
+        sa.Column("error_message", sa.Text),
+        sa.Column("callback_url", sa.String(1000)),
+    )
+    op.create_index("ix_jobs_status", "jobs", ["status"])
+    op.create_index("ix_jobs_created_at", "jobs", ["created_at"])
+    op.create_index("idx_created_status", "jobs", ["created_at", "status"])
+    op.create_index("idx_status_created", "jobs", ["status", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("jobs")
+    sa.Enum(name="jobstatus").drop(op.get_bind(), checkfirst=True)
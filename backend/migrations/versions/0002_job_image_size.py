@@ -0,0 +1,25 @@
+"""Add the image size read from the uploaded image's header to jobs.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("jobs")}
+    for name in ("image_width", "image_height"):
+        if name not in columns:
+            op.add_column("jobs", sa.Column(name, sa.Integer))
+
+
+def downgrade() -> None:
+    op.drop_column("jobs", "image_height")
+    op.drop_column("jobs", "image_width")
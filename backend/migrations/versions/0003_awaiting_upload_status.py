@@ -0,0 +1,28 @@
+"""Add the AWAITING_UPLOAD job status for presigned direct uploads.
+
+The jobstatus enum stores member names. ALTER TYPE ... ADD VALUE can't be
+used in the transaction that adds it, so it runs in an autocommit block.
+Only Postgres has a native enum type to alter.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'AWAITING_UPLOAD' BEFORE 'PENDING'")
+
+
+def downgrade() -> None:
+    # Postgres can't drop an enum value; jobs still awaiting their upload are failed instead
+    op.execute("UPDATE jobs SET status = 'FAILED' WHERE status = 'AWAITING_UPLOAD'")
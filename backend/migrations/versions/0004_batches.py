@@ -0,0 +1,50 @@
+"""Add the batches table and the batch each job was uploaded with.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("batches"):
+        op.create_table(
+            "batches",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("created_at", sa.DateTime, nullable=False),
+            sa.Column("completed_at", sa.DateTime),
+            sa.Column("total", sa.Integer, nullable=False),
+            sa.Column("pending", sa.Integer, nullable=False),
+            sa.Column("processing", sa.Integer, nullable=False),
+            sa.Column("completed", sa.Integer, nullable=False),
+            sa.Column("failed", sa.Integer, nullable=False),
+        )
+        op.create_index("ix_batches_created_at", "batches", ["created_at"])
+
+    columns = {column["name"] for column in inspector.get_columns("jobs")}
+    # Batch mode, as SQLite can't add a foreign key in place; Postgres gets plain ALTERs
+    with op.batch_alter_table("jobs") as batch:
+        if "batch_id" not in columns:
+            batch.add_column(sa.Column("batch_id", UUID(as_uuid=True)))
+            batch.create_foreign_key("jobs_batch_id_fkey", "batches", ["batch_id"], ["id"])
+            batch.create_index("ix_jobs_batch_id", ["batch_id"])
+        if "batch_index" not in columns:
+            batch.add_column(sa.Column("batch_index", sa.Integer))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("jobs") as batch:
+        batch.drop_index("ix_jobs_batch_id")
+        batch.drop_constraint("jobs_batch_id_fkey", type_="foreignkey")
+        batch.drop_column("batch_index")
+        batch.drop_column("batch_id")
+    op.drop_table("batches")
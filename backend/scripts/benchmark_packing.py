@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark batch prediction throughput against the number of images packed per request.
+
+Starts the fake OpenAI-compatible upstream from benchmark_predict.py, where
+every request costs a fixed overhead plus a delay per image, and runs the
+BatchProcessor over the sample dataset once for each pack size.
+
+Usage:
+    python scripts/benchmark_packing.py --images 64 --concurrent 4 --latency 1.0 --image-latency 0.1
+    python scripts/benchmark_packing.py --pack-sizes 1 4 8 16 --skip-preprocess
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark_predict import FAKE_UPSTREAM_PORT, start_fake_upstream
+
+
+def run_benchmark(num_images: int, concurrent: int, pack_sizes: list[int], latency: float, image_latency: float):
+    from src.cli.batch_predict.processor import BatchProcessor
+    from src.inference.packing import packing_stats
+
+    image_dir = Path(__file__).parent.parent / "dataset" / "images"
+    image_paths = sorted(image_dir.glob("*.png"))[:num_images]
+
+    print(f"Images: {len(image_paths)}, concurrency: {concurrent}, "
+          f"upstream {latency:.2f}s per request + {image_latency:.2f}s per image")
+    print(f"{'pack size':>9}  {'requests':>8}  {'wall time':>9}  {'images/s':>8}  {'speedup':>7}  {'fallbacks':>9}")
+
+    baseline = None
+    for pack_size in pack_sizes:
+        processor = BatchProcessor(model_name=None, max_concurrent=concurrent, use_cache=False, pack_size=pack_size)
+        packs_before = packing_stats.packs
+        fallbacks_before = packing_stats.fallback_images
+
+        start = time.perf_counter()
+        results = processor.process_batch(image_paths, progress_callback=lambda completed, total: None)
+        wall_time = time.perf_counter() - start
+
+        failed = sum(1 for result in results if result["status"] != "completed")
+        if failed:
+            print(f"{failed} images failed with pack size {pack_size}")
+        fallbacks = packing_stats.fallback_images - fallbacks_before
+        requests = packing_stats.packs - packs_before + fallbacks if pack_size > 1 else len(image_paths)
+        throughput = len(image_paths) / wall_time
+        baseline = baseline or throughput
+        print(f"{pack_size:>9}  {requests:>8}  {wall_time:>8.2f}s  {throughput:>8.2f}  {throughput / baseline:>6.2f}x  {fallbacks:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=64, help="Number of dataset images to predict")
+    parser.add_argument("--concurrent", type=int, default=4, help="Concurrent requests, as in batch-predict --concurrent")
+    parser.add_argument("--pack-sizes", type=int, nargs="+", default=[1, 2, 4, 8], help="Pack sizes to compare")
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated fixed cost of every upstream request in seconds")
+    parser.add_argument("--image-latency", type=float, default=0.1, help="Simulated extra upstream time per image in seconds")
+    parser.add_argument("--skip-preprocess", action="store_true", help="Send images as-is to isolate request overhead from CPU work")
+    args = parser.parse_args()
+
+    # Route the LLM client to the fake upstream before settings are loaded
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{FAKE_UPSTREAM_PORT}/v1"
+    os.environ["OPENROUTER_API_KEY"] = os.environ.get("OPENROUTER_API_KEY", "bench")
+    os.environ["PREDICTION_CACHE_BACKEND"] = "none"
+    os.environ["SINGLEFLIGHT_BACKEND"] = "none"
+    # Measure packing alone, without tiles or hedges adding requests
+    os.environ["TILING_ENABLED"] = "false"
+    os.environ["LLM_HEDGING_ENABLED"] = "false"
+    os.environ["LLM_TELEMETRY_SINKS"] = ""
+    if args.skip_preprocess:
+        os.environ["IMAGE_PREPROCESS_ENABLED"] = "false"
+
+    upstream = start_fake_upstream(args.latency, image_latency=args.image_latency)
+    try:
+        run_benchmark(args.images, args.concurrent, args.pack_sizes, args.latency, args.image_latency)
+    finally:
+        upstream.terminate()
+
+
+if __name__ == "__main__":
+    main()
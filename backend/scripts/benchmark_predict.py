@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent /predict requests against a single API process.
+
+Starts a fake OpenAI-compatible upstream with a fixed completion latency,
+points the LLM client at it and fires many concurrent /predict requests
+while probing /health on the same event loop.
+
+Usage:
+    python scripts/benchmark_predict.py --requests 300 --latency 2.0
+    python scripts/benchmark_predict.py --requests 300 --latency 0.5 --slow-fraction 0.05 [--no-hedge]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+FAKE_UPSTREAM_PORT = 18765
+
+
+def build_fake_upstream(
+    latency: float,
+    slow_fraction: float = 0.0,
+    slow_factor: float = 10.0,
+    image_latency: float = 0.0,
+) -> FastAPI:
+    """
+    OpenAI-compatible chat completions endpoint with a fixed delay and an optional slow tail.
+
+    Each image in the request adds image_latency, and requests with several
+    images are answered in the packed format.
+    """
+    upstream = FastAPI()
+    annotation = {"box_2d": [100, 200, 150, 300], "tag": "button"}
+
+    @upstream.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        images = sum(
+            1 for message in body["messages"] if isinstance(message["content"], list)
+            for part in message["content"] if part["type"] == "image_url"
+        )
+        if images > 1:
+            content = json.dumps({"images": [{"index": i, "annotations": [annotation]} for i in range(images)]})
+        else:
+            content = json.dumps({"annotations": [annotation]})
+        slow = random.random() < slow_fraction
+        delay = latency + image_latency * images
+        await asyncio.sleep(delay * slow_factor if slow else delay)
+        return {
+            "id": "bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "bench",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    return upstream
+
+
+def serve_fake_upstream(latency: float, slow_fraction: float, image_latency: float):
+    upstream = build_fake_upstream(latency, slow_fraction, image_latency=image_latency)
+    uvicorn.run(upstream, host="127.0.0.1", port=FAKE_UPSTREAM_PORT, log_level="warning")
+
+
+def start_fake_upstream(latency: float, slow_fraction: float = 0.0, image_latency: float = 0.0) -> multiprocessing.Process:
+    """Run the fake upstream in its own process so it does not share our GIL."""
+    process = multiprocessing.Process(
+        target=serve_fake_upstream, args=(latency, slow_fraction, image_latency), daemon=True
+    )
+    process.start()
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{FAKE_UPSTREAM_PORT}/docs")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("Fake upstream did not start")
+
+
+def load_test_image() -> bytes:
+    """First screenshot from the sample dataset."""
+    image_dir = Path(__file__).parent.parent / "dataset" / "images"
+    return sorted(image_dir.glob("*.png"))[0].read_bytes()
+
+
+async def run_benchmark(num_requests: int, latency: float):
+    from src.base_router import base_router
+    from src.inference.clients import llm_clients
+    from src.inference.preprocess import preprocess_stats
+    from src.inference.routing import model_router
+
+    app = FastAPI()
+    app.include_router(base_router)
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    image = load_test_image()
+    transport = httpx.ASGITransport(app=app)
+    predict_latencies: list[float] = []
+    health_latencies: list[float] = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=None) as client:
+
+        async def predict():
+            start = time.perf_counter()
+            response = await client.post("/predict", files={"file": ("bench.png", image, "image/png")})
+            response.raise_for_status()
+            predict_latencies.append(time.perf_counter() - start)
+
+        async def probe_health():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.1)
+
+        prober = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        await asyncio.gather(*(predict() for _ in range(num_requests)))
+        wall_time = time.perf_counter() - start
+        done.set()
+        await prober
+
+    await llm_clients.aclose()
+
+    print(f"Requests:            {num_requests}")
+    print(f"Upstream latency:    {latency:.2f}s")
+    print(f"Wall time:           {wall_time:.2f}s (blocking calls would need {num_requests * latency:.0f}s)")
+    print(f"Throughput:          {num_requests / wall_time:.1f} req/s")
+    print(f"Effective overlap:   {num_requests * latency / wall_time:.0f} concurrent predictions")
+    percentiles = statistics.quantiles(predict_latencies, n=100, method="inclusive")
+    print(f"Predict p50 / p99:   {percentiles[49]:.2f}s / {percentiles[98]:.2f}s (max {max(predict_latencies):.2f}s)")
+    print(f"/health p50 / max:   {statistics.median(health_latencies) * 1000:.1f}ms / {max(health_latencies) * 1000:.1f}ms")
+    print(f"Preprocessing:       {preprocess_stats.to_dict()}")
+    print(f"LLM connections:     {llm_clients.stats()}")
+    print(f"Hedged requests:     {model_router.stats()['hedges']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="Number of concurrent /predict requests")
+    parser.add_argument("--latency", type=float, default=2.0, help="Simulated upstream completion latency in seconds")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Fraction of upstream calls that take 10x the latency")
+    parser.add_argument("--no-hedge", action="store_true", help="Disable hedged requests to compare tail latency")
+    parser.add_argument("--skip-preprocess", action="store_true", help="Send images as-is to isolate event loop behaviour from CPU work")
+    args = parser.parse_args()
+
+    # Route the LLM client to the fake upstream before settings are loaded
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{FAKE_UPSTREAM_PORT}/v1"
+    os.environ["OPENROUTER_API_KEY"] = os.environ.get("OPENROUTER_API_KEY", "bench")
+    os.environ["LLM_MAX_CONNECTIONS"] = str(max(args.requests, 100))
+    # Every request uses the same image, measure the LLM path rather than cache hits
+    os.environ["PREDICTION_CACHE_BACKEND"] = "none"
+    if args.skip_preprocess:
+        os.environ["IMAGE_PREPROCESS_ENABLED"] = "false"
+    # Let the hedge delay adapt within the run instead of waiting on the production default
+    os.environ["LLM_HEDGING_ENABLED"] = "false" if args.no_hedge else "true"
+    os.environ.setdefault("LLM_HEDGE_DEFAULT_DELAY", str(args.latency * 2))
+
+    upstream = start_fake_upstream(args.latency, args.slow_fraction)
+    try:
+        asyncio.run(run_benchmark(args.requests, args.latency))
+    finally:
+        upstream.terminate()
+
+
+if __name__ == "__main__":
+    main()
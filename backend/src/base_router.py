@@ -1,48 +1,255 @@
+import asyncio
+import json
+import logging
+import math
 import time
+from collections.abc import AsyncIterator
+from typing import Any
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from openai import RateLimitError
+from sqlalchemy.orm import Session
 
-from src.llm import detect_ui_elements
-from src.schemas import PredictionResponse
+from src.inference.breaker import CircuitOpenError, circuit_breaker
+from src.inference.image_info import ImageInfo, validate_image
+from src.inference.ratelimit import RateLimitExceeded
+from src.inference.retry import retry_after
+from src.inference.tiling import TilingOptions
+from src.database.core import get_db
+from src.llm import detect_region_async, detect_ui_elements_async, stream_ui_elements
+from src.models import Job, JobStatus
+from src.schemas import ImageDimensions, PredictionResponse, PredictionStreamSummary
 from src.settings import config
+from src.storage.s3 import storage
 from src.constants import MAX_UPLOAD_SIZE
 
+logger = logging.getLogger(__name__)
+
 base_router = APIRouter()
 
+
+async def _read_image(file: UploadFile) -> tuple[bytes, ImageInfo]:
+    """Read an uploaded image, checking its size and real format before it goes anywhere."""
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    # The size is not known up front for every upload, so it is checked again after reading
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+    image_data = await file.read()
+    if len(image_data) > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+
+    try:
+        return image_data, validate_image(image_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _tiling_options(
+    tile: bool | None,
+    tile_height: int | None,
+    tile_overlap: float | None,
+) -> TilingOptions:
+    """Per-request tiling options, falling back to settings for anything not given."""
+    defaults = TilingOptions.from_settings()
+    # Passing a tile size implies tiling unless it is switched off explicitly
+    implied = tile_height is not None or tile_overlap is not None
+    return TilingOptions(
+        enabled=(defaults.enabled or implied) if tile is None else tile,
+        tile_height=defaults.tile_height if tile_height is None else tile_height,
+        overlap=defaults.overlap if tile_overlap is None else tile_overlap,
+    )
+
+
 @base_router.post("/predict", response_model=PredictionResponse)
-async def predict_ui_elements(file: UploadFile = File(...)):
+async def predict_ui_elements(
+    file: UploadFile = File(...),
+    tile: bool | None = Form(None),
+    tile_height: int | None = Form(None),
+    tile_overlap: float | None = Form(None),
+):
     """
     Predict UI elements in an uploaded image using LLM.
     This endpoint accepts an uploaded image file and returns detected UI elements (Button, Input, Radio, Dropdown, Text)
+    Tall screenshots can be split into overlapping tiles with the optional tile form fields.
     """
     start_time = time.time()
 
-    # Validate file type and size
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    try:
+        tiling = _tiling_options(tile, tile_height, tile_overlap)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Validate file size
-    if file.size > MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+    # Read file content directly into memory, validating type and size from the image header
+    image_data, image_info = await _read_image(file)
 
     try:
-        # Read file content directly into memory
-        image_data = await file.read()
-
-        # Call LLM for prediction
-        detection_result = detect_ui_elements(
+        # Call LLM for prediction without blocking the event loop
+        detection_result = await detect_ui_elements_async(
             image_data=image_data,
-            image_type=file.content_type
+            image_type=image_info.content_type,
+            tiling=tiling
         )
 
         processing_time = time.time() - start_time
 
         return PredictionResponse(
             annotations=detection_result.annotations,
-            processing_time=processing_time
+            processing_time=processing_time,
+            near_duplicate_distance=detection_result.near_duplicate_distance,
+            image_dimensions=ImageDimensions(width=image_info.width, height=image_info.height)
+        )
+
+    except Exception as e:
+        raise _prediction_error(e)
+
+
+@base_router.post("/predict/region", response_model=PredictionResponse)
+async def predict_region(
+    x: float = Form(...),
+    y: float = Form(...),
+    width: float = Form(..., gt=0),
+    height: float = Form(..., gt=0),
+    file: UploadFile | None = File(None),
+    job_id: str | None = Form(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Re-predict UI elements in one region of an image, e.g. a panel selected on the canvas.
+    The region is given in normalized 0-1000 coordinates like the annotations. The image is either
+    uploaded again or taken from an earlier job. Only the crop is sent to the model, and the boxes
+    are returned in full-image normalized coordinates.
+    """
+    start_time = time.time()
+
+    if (file is None) == (job_id is None):
+        raise HTTPException(status_code=400, detail="Provide either an image file or a job_id")
+
+    if file is not None:
+        image_data, image_info = await _read_image(file)
+    else:
+        image_data, image_info = await _read_job_image(db, job_id)
+
+    try:
+        detection_result = await detect_region_async(image_data=image_data, region=(x, y, width, height))
+
+        return PredictionResponse(
+            annotations=detection_result.annotations,
+            processing_time=time.time() - start_time,
+            image_dimensions=ImageDimensions(width=image_info.width, height=image_info.height)
         )
 
+    except Exception as e:
+        raise _prediction_error(e)
+
+
+async def _read_job_image(db: Session, job_id: str) -> tuple[bytes, ImageInfo]:
+    """Fetch and check the stored image of an earlier job, off the event loop."""
+    job = await asyncio.to_thread(lambda: db.query(Job).filter(Job.id == job_id).first())
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == JobStatus.AWAITING_UPLOAD:
+        raise HTTPException(status_code=409, detail="The image of this job has not been uploaded yet")
+
+    try:
+        image_data = await asyncio.to_thread(storage.download_image, job.s3_key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            raise HTTPException(status_code=404, detail="The image of this job is no longer stored")
+        raise HTTPException(status_code=502, detail=f"Failed to fetch the image of this job: {str(e)}")
+
+    try:
+        return image_data, validate_image(image_data)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+
+def _prediction_error(error: Exception) -> HTTPException:
+    """HTTP error for a failed prediction."""
+    if isinstance(error, RateLimitExceeded):
+        return HTTPException(
+            status_code=429,
+            detail=str(error),
+            headers={"Retry-After": str(math.ceil(error.retry_after))}
+        )
+    if isinstance(error, RateLimitError):
+        # The provider's Retry-After was too long to wait out within the request
+        delay = retry_after(error)
+        return HTTPException(
+            status_code=429,
+            detail=f"LLM provider rate limit exceeded: {str(error)}",
+            headers={"Retry-After": str(math.ceil(delay))} if delay is not None else None
+        )
+    if isinstance(error, CircuitOpenError):
+        return _provider_unavailable(error)
+    if isinstance(error, ValueError):
+        return HTTPException(status_code=422, detail=str(error))
+    return HTTPException(status_code=500, detail=f"Prediction failed: {str(error)}")
+
+
+def _provider_unavailable(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when the LLM provider will be tried again."""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+
+def _stream_event(event_type: str, data: dict[str, Any]) -> bytes:
+    """Encode one NDJSON stream event."""
+    return (json.dumps({"type": event_type, "data": data}) + "\n").encode()
+
+
+@base_router.post("/predict/stream")
+async def predict_ui_elements_stream(file: UploadFile = File(...)):
+    """
+    Stream predicted UI elements as newline-delimited JSON.
+    Each detected element is sent as an `annotation` event as soon as the model has produced it,
+    followed by a `summary` event with the total count and processing time, or an `error` event.
+    """
+    start_time = time.time()
+
+    # Read before streaming starts, the upload is closed once the handler returns
+    image_data, image_info = await _read_image(file)
+    image_type = image_info.content_type
+
+    # Fail with a proper status while we still can, headers are sent once streaming starts
+    if circuit_breaker:
+        try:
+            await asyncio.to_thread(circuit_breaker.check)
+        except CircuitOpenError as e:
+            raise _provider_unavailable(e)
+
+    async def events() -> AsyncIterator[bytes]:
+        total = 0
+        time_to_first_annotation = None
+        try:
+            async for annotation in stream_ui_elements(image_data=image_data, image_type=image_type):
+                if time_to_first_annotation is None:
+                    time_to_first_annotation = time.time() - start_time
+                total += 1
+                yield _stream_event("annotation", annotation.model_dump(mode="json"))
+        except Exception as e:
+            # Headers are already sent, report the failure in-band
+            logger.error(f"Streamed prediction failed: {e}")
+            yield _stream_event("error", {"detail": f"Prediction failed: {str(e)}"})
+            return
+
+        summary = PredictionStreamSummary(
+            total=total,
+            processing_time=time.time() - start_time,
+            time_to_first_annotation=time_to_first_annotation,
+            image_dimensions=ImageDimensions(width=image_info.width, height=image_info.height),
+        )
+        yield _stream_event("summary", summary.model_dump())
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        # Keep reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
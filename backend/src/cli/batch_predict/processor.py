@@ -1,20 +1,79 @@
 import json
-import mimetypes
+import math
 import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
-from src.llm import detect_ui_elements
+from src.inference.batch import (
+    BatchStatus,
+    build_batch_backend,
+    read_batch_results,
+    wait_for_batch,
+    write_batch_file,
+)
+from src.inference.cascade import CascadeOptions, cascade_stats
+from src.inference.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    ConcurrencyPolicy,
+    use_concurrency_limiter,
+)
+from src.inference.dedup import near_duplicates
+from src.inference.image_info import validate_image
+from src.inference.packing import packing_stats
+from src.inference.preprocess import PreprocessOptions, preprocess_stats
+from src.inference.ratelimit import rate_limiter
+from src.inference.tiling import TilingOptions
+from src.llm import (
+    assemble_batch_result,
+    detect_ui_elements,
+    detect_ui_elements_packed,
+    prepare_batch_image,
+)
+from src.settings import config
 
 
 class BatchProcessor:
     """Lightweight batch processor for auto-predicting multiple images."""
 
-    def __init__(self, model_name: str, max_concurrent: int = 5):
+    def __init__(
+        self,
+        model_name: str,
+        max_concurrent: int = 5,
+        use_cache: bool = True,
+        preprocess: PreprocessOptions | None = None,
+        tiling: TilingOptions | None = None,
+        pack_size: int = 1,
+        adaptive: bool = True,
+        adaptive_max: int | None = None,
+        cascade: CascadeOptions | None = None,
+    ):
         self.model_name = model_name
         self.max_concurrent = max_concurrent
+        # Images sent together in one request, 1 sends every image on its own
+        self.pack_size = pack_size
+        # Adaptive mode starts at max_concurrent and tunes the limit to what the provider sustains
+        self.limiter = None
+        if adaptive:
+            adaptive_max = adaptive_max or math.floor(config.llm_concurrency_max)
+            self.limiter = AdaptiveConcurrencyLimiter(
+                backend=None,
+                policy=ConcurrencyPolicy(
+                    initial=max_concurrent,
+                    min_limit=min(config.llm_concurrency_min, max_concurrent),
+                    max_limit=max(adaptive_max, max_concurrent),
+                    decrease=config.llm_concurrency_decrease,
+                ),
+                latency_tolerance=config.llm_concurrency_latency_tolerance,
+            )
+        self.use_cache = use_cache
+        self.preprocess = preprocess or PreprocessOptions.from_settings()
+        self.tiling = tiling or TilingOptions.from_settings()
+        # Only single-image requests cascade, packed requests go to the model directly
+        self.cascade = cascade or CascadeOptions.from_settings()
         self.results: list[dict[str, Any]] = []
 
     def process_single_image(self, image_path: Path) -> dict[str, Any]:
@@ -25,6 +84,9 @@ class BatchProcessor:
             "status": "pending",
             "error": None,
             "annotations": [],
+            "model": None,
+            "escalation_reasons": None,
+            "image_dimensions": None,
             "processing_time": 0
         }
 
@@ -33,18 +95,25 @@ class BatchProcessor:
             with open(image_path, "rb") as f:
                 image_data = f.read()
 
-            # Get mime type
-            mime_type, _ = mimetypes.guess_type(str(image_path))
-            if not mime_type:
-                mime_type = "image/png"
+            # Format and size from the header, rejecting non-images before any model call
+            image_info = validate_image(image_data)
+            result["image_dimensions"] = {"width": image_info.width, "height": image_info.height}
 
             # Detect UI elements
             detection_result = detect_ui_elements(
                 image_data=image_data,
-                image_type=mime_type,
+                image_type=image_info.content_type,
+                model=self.model_name,
+                use_cache=self.use_cache,
+                preprocess=self.preprocess,
+                tiling=self.tiling,
+                cascade=self.cascade,
             )
 
             result["annotations"] = [ann.model_dump() for ann in detection_result.annotations]
+            result["model"] = detection_result.model
+            result["escalation_reasons"] = detection_result.escalation_reasons
+            result["near_duplicate_distance"] = detection_result.near_duplicate_distance
             result["status"] = "completed"
 
         except Exception as e:
@@ -55,30 +124,176 @@ class BatchProcessor:
         result["processing_time"] = time.time() - start_time
         return result
 
+    def process_pack(self, image_paths: list[Path]) -> list[dict[str, Any]]:
+        """Process several images with one packed request, falling back to single requests."""
+        start_time = time.time()
+        images = []
+        image_infos = []
+        for image_path in image_paths:
+            try:
+                with open(image_path, "rb") as f:
+                    image_data = f.read()
+                image_info = validate_image(image_data)
+            except (OSError, ValueError) as e:
+                # Reported for this image alone, the rest of the pack goes ahead
+                image_info = e
+            image_infos.append(image_info)
+            if isinstance(image_info, Exception):
+                continue
+            images.append((image_data, image_info.content_type))
+
+        detections = []
+        if images:
+            detections = detect_ui_elements_packed(
+                images=images,
+                model=self.model_name,
+                use_cache=self.use_cache,
+                preprocess=self.preprocess,
+                tiling=self.tiling,
+            )
+
+        # Packed images share the request, so each is charged its share of the time
+        processing_time = (time.time() - start_time) / len(image_paths)
+        results = []
+        packed_detections = iter(detections)
+        for image_path, image_info in zip(image_paths, image_infos, strict=True):
+            result = {
+                "image_path": str(image_path),
+                "status": "completed",
+                "error": None,
+                "annotations": [],
+                "image_dimensions": None,
+                "processing_time": processing_time
+            }
+            if isinstance(image_info, Exception):
+                detection = image_info
+            else:
+                detection = next(packed_detections)
+                result["image_dimensions"] = {"width": image_info.width, "height": image_info.height}
+            if isinstance(detection, Exception):
+                result["status"] = "failed"
+                result["error"] = str(detection)
+                print(f"Error processing {image_path}: {detection}")
+            else:
+                result["annotations"] = [ann.model_dump() for ann in detection.annotations]
+                result["model"] = detection.model
+            results.append(result)
+        return results
+
     def process_batch(self, image_paths: list[Path], progress_callback=None) -> list[dict[str, Any]]:
         """Process a batch of images concurrently using threads."""
         total = len(image_paths)
         completed = 0
         results = []
 
-        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
-            # Submit all tasks
-            future_to_path = {executor.submit(self.process_single_image, path): path 
-                            for path in image_paths}
+        # With an adaptive limit, threads only wait for a slot beyond the current limit
+        max_workers = math.ceil(self.limiter.policy.max_limit) if self.limiter else self.max_concurrent
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Submit all tasks, one per pack of images when packing
+            if self.pack_size > 1:
+                packs = [image_paths[i:i + self.pack_size] for i in range(0, total, self.pack_size)]
+                futures = [executor.submit(self.process_pack, pack) for pack in packs]
+            else:
+                futures = [executor.submit(self.process_single_image, path) for path in image_paths]
 
             # Process with progress updates
-            for future in as_completed(future_to_path):
+            for future in as_completed(futures):
                 result = future.result()
-                results.append(result)
-                completed += 1
+                new_results = result if isinstance(result, list) else [result]
+                results.extend(new_results)
+                completed += len(new_results)
 
                 if progress_callback:
                     progress_callback(completed, total)
+                elif self.limiter:
+                    print(f"Progress: {completed}/{total} ({completed/total*100:.1f}%), "
+                          f"concurrency limit {self.limiter.limit:.1f}")
                 else:
                     print(f"Progress: {completed}/{total} ({completed/total*100:.1f}%)")
 
         return results
 
+    def process_offline(self, image_paths: list[Path], poll_interval: float | None = None) -> list[dict[str, Any]]:
+        """
+        Process all images as one offline batch: write a JSONL file, submit it and wait for the results.
+
+        The cache, packing and cascade are not used, every image (or tile) is one request line.
+        """
+        start_time = time.time()
+        results = []
+        requests = []
+        plans = {}
+        for idx, image_path in enumerate(image_paths):
+            result = {
+                "image_path": str(image_path),
+                "status": "pending",
+                "error": None,
+                "annotations": [],
+                "model": None,
+                "image_dimensions": None,
+                "processing_time": 0
+            }
+            results.append(result)
+            try:
+                with open(image_path, "rb") as f:
+                    image_data = f.read()
+                image_info = validate_image(image_data)
+                result["image_dimensions"] = {"width": image_info.width, "height": image_info.height}
+                bodies, plans[idx] = prepare_batch_image(
+                    image_data=image_data,
+                    image_type=image_info.content_type,
+                    model=self.model_name,
+                    preprocess=self.preprocess,
+                    tiling=self.tiling,
+                )
+                requests.extend((f"{idx}:{tile}", body) for tile, body in enumerate(bodies))
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
+                print(f"Error processing {image_path}: {e}")
+
+        if not requests:
+            return results
+
+        backend = build_batch_backend()
+        run_dir = Path(config.llm_batch_dir) / f"cli-{uuid.uuid4().hex[:8]}"
+        write_batch_file(run_dir / "input.jsonl", requests)
+        batch_id = backend.submit(run_dir / "input.jsonl")
+        print(f"Submitted batch {batch_id} with {len(requests)} requests")
+
+        def report(status: BatchStatus):
+            print(f"Batch {status.state}: {status.completed + status.failed}/{status.total} requests done, {status.failed} failed")
+
+        status = wait_for_batch(
+            backend, batch_id,
+            poll_interval=config.llm_batch_poll_interval if poll_interval is None else poll_interval,
+            progress=report,
+        )
+        lines = {}
+        if status.state == "completed":
+            backend.download_results(batch_id, run_dir / "output.jsonl")
+            lines = read_batch_results(run_dir / "output.jsonl")
+
+        # The whole run is charged evenly, requests in a batch have no latency of their own
+        processing_time = (time.time() - start_time) / len(image_paths)
+        for idx, result in enumerate(results):
+            result["processing_time"] = processing_time
+            if idx not in plans:
+                continue
+            try:
+                if status.state != "completed":
+                    raise RuntimeError(f"Batch {batch_id} ended {status.state}")
+                responses = [lines.get(f"{idx}:{tile}") for tile in range(plans[idx]["requests"])]
+                detection_result = assemble_batch_result(responses, plans[idx], self.tiling)
+                result["annotations"] = [ann.model_dump() for ann in detection_result.annotations]
+                result["model"] = detection_result.model
+                result["status"] = "completed"
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
+                print(f"Error processing {result['image_path']}: {e}")
+        return results
+
     def save_results(self, results: list[dict[str, Any]], output_dir: Path):
         """Save results as individual JSON files in the predictions format."""
         output_dir.mkdir(parents=True, exist_ok=True)
@@ -99,9 +314,23 @@ class BatchProcessor:
                 "annotations": [],
                 "metadata": {
                     "totalAnnotations": len(result["annotations"]),
-                    "exportedAt": datetime.now().isoformat() + "Z"
+                    "exportedAt": datetime.now().isoformat() + "Z",
+                    "preprocess": asdict(self.preprocess),
+                    "tiling": asdict(self.tiling),
+                    "packSize": self.pack_size,
+                    "model": result.get("model")
                 }
             }
+            if result.get("near_duplicate_distance") is not None:
+                # Annotations were reused from a near-identical image, not predicted for this one
+                prediction_data["metadata"]["nearDuplicateDistance"] = result["near_duplicate_distance"]
+            if result.get("escalation_reasons") is not None:
+                # Lets `cli evaluate --by-tier` score kept and escalated images separately
+                prediction_data["metadata"]["cascade"] = {
+                    "fastModel": self.cascade.fast_model,
+                    "tier": "strong" if result["escalation_reasons"] else "fast",
+                    "escalationReasons": result["escalation_reasons"]
+                }
 
             # Convert annotations to the required format
             for ann_idx, annotation in enumerate(result["annotations"]):
@@ -137,7 +366,15 @@ def auto_predict_images(
     output_dir: Path = None,
     model_name: str = None,
     max_concurrent: int = 5,
-    max_images: int = 1000
+    max_images: int = 1000,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+    pack_size: int = 1,
+    adaptive: bool = True,
+    adaptive_max: int | None = None,
+    cascade: CascadeOptions | None = None,
+    offline: bool = False
 ):
     """Auto-predict UI elements for up to 1000 images in a directory."""
 
@@ -163,15 +400,64 @@ def auto_predict_images(
     print(f"Found {len(image_files)} images to process")
 
     # Create processor and run
-    processor = BatchProcessor(model_name=model_name, max_concurrent=max_concurrent)
+    processor = BatchProcessor(
+        model_name=model_name,
+        max_concurrent=max_concurrent,
+        use_cache=use_cache,
+        preprocess=preprocess,
+        tiling=tiling,
+        pack_size=pack_size,
+        adaptive=adaptive,
+        adaptive_max=adaptive_max,
+        cascade=cascade
+    )
+    # Provider requests take their in-flight slots from its limiter, or run on the fixed thread count
+    use_concurrency_limiter(processor.limiter)
     start_time = time.time()
 
-    results = processor.process_batch(image_files)
+    if offline:
+        results = processor.process_offline(image_files)
+    else:
+        results = processor.process_batch(image_files)
 
     total_time = time.time() - start_time
     print(f"\nCompleted in {total_time:.1f} seconds")
     print(f"Average time per image: {total_time/len(image_files):.1f} seconds")
 
+    stats = preprocess_stats.to_dict()
+    if stats["images"]:
+        print(f"Payload size: {stats['bytes_before'] / 1e6:.1f}MB -> {stats['bytes_after'] / 1e6:.1f}MB "
+              f"(ratio {stats['size_ratio']}), preprocessing {stats['avg_latency_ms']}ms per image")
+
+    if processor.limiter:
+        limiter_stats = processor.limiter.stats()
+        print(f"Concurrency: final limit {limiter_stats['limit']}, {limiter_stats['overloads']} overloads, "
+              f"{limiter_stats['latency_spikes']} latency spikes")
+
+    pack_stats = packing_stats.to_dict()
+    if pack_stats["packs"]:
+        print(f"Packing: {pack_stats['packs']} requests, avg {pack_stats['avg_pack_size']} images each, "
+              f"{pack_stats['fallback_images']} images fell back to single requests")
+
+    if near_duplicates:
+        dedup_stats = near_duplicates.stats()
+        if dedup_stats["hits"]:
+            print(f"Near-duplicates: {dedup_stats['hits']} images reused earlier annotations "
+                  f"(hit rate {dedup_stats['hit_rate']:.0%}), avg lookup {dedup_stats['avg_lookup_ms']}ms, "
+                  f"{dedup_stats['entries']} images indexed")
+
+    escalation = cascade_stats.to_dict()
+    if escalation["images"]:
+        tiers = escalation["tiers"]
+        print(f"Cascade: {escalation['escalated']}/{escalation['images']} images escalated "
+              f"({escalation['escalation_rate']:.0%}), reasons {escalation['reasons']}, "
+              f"fast tier avg {tiers['fast']['avg_latency_ms']}ms, strong tier avg {tiers['strong']['avg_latency_ms']}ms")
+
+    for model, limiter_stats in rate_limiter.stats()["models"].items():
+        if limiter_stats["waited"]:
+            print(f"Rate limiter ({model}): {limiter_stats['waited']} requests waited, "
+                  f"avg {limiter_stats['avg_wait_ms']}ms, max {limiter_stats['max_wait_ms']}ms")
+
     # Save results
     processor.save_results(results, output_dir)
 
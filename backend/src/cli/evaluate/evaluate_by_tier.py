@@ -0,0 +1,77 @@
+"""Per-tier evaluation of model cascade predictions."""
+
+import json
+from collections import defaultdict
+from pathlib import Path
+
+from src.cli.evaluate.match_predictions_to_ground_truth import (
+    match_predictions_to_ground_truth,
+)
+from src.cli.evaluate.parser import load_annotations_from_directory
+
+# Tier of predictions made without the cascade
+DIRECT_TIER = "direct"
+
+
+def load_prediction_tiers(predictions_dir: Path) -> dict[str, str]:
+    """
+    Read which cascade tier produced each prediction file.
+
+    Args:
+        predictions_dir: Directory containing prediction JSON files
+
+    Returns:
+        Dictionary mapping image names to 'fast', 'strong' or 'direct'
+    """
+    tiers = {}
+    for file_path in predictions_dir.glob('*.json'):
+        try:
+            with open(file_path) as f:
+                data = json.load(f)
+            cascade = (data.get('metadata') or {}).get('cascade') or {}
+            tiers[data['imageName']] = cascade.get('tier', DIRECT_TIER)
+        except Exception as e:
+            print(f"Error parsing {file_path}: {e}")
+    return tiers
+
+
+def evaluate_by_tier(
+    ground_truth_dir: Path,
+    predictions_dir: Path,
+    iou_threshold: float = 0.5
+) -> dict[str, dict]:
+    """
+    Evaluate predictions separately for images the fast model kept and images escalated to the strong model.
+
+    Args:
+        ground_truth_dir: Directory containing ground truth JSON files
+        predictions_dir: Directory containing prediction JSON files written by batch-predict
+        iou_threshold: IoU threshold for matching (default: 0.5)
+
+    Returns:
+        Dictionary mapping each tier to its image count and metrics per tag
+    """
+    ground_truth_data = load_annotations_from_directory(ground_truth_dir, source_filter='user')
+    prediction_data = load_annotations_from_directory(predictions_dir, source_filter='prediction')
+    tiers = load_prediction_tiers(predictions_dir)
+
+    results = defaultdict(lambda: {'images': 0, 'tag_metrics': defaultdict(lambda: {'tp': 0, 'fp': 0, 'fn': 0})})
+
+    # Only images with a prediction have a tier
+    for image_name, pred_boxes in prediction_data.items():
+        tier = results[tiers.get(image_name, DIRECT_TIER)]
+        tier['images'] += 1
+
+        match_result = match_predictions_to_ground_truth(ground_truth_data.get(image_name, []), pred_boxes, iou_threshold)
+
+        for gt_box, _pred_box in match_result.true_positives:
+            tier['tag_metrics'][gt_box.tag]['tp'] += 1
+        for fp_box in match_result.false_positives:
+            tier['tag_metrics'][fp_box.tag]['fp'] += 1
+        for fn_box in match_result.false_negatives:
+            tier['tag_metrics'][fn_box.tag]['fn'] += 1
+
+    return {
+        name: {'images': tier['images'], 'tag_metrics': dict(tier['tag_metrics'])}
+        for name, tier in results.items()
+    }
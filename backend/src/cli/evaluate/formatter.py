@@ -4,13 +4,18 @@
 from src.cli.evaluate.calculate_metrics import calculate_metrics
 
 
-def print_evaluation_results(tag_metrics: dict[str, dict[str, int]], show_errors: bool = False):
+def print_evaluation_results(
+    tag_metrics: dict[str, dict[str, int]],
+    show_errors: bool = False,
+    title: str = "EVALUATION RESULTS",
+    show_definitions: bool = True,
+):
     """Print evaluation results in a formatted table with metrics."""
     # Adjust table width based on columns shown
     table_width = 88 if show_errors else 68
 
     print("\n" + "=" * table_width)
-    print("EVALUATION RESULTS")
+    print(title)
     print("=" * table_width)
 
     # Sort tags for consistent output
@@ -64,6 +69,9 @@ def print_evaluation_results(tag_metrics: dict[str, dict[str, int]], show_errors
               f"{overall_precision:<10.3f} {overall_recall:<10.3f} {overall_f1:<10.3f}")
     print("=" * table_width)
 
+    if not show_definitions:
+        return
+
     # Print metric explanations
     print("\nMetric Definitions:")
     print("  GT = Ground Truth (total boxes)")
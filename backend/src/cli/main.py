@@ -2,6 +2,7 @@
 """Main CLI entry point for UI annotation tools."""
 
 import json
+from dataclasses import replace
 from pathlib import Path
 
 import click
@@ -11,8 +12,16 @@ from src.cli.batch_predict.processor import auto_predict_images
 
 # Import evaluation commands
 from src.cli.evaluate.detection_evaluator import evaluate_detection_performance
+from src.cli.evaluate.evaluate_by_tier import evaluate_by_tier
 from src.cli.evaluate.formatter import format_results_as_json, print_evaluation_results
 
+# Import model cascade options
+from src.inference.cascade import CascadeOptions
+
+# Import image preprocessing options
+from src.inference.preprocess import OUTPUT_FORMATS, PreprocessOptions
+from src.inference.tiling import TilingOptions
+
 # Import settings to get default model
 from src.settings import config
 from src.constants import DEFAULT_PREDICTIONS_DIR, DEFAULT_GROUND_TRUTH_DIR, DEFAULT_IMAGE_DIR
@@ -65,7 +74,8 @@ def cli():
 @click.option('--iou-threshold', default=0.5, help='IoU threshold for matching boxes', show_default=True)
 @click.option('--output', type=click.Path(dir_okay=False, path_type=Path), help='Optional output file for results (JSON format)')
 @click.option('--show-errors/--no-show-errors', default=False, help='Show FP (False Positives) and FN (False Negatives) columns')
-def evaluate(ground_truth_dir: Path, predictions_dir: Path, iou_threshold: float, output: Path, show_errors: bool):
+@click.option('--by-tier', is_flag=True, help='Also score images kept by the cascade fast model and images escalated to the strong model separately')
+def evaluate(ground_truth_dir: Path, predictions_dir: Path, iou_threshold: float, output: Path, show_errors: bool, by_tier: bool):
     # Use defaults if not provided
     if ground_truth_dir is None:
         ground_truth_dir = DEFAULT_GROUND_TRUTH_DIR
@@ -84,6 +94,20 @@ def evaluate(ground_truth_dir: Path, predictions_dir: Path, iou_threshold: float
     # Print results
     print_evaluation_results(tag_metrics, show_errors=show_errors)
 
+    tier_results = evaluate_by_tier(ground_truth_dir, predictions_dir, iou_threshold) if by_tier else {}
+    for tier, tier_result in sorted(tier_results.items()):
+        print_evaluation_results(
+            tier_result['tag_metrics'],
+            show_errors=show_errors,
+            title=f"TIER: {tier} ({tier_result['images']} images)",
+            show_definitions=False,
+        )
+    if tier_results:
+        cascaded = sum(result['images'] for tier, result in tier_results.items() if tier in ('fast', 'strong'))
+        escalated = tier_results.get('strong', {}).get('images', 0)
+        if cascaded:
+            click.echo(f"\nEscalation rate: {escalated}/{cascaded} ({escalated / cascaded:.0%})")
+
     # Save results if output file specified
     if output:
         params = {
@@ -93,6 +117,14 @@ def evaluate(ground_truth_dir: Path, predictions_dir: Path, iou_threshold: float
         }
 
         results = format_results_as_json(tag_metrics, params)
+        if tier_results:
+            results['per_tier_metrics'] = {
+                tier: {
+                    'images': tier_result['images'],
+                    **format_results_as_json(tier_result['tag_metrics'], params)['overall_metrics'],
+                }
+                for tier, tier_result in tier_results.items()
+            }
 
         # Write to file
         with open(output, 'w') as f:
@@ -105,9 +137,26 @@ def evaluate(ground_truth_dir: Path, predictions_dir: Path, iou_threshold: float
 @click.argument('image_dir', type=click.Path(exists=True), required=False)
 @click.argument('output_dir', type=click.Path(), required=False)
 @click.option('--model', '-m', help='Model to use for prediction (default: from OPENROUTER_MODEL env)')
-@click.option('--concurrent', '-c', default=5, help='Number of concurrent requests')
+@click.option('--concurrent', '-c', default=5, help='Number of concurrent requests, the starting point in adaptive mode')
+@click.option('--adaptive/--fixed', default=True, help='Adapt concurrency to provider latency and rate limits (AIMD)')
+@click.option('--max-concurrent', type=click.IntRange(min=1), help='Upper bound for adaptive concurrency (default: LLM_CONCURRENCY_MAX)')
 @click.option('--max-images', '-n', default=1000, help='Maximum number of images to process')
-def batch_predict(image_dir: str, output_dir: str, model: str, concurrent: int, max_images: int):
+@click.option('--cache/--no-cache', default=True, help='Reuse cached predictions for identical images (backend from PREDICTION_CACHE_BACKEND)')
+@click.option('--preprocess/--no-preprocess', default=None, help='Resize and re-encode images before sending (default: IMAGE_PREPROCESS_ENABLED)')
+@click.option('--max-edge', type=int, help='Longest image side in pixels sent to the model (default: IMAGE_MAX_EDGE)')
+@click.option('--image-format', type=click.Choice(sorted(OUTPUT_FORMATS)), help='Encoding for preprocessed images (default: IMAGE_FORMAT)')
+@click.option('--quality', type=click.IntRange(1, 100), help='Encoder quality for webp/jpeg (default: IMAGE_QUALITY)')
+@click.option('--tile/--no-tile', default=None, help='Split tall screenshots into overlapping tiles (default: TILING_ENABLED)')
+@click.option('--tile-height', type=click.IntRange(min=1), help='Tile height in pixels (default: TILE_HEIGHT)')
+@click.option('--tile-overlap', type=click.FloatRange(0, 1, max_open=True), help='Fraction of each tile shared with the next (default: TILE_OVERLAP)')
+@click.option('--pack-size', type=click.IntRange(min=1), default=1, help='Images sent together in one request, for small screenshots (default: 1, no packing)')
+@click.option('--cascade/--no-cascade', default=None, help='Try a fast model first and escalate weak results to --model (default: CASCADE_ENABLED)')
+@click.option('--fast-model', help='Fast model tried first in the cascade (default: CASCADE_FAST_MODEL)')
+@click.option('--offline', is_flag=True, help='Submit all images as one batch file to LLM_BATCH_BACKEND and wait for the results, cheaper but slower')
+def batch_predict(image_dir: str, output_dir: str, model: str, concurrent: int, max_images: int, cache: bool,
+                  preprocess: bool, max_edge: int, image_format: str, quality: int,
+                  tile: bool, tile_height: int, tile_overlap: float, pack_size: int,
+                  adaptive: bool, max_concurrent: int, cascade: bool, fast_model: str, offline: bool):
     # Use model from env if not specified
     if not model:
         model = config.openrouter_model
@@ -128,8 +177,50 @@ def batch_predict(image_dir: str, output_dir: str, model: str, concurrent: int,
     click.echo(f"Processing images from: {image_path}")
     click.echo(f"Output directory: {output_path}")
     click.echo(f"Model: {model}")
-    click.echo(f"Concurrent requests: {concurrent}")
+    if adaptive:
+        click.echo(f"Concurrent requests: adaptive, starting at {concurrent}")
+    else:
+        click.echo(f"Concurrent requests: {concurrent}")
     click.echo(f"Max images: {max_images}")
+    click.echo(f"Prediction cache: {'enabled' if cache else 'disabled'}")
+    if offline:
+        click.echo(f"Offline batch: {config.llm_batch_backend} backend, cache, packing and cascade not used")
+    if pack_size > 1:
+        click.echo(f"Packing: up to {pack_size} images per request")
+
+    # Command line options override the preprocessing settings
+    defaults = PreprocessOptions.from_settings()
+    preprocess_options = PreprocessOptions(
+        enabled=defaults.enabled if preprocess is None else preprocess,
+        max_edge=defaults.max_edge if max_edge is None else max_edge,
+        format=image_format or defaults.format,
+        quality=quality or defaults.quality,
+    )
+    if preprocess_options.enabled:
+        click.echo(f"Preprocessing: max edge {preprocess_options.max_edge}px, "
+                   f"{preprocess_options.format} quality {preprocess_options.quality}")
+    else:
+        click.echo("Preprocessing: disabled")
+
+    # Command line options override the tiling settings
+    tiling_defaults = TilingOptions.from_settings()
+    tiling_options = TilingOptions(
+        enabled=tiling_defaults.enabled if tile is None else tile,
+        tile_height=tile_height or tiling_defaults.tile_height,
+        overlap=tiling_defaults.overlap if tile_overlap is None else tile_overlap,
+    )
+    if tiling_options.enabled:
+        click.echo(f"Tiling: {tiling_options.tile_height}px tiles, {tiling_options.overlap:.0%} overlap")
+
+    # Command line options override the cascade settings
+    cascade_defaults = CascadeOptions.from_settings()
+    cascade_options = replace(
+        cascade_defaults,
+        enabled=cascade_defaults.enabled if cascade is None else cascade,
+        fast_model=fast_model or cascade_defaults.fast_model,
+    )
+    if cascade_options.enabled:
+        click.echo(f"Cascade: {cascade_options.fast_model} first, escalating weak results to {model}")
 
     # Run batch prediction
     results = auto_predict_images(
@@ -137,7 +228,15 @@ def batch_predict(image_dir: str, output_dir: str, model: str, concurrent: int,
         output_dir=output_path,
         model_name=model,
         max_concurrent=concurrent,
-        max_images=max_images
+        max_images=max_images,
+        use_cache=cache,
+        preprocess=preprocess_options,
+        tiling=tiling_options,
+        pack_size=pack_size,
+        adaptive=adaptive,
+        adaptive_max=max_concurrent,
+        cascade=cascade_options,
+        offline=offline
     )
 
     if results:
@@ -2,6 +2,7 @@
 
 # File upload limits
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB limit
+MAX_BATCH_UPLOAD_FILES = 100  # Images per /upload/batch request
 
 # Supported file types
 SUPPORTED_IMAGE_TYPES = ('image/',)
@@ -0,0 +1,365 @@
+import asyncio
+import json
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from typing import Any, Protocol
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Redis stream of job status events. Streams are Redis' persistent pub/sub:
+# API processes block on new entries, and the retained tail lets clients resume
+EVENTS_STREAM = "job-events"
+
+# Close code asking a client that fell too far behind to reconnect and resume
+CLOSE_TRY_AGAIN = 1013
+
+# (event_id, {"job_id", "batch_id", "data"})
+Event = tuple[str, dict[str, Any]]
+
+# Current state of subscribed jobs and batches as events without an id, for clients that cannot resume
+Snapshot = Callable[[list[str], list[str]], Awaitable[list[dict[str, Any]]]]
+
+_redis_client = None
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+
+        _redis_client = redis.Redis.from_url(config.redis_url)
+    return _redis_client
+
+
+def publish_job_events(events: list[dict[str, Any]]):
+    """Append job events to the stream in one round trip. Failures are logged, clients resync on reconnect."""
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(
+                EVENTS_STREAM,
+                {"event": json.dumps(event)},
+                maxlen=config.job_events_stream_maxlen,
+                approximate=True,
+            )
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish {len(events)} job events: {e}")
+
+
+class EventSource(Protocol):
+    """Where an EventHub reads job events from."""
+
+    async def latest_id(self) -> str: ...
+
+    async def read(self, last_id: str, block: float) -> list[Event]: ...
+
+    async def history(self, after_id: str) -> list[Event] | None: ...
+
+
+class RedisEventSource:
+    """Job events from the Redis stream."""
+
+    def __init__(self, redis_url: str, history_limit: int = 10000):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(redis_url)
+        self.history_limit = history_limit
+
+    async def read(self, last_id: str, block: float) -> list[Event]:
+        response = await self.client.xread({EVENTS_STREAM: last_id}, block=int(block * 1000), count=1000)
+        return [self._event(entry) for _stream, entries in response for entry in entries]
+
+    async def history(self, after_id: str) -> list[Event] | None:
+        """Events after after_id, or None when some may have been trimmed from the stream."""
+        oldest = await self.client.xrange(EVENTS_STREAM, count=1)
+        if not oldest or _id_key(oldest[0][0].decode()) > _id_key(after_id):
+            return None
+        entries = await self.client.xrange(EVENTS_STREAM, min=f"({after_id}", count=self.history_limit)
+        if len(entries) >= self.history_limit:
+            return None
+        return [self._event(entry) for entry in entries]
+
+    async def latest_id(self) -> str:
+        entries = await self.client.xrevrange(EVENTS_STREAM, count=1)
+        return entries[0][0].decode() if entries else "0-0"
+
+    @staticmethod
+    def _event(entry) -> Event:
+        event_id, fields = entry
+        return event_id.decode(), json.loads(fields[b"event"])
+
+
+def _update(event_id: str | None, event: dict[str, Any]) -> dict[str, Any]:
+    return {"type": "job_update", "job_id": event["job_id"], "data": event["data"], "event_id": event_id}
+
+
+def _id_key(event_id: str) -> tuple[int, int]:
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class Connection:
+    """A subscribed WebSocket and the messages waiting to be sent to it."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue(maxsize=queue_size)
+        self.job_ids: set[str] = set()
+        self.batch_ids: set[str] = set()
+        self.lagging = False
+        # Live messages held back while the client catches up, so they are not sent before older ones
+        self.held: list[dict[str, Any]] | None = None
+
+    def push(self, message: dict[str, Any]) -> bool:
+        """Queue a live message. Returns False when the connection is lagging and it was dropped."""
+        if self.held is not None and not self.lagging:
+            if len(self.held) < self.queue.maxsize:
+                self.held.append(message)
+                return True
+            self._overflow()
+        return self.send(message)
+
+    def send(self, message: dict[str, Any]) -> bool:
+        """Queue a message ahead of any held ones."""
+        if self.lagging:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self._overflow()
+            return False
+
+    def release(self):
+        """Queue the live messages held during a catch-up."""
+        held, self.held = self.held or [], None
+        for message in held:
+            self.send(message)
+
+    def _overflow(self):
+        # Don't let one slow client hold the others back, it resumes after reconnecting
+        self.lagging = True
+        self.held = None
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventHub:
+    """
+    Fans job events out to the WebSockets of one API process.
+
+    A single task reads the event stream and pushes each event to the
+    connections subscribed to its job or batch, looked up in indexes, so
+    idle connections cost nothing per event. Each connection has a
+    bounded send queue; one that overflows is closed, and the client
+    resumes from its last event after reconnecting.
+    """
+
+    def __init__(self, source: EventSource, heartbeat: float = 25.0, queue_size: int = 1000, block: float = 5.0):
+        self.source = source
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.block = block
+        self.by_job: dict[str, set[Connection]] = {}
+        self.by_batch: dict[str, set[Connection]] = {}
+        self.connections: set[Connection] = set()
+        self.last_id: str | None = None
+        self._task: asyncio.Task | None = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start reading events, once per process and event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                if self.last_id is None:
+                    self.last_id = await self.source.latest_id()
+                events = await self.source.read(self.last_id, self.block)
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job event stream unavailable, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            for event_id, event in events:
+                self.last_id = event_id
+                self.dispatch(event_id, event)
+
+    def dispatch(self, event_id: str | None, event: dict[str, Any]):
+        connections = set(self.by_job.get(event["job_id"], ()))
+        if event.get("batch_id"):
+            connections |= self.by_batch.get(event["batch_id"], set())
+        if not connections:
+            return
+        message = _update(event_id, event)
+        for connection in connections:
+            if connection.push(message):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+    def add(self, websocket: WebSocket) -> Connection:
+        connection = Connection(websocket, self.queue_size)
+        self.connections.add(connection)
+        return connection
+
+    def remove(self, connection: Connection):
+        self.connections.discard(connection)
+        self.unsubscribe(connection, list(connection.job_ids), list(connection.batch_ids))
+
+    def subscribe(self, connection: Connection, job_ids: list[str], batch_ids: list[str]):
+        for index, ids, keys in ((self.by_job, connection.job_ids, job_ids), (self.by_batch, connection.batch_ids, batch_ids)):
+            for key in keys:
+                ids.add(key)
+                index.setdefault(key, set()).add(connection)
+
+    def unsubscribe(self, connection: Connection, job_ids: list[str], batch_ids: list[str]):
+        for index, ids, keys in ((self.by_job, connection.job_ids, job_ids), (self.by_batch, connection.batch_ids, batch_ids)):
+            for key in keys:
+                ids.discard(key)
+                subscribers = index.get(key)
+                if subscribers is not None:
+                    subscribers.discard(connection)
+                    if not subscribers:
+                        del index[key]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "subscribed_jobs": len(self.by_job),
+            "subscribed_batches": len(self.by_batch),
+            "last_event_id": self.last_id,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+    async def serve(self, websocket: WebSocket, snapshot: Snapshot):
+        """
+        Run the job event protocol on an accepted WebSocket until it closes.
+
+        Clients send {"type": "subscribe" | "unsubscribe", "job_ids": [...],
+        "batch_ids": [...]}, optionally with the "last_event_id" they saw to
+        receive what they missed, and get {"type": "job_update", "job_id",
+        "data", "event_id"} messages. {"type": "ping"} is sent when nothing
+        else was for a heartbeat interval, and answered with a pong.
+        """
+        self.start()
+        connection = self.add(websocket)
+        sender = asyncio.create_task(self._send(connection))
+        try:
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                except (ValueError, KeyError):
+                    await websocket.send_json({"type": "error", "message": "Messages must be JSON objects"})
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                message_type = message.get("type")
+                job_ids = [str(job_id) for job_id in message.get("job_ids") or []]
+                batch_ids = [str(batch_id) for batch_id in message.get("batch_ids") or []]
+                if message_type == "subscribe":
+                    connection.held = []
+                    # Events up to here are caught up on, later ones arrive live
+                    cutoff = self.last_id
+                    self.subscribe(connection, job_ids, batch_ids)
+                    try:
+                        await self._catch_up(connection, job_ids, batch_ids, message.get("last_event_id"), cutoff,
+                                             snapshot)
+                    finally:
+                        connection.release()
+                elif message_type == "unsubscribe":
+                    self.unsubscribe(connection, job_ids, batch_ids)
+                elif message_type == "ping":
+                    connection.send({"type": "pong", "event_id": self.last_id})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.remove(connection)
+            sender.cancel()
+
+    async def _catch_up(self, connection: Connection, job_ids: list[str], batch_ids: list[str],
+                        last_event_id: str | None, cutoff: str | None, snapshot: Snapshot):
+        """Send what the client missed: the events since its last one, or the current state."""
+        history = None
+        if last_event_id and cutoff:
+            try:
+                history = await self.source.history(str(last_event_id))
+            except Exception as e:
+                logger.warning(f"Failed to read job event history: {e}")
+        if history is not None:
+            jobs, batches = set(job_ids), set(batch_ids)
+            for event_id, event in history:
+                if _id_key(event_id) > _id_key(cutoff):
+                    break
+                if event["job_id"] in jobs or (event.get("batch_id") and event["batch_id"] in batches):
+                    connection.send(_update(event_id, event))
+            return
+        for event in await snapshot(job_ids, batch_ids):
+            connection.send(_update(None, event))
+
+    async def _send(self, connection: Connection):
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(connection.queue.get(), timeout=self.heartbeat)
+                except TimeoutError:
+                    # Everything up to last_id was sent, unless a catch-up is holding messages back
+                    message = {"type": "ping", "event_id": self.last_id if connection.held is None else None}
+                if message is None:
+                    await connection.websocket.close(code=CLOSE_TRY_AGAIN, reason="Too far behind, resume")
+                    return
+                await connection.websocket.send_json(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Closed under us, the receive loop cleans up
+            pass
+
+
+def job_event_data(status: str, error: str | None = None, processing_time: float | None = None,
+                   batch_id: str | None = None) -> dict[str, Any]:
+    """Payload of a job_update message, shared by published events and snapshots."""
+    return {
+        "status": status,
+        "error": error,
+        "processing_time": processing_time,
+        "batch_id": batch_id,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+def build_event_hub() -> EventHub:
+    """Create the event hub of this API process, reading from Redis."""
+    return EventHub(
+        RedisEventSource(config.redis_url),
+        heartbeat=config.ws_heartbeat_interval,
+        queue_size=config.ws_send_queue_size,
+    )
+
+
+# Job event fan-out of this API process
+event_hub = build_event_hub()
@@ -0,0 +1 @@
+"""Support components for LLM inference."""
@@ -0,0 +1,264 @@
+import json
+import logging
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Protocol
+
+from openai import APIStatusError, OpenAI
+
+from src.inference.clients import llm_clients
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Endpoint every request line of a batch file is sent to
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch states after which nothing changes any more
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+# Sends one request body and returns the HTTP status code and response body
+BatchHandler = Callable[[dict[str, Any]], tuple[int, dict[str, Any]]]
+
+
+@dataclass
+class BatchStatus:
+    """Progress of a submitted batch."""
+    state: str  # validating, in_progress, finalizing, completed, failed, expired or cancelled
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+
+def write_batch_file(path: Path, requests: Iterable[tuple[str, dict[str, Any]]]) -> int:
+    """Write (custom_id, body) pairs as a JSONL batch input file. Returns the number of requests."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "w") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}) + "\n")
+            count += 1
+    return count
+
+
+def read_batch_results(path: Path) -> dict[str, dict[str, Any]]:
+    """Output lines of a finished batch by custom_id."""
+    results = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[result["custom_id"]] = result
+    return results
+
+
+class BatchBackend(Protocol):
+    """A service that runs a JSONL file of requests offline."""
+
+    def submit(self, input_path: Path) -> str: ...
+
+    def status(self, batch_id: str) -> BatchStatus: ...
+
+    def download_results(self, batch_id: str, output_path: Path) -> None: ...
+
+
+class OpenAIBatchBackend:
+    """Batch API of OpenAI and compatible providers, typically at half the interactive price."""
+
+    def __init__(self, base_url: str, api_key: str, completion_window: str = "24h"):
+        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.completion_window = completion_window
+
+    def submit(self, input_path: Path) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> BatchStatus:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return BatchStatus(
+            state=batch.status,
+            total=counts.total if counts else 0,
+            completed=counts.completed if counts else 0,
+            failed=counts.failed if counts else 0,
+        )
+
+    def download_results(self, batch_id: str, output_path: Path) -> None:
+        batch = self.client.batches.retrieve(batch_id)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "wb") as f:
+            # Requests that failed outright are in a separate error file
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).read())
+
+
+def send_with_client(body: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+    """Send a batch request line through the pooled interactive client."""
+    client = llm_clients.get_client(
+        base_url=config.openrouter_base_url,
+        api_key=config.openrouter_api_key,
+        model=body["model"],
+    )
+    try:
+        return 200, client.chat.completions.create(**body).model_dump()
+    except APIStatusError as e:
+        return e.status_code, {"error": {"message": str(e)}}
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for a provider batch API.
+
+    Each batch is a directory with the input file, the output written line
+    by line and a state file. Requests are sent by a handler, the pooled
+    interactive client by default, a few at a time in a background thread.
+    A batch left unfinished by a stopped process is resumed the next time
+    its status is checked, skipping the requests already answered.
+    """
+
+    # Seconds without progress after which an unfinished batch is taken over
+    STALE_AFTER = 600.0
+
+    def __init__(self, directory: Path, handler: BatchHandler | None = None, concurrency: int = 2):
+        self.directory = Path(directory)
+        self.handler = handler or send_with_client
+        self.concurrency = concurrency
+        self._running: set[str] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, input_path: Path) -> str:
+        batch_id = f"local-{uuid.uuid4().hex}"
+        batch_dir = self.directory / batch_id
+        batch_dir.mkdir(parents=True)
+        shutil.copyfile(input_path, batch_dir / "input.jsonl")
+        with open(batch_dir / "input.jsonl") as f:
+            total = sum(1 for line in f if line.strip())
+        self._write_state(batch_id, BatchStatus(state="in_progress", total=total))
+        self._start(batch_id)
+        return batch_id
+
+    def status(self, batch_id: str) -> BatchStatus:
+        status = self._read_state(batch_id)
+        state_age = time.time() - (self.directory / batch_id / "state.json").stat().st_mtime
+        if not status.done and state_age > self.STALE_AFTER:
+            # The process running it went away, resume where it stopped
+            self._start(batch_id)
+        return status
+
+    def download_results(self, batch_id: str, output_path: Path) -> None:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.directory / batch_id / "output.jsonl", output_path)
+
+    def _start(self, batch_id: str):
+        with self._lock:
+            if batch_id in self._running:
+                return
+            self._running.add(batch_id)
+        threading.Thread(target=self._run, args=(batch_id,), name=f"batch-{batch_id}", daemon=True).start()
+
+    def _run(self, batch_id: str):
+        batch_dir = self.directory / batch_id
+        output_path = batch_dir / "output.jsonl"
+        try:
+            done = read_batch_results(output_path) if output_path.exists() else {}
+            with open(batch_dir / "input.jsonl") as f:
+                pending = [json.loads(line) for line in f if line.strip()]
+            pending = [request for request in pending if request["custom_id"] not in done]
+
+            status = self._read_state(batch_id)
+            status.completed = sum(1 for result in done.values() if not result.get("error"))
+            status.failed = len(done) - status.completed
+            write_lock = threading.Lock()
+
+            def run_request(request: dict[str, Any]):
+                try:
+                    status_code, body = self.handler(request["body"])
+                    result = {"status_code": status_code, "body": body}
+                    error = None if status_code == 200 else body.get("error", {"message": f"HTTP {status_code}"})
+                except Exception as e:
+                    result, error = None, {"message": f"{type(e).__name__}: {e}"}
+                line = {"id": uuid.uuid4().hex, "custom_id": request["custom_id"], "response": result, "error": error}
+                with write_lock:
+                    with open(output_path, "a") as out:
+                        out.write(json.dumps(line) + "\n")
+                    if error:
+                        status.failed += 1
+                    else:
+                        status.completed += 1
+                    self._write_state(batch_id, status)
+
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(run_request, pending))
+
+            output_path.touch()
+            status.state = "completed"
+            self._write_state(batch_id, status)
+        except Exception as e:
+            logger.error(f"Local batch {batch_id} failed: {e}")
+            self._write_state(batch_id, BatchStatus(state="failed"))
+        finally:
+            with self._lock:
+                self._running.discard(batch_id)
+
+    def _read_state(self, batch_id: str) -> BatchStatus:
+        with open(self.directory / batch_id / "state.json") as f:
+            return BatchStatus(**json.load(f))
+
+    def _write_state(self, batch_id: str, status: BatchStatus):
+        # Replace atomically, status may be read from another process
+        state_path = self.directory / batch_id / "state.json"
+        temp_path = state_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(asdict(status)))
+        temp_path.replace(state_path)
+
+
+def wait_for_batch(
+    backend: BatchBackend,
+    batch_id: str,
+    poll_interval: float,
+    timeout: float | None = None,
+    progress: Callable[[BatchStatus], None] | None = None,
+) -> BatchStatus:
+    """Poll a batch until it reaches a terminal state. Raises TimeoutError after timeout seconds."""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        status = backend.status(batch_id)
+        if progress:
+            progress(status)
+        if status.done:
+            return status
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Batch {batch_id} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+
+
+def build_batch_backend() -> BatchBackend:
+    """Create the batch backend configured in settings."""
+    backend_name = config.llm_batch_backend.lower()
+
+    if backend_name == "local":
+        return LocalBatchBackend(Path(config.llm_batch_dir) / "local", concurrency=config.llm_batch_local_concurrency)
+    if backend_name == "openai":
+        return OpenAIBatchBackend(
+            base_url=config.llm_batch_base_url,
+            api_key=config.llm_batch_api_key or config.openrouter_api_key,
+            completion_window=config.llm_batch_completion_window,
+        )
+    raise ValueError(f"Unknown batch backend: {config.llm_batch_backend}")
@@ -0,0 +1,446 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded
+from openai import APIConnectionError, APIStatusError
+
+from src.inference.ratelimit import RateLimitExceeded
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Outcomes of a guarded call
+SUCCESS = "ok"
+FAILURE = "err"
+IGNORED = "ignore"
+
+
+@dataclass(frozen=True)
+class BreakerPolicy:
+    """When the circuit opens and how it recovers."""
+    # Fraction of failed calls in the window that opens the circuit
+    failure_threshold: float = 0.5
+    # Calls needed in the window before the failure rate is trusted
+    min_calls: int = 10
+    window: float = 60.0
+    bucket: float = 5.0
+    # Seconds the circuit stays open before probing
+    open_duration: float = 30.0
+    # Probe calls allowed while half-open, all must succeed to close. Permits
+    # not settled within open_duration, e.g. held by a killed worker, are reissued
+    half_open_calls: int = 3
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that is known to be down."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"LLM provider {name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Whether an error means the provider is down rather than that the request was bad."""
+    if isinstance(error, (APIConnectionError, TimeoutError, SoftTimeLimitExceeded, TimeLimitExceeded)):
+        # Includes timeouts, and tasks killed by their time limit while the provider hangs
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code >= 500 or error.status_code == 429)
+
+
+class BreakerBackend(Protocol):
+    """Storage for circuit state. `allow` returns (allowed, probe, retry_after)."""
+
+    def allow(self, key: str, policy: BreakerPolicy) -> tuple[bool, bool, float]: ...
+
+    def record(self, key: str, policy: BreakerPolicy, outcome: str, probe: bool) -> str: ...
+
+    def state(self, key: str) -> tuple[str, float]: ...
+
+
+class LocalBreakerBackend:
+    """In-process circuit state, used when Redis is not configured or unreachable."""
+
+    def __init__(self):
+        # key -> {"state", "open_until", "probes", "probe_ok", "probes_since", "buckets": {bucket: [ok, err]}}
+        self._circuits: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, policy: BreakerPolicy) -> tuple[bool, bool, float]:
+        with self._lock:
+            circuit = self._get_circuit(key)
+            now = time.monotonic()
+            if circuit["state"] == OPEN:
+                if now < circuit["open_until"]:
+                    return False, False, circuit["open_until"] - now
+                circuit.update(state=HALF_OPEN, probes=0, probe_ok=0, probes_since=now)
+            if circuit["state"] == HALF_OPEN:
+                if circuit["probes"] >= policy.half_open_calls:
+                    if now - circuit["probes_since"] < policy.open_duration:
+                        return False, False, 1.0
+                    # The probes never reported back, their callers are gone
+                    circuit.update(probes=0, probe_ok=0, probes_since=now)
+                circuit["probes"] += 1
+                return True, True, 0.0
+            return True, False, 0.0
+
+    def record(self, key: str, policy: BreakerPolicy, outcome: str, probe: bool) -> str:
+        with self._lock:
+            circuit = self._get_circuit(key)
+            now = time.monotonic()
+            if probe:
+                if circuit["state"] != HALF_OPEN:
+                    return circuit["state"]
+                if outcome == FAILURE:
+                    self._open(circuit, policy, now)
+                elif outcome == IGNORED:
+                    circuit["probes"] = max(circuit["probes"] - 1, 0)
+                else:
+                    circuit["probe_ok"] += 1
+                    if circuit["probe_ok"] >= policy.half_open_calls:
+                        circuit.update(state=CLOSED, buckets={})
+                return circuit["state"]
+
+            if outcome == IGNORED or circuit["state"] != CLOSED:
+                return circuit["state"]
+
+            # Count the call in its time bucket and forget buckets outside the window
+            bucket = math.floor(now / policy.bucket)
+            buckets = circuit["buckets"]
+            buckets.setdefault(bucket, [0, 0])[outcome == FAILURE] += 1
+            oldest = bucket - math.ceil(policy.window / policy.bucket) + 1
+            for stale in [b for b in buckets if b < oldest]:
+                del buckets[stale]
+
+            ok = sum(counts[0] for counts in buckets.values())
+            err = sum(counts[1] for counts in buckets.values())
+            if ok + err >= policy.min_calls and err / (ok + err) >= policy.failure_threshold:
+                self._open(circuit, policy, now)
+            return circuit["state"]
+
+    def state(self, key: str) -> tuple[str, float]:
+        with self._lock:
+            circuit = self._get_circuit(key)
+            if circuit["state"] == OPEN:
+                return OPEN, max(circuit["open_until"] - time.monotonic(), 0.0)
+            return circuit["state"], 0.0
+
+    def _open(self, circuit: dict[str, Any], policy: BreakerPolicy, now: float):
+        circuit.update(state=OPEN, open_until=now + policy.open_duration, buckets={})
+
+    def _get_circuit(self, key: str) -> dict[str, Any]:
+        if key not in self._circuits:
+            self._circuits[key] = {
+                "state": CLOSED, "open_until": 0.0, "probes": 0, "probe_ok": 0, "probes_since": 0.0, "buckets": {},
+            }
+        return self._circuits[key]
+
+
+# Moves an open circuit to half-open once its time is up, then hands out probe
+# permits, reissued once they went unsettled for the open duration. Uses the
+# Redis server clock so every process agrees on timing.
+ALLOW_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+
+if state == 'open' then
+    local open_until = tonumber(redis.call('HGET', KEYS[1], 'open_until'))
+    if now < open_until then
+        return {0, 0, open_until - now}
+    end
+    state = 'half_open'
+    redis.call('HSET', KEYS[1], 'state', state, 'probes', 0, 'probe_ok', 0, 'probes_since', now)
+end
+if state == 'half_open' then
+    if tonumber(redis.call('HGET', KEYS[1], 'probes')) >= tonumber(ARGV[1]) then
+        local probes_since = tonumber(redis.call('HGET', KEYS[1], 'probes_since')) or 0
+        if now - probes_since < tonumber(ARGV[2]) then
+            return {0, 0, 1000}
+        end
+        redis.call('HSET', KEYS[1], 'probes', 0, 'probe_ok', 0, 'probes_since', now)
+    end
+    redis.call('HINCRBY', KEYS[1], 'probes', 1)
+    return {1, 1, 0}
+end
+return {1, 0, 0}
+"""
+
+# Records a call outcome in the sliding window of time buckets, or settles a
+# probe, and opens or closes the circuit accordingly. Returns the new state.
+RECORD_SCRIPT = """
+local outcome = ARGV[1]
+local probe = ARGV[2] == '1'
+local threshold = tonumber(ARGV[3])
+local min_calls = tonumber(ARGV[4])
+local window_ms = tonumber(ARGV[5])
+local bucket_ms = tonumber(ARGV[6])
+local open_ms = tonumber(ARGV[7])
+local half_open_calls = tonumber(ARGV[8])
+
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+
+local function open()
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + open_ms)
+    redis.call('DEL', KEYS[2])
+    return 'open'
+end
+
+if probe then
+    if state ~= 'half_open' then
+        return state
+    end
+    if outcome == 'err' then
+        return open()
+    end
+    if outcome == 'ignore' then
+        if tonumber(redis.call('HGET', KEYS[1], 'probes')) > 0 then
+            redis.call('HINCRBY', KEYS[1], 'probes', -1)
+        end
+        return state
+    end
+    if redis.call('HINCRBY', KEYS[1], 'probe_ok', 1) >= half_open_calls then
+        redis.call('HSET', KEYS[1], 'state', 'closed')
+        redis.call('DEL', KEYS[2])
+        return 'closed'
+    end
+    return state
+end
+
+if outcome == 'ignore' or state ~= 'closed' then
+    return state
+end
+
+local bucket = math.floor(now / bucket_ms)
+local buckets = math.ceil(window_ms / bucket_ms)
+redis.call('HINCRBY', KEYS[2], bucket .. ':' .. outcome, 1)
+redis.call('HDEL', KEYS[2], (bucket - buckets) .. ':ok', (bucket - buckets) .. ':err')
+redis.call('PEXPIRE', KEYS[2], window_ms)
+
+local ok, err = 0, 0
+for b = bucket - buckets + 1, bucket do
+    local counts = redis.call('HMGET', KEYS[2], b .. ':ok', b .. ':err')
+    ok = ok + (tonumber(counts[1]) or 0)
+    err = err + (tonumber(counts[2]) or 0)
+end
+if ok + err >= min_calls and err / (ok + err) >= threshold then
+    return open()
+end
+return state
+"""
+
+
+class RedisBreakerBackend:
+    """Circuit state shared by the API and every worker through Redis."""
+
+    def __init__(self, redis_url: str, prefix: str = "llm-breaker:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        self.prefix = prefix
+        self._allow = self.client.register_script(ALLOW_SCRIPT)
+        self._record = self.client.register_script(RECORD_SCRIPT)
+
+    def allow(self, key: str, policy: BreakerPolicy) -> tuple[bool, bool, float]:
+        allowed, probe, retry_after_ms = self._allow(
+            keys=[self.prefix + key], args=[policy.half_open_calls, int(policy.open_duration * 1000)]
+        )
+        return bool(allowed), bool(probe), retry_after_ms / 1000
+
+    def record(self, key: str, policy: BreakerPolicy, outcome: str, probe: bool) -> str:
+        state = self._record(
+            keys=[self.prefix + key, f"{self.prefix}{key}:window"],
+            args=[
+                outcome, int(probe), policy.failure_threshold, policy.min_calls,
+                int(policy.window * 1000), int(policy.bucket * 1000),
+                int(policy.open_duration * 1000), policy.half_open_calls,
+            ],
+        )
+        return state.decode()
+
+    def state(self, key: str) -> tuple[str, float]:
+        state, open_until = self.client.hmget(self.prefix + key, "state", "open_until")
+        if state is None or state.decode() != OPEN:
+            return (state.decode() if state else CLOSED), 0.0
+        seconds, microseconds = self.client.time()
+        return OPEN, max(int(open_until) / 1000 - seconds - microseconds / 1e6, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the LLM provider is down.
+
+    Calls are counted in a sliding window. Once enough of them fail with
+    connection errors, timeouts, 5xx or 429 responses, the circuit opens and
+    calls raise CircuitOpenError without reaching the provider. After the
+    open duration a few probe calls are let through. The circuit closes when
+    they all succeed and reopens on the first failure. Other errors, such
+    as unparseable output, mean the provider answered and count as success.
+    With a shared backend the API and every worker see the same circuit.
+    """
+
+    # Seconds to stay on the local circuit after the shared backend fails
+    BACKEND_RETRY_INTERVAL = 30.0
+
+    def __init__(self, backend: BreakerBackend | None, policy: BreakerPolicy, name: str):
+        self.backend = backend
+        self.fallback = LocalBreakerBackend()
+        self.policy = policy
+        self.name = name
+        self.rejected = 0
+        self.probes = 0
+        self.opened = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._backend_retry_at = 0.0
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Run a provider call through the breaker. Raises CircuitOpenError while it is open."""
+        probe = self._allow()
+        try:
+            yield
+        except BaseException as e:
+            self._record(self._outcome(e), probe)
+            raise
+        self._record(SUCCESS, probe)
+
+    @asynccontextmanager
+    async def guard_async(self) -> AsyncIterator[None]:
+        """Async variant of guard. Shared backends are called off the event loop."""
+        probe = await self._run(self._allow)
+        try:
+            yield
+        except BaseException as e:
+            await self._run(self._record, self._outcome(e), probe)
+            raise
+        await self._run(self._record, SUCCESS, probe)
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if a call would be rejected now, without taking a probe permit."""
+        state, retry_after = self.state()
+        if state == OPEN:
+            self._count("rejected")
+            raise CircuitOpenError(self.name, retry_after)
+
+    def state(self) -> tuple[str, float]:
+        """Current state and the seconds until an open circuit starts probing."""
+        try:
+            return self._backend().state(self.name)
+        except Exception as e:
+            self._backend_failed(e)
+            return self.fallback.state(self.name)
+
+    def stats(self) -> dict[str, Any]:
+        state, retry_after = self.state()
+        return {
+            "backend": type(self.backend or self.fallback).__name__,
+            "state": state,
+            "retry_after": round(retry_after, 1),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "probes": self.probes,
+            "fallbacks": self.fallbacks,
+        }
+
+    def _allow(self) -> bool:
+        backend = self._backend()
+        try:
+            allowed, probe, retry_after = backend.allow(self.name, self.policy)
+        except Exception as e:
+            self._backend_failed(e)
+            allowed, probe, retry_after = self.fallback.allow(self.name, self.policy)
+        if not allowed:
+            self._count("rejected")
+            raise CircuitOpenError(self.name, retry_after)
+        if probe:
+            self._count("probes")
+        return probe
+
+    def _record(self, outcome: str, probe: bool) -> None:
+        backend = self._backend()
+        try:
+            state = backend.record(self.name, self.policy, outcome, probe)
+        except Exception as e:
+            self._backend_failed(e)
+            state = self.fallback.record(self.name, self.policy, outcome, probe)
+        if state == OPEN and outcome == FAILURE:
+            # Only the call that tripped the circuit sees this transition
+            self._count("opened")
+            logger.error(f"Circuit for LLM provider {self.name} is open, failing fast for {self.policy.open_duration}s")
+
+    @staticmethod
+    def _outcome(error: BaseException) -> str:
+        if is_provider_failure(error):
+            return FAILURE
+        if isinstance(error, Exception) and not isinstance(error, RateLimitExceeded):
+            # The provider answered, the request or its output was the problem
+            return SUCCESS
+        # Our own rate limit or a cancelled call, e.g. a losing hedge, says nothing either way
+        return IGNORED
+
+    async def _run(self, fn, *args):
+        if self.backend is not None and time.monotonic() >= self._backend_retry_at:
+            # Shared backends do network I/O
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _backend(self) -> BreakerBackend:
+        if self.backend is not None and time.monotonic() >= self._backend_retry_at:
+            return self.backend
+        if self.backend is not None:
+            self._count("fallbacks")
+        return self.fallback
+
+    def _backend_failed(self, error: Exception):
+        # A broken breaker store must not stop predictions, nor cost a timeout on every call
+        logger.warning(f"Shared circuit breaker unavailable, using a local circuit for {self.BACKEND_RETRY_INTERVAL}s: {error}")
+        self._backend_retry_at = time.monotonic() + self.BACKEND_RETRY_INTERVAL
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def build_circuit_breaker() -> CircuitBreaker | None:
+    """Create the circuit breaker configured in settings, or None when disabled."""
+    backend_name = config.llm_breaker_backend.lower()
+
+    backend: BreakerBackend | None
+    if backend_name == "none":
+        return None
+    if backend_name == "redis":
+        backend = RedisBreakerBackend(redis_url=config.redis_url)
+    elif backend_name == "memory":
+        backend = None
+    else:
+        raise ValueError(f"Unknown circuit breaker backend: {config.llm_breaker_backend}")
+
+    return CircuitBreaker(
+        backend=backend,
+        policy=BreakerPolicy(
+            failure_threshold=config.llm_breaker_failure_threshold,
+            min_calls=config.llm_breaker_min_calls,
+            window=config.llm_breaker_window,
+            open_duration=config.llm_breaker_open_duration,
+            half_open_calls=config.llm_breaker_half_open_calls,
+        ),
+        name=config.openrouter_base_url,
+    )
+
+
+# Global circuit breaker around the LLM provider
+circuit_breaker = build_circuit_breaker()
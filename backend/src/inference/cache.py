@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Protocol
+
+from src.schemas import DetectionResult
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    """Storage backend for serialized predictions."""
+
+    # Whether calls do I/O and should run off the event loop
+    blocking: bool
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes) -> None: ...
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry TTL."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DiskCacheBackend:
+    """Local directory cache, one file per entry, expired by modification time."""
+
+    blocking = True
+
+    # Only scan the directory for eviction every N writes
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, directory: Path, max_entries: int, ttl: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._writes = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            if path.stat().st_mtime + self.ttl < time.time():
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        # Write to a temp file first so concurrent readers never see partial data
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(value)
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % self.EVICTION_INTERVAL == 0:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        cutoff = time.time() - self.ttl
+        excess = len(entries) - self.max_entries
+        for index, entry in enumerate(entries):
+            if index < excess or entry.stat().st_mtime < cutoff:
+                Path(entry.path).unlink(missing_ok=True)
+
+
+class RedisCacheBackend:
+    """Shared Redis cache. Entries expire by TTL; size is bounded by Redis maxmemory policy."""
+
+    blocking = True
+
+    def __init__(self, redis_url: str, ttl: int, prefix: str = "prediction-cache:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+
+class PredictionCache:
+    """Content-addressed cache of detection results with hit/miss counters."""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        *,
+        image_data: bytes,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        **params: Any,
+    ) -> str:
+        """
+        Build a cache key from the image content and every input that affects the output.
+
+        Args:
+            image_data: Raw image bytes
+            model: Model identifier
+            system_prompt: System prompt sent to the model
+            user_prompt: User prompt sent to the model
+            temperature: Sampling temperature
+            **params: Extra request parameters that change the result
+
+        Returns:
+            Hex SHA-256 digest
+        """
+        digest = hashlib.sha256(image_data)
+        for part in (model, system_prompt, user_prompt, repr(temperature), repr(sorted(params.items()))):
+            digest.update(b"\0")
+            digest.update(part.encode())
+        return digest.hexdigest()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> DetectionResult | None:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never fail a prediction
+            logger.warning(f"Prediction cache read failed: {e}")
+            self._count("errors")
+            value = None
+
+        if value is None:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return DetectionResult.model_validate_json(value)
+
+    def set(self, key: str, result: DetectionResult) -> None:
+        try:
+            self.backend.set(key, result.model_dump_json().encode())
+        except Exception as e:
+            logger.warning(f"Prediction cache write failed: {e}")
+            self._count("errors")
+
+    async def aget(self, key: str) -> DetectionResult | None:
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, result: DetectionResult) -> None:
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set, key, result)
+        else:
+            self.set(key, result)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_prediction_cache() -> PredictionCache | None:
+    """Create the prediction cache configured in settings, or None when disabled."""
+    backend_name = config.prediction_cache_backend.lower()
+
+    if backend_name == "none":
+        return None
+    if backend_name == "memory":
+        backend = MemoryCacheBackend(
+            max_entries=config.prediction_cache_max_entries,
+            ttl=config.prediction_cache_ttl,
+        )
+    elif backend_name == "disk":
+        backend = DiskCacheBackend(
+            directory=Path(config.prediction_cache_dir),
+            max_entries=config.prediction_cache_max_entries,
+            ttl=config.prediction_cache_ttl,
+        )
+    elif backend_name == "redis":
+        backend = RedisCacheBackend(
+            redis_url=config.redis_url,
+            ttl=config.prediction_cache_ttl,
+        )
+    else:
+        raise ValueError(f"Unknown prediction cache backend: {config.prediction_cache_backend}")
+
+    return PredictionCache(backend)
+
+
+# Global prediction cache
+prediction_cache = build_prediction_cache()
@@ -0,0 +1,110 @@
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+from src.inference.tiling import box_overlap
+from src.schemas import DetectionResult
+from src.settings import config
+
+# Boxes overlapping another box above this IoU count as overlapping
+OVERLAP_IOU = 0.5
+
+
+@dataclass(frozen=True)
+class CascadeOptions:
+    """When a fast model's answer is trusted and when the strong model is asked instead."""
+    enabled: bool = False
+    fast_model: str = "openai/gpt-4o-mini"
+    # Escalate when fewer elements than this were found
+    min_elements: int = 1
+    # Escalate when the element count is low for the image area, e.g. a busy page with two boxes
+    min_elements_per_megapixel: float = 2.0
+    # Escalate when the output was not valid JSON and had to be repaired
+    escalate_on_repair: bool = True
+    # Escalate when more than this fraction of boxes overlap another box
+    max_overlap: float = 0.25
+
+    @classmethod
+    def from_settings(cls) -> "CascadeOptions":
+        return cls(
+            enabled=config.cascade_enabled,
+            fast_model=config.cascade_fast_model,
+            min_elements=config.cascade_min_elements,
+            min_elements_per_megapixel=config.cascade_min_elements_per_megapixel,
+            escalate_on_repair=config.cascade_escalate_on_repair,
+            max_overlap=config.cascade_max_overlap,
+        )
+
+    def __post_init__(self):
+        if self.min_elements < 0 or self.min_elements_per_megapixel < 0:
+            raise ValueError("Cascade element thresholds must not be negative")
+        if not 0 <= self.max_overlap <= 1:
+            raise ValueError("Cascade overlap threshold must be in [0, 1]")
+
+
+def escalation_reasons(result: DetectionResult, image_size: tuple[int, int], options: CascadeOptions) -> list[str]:
+    """Why a fast-tier result looks too weak to return, empty when it can be kept."""
+    reasons = []
+    annotations = result.annotations
+
+    megapixels = image_size[0] * image_size[1] / 1e6
+    if len(annotations) < max(options.min_elements, options.min_elements_per_megapixel * megapixels):
+        reasons.append("few_elements")
+
+    if options.escalate_on_repair and result.json_repaired:
+        reasons.append("json_repaired")
+
+    if len(annotations) > 1:
+        overlapping = sum(
+            1 for i, annotation in enumerate(annotations)
+            if any(box_overlap(annotation, other)[0] > OVERLAP_IOU for j, other in enumerate(annotations) if j != i)
+        )
+        if overlapping / len(annotations) > options.max_overlap:
+            reasons.append("overlapping_boxes")
+
+    return reasons
+
+
+class CascadeStats:
+    """Escalation counters and per-tier latency of the model cascade."""
+
+    def __init__(self):
+        self.images = 0
+        self.escalated = 0
+        self.reasons: dict[str, int] = {}
+        self.tier_calls = {"fast": 0, "strong": 0}
+        self.tier_time = {"fast": 0.0, "strong": 0.0}
+        self._lock = threading.Lock()
+
+    def record_tier(self, tier: str, elapsed: float):
+        with self._lock:
+            self.tier_calls[tier] += 1
+            self.tier_time[tier] += elapsed
+
+    def record_outcome(self, reasons: list[str]):
+        with self._lock:
+            self.images += 1
+            if reasons:
+                self.escalated += 1
+            for reason in reasons:
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "images": self.images,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / self.images, 4) if self.images else None,
+                "reasons": dict(self.reasons),
+                "tiers": {
+                    tier: {
+                        "calls": calls,
+                        "avg_latency_ms": round(self.tier_time[tier] / calls * 1000, 2) if calls else None,
+                    }
+                    for tier, calls in self.tier_calls.items()
+                },
+            }
+
+
+# Global cascade counters
+cascade_stats = CascadeStats()
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Cassette modes
+OFF = "off"
+RECORD = "record"  # Call the provider and store every successful response
+REPLAY = "replay"  # Serve stored responses only, unknown requests get a 404
+AUTO = "auto"  # Serve stored responses, call the provider and record on a miss
+MODES = {OFF, RECORD, REPLAY, AUTO}
+
+# Latency simulated on replay
+LATENCY_NONE = "none"
+LATENCY_RECORDED = "recorded"  # What the provider took when the response was recorded
+LATENCY_LOGNORMAL = "lognormal"  # Drawn around a median, like real completion latencies
+
+# Statuses of simulated provider errors
+SIMULATED_ERRORS = (429, 500, 503)
+
+# Response headers that no longer apply once the body is stored decoded
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class Cassette:
+    """
+    Recorded LLM responses for running the API, workers and CLI without a provider.
+
+    Requests are identified by a fingerprint of the method, path and JSON
+    body, which includes the model, prompts and image. Each recorded
+    response is one JSON file in the cassette directory. On replay,
+    responses can be delayed by the recorded or a simulated latency and
+    replaced by provider errors at a given rate. A seed makes the
+    simulation repeatable.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        mode: str = REPLAY,
+        latency: str = LATENCY_RECORDED,
+        latency_median: float = 2.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        if mode not in MODES - {OFF}:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if latency not in (LATENCY_NONE, LATENCY_RECORDED, LATENCY_LOGNORMAL):
+            raise ValueError(f"Unknown cassette latency: {latency}")
+        if not 0 <= error_rate <= 1:
+            raise ValueError("Cassette error rate must be in [0, 1]")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.latency = latency
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.simulated_errors = 0
+
+    @staticmethod
+    def fingerprint(request: httpx.Request) -> str:
+        try:
+            body = json.dumps(json.loads(request.content), sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            body = request.content.decode(errors="replace")
+        digest = hashlib.sha256(f"{request.method} {request.url.path}\n".encode())
+        digest.update(body.encode())
+        return digest.hexdigest()
+
+    def _path(self, fingerprint: str) -> Path:
+        return self.directory / f"{fingerprint}.json"
+
+    def lookup(self, request: httpx.Request) -> tuple[dict[str, Any] | None, float]:
+        """Recorded entry for the request and the seconds to wait before serving it."""
+        path = self._path(self.fingerprint(request))
+        try:
+            entry = json.loads(path.read_text())
+        except FileNotFoundError:
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None, 0.0
+            self.hits += 1
+            if self.latency == LATENCY_RECORDED:
+                delay = entry.get("elapsed", 0.0)
+            elif self.latency == LATENCY_LOGNORMAL:
+                delay = self._random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+            else:
+                delay = 0.0
+        return entry, delay
+
+    def replay(self, request: httpx.Request, entry: dict[str, Any]) -> httpx.Response:
+        """The recorded response, or a simulated provider error at the configured rate."""
+        with self._lock:
+            status_code = None
+            if self.error_rate and self._random.random() < self.error_rate:
+                status_code = self._random.choice(SIMULATED_ERRORS)
+                self.simulated_errors += 1
+        if status_code is not None:
+            headers = {"retry-after": "1"} if status_code == 429 else {}
+            return httpx.Response(
+                status_code,
+                headers=headers,
+                json={"error": {"message": f"Simulated provider error ({status_code})"}},
+                request=request,
+            )
+        return httpx.Response(
+            entry["status_code"],
+            headers=entry["headers"],
+            content=entry["body"].encode(),
+            request=request,
+        )
+
+    def miss(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            404,
+            json={"error": {"message": f"No recorded response in cassette {self.directory} for this request"}},
+            request=request,
+        )
+
+    def record(self, request: httpx.Request, response: httpx.Response, elapsed: float) -> httpx.Response:
+        """Store a read provider response and return a copy to hand to the client."""
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        body = response.content.decode(errors="replace")
+        if response.status_code < 400:
+            entry = {
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": response.status_code,
+                "headers": headers,
+                "body": body,
+                "elapsed": round(elapsed, 3),
+                "recorded_at": time.time(),
+            }
+            path = self._path(self.fingerprint(request))
+            # Write to a temp file first so concurrent readers never see partial data
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(json.dumps(entry))
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.recorded += 1
+        return httpx.Response(response.status_code, headers=headers, content=response.content, request=request)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "directory": str(self.directory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+                "simulated_errors": self.simulated_errors,
+            }
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport that records to or replays from a cassette, around the real transport."""
+
+    def __init__(self, cassette: Cassette, transport: httpx.BaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.cassette.mode in (REPLAY, AUTO):
+            entry, delay = self.cassette.lookup(request)
+            if entry is not None:
+                time.sleep(delay)
+                return self.cassette.replay(request, entry)
+            if self.cassette.mode == REPLAY:
+                return self.cassette.miss(request)
+
+        start_time = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            response.read()
+        finally:
+            response.close()
+        return self.cassette.record(request, response, time.perf_counter() - start_time)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async variant of CassetteTransport."""
+
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.cassette.mode in (REPLAY, AUTO):
+            # Reads a small file, not worth a thread hop
+            entry, delay = self.cassette.lookup(request)
+            if entry is not None:
+                await asyncio.sleep(delay)
+                return self.cassette.replay(request, entry)
+            if self.cassette.mode == REPLAY:
+                return self.cassette.miss(request)
+
+        start_time = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return await asyncio.to_thread(self.cassette.record, request, response, time.perf_counter() - start_time)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def build_cassette() -> Cassette | None:
+    """Create the cassette configured in settings, or None when LLM calls go to the provider directly."""
+    mode = config.llm_cassette_mode.lower()
+    if mode == OFF:
+        return None
+    cassette = Cassette(
+        directory=Path(config.llm_cassette_dir),
+        mode=mode,
+        latency=config.llm_cassette_latency.lower(),
+        latency_median=config.llm_cassette_latency_median,
+        latency_sigma=config.llm_cassette_latency_sigma,
+        error_rate=config.llm_cassette_error_rate,
+        seed=config.llm_cassette_seed,
+    )
+    logger.info(f"LLM cassette in {mode} mode at {cassette.directory}")
+    return cassette
+
+
+# Global cassette, None unless LLM_CASSETTE_MODE is set
+cassette = build_cassette()
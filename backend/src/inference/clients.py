@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from src.inference.cassette import AsyncCassetteTransport, CassetteTransport, cassette
+from src.inference.telemetry import CallRecord, current_call
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# (base_url, api_key, model)
+ClientKey = tuple[str, str, str]
+
+# httpcore trace events fired when the response status line and headers arrive
+RESPONSE_HEADERS_EVENTS = frozenset({
+    "http11.receive_response_headers.complete",
+    "http2.receive_response_headers.complete",
+})
+
+
+def _start_call_record(request: httpx.Request) -> CallRecord | None:
+    """Attach the request to the LLM call record of the calling context, if any."""
+    record = current_call()
+    if record is not None:
+        content_length = request.headers.get("content-length")
+        record.request_bytes = int(content_length) if content_length else None
+        record.mark_request_sent()
+    return record
+
+
+@dataclass
+class ConnectionStats:
+    """Connection reuse counters for a single pooled client."""
+    base_url: str
+    model: str
+    requests: int = 0
+    new_connections: int = 0
+    tls_handshakes: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_trace(self, event_name: str) -> None:
+        """Count connection setup events reported by httpcore."""
+        if event_name == "connection.connect_tcp.complete":
+            self.increment("new_connections")
+        elif event_name == "connection.start_tls.complete":
+            self.increment("tls_handshakes")
+
+    @property
+    def reused_connections(self) -> int:
+        """Requests that were served over an already open connection."""
+        return max(self.requests - self.new_connections, 0)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connections": self.reused_connections,
+        }
+
+
+class LLMClientRegistry:
+    """
+    Process-wide registry of LLM clients with keep-alive connection pools.
+
+    Clients are keyed by (base_url, api_key, model) and created lazily. Async
+    clients are additionally scoped to the event loop that created them. After
+    a fork (e.g. Celery prefork workers) the child drops the inherited clients
+    and builds its own, so sockets are never shared between processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: dict[ClientKey, OpenAI] = {}
+        self._async_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[ClientKey, AsyncOpenAI]
+        ] = weakref.WeakKeyDictionary()
+        self._stats: dict[ClientKey, ConnectionStats] = {}
+        # Clients inherited from a parent process. They are kept referenced but
+        # never closed here, closing them would tear down the parent's sockets.
+        self._inherited: list[OpenAI | AsyncOpenAI] = []
+        self._pid = os.getpid()
+
+    def get_client(self, *, base_url: str, api_key: str, model: str) -> OpenAI:
+        """Return the pooled client for the given endpoint, creating it if needed."""
+        self._check_pid()
+        key = (base_url, api_key, model)
+
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._create_client(key)
+                    self._clients[key] = client
+        return client
+
+    def get_async_client(self, *, base_url: str, api_key: str, model: str) -> AsyncOpenAI:
+        """Return the pooled async client for the running event loop."""
+        self._check_pid()
+        key = (base_url, api_key, model)
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            loop_clients = self._async_clients.setdefault(loop, {})
+            client = loop_clients.get(key)
+            if client is None:
+                client = self._create_async_client(key)
+                loop_clients[key] = client
+        return client
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Connection reuse counters for every client in this process."""
+        return [stats.to_dict() for stats in list(self._stats.values())]
+
+    def close(self):
+        """Close all sync clients owned by this process."""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+    async def aclose(self):
+        """Close the async clients bound to the running event loop."""
+        with self._lock:
+            loop_clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in loop_clients.values():
+            await client.close()
+
+    def _check_pid(self):
+        # Covers forks that bypass os.register_at_fork hooks
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._inherited.extend(self._clients.values())
+        for loop_clients in self._async_clients.values():
+            self._inherited.extend(loop_clients.values())
+        self._clients = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def _get_stats(self, key: ClientKey) -> ConnectionStats:
+        base_url, _api_key, model = key
+        if key not in self._stats:
+            self._stats[key] = ConnectionStats(base_url=base_url, model=model)
+        return self._stats[key]
+
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        return httpx.Timeout(config.llm_request_timeout, connect=config.llm_connect_timeout)
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=config.llm_max_connections,
+            max_keepalive_connections=config.llm_max_keepalive_connections,
+            keepalive_expiry=config.llm_keepalive_expiry,
+        )
+
+    def _create_client(self, key: ClientKey) -> OpenAI:
+        base_url, api_key, model = key
+        stats = self._get_stats(key)
+
+        def on_request(request: httpx.Request) -> None:
+            stats.increment("requests")
+            record = _start_call_record(request)
+
+            def trace(event_name: str, _info: dict[str, Any]) -> None:
+                stats.record_trace(event_name)
+                if record is not None and event_name in RESPONSE_HEADERS_EVENTS:
+                    record.mark_first_byte()
+
+            request.extensions["trace"] = trace
+
+        # Recorded responses are served in place of the provider's in cassette mode
+        transport = None
+        if cassette is not None:
+            transport = CassetteTransport(cassette, httpx.HTTPTransport(limits=self._limits()))
+
+        http_client = DefaultHttpxClient(
+            limits=self._limits(),
+            timeout=self._timeout(),
+            transport=transport,
+            event_hooks={"request": [on_request]},
+        )
+
+        logger.info(f"Creating pooled LLM client for {base_url} ({model}) in process {os.getpid()}")
+        return OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=self._timeout(),
+            # Retries are made by the caller's RetryPolicy, so they are not stacked on top of the SDK's
+            max_retries=0,
+            http_client=http_client,
+        )
+
+    def _create_async_client(self, key: ClientKey) -> AsyncOpenAI:
+        base_url, api_key, model = key
+        stats = self._get_stats(key)
+
+        async def on_request(request: httpx.Request) -> None:
+            stats.increment("requests")
+            record = _start_call_record(request)
+
+            # httpcore awaits trace callbacks on async connections
+            async def trace(event_name: str, _info: dict[str, Any]) -> None:
+                stats.record_trace(event_name)
+                if record is not None and event_name in RESPONSE_HEADERS_EVENTS:
+                    record.mark_first_byte()
+
+            request.extensions["trace"] = trace
+
+        transport = None
+        if cassette is not None:
+            transport = AsyncCassetteTransport(cassette, httpx.AsyncHTTPTransport(limits=self._limits()))
+
+        http_client = DefaultAsyncHttpxClient(
+            limits=self._limits(),
+            timeout=self._timeout(),
+            transport=transport,
+            event_hooks={"request": [on_request]},
+        )
+
+        logger.info(f"Creating pooled async LLM client for {base_url} ({model}) in process {os.getpid()}")
+        return AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=self._timeout(),
+            # Retries are made by the caller's RetryPolicy, so they are not stacked on top of the SDK's
+            max_retries=0,
+            http_client=http_client,
+        )
+
+
+# Global client registry
+llm_clients = LLMClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=llm_clients._reset_after_fork)
@@ -0,0 +1,561 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+import httpx
+from openai import APIStatusError, APITimeoutError, RateLimitError
+
+from src.inference.ratelimit import RateLimitExceeded
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Provider responses that mean it is overloaded rather than that the request was bad
+OVERLOAD_STATUS_CODES = frozenset({429, 503, 529})
+
+
+@dataclass(frozen=True)
+class ConcurrencyPolicy:
+    """Additive increase, multiplicative decrease bounds for the in-flight limit."""
+    initial: float = 4
+    min_limit: float = 1
+    max_limit: float = 32
+    # Added to the limit over one limit's worth of successful calls
+    increase: float = 1.0
+    # Factor applied to the limit on overload
+    decrease: float = 0.5
+
+    def __post_init__(self):
+        if not 1 <= self.min_limit <= self.initial <= self.max_limit:
+            raise ValueError("Concurrency limits must satisfy 1 <= min <= initial <= max")
+        if not 0 < self.decrease < 1:
+            raise ValueError("Concurrency decrease must be between 0 and 1")
+
+    @classmethod
+    def from_settings(cls, initial: float | None = None) -> "ConcurrencyPolicy":
+        return cls(
+            initial=config.llm_concurrency_initial if initial is None else initial,
+            min_limit=config.llm_concurrency_min,
+            max_limit=config.llm_concurrency_max,
+            decrease=config.llm_concurrency_decrease,
+        )
+
+    def increased(self, limit: float) -> float:
+        return min(self.max_limit, limit + self.increase / limit)
+
+    def decreased(self, limit: float) -> float:
+        return max(self.min_limit, limit * self.decrease)
+
+
+class ConcurrencyLimitExceeded(RateLimitExceeded):
+    """Raised when no in-flight slot frees up within the maximum wait."""
+
+
+def is_overload(error: BaseException) -> bool:
+    """Whether an error signals that the provider is overloaded."""
+    if isinstance(error, (RateLimitError, RateLimitExceeded, APITimeoutError, httpx.TimeoutException)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in OVERLOAD_STATUS_CODES
+
+
+class ConcurrencyBackend(Protocol):
+    """
+    Storage for the adaptive limit and the slots held against it.
+
+    Every decrease starts a new generation. A slot remembers the generation it
+    was acquired in, so a burst of failures from one round of requests cuts
+    the limit only once, like a congestion window is cut once per round trip.
+    """
+
+    def try_acquire(self, key: str, lease: str, policy: ConcurrencyPolicy, ttl: float) -> tuple[bool, int]: ...
+
+    def release(self, key: str, lease: str) -> None: ...
+
+    def feedback(self, key: str, policy: ConcurrencyPolicy, overloaded: bool, generation: int) -> float: ...
+
+    def current(self, key: str, policy: ConcurrencyPolicy) -> tuple[float, int]: ...
+
+    def listen(self, key: str, on_release: Callable[[], None]) -> None:
+        """Call on_release whenever any process frees a slot. Blocks until the backend fails."""
+        ...
+
+
+class LocalConcurrencyBackend:
+    """In-process limit and slots, used when Redis is not configured or unreachable."""
+
+    def __init__(self):
+        # key -> [limit, generation, leases]
+        self._state: dict[str, list[Any]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, lease: str, policy: ConcurrencyPolicy, ttl: float) -> tuple[bool, int]:
+        with self._lock:
+            state = self._get_state(key, policy)
+            if len(state[2]) >= math.floor(state[0]):
+                return False, state[1]
+            state[2].add(lease)
+            return True, state[1]
+
+    def release(self, key: str, lease: str) -> None:
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None:
+                state[2].discard(lease)
+
+    def feedback(self, key: str, policy: ConcurrencyPolicy, overloaded: bool, generation: int) -> float:
+        with self._lock:
+            state = self._get_state(key, policy)
+            if not overloaded:
+                state[0] = policy.increased(state[0])
+            elif generation == state[1]:
+                state[0] = policy.decreased(state[0])
+                state[1] += 1
+            return state[0]
+
+    def current(self, key: str, policy: ConcurrencyPolicy) -> tuple[float, int]:
+        with self._lock:
+            state = self._get_state(key, policy)
+            return state[0], len(state[2])
+
+    def listen(self, key: str, on_release: Callable[[], None]) -> None:
+        # Slots are only freed in this process, and the limiter wakes its own waiters
+        return
+
+    def _get_state(self, key: str, policy: ConcurrencyPolicy) -> list[Any]:
+        if key not in self._state:
+            self._state[key] = [float(policy.initial), 0, set()]
+        return self._state[key]
+
+
+# Drops expired slots, then takes one if the limit allows. Slots expire so a
+# crashed holder cannot shrink the limit forever.
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+
+local state = redis.call('HMGET', KEYS[1], 'limit', 'generation')
+local limit = tonumber(state[1]) or tonumber(ARGV[3])
+local generation = tonumber(state[2]) or 0
+
+local acquired = 0
+if redis.call('ZCARD', KEYS[2]) < math.floor(limit) then
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), ARGV[1])
+    acquired = 1
+end
+redis.call('PEXPIRE', KEYS[2], tonumber(ARGV[2]))
+return {acquired, generation}
+"""
+
+# Applies one AIMD step. A decrease only counts for slots of the current generation.
+FEEDBACK_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'limit', 'generation')
+local limit = tonumber(state[1]) or tonumber(ARGV[3])
+local generation = tonumber(state[2]) or 0
+local min_limit = tonumber(ARGV[4])
+local max_limit = tonumber(ARGV[5])
+
+if ARGV[1] == '0' then
+    limit = math.min(max_limit, limit + tonumber(ARGV[6]) / limit)
+elseif tonumber(ARGV[2]) == generation then
+    limit = math.max(min_limit, limit * tonumber(ARGV[7]))
+    generation = generation + 1
+end
+
+redis.call('HSET', KEYS[1], 'limit', limit, 'generation', generation)
+redis.call('EXPIRE', KEYS[1], 86400)
+return tostring(limit)
+"""
+
+
+class RedisConcurrencyBackend:
+    """Limit and slots shared by every process through Redis."""
+
+    # Seconds each read of the release channel blocks for
+    LISTEN_TIMEOUT = 0.5
+
+    def __init__(self, redis_url: str, prefix: str = "llm-concurrency:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        self.prefix = prefix
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._feedback = self.client.register_script(FEEDBACK_SCRIPT)
+
+    def try_acquire(self, key: str, lease: str, policy: ConcurrencyPolicy, ttl: float) -> tuple[bool, int]:
+        acquired, generation = self._acquire(
+            keys=[f"{self.prefix}{key}", f"{self.prefix}{key}:leases"],
+            args=[lease, int(ttl * 1000), policy.initial],
+        )
+        return bool(acquired), int(generation)
+
+    def release(self, key: str, lease: str) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrem(f"{self.prefix}{key}:leases", lease)
+        # Wakes the callers waiting for a slot in every process
+        pipe.publish(f"{self.prefix}{key}:released", lease)
+        pipe.execute()
+
+    def feedback(self, key: str, policy: ConcurrencyPolicy, overloaded: bool, generation: int) -> float:
+        return float(self._feedback(
+            keys=[f"{self.prefix}{key}"],
+            args=[int(overloaded), generation, policy.initial, policy.min_limit, policy.max_limit,
+                  policy.increase, policy.decrease],
+        ))
+
+    def current(self, key: str, policy: ConcurrencyPolicy) -> tuple[float, int]:
+        limit = self.client.hget(f"{self.prefix}{key}", "limit")
+        in_flight = self.client.zcount(f"{self.prefix}{key}:leases", int(time.time() * 1000), "+inf")
+        return float(limit) if limit is not None else float(policy.initial), in_flight
+
+    def listen(self, key: str, on_release: Callable[[], None]) -> None:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(f"{self.prefix}{key}:released")
+            while True:
+                if pubsub.get_message(timeout=self.LISTEN_TIMEOUT) is not None:
+                    on_release()
+        finally:
+            pubsub.close()
+
+
+class Slot:
+    """An acquired in-flight slot. Callers that catch errors themselves can still report an overload."""
+
+    def __init__(self):
+        self.overloaded = False
+
+    def mark_overloaded(self) -> None:
+        self.overloaded = True
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit on concurrent LLM calls that adapts to provider health.
+
+    The limit grows by about one slot for every limit's worth of calls that
+    succeed at a steady latency. It is cut multiplicatively when a call hits
+    a rate limit, times out or is overloaded, or when its latency exceeds the
+    running average by the latency tolerance. Other errors leave the limit
+    unchanged. With a shared backend, every process draws from one limit.
+    When that backend fails, the limiter falls back to an in-process limit.
+
+    Callers waiting for a slot are woken when one is released, in this
+    process directly and in others through the backend. They still recheck
+    every poll_interval, for slots whose lease expired or a limit that grew.
+    """
+
+    # Seconds to stay on the local limit after the shared backend fails
+    BACKEND_RETRY_INTERVAL = 30.0
+    # Weight of each new sample in the latency average
+    LATENCY_ALPHA = 0.1
+
+    def __init__(
+        self,
+        backend: ConcurrencyBackend | None,
+        policy: ConcurrencyPolicy,
+        key: str = "llm",
+        latency_tolerance: float = 2.0,
+        min_samples: int = 10,
+        max_wait: float | None = None,
+        lease_ttl: float = 300.0,
+        poll_interval: float = 1.0,
+    ):
+        self.backend = backend
+        self.fallback = LocalConcurrencyBackend()
+        self.policy = policy
+        self.key = key
+        self.latency_tolerance = latency_tolerance
+        self.min_samples = min_samples
+        self.max_wait = max_wait
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.overloads = 0
+        self.latency_spikes = 0
+        self.fallbacks = 0
+        self._latency_avg: float | None = None
+        self._latency_samples = 0
+        self._lock = threading.Lock()
+        self._backend_retry_at = 0.0
+        # Counts releases, so a waiter notices one that happened while it was checking
+        self._released = threading.Condition()
+        self._releases = 0
+        self._async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._listener_pid: int | None = None
+
+    @contextmanager
+    def slot(self) -> Iterator[Slot]:
+        """Hold one in-flight slot for the duration of the block, and learn from how it went."""
+        lease = uuid.uuid4().hex
+        backend, generation = self._acquire(lease)
+        slot = Slot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except BaseException as e:
+            self._finish(backend, generation, lease, slot, error=e)
+            raise
+        self._finish(backend, generation, lease, slot, latency=time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot_async(self) -> AsyncIterator[Slot]:
+        """Async variant of slot. Shared backends are called off the event loop."""
+        lease = uuid.uuid4().hex
+        backend, generation = await self._acquire_async(lease)
+        slot = Slot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except BaseException as e:
+            await self._run(self._finish, backend, generation, lease, slot, e)
+            raise
+        await self._run(self._finish, backend, generation, lease, slot, None, time.monotonic() - start)
+
+    @property
+    def limit(self) -> float:
+        """Current in-flight limit."""
+        return self._current()[0]
+
+    def stats(self) -> dict[str, Any]:
+        limit, in_flight = self._current()
+        return {
+            "backend": type(self.backend or self.fallback).__name__,
+            "limit": round(limit, 2),
+            "in_flight": in_flight,
+            "min_limit": self.policy.min_limit,
+            "max_limit": self.policy.max_limit,
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "avg_wait_ms": round(self.wait_time / self.acquired * 1000, 2) if self.acquired else None,
+            "overloads": self.overloads,
+            "latency_spikes": self.latency_spikes,
+            "avg_latency_ms": round(self._latency_avg * 1000, 2) if self._latency_avg is not None else None,
+            "fallbacks": self.fallbacks,
+        }
+
+    def _acquire(self, lease: str) -> tuple[ConcurrencyBackend, int]:
+        start = time.monotonic()
+        waited = 0.0
+        while True:
+            seen = self._releases
+            acquired = self._try_acquire(lease, waited)
+            if acquired is not None:
+                return acquired
+            self._listen()
+            with self._released:
+                if self._releases == seen:
+                    self._released.wait(self._wait_timeout(start))
+            waited = time.monotonic() - start
+
+    async def _acquire_async(self, lease: str) -> tuple[ConcurrencyBackend, int]:
+        start = time.monotonic()
+        waited = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            seen = self._releases
+            acquired = await self._run(self._try_acquire, lease, waited)
+            if acquired is not None:
+                return acquired
+            self._listen()
+            waiter = (loop, asyncio.Event())
+            with self._released:
+                released = self._releases != seen
+                if not released:
+                    self._async_waiters.add(waiter)
+            if not released:
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), self._wait_timeout(start))
+                except TimeoutError:
+                    pass
+                finally:
+                    with self._released:
+                        self._async_waiters.discard(waiter)
+            waited = time.monotonic() - start
+
+    def _wait_timeout(self, start: float) -> float:
+        """Seconds to wait for a release before checking again, never past the maximum wait."""
+        if self.max_wait is None:
+            return self.poll_interval
+        return max(min(self.poll_interval, start + self.max_wait - time.monotonic()), 0.0)
+
+    def _notify(self) -> None:
+        """Wake every caller waiting for a slot, sync or async."""
+        with self._released:
+            self._releases += 1
+            self._released.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's loop is closed
+                pass
+
+    def _listen(self) -> None:
+        """Start waking waiters on releases from other processes, once per process."""
+        with self._lock:
+            if self.backend is None or self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen_forever, name="llm-concurrency-listener", daemon=True).start()
+
+    def _listen_forever(self) -> None:
+        while True:
+            try:
+                self.backend.listen(self.key, self._notify)
+                return
+            except Exception as e:
+                # Waiters still recheck every poll_interval
+                logger.warning(f"Concurrency release notifications unavailable, retrying in {self.BACKEND_RETRY_INTERVAL}s: {e}")
+                time.sleep(self.BACKEND_RETRY_INTERVAL)
+
+    def _try_acquire(self, lease: str, waited: float) -> tuple[ConcurrencyBackend, int] | None:
+        """Take a slot if one is free. Raises once the maximum wait has passed."""
+        while True:
+            backend = self._backend()
+            if backend is not self.backend and self.backend is not None:
+                self._count("fallbacks")
+            try:
+                acquired, generation = backend.try_acquire(self.key, lease, self.policy, self.lease_ttl)
+                break
+            except Exception as e:
+                self._backend_failed(e)
+        if acquired:
+            with self._lock:
+                self.acquired += 1
+                if waited:
+                    self.waited += 1
+                    self.wait_time += waited
+            return backend, generation
+        if self.max_wait is not None and waited >= self.max_wait:
+            raise ConcurrencyLimitExceeded(self.key, self.poll_interval)
+        return None
+
+    def _finish(self, backend: ConcurrencyBackend, generation: int, lease: str, slot: Slot,
+                error: BaseException | None = None, latency: float | None = None) -> None:
+        """Learn from a finished call, failed with error or successful in latency seconds, and free its slot."""
+        if error is not None:
+            if isinstance(error, Exception) and is_overload(error):
+                slot.mark_overloaded()
+            # Other errors, such as bad output, say nothing about provider load
+            if slot.overloaded:
+                self._feedback(backend, generation, overloaded=True)
+        else:
+            if not slot.overloaded and self._is_latency_spike(latency):
+                self._count("latency_spikes")
+                slot.mark_overloaded()
+            self._feedback(backend, generation, overloaded=slot.overloaded)
+        self._release(backend, lease)
+
+    async def _run(self, fn, *args):
+        if self.backend is not None and time.monotonic() >= self._backend_retry_at:
+            # Shared backends do network I/O
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _release(self, backend: ConcurrencyBackend, lease: str) -> None:
+        try:
+            backend.release(self.key, lease)
+        except Exception as e:
+            # The lease expires on its own
+            self._backend_failed(e)
+        self._notify()
+
+    def _feedback(self, backend: ConcurrencyBackend, generation: int, overloaded: bool) -> None:
+        if overloaded:
+            self._count("overloads")
+        try:
+            backend.feedback(self.key, self.policy, overloaded, generation)
+        except Exception as e:
+            self._backend_failed(e)
+
+    def _is_latency_spike(self, latency: float) -> bool:
+        with self._lock:
+            average = self._latency_avg
+            spike = (
+                average is not None
+                and self._latency_samples >= self.min_samples
+                and latency > average * self.latency_tolerance
+            )
+            if not spike:
+                # Spikes stay out of the average so it keeps tracking healthy latency
+                self._latency_avg = latency if average is None else average + self.LATENCY_ALPHA * (latency - average)
+                self._latency_samples += 1
+            return spike
+
+    def _current(self) -> tuple[float, int]:
+        backend = self._backend()
+        try:
+            return backend.current(self.key, self.policy)
+        except Exception as e:
+            self._backend_failed(e)
+            return self.fallback.current(self.key, self.policy)
+
+    def _backend(self) -> ConcurrencyBackend:
+        if self.backend is not None and time.monotonic() >= self._backend_retry_at:
+            return self.backend
+        return self.fallback
+
+    def _backend_failed(self, error: Exception):
+        # A broken limiter store must not stop predictions, nor cost a timeout on every call
+        logger.warning(f"Shared concurrency limiter unavailable, using a local limit for {self.BACKEND_RETRY_INTERVAL}s: {error}")
+        self._backend_retry_at = time.monotonic() + self.BACKEND_RETRY_INTERVAL
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def build_concurrency_limiter() -> AdaptiveConcurrencyLimiter | None:
+    """Create the concurrency limiter configured in settings, or None when disabled."""
+    backend_name = config.llm_concurrency_backend.lower()
+
+    backend: ConcurrencyBackend | None
+    if backend_name == "none":
+        return None
+    if backend_name == "redis":
+        backend = RedisConcurrencyBackend(redis_url=config.redis_url)
+    elif backend_name == "memory":
+        backend = None
+    else:
+        raise ValueError(f"Unknown concurrency limiter backend: {config.llm_concurrency_backend}")
+
+    return AdaptiveConcurrencyLimiter(
+        backend=backend,
+        policy=ConcurrencyPolicy.from_settings(),
+        latency_tolerance=config.llm_concurrency_latency_tolerance,
+        max_wait=config.llm_concurrency_max_wait,
+    )
+
+
+# Limiter on concurrent LLM calls of this process. Installed by the Celery
+# workers, which share it through Redis, and by the batch CLI. The API leaves
+# it unset: interactive predictions are not queued behind the workers' limit.
+concurrency_limiter: AdaptiveConcurrencyLimiter | None = None
+
+
+def use_concurrency_limiter(limiter: AdaptiveConcurrencyLimiter | None) -> None:
+    """Install the limiter of this process, e.g. the configured one in a worker, or None to disable it."""
+    global concurrency_limiter
+    concurrency_limiter = limiter
+
+
+def provider_slot():
+    """In-flight slot around one provider request, a no-op when the limiter is disabled."""
+    return concurrency_limiter.slot() if concurrency_limiter else nullcontext()
+
+
+def provider_slot_async():
+    """Async variant of provider_slot."""
+    return concurrency_limiter.slot_async() if concurrency_limiter else nullcontext()
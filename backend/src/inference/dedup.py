@@ -0,0 +1,220 @@
+import io
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import combinations
+from pathlib import Path
+from typing import Any
+
+from PIL import Image, UnidentifiedImageError
+
+from src.schemas import DetectionResult
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# dHash compares each pixel of a HASH_SIZE x HASH_SIZE grayscale thumbnail with its right neighbour
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Multi-index hashing: the hash is split into chunks, each with its own lookup table.
+# About log2(entries) bits per chunk keeps buckets near one entry at a million images
+CHUNK_WIDTHS = (22, 21, 21)
+CHUNKS = len(CHUNK_WIDTHS)
+
+
+@dataclass(frozen=True)
+class ImageFingerprint:
+    """Perceptual hash of an image and its size."""
+    hash: int
+    width: int
+    height: int
+
+
+def fingerprint(image_data: bytes) -> ImageFingerprint:
+    """
+    64-bit difference hash of an image.
+
+    Near-identical screenshots, e.g. the same page with a different clock
+    or a moved cursor, differ in only a few bits.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+    except UnidentifiedImageError:
+        raise ValueError("File is not a valid image")
+
+    with image:
+        width, height = image.size
+        # Lets JPEG decode at a fraction of the size, a no-op for other formats
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        pixels = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX).tobytes()
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return ImageFingerprint(value, width, height)
+
+
+def _chunks(value: int) -> list[int]:
+    chunks = []
+    for width in CHUNK_WIDTHS:
+        chunks.append(value & ((1 << width) - 1))
+        value >>= width
+    return chunks
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hash index of predicted images for reusing their annotations.
+
+    Lookups use multi-index hashing: two hashes within max_distance bits
+    have at least one of the CHUNKS chunks within max_distance // CHUNKS
+    bits, so only the buckets of those few chunk variants are probed
+    instead of comparing against every entry. Matches must also share the
+    scope (the model) and aspect ratio, since the stored boxes are
+    normalized to the image. The index lives in process memory and is
+    optionally persisted to an append-only JSONL file, loaded at startup.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 4,
+        max_entries: int = 100000,
+        path: Path | None = None,
+        aspect_tolerance: float = 0.01,
+    ):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"Near-duplicate distance must be in [0, {HASH_BITS})")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.path = path
+        self.aspect_tolerance = aspect_tolerance
+        # Chunk variants probed per chunk: every flip of up to max_distance // CHUNKS bits
+        chunk_distance = max_distance // CHUNKS
+        self._probes = [
+            [
+                sum(1 << bit for bit in bits)
+                for flips in range(chunk_distance + 1)
+                for bits in combinations(range(chunk_bits), flips)
+            ]
+            for chunk_bits in CHUNK_WIDTHS
+        ]
+        self._entries: OrderedDict[int, tuple[ImageFingerprint, str, bytes]] = OrderedDict()
+        self._tables: list[dict[int, set[int]]] = [{} for _ in range(CHUNKS)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+        self.distances: dict[int, int] = {}
+
+        if path is not None and path.exists():
+            self._load(path)
+
+    def lookup(self, image: ImageFingerprint, scope: str) -> DetectionResult | None:
+        """Result of the closest indexed image within max_distance, with near_duplicate_distance set."""
+        start_time = time.perf_counter()
+        with self._lock:
+            best = None
+            for table, value, probes in zip(self._tables, _chunks(image.hash), self._probes, strict=True):
+                for probe in probes:
+                    for entry_id in table.get(value ^ probe, ()):
+                        stored, stored_scope, result = self._entries[entry_id]
+                        distance = (stored.hash ^ image.hash).bit_count()
+                        if distance > self.max_distance or stored_scope != scope or not self._same_shape(stored, image):
+                            continue
+                        if best is None or distance < best[0]:
+                            best = (distance, result)
+
+            self.lookup_time += time.perf_counter() - start_time
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.distances[best[0]] = self.distances.get(best[0], 0) + 1
+
+        result = DetectionResult.model_validate_json(best[1])
+        result.near_duplicate_distance = best[0]
+        return result
+
+    def add(self, image: ImageFingerprint, scope: str, result: DetectionResult) -> None:
+        value = result.model_dump_json(exclude={"near_duplicate_distance"}).encode()
+        with self._lock:
+            self._insert(image, scope, value)
+        if self.path is not None:
+            try:
+                line = {"hash": image.hash, "width": image.width, "height": image.height,
+                        "scope": scope, "result": value.decode()}
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(line) + "\n")
+            except OSError as e:
+                logger.warning(f"Near-duplicate index write failed: {e}")
+
+    def _insert(self, image: ImageFingerprint, scope: str, value: bytes):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (image, scope, value)
+        for table, value in zip(self._tables, _chunks(image.hash), strict=True):
+            table.setdefault(value, set()).add(entry_id)
+
+        # Forget the oldest images beyond the size limit
+        while len(self._entries) > self.max_entries:
+            old_id, (old_image, _scope, _value) = self._entries.popitem(last=False)
+            for table, value in zip(self._tables, _chunks(old_image.hash), strict=True):
+                bucket = table[value]
+                bucket.discard(old_id)
+                if not bucket:
+                    del table[value]
+
+    def _same_shape(self, a: ImageFingerprint, b: ImageFingerprint) -> bool:
+        aspect_a, aspect_b = a.width / a.height, b.width / b.height
+        return abs(aspect_a - aspect_b) <= self.aspect_tolerance * aspect_a
+
+    def _load(self, path: Path):
+        loaded = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    image = ImageFingerprint(entry["hash"], entry["width"], entry["height"])
+                    self._insert(image, entry["scope"], entry["result"].encode())
+                    loaded += 1
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Skipping invalid near-duplicate index line: {e}")
+        logger.info(f"Loaded {len(self._entries)} near-duplicate index entries from {path} ({loaded} lines)")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_lookup_ms": round(self.lookup_time / lookups * 1000, 4) if lookups else None,
+                "hit_distances": dict(sorted(self.distances.items())),
+            }
+
+
+def build_near_duplicate_index() -> NearDuplicateIndex | None:
+    """Create the near-duplicate index configured in settings, or None when disabled."""
+    if not config.near_duplicate_enabled:
+        return None
+    path = Path(config.near_duplicate_index_path) if config.near_duplicate_index_path else None
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    return NearDuplicateIndex(
+        max_distance=config.near_duplicate_max_distance,
+        max_entries=config.near_duplicate_max_entries,
+        path=path,
+    )
+
+
+# Global near-duplicate index
+near_duplicates = build_near_duplicate_index()
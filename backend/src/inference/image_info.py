@@ -0,0 +1,122 @@
+import struct
+from dataclasses import dataclass
+
+from src.settings import config
+
+# JPEG start-of-frame markers, which carry the image size (DHT 0xC4, JPG 0xC8 and DAC 0xCC are not frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xDA)}
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """Format and pixel size of an image, read from its header."""
+    format: str  # png, jpeg, webp or gif
+    width: int
+    height: int
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def read_image_info(data: bytes) -> ImageInfo:
+    """
+    Read the format and size of a PNG, JPEG, WebP or GIF image from its header, without decoding it.
+
+    Only the first bytes are parsed, up to the first frame header for JPEG.
+    Raises ValueError for anything else or a truncated header.
+    """
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n") and data[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", data[16:24])
+            return _checked("png", width, height)
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", data[6:10])
+            return _checked("gif", width, height)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return _read_webp(data)
+        if data.startswith(b"\xff\xd8"):
+            return _read_jpeg(data)
+    except struct.error:
+        raise ValueError("Image header is truncated")
+    raise ValueError("File is not a supported image (PNG, JPEG, WebP or GIF)")
+
+
+def _read_webp(data: bytes) -> ImageInfo:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+        # Lossy: 14-bit sizes in the key frame header
+        width, height = struct.unpack("<HH", data[26:30])
+        return _checked("webp", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L" and data[20] == 0x2F:
+        # Lossless: 14-bit sizes minus one, packed after the signature byte
+        bits = struct.unpack("<I", data[21:25])[0]
+        return _checked("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X":
+        # Extended: 24-bit canvas sizes minus one
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return _checked("webp", width, height)
+    raise ValueError("Unsupported WebP image")
+
+
+def _read_jpeg(data: bytes) -> ImageInfo:
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError("Corrupt JPEG header")
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            position += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker == 0xDA:
+            break
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[position + 5:position + 9])
+            return _checked("jpeg", width, height)
+        position += 2 + length
+    raise ValueError("JPEG has no frame header")
+
+
+def _checked(image_format: str, width: int, height: int) -> ImageInfo:
+    if width <= 0 or height <= 0:
+        raise ValueError("Image has no pixels")
+    return ImageInfo(image_format, width, height)
+
+
+def validate_image(data: bytes, max_pixels: int | None = None, max_edge: int | None = None) -> ImageInfo:
+    """
+    Check that data is a supported image that is safe to decode.
+
+    Rejects non-images and decompression bombs, i.e. small files that
+    declare huge dimensions, before they are stored or sent to the model.
+
+    Args:
+        data: Raw image bytes
+        max_pixels: Most pixels allowed (default: IMAGE_MAX_PIXELS)
+        max_edge: Longest side allowed in pixels (default: IMAGE_MAX_DIMENSION)
+
+    Returns:
+        ImageInfo read from the header
+    """
+    max_pixels = config.image_max_pixels if max_pixels is None else max_pixels
+    max_edge = config.image_max_dimension if max_edge is None else max_edge
+
+    info = read_image_info(data)
+    if max(info.width, info.height) > max_edge:
+        raise ValueError(f"Image is {info.width}x{info.height}, sides are limited to {max_edge} pixels")
+    if info.pixels > max_pixels:
+        raise ValueError(f"Image is {info.width}x{info.height}, limited to {max_pixels} pixels")
+    return info
@@ -0,0 +1,156 @@
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def split_packed_output(data: Any, count: int) -> dict[int, list[Any]]:
+    """
+    Split a packed completion into the annotation arrays of each image.
+
+    Expects {"images": [{"index": 0, "annotations": [...]}, ...]}. Entries
+    with an unknown or repeated index, or without an annotations array, are
+    left out, so the caller can detect them with a fallback for each missing image.
+    """
+    entries = data.get("images") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError("Packed output must contain an 'images' list")
+
+    arrays: dict[int, list[Any]] = {}
+    repeated: set[int] = set()
+    for entry in entries:
+        index = entry.get("index") if isinstance(entry, dict) else None
+        annotations = entry.get("annotations") if isinstance(entry, dict) else None
+        if not isinstance(index, int) or not 0 <= index < count or not isinstance(annotations, list):
+            logger.warning(f"Ignoring malformed packed entry: {str(entry)[:200]}")
+            continue
+        if index in arrays:
+            # Two answers for one image, neither can be trusted
+            repeated.add(index)
+        arrays[index] = annotations
+
+    for index in repeated:
+        del arrays[index]
+    return arrays
+
+
+class PackingStats:
+    """Counters for multi-image requests and their single-image fallbacks."""
+
+    def __init__(self):
+        self.packs = 0
+        self.packed_images = 0
+        self.failed_packs = 0
+        self.incomplete_packs = 0
+        self.fallback_images = 0
+        self._lock = threading.Lock()
+
+    def record(self, images: int, returned: int, failed: bool = False):
+        with self._lock:
+            self.packs += 1
+            self.packed_images += images
+            self.fallback_images += images - returned
+            if failed:
+                self.failed_packs += 1
+            elif returned < images:
+                self.incomplete_packs += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "packs": self.packs,
+            "packed_images": self.packed_images,
+            "avg_pack_size": round(self.packed_images / self.packs, 2) if self.packs else None,
+            "failed_packs": self.failed_packs,
+            "incomplete_packs": self.incomplete_packs,
+            "fallback_images": self.fallback_images,
+        }
+
+
+# Global packing counters
+packing_stats = PackingStats()
+
+
+class _Batch:
+    def __init__(self):
+        self.items: list[Any] = []
+        self.futures: list[Future] = []
+        self.full = threading.Event()
+
+
+class MicroBatcher[T, R]:
+    """
+    Gather items submitted by concurrent callers into batches.
+
+    The first caller of a batch waits until it holds max_size items or
+    max_wait seconds have passed since it arrived, then runs flush on the
+    whole batch in its own thread. Every caller receives the entry of the
+    flush result at its position, and an exception entry is raised to that
+    caller alone. No background thread is used, so the batcher survives forks.
+    """
+
+    def __init__(self, flush: Callable[[list[T]], list[R | BaseException]], max_size: int, max_wait: float):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.flush = flush
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._open: _Batch | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: T) -> R:
+        """Add an item to the current batch and block until its result is ready."""
+        future: Future = Future()
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_size:
+                self._open = None
+                batch.full.set()
+
+        if not leader:
+            return future.result()
+
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            if self._open is batch:
+                self._open = None
+            self.batches += 1
+            self.items += len(batch.items)
+
+        try:
+            results = self.flush(batch.items)
+            if len(results) != len(batch.items):
+                raise RuntimeError(f"Batch flush returned {len(results)} results for {len(batch.items)} items")
+        except BaseException as e:
+            for waiter in batch.futures:
+                waiter.set_exception(e)
+        else:
+            for waiter, result in zip(batch.futures, results, strict=True):
+                if isinstance(result, BaseException):
+                    waiter.set_exception(result)
+                else:
+                    waiter.set_result(result)
+        return future.result()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_size": self.max_size,
+            "max_wait": self.max_wait,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+        }
+
+    def _reset_after_fork(self):
+        # Waiters of an open batch belong to the parent's threads
+        self._lock = threading.Lock()
+        self._open = None
@@ -0,0 +1,175 @@
+import asyncio
+import io
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.settings import config
+
+# Pillow encoder name and MIME type per output format
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+
+@dataclass(frozen=True)
+class PreprocessOptions:
+    """How images are resized and re-encoded before being sent to the model."""
+    enabled: bool = True
+    max_edge: int = 2048  # Longest side in pixels, 0 keeps the original size
+    format: str = "webp"
+    quality: int = 85
+
+    @classmethod
+    def from_settings(cls) -> "PreprocessOptions":
+        return cls(
+            enabled=config.image_preprocess_enabled,
+            max_edge=config.image_max_edge,
+            format=config.image_format.lower(),
+            quality=config.image_quality,
+        )
+
+    def cache_params(self) -> dict[str, Any]:
+        """Parameters that change the model input and therefore the cache key."""
+        if not self.enabled:
+            return {}
+        return {"max_edge": self.max_edge, "format": self.format, "quality": self.quality}
+
+
+@dataclass
+class PreprocessedImage:
+    """Image payload ready to be base64 encoded, with size bookkeeping."""
+    data: bytes
+    content_type: str
+    width: int
+    height: int
+    bytes_before: int
+    bytes_after: int
+    elapsed: float
+
+
+class PreprocessStats:
+    """Aggregate payload size and latency counters for the preprocessing stage."""
+
+    def __init__(self):
+        self.images = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.total_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, image: PreprocessedImage):
+        with self._lock:
+            self.images += 1
+            self.bytes_before += image.bytes_before
+            self.bytes_after += image.bytes_after
+            self.total_time += image.elapsed
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "images": self.images,
+            "bytes_before": self.bytes_before,
+            "bytes_after": self.bytes_after,
+            "size_ratio": round(self.bytes_after / self.bytes_before, 4) if self.bytes_before else None,
+            "avg_latency_ms": round(self.total_time / self.images * 1000, 2) if self.images else None,
+        }
+
+
+# Global preprocessing counters
+preprocess_stats = PreprocessStats()
+
+
+def preprocess_image(
+    image_data: bytes,
+    image_type: str,
+    options: PreprocessOptions | None = None,
+) -> PreprocessedImage:
+    """
+    Downsize and re-encode an image before it is sent to the model.
+
+    Boxes come back normalized to 0-1000, so resizing with the aspect ratio
+    preserved does not change their meaning.
+
+    Args:
+        image_data: Raw image bytes
+        image_type: MIME type of the raw image
+        options: Preprocessing options (default: from settings)
+
+    Returns:
+        PreprocessedImage with the bytes to send
+    """
+    options = options or PreprocessOptions.from_settings()
+    start_time = time.perf_counter()
+
+    try:
+        source = Image.open(io.BytesIO(image_data))
+    except UnidentifiedImageError:
+        raise ValueError("File is not a valid image")
+
+    with source:
+        original_width, original_height = source.size
+
+        if not options.enabled:
+            result_data, content_type = image_data, image_type
+            width, height = original_width, original_height
+        else:
+            image = ImageOps.exif_transpose(source)
+            if options.max_edge and max(image.size) > options.max_edge:
+                image.thumbnail((options.max_edge, options.max_edge), Image.Resampling.LANCZOS)
+            width, height = image.size
+            result_data, content_type = _encode(image, options)
+
+            # Re-encoding an already compact image can grow it, keep the smaller one
+            if (width, height) == (original_width, original_height) and len(result_data) >= len(image_data):
+                result_data, content_type = image_data, image_type
+
+    processed = PreprocessedImage(
+        data=result_data,
+        content_type=content_type,
+        width=width,
+        height=height,
+        bytes_before=len(image_data),
+        bytes_after=len(result_data),
+        elapsed=time.perf_counter() - start_time,
+    )
+    preprocess_stats.record(processed)
+    return processed
+
+
+async def preprocess_image_async(
+    image_data: bytes,
+    image_type: str,
+    options: PreprocessOptions | None = None,
+) -> PreprocessedImage:
+    """Run preprocess_image in a worker thread to keep the event loop free."""
+    return await asyncio.to_thread(preprocess_image, image_data, image_type, options)
+
+
+def _encode(image: Image.Image, options: PreprocessOptions) -> tuple[bytes, str]:
+    if options.format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported image format: {options.format}")
+    pil_format, content_type = OUTPUT_FORMATS[options.format]
+
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        # JPEG has no alpha channel, flatten onto white like a browser would
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA")
+
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(buffer, format=pil_format, optimize=True)
+    elif pil_format == "WEBP":
+        # method=2 encodes about twice as fast as the default for a near identical size
+        image.save(buffer, format=pil_format, quality=options.quality, method=2)
+    else:
+        image.save(buffer, format=pil_format, quality=options.quality)
+    return buffer.getvalue(), content_type
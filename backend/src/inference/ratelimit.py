@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Per-minute request and token budget for one model. Zero means unlimited."""
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.requests_per_minute <= 0 and self.tokens_per_minute <= 0
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a rate limit slot is not available within the maximum wait."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Rate limit for {model} not available, retry in {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class BucketBackend(Protocol):
+    """Storage for token buckets. `take` returns 0 on success or the seconds to wait."""
+
+    def take(self, key: str, limit: RateLimit, tokens: int) -> float: ...
+
+    def adjust(self, key: str, tokens: int) -> None: ...
+
+
+class LocalBucketBackend:
+    """In-process token buckets, used when Redis is not configured or unreachable."""
+
+    def __init__(self):
+        # key -> [requests, tokens, updated_at]
+        self._buckets: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: RateLimit, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit.requests_per_minute, limit.tokens_per_minute, now]
+
+            # Refill both buckets for the time elapsed, capped at one minute of budget
+            elapsed = now - bucket[2]
+            bucket[0] = min(limit.requests_per_minute, bucket[0] + elapsed * limit.requests_per_minute / 60)
+            bucket[1] = min(limit.tokens_per_minute, bucket[1] + elapsed * limit.tokens_per_minute / 60)
+            bucket[2] = now
+
+            wait = 0.0
+            if limit.requests_per_minute > 0 and bucket[0] < 1:
+                wait = max(wait, (1 - bucket[0]) * 60 / limit.requests_per_minute)
+            if limit.tokens_per_minute > 0 and bucket[1] < min(tokens, limit.tokens_per_minute):
+                wait = max(wait, (min(tokens, limit.tokens_per_minute) - bucket[1]) * 60 / limit.tokens_per_minute)
+            if wait:
+                return wait
+
+            bucket[0] -= 1
+            bucket[1] -= tokens
+            return 0.0
+
+    def adjust(self, key: str, tokens: int) -> None:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[1] -= tokens
+
+
+# Refills and takes from the request and token buckets atomically. Uses the
+# Redis server clock so every process agrees on elapsed time.
+TAKE_SCRIPT = """
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated_at')
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local updated_at = tonumber(state[3]) or now
+
+local elapsed = math.max(now - updated_at, 0)
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+
+local wait = 0
+if rpm > 0 and requests < 1 then
+    wait = math.max(wait, (1 - requests) * 60 / rpm)
+end
+local needed = math.min(cost, tpm)
+if tpm > 0 and tokens < needed then
+    wait = math.max(wait, (needed - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+
+class RedisBucketBackend:
+    """Token buckets shared by every process through Redis."""
+
+    def __init__(self, redis_url: str, prefix: str = "llm-rate-limit:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key: str, limit: RateLimit, tokens: int) -> float:
+        return float(self._take(
+            keys=[self.prefix + key],
+            args=[limit.requests_per_minute, limit.tokens_per_minute, tokens],
+        ))
+
+    def adjust(self, key: str, tokens: int) -> None:
+        self.client.hincrbyfloat(self.prefix + key, "tokens", -tokens)
+
+
+@dataclass
+class LimiterStats:
+    """Wait time counters for one model."""
+    acquired: int = 0
+    waited: int = 0
+    wait_time: float = 0.0
+    max_wait: float = 0.0
+    rejected: int = 0
+    fallbacks: int = 0
+    tokens_reserved: int = 0
+    tokens_used: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_acquire(self, wait: float, tokens: int) -> None:
+        with self._lock:
+            self.acquired += 1
+            self.tokens_reserved += tokens
+            if wait > 0:
+                self.waited += 1
+                self.wait_time += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "avg_wait_ms": round(self.wait_time / self.acquired * 1000, 2) if self.acquired else None,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "rejected": self.rejected,
+            "fallbacks": self.fallbacks,
+            "tokens_reserved": self.tokens_reserved,
+            "tokens_used": self.tokens_used,
+        }
+
+
+class LLMRateLimiter:
+    """
+    Per-model request and token budget shared by every caller of the provider.
+
+    Callers acquire a slot with an estimate of the tokens they will use before
+    sending, then settle the difference once the actual usage is known. When
+    the shared backend fails, the limiter falls back to in-process buckets.
+    """
+
+    # Seconds to stay on local buckets after the shared backend fails
+    BACKEND_RETRY_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        backend: BucketBackend | None,
+        default_limit: RateLimit,
+        model_limits: dict[str, RateLimit] | None = None,
+        max_wait: float = 60.0,
+        headroom: float = 1.0,
+    ):
+        self.backend = backend
+        self.fallback = LocalBucketBackend()
+        self.default_limit = default_limit
+        self.model_limits = model_limits or {}
+        self.max_wait = max_wait
+        self.headroom = headroom
+        self._stats: dict[str, LimiterStats] = {}
+        self._lock = threading.Lock()
+        self._backend_retry_at = 0.0
+
+    def limit_for(self, model: str) -> RateLimit:
+        """Effective limit for a model, scaled down by the configured headroom."""
+        limit = self.model_limits.get(model, self.default_limit)
+        return RateLimit(
+            requests_per_minute=math.floor(limit.requests_per_minute * self.headroom),
+            tokens_per_minute=math.floor(limit.tokens_per_minute * self.headroom),
+        )
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """Block until a request slot is available. Returns the seconds spent waiting."""
+        limit = self.limit_for(model)
+        if limit.unlimited:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            wait = self._take(model, limit, tokens)
+            if not wait:
+                self._get_stats(model).record_acquire(waited, tokens)
+                return waited
+            self._check_deadline(model, waited, wait)
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, model: str, tokens: int) -> float:
+        """Async variant of acquire that sleeps without blocking the event loop."""
+        limit = self.limit_for(model)
+        if limit.unlimited:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            if self.backend is not None:
+                # Shared backends do network I/O
+                wait = await asyncio.to_thread(self._take, model, limit, tokens)
+            else:
+                wait = self._take(model, limit, tokens)
+            if not wait:
+                self._get_stats(model).record_acquire(waited, tokens)
+                return waited
+            self._check_deadline(model, waited, wait)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def settle(self, model: str, reserved: int, used: int | None) -> None:
+        """Charge or refund the difference between reserved and actual token usage."""
+        if used is None or self.limit_for(model).unlimited:
+            return
+        self._get_stats(model).increment("tokens_used", used)
+        if used == reserved:
+            return
+        # Settle against whichever store the slot was most likely taken from
+        if self.backend is not None and time.monotonic() >= self._backend_retry_at:
+            try:
+                self.backend.adjust(model, used - reserved)
+                return
+            except Exception as e:
+                logger.warning(f"Rate limiter adjust failed: {e}")
+        self.fallback.adjust(model, used - reserved)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": type(self.backend or self.fallback).__name__,
+            "models": {model: stats.to_dict() for model, stats in list(self._stats.items())},
+        }
+
+    def _take(self, model: str, limit: RateLimit, tokens: int) -> float:
+        if self.backend is not None and time.monotonic() >= self._backend_retry_at:
+            try:
+                return self.backend.take(model, limit, tokens)
+            except Exception as e:
+                # A broken limiter store must not stop predictions, nor cost a timeout on every call
+                logger.warning(f"Shared rate limiter unavailable, using local buckets for {self.BACKEND_RETRY_INTERVAL}s: {e}")
+                self._backend_retry_at = time.monotonic() + self.BACKEND_RETRY_INTERVAL
+        if self.backend is not None:
+            self._get_stats(model).increment("fallbacks")
+        return self.fallback.take(model, limit, tokens)
+
+    def _check_deadline(self, model: str, waited: float, wait: float):
+        if waited + wait > self.max_wait:
+            self._get_stats(model).increment("rejected")
+            raise RateLimitExceeded(model, wait)
+
+    def _get_stats(self, model: str) -> LimiterStats:
+        with self._lock:
+            if model not in self._stats:
+                self._stats[model] = LimiterStats()
+            return self._stats[model]
+
+
+def estimate_tokens(image_width: int, image_height: int, prompt_chars: int) -> int:
+    """
+    Rough upper estimate of the tokens a detection request will consume.
+
+    Image cost follows the high-detail tiling rule used by OpenAI vision models:
+    fit in 2048x2048, scale the short side to 768, then 170 tokens per 512px
+    tile plus 85. Text is counted at about 4 characters per token.
+    """
+    scale = min(1.0, 2048 / max(image_width, image_height, 1))
+    width, height = image_width * scale, image_height * scale
+    scale = min(1.0, 768 / max(min(width, height), 1))
+    width, height = width * scale, height * scale
+    image_tokens = 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+    return image_tokens + prompt_chars // 4 + config.llm_estimated_output_tokens
+
+
+def build_rate_limiter() -> LLMRateLimiter:
+    """Create the rate limiter configured in settings."""
+    backend_name = config.llm_rate_limit_backend.lower()
+
+    backend: BucketBackend | None
+    if backend_name == "redis":
+        backend = RedisBucketBackend(redis_url=config.redis_url)
+    elif backend_name == "memory":
+        backend = None
+    else:
+        raise ValueError(f"Unknown rate limit backend: {config.llm_rate_limit_backend}")
+
+    return LLMRateLimiter(
+        backend=backend,
+        default_limit=RateLimit(
+            requests_per_minute=config.llm_requests_per_minute,
+            tokens_per_minute=config.llm_tokens_per_minute,
+        ),
+        model_limits={
+            model: RateLimit(**limits) for model, limits in config.llm_model_rate_limits.items()
+        },
+        max_wait=config.llm_rate_limit_max_wait,
+        headroom=config.llm_rate_limit_headroom,
+    )
+
+
+# Global rate limiter
+rate_limiter = build_rate_limiter()
@@ -0,0 +1,164 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from src.inference.concurrency import ConcurrencyLimitExceeded
+from src.inference.ratelimit import RateLimitExceeded
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+def retry_reason(error: BaseException) -> str | None:
+    """Why an error is worth retrying, or None when it is not."""
+    if isinstance(error, RateLimitError):
+        return "rate_limited"
+    if isinstance(error, ConcurrencyLimitExceeded):
+        return "concurrency_limit"
+    if isinstance(error, RateLimitExceeded):
+        return "rate_limit_budget"
+    if isinstance(error, APITimeoutError):
+        return "timeout"
+    if isinstance(error, APIConnectionError):
+        return "connection_error"
+    if isinstance(error, APIStatusError):
+        if error.status_code >= 500:
+            return "server_error"
+        if error.status_code == 408:
+            return "timeout"
+        if error.status_code == 409:
+            return "conflict"
+    return None
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds the provider, or our own limiter, asked us to wait before retrying."""
+    if isinstance(error, RateLimitExceeded):
+        return error.retry_after
+    if not isinstance(error, APIStatusError):
+        return None
+
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            # HTTP date form
+            return max((parsedate_to_datetime(value) - datetime.now(UTC)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retry budget for one prediction from first attempt to final answer.
+
+    The same policy is passed down to every provider call made for a job,
+    including fallback models and tiles, so retries do not multiply across
+    layers. Short delays are waited out inline. Longer ones are left to the
+    caller, e.g. a Celery retry that carries the policy over with to_dict.
+    Delays use full-jitter exponential backoff and never undercut a
+    Retry-After from the provider.
+    """
+    max_retries: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    # Longest delay slept in place, longer ones are handed to the caller
+    max_inline_delay: float = 10.0
+    # Wall clock time after which no retry is started
+    deadline: float | None = None
+    retries: int = 0
+    # One entry per retry: reason, delay, error and when it happened
+    history: list[dict[str, Any]] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        deadline = config.llm_retry_deadline
+        return cls(
+            max_retries=config.llm_retry_max,
+            base_delay=config.llm_retry_base_delay,
+            max_delay=config.llm_retry_max_delay,
+            max_inline_delay=config.llm_retry_max_inline_delay,
+            deadline=time.time() + deadline if deadline > 0 else None,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RetryPolicy":
+        return cls(**data)
+
+    @staticmethod
+    def tightest(policies: list["RetryPolicy"]) -> "RetryPolicy":
+        """The policy closest to running out, for one request made on behalf of several."""
+        return min(policies, key=lambda policy: (
+            policy.deadline if policy.deadline is not None else float("inf"),
+            policy.max_retries - policy.retries,
+        ))
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "max_retries": self.max_retries,
+                "base_delay": self.base_delay,
+                "max_delay": self.max_delay,
+                "max_inline_delay": self.max_inline_delay,
+                "deadline": self.deadline,
+                "retries": self.retries,
+                "history": list(self.history),
+            }
+
+    def next_delay(self, error: BaseException, inline: bool = False, reason: str | None = None) -> float | None:
+        """
+        Spend one retry on an error and return the seconds to wait first.
+
+        Returns None without spending anything when the error is not
+        retryable, the budget or deadline is used up, or, for inline
+        retries, the delay is too long to sleep in place.
+        """
+        reason = reason or retry_reason(error)
+        if reason is None:
+            return None
+
+        with self._lock:
+            if self.retries >= self.max_retries:
+                return None
+            delay = self._backoff(retry_after(error))
+            if inline and delay > self.max_inline_delay:
+                return None
+            if self.deadline is not None and time.time() + delay > self.deadline:
+                return None
+            self.retries += 1
+            self.history.append({
+                "reason": reason,
+                "delay": round(delay, 2),
+                "error": f"{type(error).__name__}: {error}"[:200],
+                "at": datetime.now(UTC).isoformat(),
+            })
+
+        logger.warning(f"Retry {self.retries}/{self.max_retries} in {delay:.1f}s ({reason}): {error}")
+        return delay
+
+    def reasons(self) -> list[str]:
+        with self._lock:
+            return [entry["reason"] for entry in self.history]
+
+    def _backoff(self, retry_after: float | None) -> float:
+        # Full jitter keeps clients that failed together from retrying together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** self.retries))
+        if retry_after is not None:
+            # Never sooner than asked, spread over one base delay after that
+            delay = retry_after + random.uniform(0, self.base_delay)
+        return delay
@@ -0,0 +1,377 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from src.inference.retry import retry_reason
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, float("inf"))
+
+
+@dataclass
+class ModelLatency:
+    """Latency histogram and rolling window of recent successful calls for one model."""
+    window: int = 200
+    successes: int = 0
+    errors: int = 0
+    hedge_wins: int = 0
+    cancelled: int = 0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    _recent: deque[float] = field(default_factory=deque, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.successes += 1
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self._recent.append(latency)
+            if len(self._recent) > self.window:
+                self._recent.popleft()
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def percentile(self, q: float) -> float | None:
+        """Latency percentile over the rolling window, None when there are no samples."""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    @property
+    def samples(self) -> int:
+        return len(self._recent)
+
+    def to_dict(self) -> dict[str, Any]:
+        calls = self.successes + self.errors
+        return {
+            "successes": self.successes,
+            "errors": self.errors,
+            "error_rate": round(self.errors / calls, 4) if calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "cancelled": self.cancelled,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "histogram": {
+                ("+Inf" if bound == float("inf") else str(bound)): count
+                for bound, count in zip(LATENCY_BUCKETS, self.buckets, strict=True)
+            },
+        }
+
+
+class ModelRouter:
+    """
+    Send a request down an ordered list of models, hedging slow attempts.
+
+    The first model is tried alone. If it has not answered after the hedge
+    delay, the next model in the route is started as well, and the first
+    successful response wins. Outstanding attempts are then cancelled. The
+    hedge delay is the configured percentile of the latency of the model
+    being waited on, so only the slowest few percent of calls are
+    duplicated. Hedges are capped at a fraction of routed requests, so a
+    provider slowdown that affects every call does not double the load on it.
+
+    A failed attempt moves on to the next different model right away, outside
+    the hedge budget, but only for errors worth retrying (see retry_reason).
+    A bad request or unparseable output is not sent again, and retrying the
+    same model is left to the caller's RetryPolicy, which honours Retry-After.
+    """
+
+    def __init__(
+        self,
+        hedging: bool = True,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        default_delay: float = 15.0,
+        min_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_hedge_ratio: float = 0.1,
+        max_workers: int = 64,
+    ):
+        self.hedging = hedging
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_workers = max_workers
+        self.routed = 0
+        self.hedges = 0
+        self._latency: dict[str, ModelLatency] = {}
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def attempts(self, route: list[str]) -> list[str]:
+        """Models to try in order. A single-model route hedges against itself when slow."""
+        if not self.hedging:
+            return route
+        return route if len(route) > 1 else route * 2
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait on a model before starting the next attempt."""
+        latency = self._get_latency(model)
+        if latency.samples < self.min_samples:
+            return self.default_delay
+        return min(max(latency.percentile(self.percentile), self.min_delay), self.max_delay)
+
+    def route(self, route: list[str], call: Callable[[str], T]) -> tuple[T, str]:
+        """
+        Run call(model) along the route and return the first successful result and its model.
+
+        Worker threads cannot be interrupted, so a losing attempt runs to
+        completion in the background and its result is discarded.
+        """
+        attempts = self.attempts(route)
+        self._count("routed")
+        if not self.hedging:
+            return self._failover(attempts, call)
+
+        executor = self._get_executor()
+        pending: dict[Future, tuple[int, str]] = {}
+        last_error: BaseException | None = None
+        failed: str | None = None
+        next_attempt = 0
+        deadline = None
+
+        while True:
+            if next_attempt < len(attempts) and self._due(pending, failed, deadline):
+                model = attempts[next_attempt]
+                if failed is not None:
+                    logger.warning(f"Model {failed} failed, falling back to {model}")
+                pending[executor.submit(self._timed, model, call)] = (next_attempt, model)
+                next_attempt += 1
+                failed = None
+                deadline = self._next_deadline(model, next_attempt < len(attempts))
+            elif next_attempt < len(attempts) and deadline is not None and time.monotonic() >= deadline:
+                # Out of hedge budget, keep waiting on the outstanding attempts
+                deadline = None
+            if not pending:
+                raise last_error
+
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt, model = pending.pop(future)
+                if future.exception() is None:
+                    self._finish(model, attempt, pending.values())
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result(), model
+                last_error = future.exception()
+                next_attempt = self._fallback(attempts, next_attempt, model, last_error)
+                if next_attempt < len(attempts):
+                    failed = model
+
+    async def route_async(self, route: list[str], call: Callable[[str], Awaitable[T]]) -> tuple[T, str]:
+        """Async variant of route. Losing attempts are cancelled, closing their connections."""
+        attempts = self.attempts(route)
+        self._count("routed")
+        if not self.hedging:
+            return await self._failover_async(attempts, call)
+
+        pending: dict[asyncio.Task, tuple[int, str]] = {}
+        last_error: BaseException | None = None
+        failed: str | None = None
+        next_attempt = 0
+        deadline = None
+
+        try:
+            while True:
+                if next_attempt < len(attempts) and self._due(pending, failed, deadline):
+                    model = attempts[next_attempt]
+                    if failed is not None:
+                        logger.warning(f"Model {failed} failed, falling back to {model}")
+                    pending[asyncio.create_task(self._timed_async(model, call))] = (next_attempt, model)
+                    next_attempt += 1
+                    failed = None
+                    deadline = self._next_deadline(model, next_attempt < len(attempts))
+                elif next_attempt < len(attempts) and deadline is not None and time.monotonic() >= deadline:
+                    # Out of hedge budget, keep waiting on the outstanding attempts
+                    deadline = None
+                if not pending:
+                    raise last_error
+
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt, model = pending.pop(task)
+                    if task.exception() is None:
+                        self._finish(model, attempt, pending.values())
+                        return task.result(), model
+                    last_error = task.exception()
+                    next_attempt = self._fallback(attempts, next_attempt, model, last_error)
+                    if next_attempt < len(attempts):
+                        failed = model
+        finally:
+            # Cancel losers, and every attempt if the caller itself was cancelled
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hedging": self.hedging,
+            "routed": self.routed,
+            "hedges": self.hedges,
+            "models": {
+                model: {**latency.to_dict(), "hedge_delay": round(self.hedge_delay(model), 3)}
+                for model, latency in list(self._latency.items())
+            },
+        }
+
+    def _failover(self, attempts: list[str], call: Callable[[str], T]) -> tuple[T, str]:
+        """Try one model after the other, moving on only when an attempt fails with a retryable error."""
+        attempt = 0
+        while True:
+            model = attempts[attempt]
+            try:
+                result = self._timed(model, call)
+            except Exception as e:
+                attempt = self._fallback(attempts, attempt + 1, model, e)
+                if attempt == len(attempts):
+                    raise
+                logger.warning(f"Model {model} failed, falling back to {attempts[attempt]}")
+                continue
+            self._finish(model, attempt, [])
+            return result, model
+
+    async def _failover_async(self, attempts: list[str], call: Callable[[str], Awaitable[T]]) -> tuple[T, str]:
+        """Async variant of _failover."""
+        attempt = 0
+        while True:
+            model = attempts[attempt]
+            try:
+                result = await self._timed_async(model, call)
+            except Exception as e:
+                attempt = self._fallback(attempts, attempt + 1, model, e)
+                if attempt == len(attempts):
+                    raise
+                logger.warning(f"Model {model} failed, falling back to {attempts[attempt]}")
+                continue
+            self._finish(model, attempt, [])
+            return result, model
+
+    def _timed(self, model: str, call: Callable[[str], T]) -> T:
+        start = time.monotonic()
+        try:
+            result = call(model)
+        except Exception:
+            self._get_latency(model).increment("errors")
+            raise
+        self._get_latency(model).record_success(time.monotonic() - start)
+        return result
+
+    async def _timed_async(self, model: str, call: Callable[[str], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._get_latency(model).increment("errors")
+            raise
+        self._get_latency(model).record_success(time.monotonic() - start)
+        return result
+
+    def _finish(self, winner: str, attempt: int, losers) -> None:
+        # A hedge won when the first attempt was still running or had failed
+        if attempt:
+            self._get_latency(winner).increment("hedge_wins")
+        for _attempt, model in losers:
+            self._get_latency(model).increment("cancelled")
+
+    def _due(self, pending, failed: str | None, deadline: float | None) -> bool:
+        """Whether to start the next attempt now."""
+        if not pending or failed is not None:
+            # The first attempt, or a failover, which is not a hedge
+            return True
+        return deadline is not None and time.monotonic() >= deadline and self._take_hedge()
+
+    @staticmethod
+    def _fallback(attempts: list[str], next_attempt: int, failed: str, error: BaseException) -> int:
+        """
+        Index of the attempt to fail over to after `failed` raised error.
+
+        Returns len(attempts) when no more attempts should start: the error is
+        not worth retrying, or only the same model is left to try.
+        """
+        if retry_reason(error) is None:
+            return len(attempts)
+        for index in range(next_attempt, len(attempts)):
+            if attempts[index] != failed:
+                return index
+        return len(attempts)
+
+    def _next_deadline(self, model: str, has_next: bool) -> float | None:
+        """When to start the next attempt, None when there is none."""
+        if not has_next:
+            return None
+        return time.monotonic() + self.hedge_delay(model)
+
+    def _take_hedge(self) -> bool:
+        # When every call is slow, hedging would only add load. Failovers
+        # to the next model do not use the budget.
+        with self._lock:
+            if self.hedges >= self.max_hedge_ratio * self.routed:
+                return False
+            self.hedges += 1
+            return True
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _get_latency(self, model: str) -> ModelLatency:
+        with self._lock:
+            if model not in self._latency:
+                self._latency[model] = ModelLatency()
+            return self._latency[model]
+
+    def _reset_after_fork(self):
+        # The parent's worker threads do not exist in the child
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm-hedge")
+            return self._executor
+
+
+def model_route(model: str | None = None) -> list[str]:
+    """Ordered models to try. An explicit model pins the route to that model."""
+    if model:
+        return [model]
+    return [config.openrouter_model, *config.openrouter_fallback_models]
+
+
+# Global model router
+model_router = ModelRouter(
+    hedging=config.llm_hedging_enabled,
+    percentile=config.llm_hedge_percentile,
+    min_samples=config.llm_hedge_min_samples,
+    default_delay=config.llm_hedge_default_delay,
+    min_delay=config.llm_hedge_min_delay,
+    max_delay=config.llm_hedge_max_delay,
+    max_hedge_ratio=config.llm_hedge_max_ratio,
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=model_router._reset_after_fork)
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Future
+from typing import Any
+
+from src.schemas import DetectionResult
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Publishes the leader's result, or an empty message when it failed, then
+# releases the lock if it is still held by the same leader
+RELEASE_SCRIPT = """
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+end
+redis.call('PUBLISH', KEYS[3], ARGV[2])
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+
+class _LeaderCancelled(Exception):
+    """The in-process leader was cancelled before producing a result."""
+
+
+class SingleFlight[T]:
+    """
+    Coalesce concurrent calls with the same key into a single execution.
+
+    Within a process, the first caller for a key runs the call and every
+    concurrent caller (thread or task) waits for its result. Across
+    processes, the leader holds a Redis lock while it runs and publishes
+    the result on a per-key channel. Callers in other processes subscribe
+    and reuse it. If the remote leader fails or disappears, waiting callers
+    compete for the lock again. When Redis is unavailable, only in-process
+    coalescing applies.
+    """
+
+    # Seconds to skip Redis after it fails
+    BACKEND_RETRY_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        encode: Callable[[T], bytes],
+        decode: Callable[[bytes], T],
+        redis_url: str | None = None,
+        lock_ttl: float = 300.0,
+        wait_timeout: float = 300.0,
+        result_ttl: int = 60,
+        prefix: str = "singleflight:",
+    ):
+        self.encode = encode
+        self.decode = decode
+        self.redis_url = redis_url
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.prefix = prefix
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self.errors = 0
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._async_redis: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any] = weakref.WeakKeyDictionary()
+        self._backend_retry_at = 0.0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Run fn, or wait for the identical call already in flight."""
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+
+            if leader:
+                break
+            try:
+                result = future.result()
+            except _LeaderCancelled:
+                # The leader was an async caller that went away, take over
+                continue
+            self._count("coalesced")
+            return result
+
+        try:
+            result = self._run_shared(key, fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of do. Shares in-flight calls with threads of the same process."""
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+
+            if leader:
+                break
+            try:
+                result = await asyncio.wrap_future(future)
+            except _LeaderCancelled:
+                # The leader's caller went away, take over
+                continue
+            self._count("coalesced")
+            return result
+
+        try:
+            result = await self._arun_shared(key, fn)
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "redis" if self.redis_url else "memory",
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_remote": self.coalesced_remote,
+            "errors": self.errors,
+        }
+
+    def _keys(self, key: str) -> list[str]:
+        return [f"{self.prefix}lock:{key}", f"{self.prefix}result:{key}", f"{self.prefix}channel:{key}"]
+
+    def _run_shared(self, key: str, fn: Callable[[], T]) -> T:
+        client = self._client()
+        token = uuid.uuid4().hex
+        lock_key, result_key, channel = self._keys(key)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while client is not None:
+            try:
+                if client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                    break
+                value = self._wait_remote(client, key, deadline)
+            except Exception as e:
+                self._backend_failed(e)
+                client = None
+                break
+            if value is not None:
+                self._count("coalesced_remote")
+                return self.decode(value)
+            if time.monotonic() >= deadline:
+                client = None
+
+        self._count("leaders")
+        if client is None:
+            return fn()
+
+        encoded = b""
+        try:
+            result = fn()
+            encoded = self.encode(result)
+            return result
+        finally:
+            try:
+                client.eval(RELEASE_SCRIPT, 3, lock_key, result_key, channel, token, encoded, self.result_ttl)
+            except Exception as e:
+                self._backend_failed(e)
+
+    def _wait_remote(self, client, key: str, deadline: float) -> bytes | None:
+        """Wait for another process's leader. Returns its result, or None when it failed or vanished."""
+        lock_key, result_key, channel = self._keys(key)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(channel)
+            # The leader may have finished before we subscribed
+            value = client.get(result_key)
+            while value is None and time.monotonic() < deadline:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    return message["data"] or None
+                if not client.exists(lock_key):
+                    return client.get(result_key)
+            return value
+        finally:
+            pubsub.close()
+
+    async def _arun_shared(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        client = self._aclient()
+        token = uuid.uuid4().hex
+        lock_key, result_key, channel = self._keys(key)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while client is not None:
+            try:
+                if await client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                    break
+                value = await self._await_remote(client, key, deadline)
+            except Exception as e:
+                self._backend_failed(e)
+                client = None
+                break
+            if value is not None:
+                self._count("coalesced_remote")
+                return self.decode(value)
+            if time.monotonic() >= deadline:
+                client = None
+
+        self._count("leaders")
+        if client is None:
+            return await fn()
+
+        encoded = b""
+        try:
+            result = await fn()
+            encoded = self.encode(result)
+            return result
+        finally:
+            try:
+                await client.eval(RELEASE_SCRIPT, 3, lock_key, result_key, channel, token, encoded, self.result_ttl)
+            except Exception as e:
+                self._backend_failed(e)
+
+    async def _await_remote(self, client, key: str, deadline: float) -> bytes | None:
+        """Async variant of _wait_remote."""
+        lock_key, result_key, channel = self._keys(key)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            value = await client.get(result_key)
+            while value is None and time.monotonic() < deadline:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    return message["data"] or None
+                if not await client.exists(lock_key):
+                    return await client.get(result_key)
+            return value
+        finally:
+            await pubsub.aclose()
+
+    def _client(self):
+        if not self.redis_url or time.monotonic() < self._backend_retry_at:
+            return None
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url, socket_connect_timeout=1.0)
+        return self._redis
+
+    def _aclient(self):
+        if not self.redis_url or time.monotonic() < self._backend_retry_at:
+            return None
+        # asyncio Redis connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        client = self._async_redis.get(loop)
+        if client is None:
+            import redis.asyncio
+
+            client = self._async_redis[loop] = redis.asyncio.Redis.from_url(self.redis_url, socket_connect_timeout=1.0)
+        return client
+
+    def _backend_failed(self, error: Exception):
+        # Never fail a prediction because coordination is unavailable
+        logger.warning(f"Single-flight Redis unavailable, coalescing in-process only: {error}")
+        self._count("errors")
+        self._backend_retry_at = time.monotonic() + self.BACKEND_RETRY_INTERVAL
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _reset_after_fork(self):
+        # In-flight calls belong to the parent's threads and never finish here
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._redis = None
+        self._async_redis = weakref.WeakKeyDictionary()
+
+
+def build_single_flight() -> SingleFlight[DetectionResult] | None:
+    """Create the single-flight layer configured in settings, or None when disabled."""
+    backend_name = config.singleflight_backend.lower()
+
+    if backend_name == "none":
+        return None
+    if backend_name not in ("memory", "redis"):
+        raise ValueError(f"Unknown single-flight backend: {config.singleflight_backend}")
+
+    return SingleFlight(
+        encode=lambda result: result.model_dump_json().encode(),
+        decode=DetectionResult.model_validate_json,
+        redis_url=config.redis_url if backend_name == "redis" else None,
+        lock_ttl=config.singleflight_lock_ttl,
+        wait_timeout=config.singleflight_wait_timeout,
+        result_ttl=config.singleflight_result_ttl,
+    )
+
+
+# Global single-flight layer for predictions
+single_flight = build_single_flight()
+
+if single_flight and hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=single_flight._reset_after_fork)
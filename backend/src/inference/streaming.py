@@ -0,0 +1,90 @@
+import json
+import logging
+from typing import Any
+
+from json_repair import repair_json
+
+logger = logging.getLogger(__name__)
+
+
+class AnnotationStreamParser:
+    """
+    Incremental parser for the `annotations` array of a streamed completion.
+
+    Text is fed as it arrives. Each object in the array is returned as soon
+    as its closing brace is seen, without waiting for the rest of the
+    document. Only string and bracket state is tracked, so the scan is a
+    single pass over the text.
+    """
+
+    ARRAY_KEY = '"annotations"'
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0
+        # Bracket depth of the annotations array once its opening bracket is seen
+        self._array_depth: int | None = None
+        self._item_start: int | None = None
+        self._done = False
+        # Items that needed JSON repair, and malformed items that were skipped
+        self.repaired = 0
+        self.dropped = 0
+
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        """Consume a chunk of model output and return the items completed by it."""
+        self.text += chunk
+        items = []
+
+        while self._pos < len(self.text) and not self._done:
+            char = self.text[self._pos]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._array_depth is None and self._follows_array_key():
+                    self._array_depth = self._depth
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = self._pos
+            elif char in "}]":
+                if char == "}" and self._item_start is not None and self._depth == self._array_depth + 1:
+                    item = self._parse_item(self.text[self._item_start:self._pos + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._item_start = None
+                elif char == "]" and self._depth == self._array_depth:
+                    self._done = True
+                self._depth -= 1
+
+            self._pos += 1
+
+        return items
+
+    def _follows_array_key(self) -> bool:
+        # Opening bracket preceded by `"annotations":` with optional whitespace
+        before = self.text[:self._pos].rstrip()
+        if not before.endswith(":"):
+            return False
+        return before[:-1].rstrip().endswith(self.ARRAY_KEY)
+
+    def _parse_item(self, text: str) -> dict[str, Any] | None:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            item = repair_json(text, return_objects=True)
+            self.repaired += 1
+        if not isinstance(item, dict):
+            logger.warning(f"Skipping malformed streamed annotation: {text[:200]}")
+            self.dropped += 1
+            return None
+        return item
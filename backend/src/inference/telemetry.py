@@ -0,0 +1,248 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Protocol
+
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CallRecord:
+    """Timing, size and usage of a single LLM detection call."""
+    model: str
+    streamed: bool = False
+    images: int = 1  # Images sent in the request, more than one when packed
+    started_at: str = field(default_factory=lambda: datetime.now(UTC).isoformat())
+    encode_time: float | None = None  # Seconds spent base64 encoding and building messages
+    request_bytes: int | None = None  # Size of the HTTP request body
+    ttfb: float | None = None  # Seconds from sending to the first response byte, last attempt
+    total_time: float | None = None  # Seconds for the whole call including retries
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    json_repaired: bool = False  # Model output was not valid JSON and had to be repaired
+    annotations: int = 0
+    dropped_annotations: int = 0  # Items in the output that failed validation
+    retries: int = 0
+    retry_reasons: list[str] = field(default_factory=list)  # Why each retry happened, e.g. rate_limited
+    status: str = "ok"
+    error: str | None = None
+    _request_started: float | None = field(default=None, repr=False)
+
+    def mark_request_sent(self) -> None:
+        # Each retry restarts the clock, so ttfb reflects the attempt that answered
+        self._request_started = time.perf_counter()
+        self.ttfb = None
+
+    def mark_first_byte(self) -> None:
+        if self._request_started is not None and self.ttfb is None:
+            self.ttfb = time.perf_counter() - self._request_started
+
+    def set_usage(self, usage: Any) -> None:
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_tokens
+            self.completion_tokens = usage.completion_tokens
+
+    def to_dict(self) -> dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if not key.startswith("_")}
+
+
+# Record of the LLM call running in the current thread or task
+_current_call: contextvars.ContextVar[CallRecord | None] = contextvars.ContextVar("llm_call", default=None)
+
+
+def current_call() -> CallRecord | None:
+    """Record of the LLM call in progress, for code deeper in the stack to annotate."""
+    return _current_call.get()
+
+
+class TelemetrySink(Protocol):
+    """Destination for finished call records."""
+
+    def emit(self, record: CallRecord) -> None: ...
+
+
+class LogSink:
+    """Write each call record as one structured log line."""
+
+    def emit(self, record: CallRecord) -> None:
+        logger.info(f"LLM call {json.dumps(record.to_dict())}")
+
+
+class JsonlSink:
+    """Append call records to a JSON Lines file for offline analysis."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def emit(self, record: CallRecord) -> None:
+        line = json.dumps(record.to_dict()) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+class PrometheusSink:
+    """Export call records as Prometheus metrics. Requires prometheus-client."""
+
+    def __init__(self):
+        from prometheus_client import Counter, Histogram
+
+        seconds = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+        self.calls = Counter("llm_calls_total", "LLM detection calls", ["model", "status"])
+        self.total_time = Histogram("llm_call_seconds", "LLM call duration including retries", ["model"], buckets=seconds)
+        self.ttfb = Histogram("llm_ttfb_seconds", "Time to first response byte", ["model"], buckets=seconds)
+        self.encode_time = Histogram("llm_encode_seconds", "Image encoding time", ["model"])
+        self.request_bytes = Histogram(
+            "llm_request_bytes", "Request body size", ["model"],
+            buckets=(1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7),
+        )
+        self.tokens = Counter("llm_tokens_total", "Tokens used", ["model", "kind"])
+        self.retries = Counter("llm_retries_total", "Retried LLM requests", ["model", "reason"])
+        self.repaired = Counter("llm_json_repaired_total", "Responses that needed JSON repair", ["model"])
+        self.dropped = Counter("llm_dropped_annotations_total", "Annotations that failed validation", ["model"])
+
+    def emit(self, record: CallRecord) -> None:
+        model = record.model
+        self.calls.labels(model, record.status).inc()
+        self.total_time.labels(model).observe(record.total_time or 0)
+        if record.ttfb is not None:
+            self.ttfb.labels(model).observe(record.ttfb)
+        if record.encode_time is not None:
+            self.encode_time.labels(model).observe(record.encode_time)
+        if record.request_bytes is not None:
+            self.request_bytes.labels(model).observe(record.request_bytes)
+        self.tokens.labels(model, "prompt").inc(record.prompt_tokens or 0)
+        self.tokens.labels(model, "completion").inc(record.completion_tokens or 0)
+        for reason in record.retry_reasons:
+            self.retries.labels(model, reason).inc()
+        self.repaired.labels(model).inc(int(record.json_repaired))
+        self.dropped.labels(model).inc(record.dropped_annotations)
+
+
+class LLMTelemetry:
+    """Collects per-call records, forwards them to the sinks and keeps running totals."""
+
+    def __init__(self, sinks: list[TelemetrySink]):
+        self.sinks = sinks
+        self._totals: dict[str, float] = {
+            "calls": 0, "errors": 0, "retries": 0, "json_repaired": 0, "dropped_annotations": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "request_bytes": 0,
+            "total_time": 0.0, "ttfb": 0.0, "ttfb_samples": 0, "encode_time": 0.0,
+        }
+        self._retry_reasons: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def record_call(self, model: str, streamed: bool = False, activate: bool = True) -> Iterator[CallRecord]:
+        """
+        Time an LLM call and emit its record when it finishes or fails.
+
+        With activate, the record is current for the duration of the block.
+        Async generators must pass activate=False and use activate() around
+        their awaits instead, since a context variable cannot span a yield.
+        """
+        record = CallRecord(model=model, streamed=streamed)
+        start = time.perf_counter()
+        try:
+            if activate:
+                with self.activate(record):
+                    yield record
+            else:
+                yield record
+        except (asyncio.CancelledError, GeneratorExit):
+            # Lost a hedge race or the client went away
+            record.status = "cancelled"
+            raise
+        except BaseException as e:
+            record.status = "error"
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.total_time = time.perf_counter() - start
+            self.emit(record)
+
+    @contextmanager
+    def activate(self, record: CallRecord) -> Iterator[CallRecord]:
+        """Make a record current so HTTP hooks and the parser can annotate it."""
+        token = _current_call.set(record)
+        try:
+            yield record
+        finally:
+            _current_call.reset(token)
+
+    def emit(self, record: CallRecord) -> None:
+        with self._lock:
+            totals = self._totals
+            totals["calls"] += 1
+            totals["errors"] += record.status == "error"
+            totals["retries"] += record.retries
+            for reason in record.retry_reasons:
+                self._retry_reasons[reason] = self._retry_reasons.get(reason, 0) + 1
+            totals["json_repaired"] += record.json_repaired
+            totals["dropped_annotations"] += record.dropped_annotations
+            totals["prompt_tokens"] += record.prompt_tokens or 0
+            totals["completion_tokens"] += record.completion_tokens or 0
+            totals["request_bytes"] += record.request_bytes or 0
+            totals["total_time"] += record.total_time or 0
+            totals["encode_time"] += record.encode_time or 0
+            if record.ttfb is not None:
+                totals["ttfb"] += record.ttfb
+                totals["ttfb_samples"] += 1
+
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                # Telemetry must never fail a prediction
+                logger.warning(f"Telemetry sink {type(sink).__name__} failed: {e}")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            totals = dict(self._totals)
+            retry_reasons = dict(self._retry_reasons)
+        calls = totals["calls"]
+        return {
+            "sinks": [type(sink).__name__ for sink in self.sinks],
+            "calls": calls,
+            "errors": totals["errors"],
+            "retries": totals["retries"],
+            "retry_reasons": retry_reasons,
+            "json_repaired": totals["json_repaired"],
+            "dropped_annotations": totals["dropped_annotations"],
+            "prompt_tokens": totals["prompt_tokens"],
+            "completion_tokens": totals["completion_tokens"],
+            "avg_request_bytes": round(totals["request_bytes"] / calls) if calls else None,
+            "avg_encode_ms": round(totals["encode_time"] / calls * 1000, 2) if calls else None,
+            "avg_ttfb_ms": round(totals["ttfb"] / totals["ttfb_samples"] * 1000, 2) if totals["ttfb_samples"] else None,
+            "avg_total_ms": round(totals["total_time"] / calls * 1000, 2) if calls else None,
+        }
+
+
+def build_telemetry() -> LLMTelemetry:
+    """Create the telemetry sinks configured in settings."""
+    sinks: list[TelemetrySink] = []
+    for name in filter(None, (part.strip().lower() for part in config.llm_telemetry_sinks.split(","))):
+        if name == "log":
+            sinks.append(LogSink())
+        elif name == "jsonl":
+            sinks.append(JsonlSink(Path(config.llm_telemetry_jsonl_path)))
+        elif name == "prometheus":
+            sinks.append(PrometheusSink())
+        else:
+            raise ValueError(f"Unknown telemetry sink: {name}")
+    return LLMTelemetry(sinks)
+
+
+# Global LLM call telemetry
+telemetry = build_telemetry()
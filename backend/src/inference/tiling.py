@@ -0,0 +1,204 @@
+import io
+import math
+from dataclasses import dataclass
+
+from PIL import Image, UnidentifiedImageError
+
+from src.inference.image_info import read_image_info
+from src.schemas import AnnotationSchema
+from src.settings import config
+
+# Coordinates returned by the model are normalized to this range
+NORMALIZED_SCALE = 1000
+
+# Boxes within this many normalized units of an interior tile edge are treated as cut off
+EDGE_MARGIN = 5
+
+
+@dataclass(frozen=True)
+class TilingOptions:
+    """How tall images are split into overlapping horizontal bands."""
+    enabled: bool = True
+    tile_height: int = 1600  # Tile height in source pixels
+    overlap: float = 0.15  # Fraction of tile height shared with the next tile
+    iou_threshold: float = 0.5  # Same-tag boxes above this IoU are duplicates
+
+    @classmethod
+    def from_settings(cls) -> "TilingOptions":
+        return cls(
+            enabled=config.tiling_enabled,
+            tile_height=config.tile_height,
+            overlap=config.tile_overlap,
+        )
+
+    def __post_init__(self):
+        if self.tile_height <= 0:
+            raise ValueError("Tile height must be positive")
+        if not 0 <= self.overlap < 1:
+            raise ValueError("Tile overlap must be in [0, 1)")
+
+
+@dataclass(frozen=True)
+class TileBox:
+    """Pixel rectangle of a tile within the full image."""
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+def read_image_size(image_data: bytes) -> tuple[int, int]:
+    """Image width and height from the header, without decoding pixels."""
+    try:
+        info = read_image_info(image_data)
+        return info.width, info.height
+    except ValueError:
+        # Formats the header reader does not know, Pillow also only reads the header
+        pass
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            return image.size
+    except UnidentifiedImageError:
+        raise ValueError("File is not a valid image")
+
+
+def plan_tiles(image_width: int, image_height: int, options: TilingOptions) -> list[TileBox]:
+    """
+    Split an image into full-width, vertically overlapping tiles.
+
+    Args:
+        image_width: Image width in pixels
+        image_height: Image height in pixels
+        options: Tiling options
+
+    Returns:
+        Tiles from top to bottom, or a single full-image tile when the image is short enough
+    """
+    tile_height = options.tile_height
+    overlap = int(tile_height * options.overlap)
+    if image_height <= tile_height + overlap:
+        return [TileBox(0, 0, image_width, image_height)]
+
+    step = tile_height - overlap
+    tops = list(range(0, image_height - tile_height, step))
+    # Align the last tile with the bottom edge so nothing is left uncovered
+    tops.append(image_height - tile_height)
+    return [TileBox(0, top, image_width, tile_height) for top in tops]
+
+
+def region_tile(
+    x: float,
+    y: float,
+    width: float,
+    height: float,
+    image_width: int,
+    image_height: int,
+) -> TileBox:
+    """
+    Pixel rectangle of a region given in normalized 0-1000 coordinates, clipped to the image.
+
+    Raises ValueError when nothing of the region is left inside the image.
+    """
+    left = max(0, math.floor(x / NORMALIZED_SCALE * image_width))
+    top = max(0, math.floor(y / NORMALIZED_SCALE * image_height))
+    right = min(image_width, math.ceil((x + width) / NORMALIZED_SCALE * image_width))
+    bottom = min(image_height, math.ceil((y + height) / NORMALIZED_SCALE * image_height))
+    if right <= left or bottom <= top:
+        raise ValueError("Region must overlap the image")
+    return TileBox(left, top, right - left, bottom - top)
+
+
+def crop_tiles(image_data: bytes, tiles: list[TileBox]) -> list[bytes]:
+    """Crop tiles out of an image and encode each one losslessly."""
+    crops = []
+    with Image.open(io.BytesIO(image_data)) as image:
+        for tile in tiles:
+            region = image.crop((tile.left, tile.top, tile.left + tile.width, tile.top + tile.height))
+            buffer = io.BytesIO()
+            # Fast lossless encoding, the preprocessing stage re-encodes afterwards
+            region.save(buffer, format="PNG", compress_level=1)
+            crops.append(buffer.getvalue())
+    return crops
+
+
+def map_to_image(
+    annotation: AnnotationSchema,
+    tile: TileBox,
+    image_width: int,
+    image_height: int,
+) -> AnnotationSchema:
+    """Convert tile-local normalized coordinates to full-image normalized coordinates."""
+    scale_x = tile.width / image_width
+    scale_y = tile.height / image_height
+    return AnnotationSchema(
+        x=tile.left / image_width * NORMALIZED_SCALE + annotation.x * scale_x,
+        y=tile.top / image_height * NORMALIZED_SCALE + annotation.y * scale_y,
+        width=annotation.width * scale_x,
+        height=annotation.height * scale_y,
+        tag=annotation.tag,
+    )
+
+
+def box_overlap(a: AnnotationSchema, b: AnnotationSchema) -> tuple[float, float]:
+    """IoU and intersection over the smaller box."""
+    x1 = max(a.x, b.x)
+    y1 = max(a.y, b.y)
+    x2 = min(a.x + a.width, b.x + b.width)
+    y2 = min(a.y + a.height, b.y + b.height)
+    if x2 <= x1 or y2 <= y1:
+        return 0.0, 0.0
+
+    intersection = (x2 - x1) * (y2 - y1)
+    area_a = a.width * a.height
+    area_b = b.width * b.height
+    return intersection / (area_a + area_b - intersection), intersection / min(area_a, area_b)
+
+
+def merge_tile_annotations(
+    tile_results: list[tuple[TileBox, list[AnnotationSchema]]],
+    image_width: int,
+    image_height: int,
+    options: TilingOptions,
+) -> list[AnnotationSchema]:
+    """
+    Map per-tile detections to the full image and drop duplicates from overlap zones.
+
+    Boxes cut off by an interior tile edge rank below complete boxes, so the
+    copy from the tile that saw the whole element survives non-maximum suppression.
+
+    Args:
+        tile_results: Tiles with their tile-local annotations
+        image_width: Full image width in pixels
+        image_height: Full image height in pixels
+        options: Tiling options
+
+    Returns:
+        Deduplicated annotations in full-image normalized coordinates
+    """
+    candidates: list[tuple[bool, AnnotationSchema]] = []
+    last_index = len(tile_results) - 1
+
+    for index, (tile, annotations) in enumerate(tile_results):
+        for annotation in annotations:
+            cut_top = index > 0 and annotation.y <= EDGE_MARGIN
+            cut_bottom = index < last_index and annotation.y + annotation.height >= NORMALIZED_SCALE - EDGE_MARGIN
+            candidates.append((cut_top or cut_bottom, map_to_image(annotation, tile, image_width, image_height)))
+
+    # Complete boxes first, then larger boxes first
+    candidates.sort(key=lambda item: (item[0], -item[1].width * item[1].height))
+
+    kept: list[tuple[bool, AnnotationSchema]] = []
+    for truncated, annotation in candidates:
+        duplicate = False
+        for kept_truncated, other in kept:
+            if other.tag != annotation.tag:
+                continue
+            iou, overlap_of_smaller = box_overlap(annotation, other)
+            # A cut-off box lying inside a kept box is the same element seen partially
+            if iou >= options.iou_threshold or ((truncated or kept_truncated) and overlap_of_smaller >= 0.8):
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((truncated, annotation))
+
+    return [annotation for _truncated, annotation in sorted(kept, key=lambda item: (item[1].y, item[1].x))]
@@ -1,13 +1,49 @@
+import asyncio
 import base64
 import json
 import logging
 import time
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, astuple
+from functools import partial
 from pathlib import Path
 from typing import Any
 
-from openai import OpenAI, RateLimitError, APIError
+from openai import AsyncStream, APIError
+from openai.types.chat import ChatCompletionChunk
 from json_repair import repair_json
 
+from src.inference.breaker import CircuitOpenError, circuit_breaker
+from src.inference.cache import PredictionCache, prediction_cache
+from src.inference.cascade import CascadeOptions, cascade_stats, escalation_reasons
+from src.inference.clients import llm_clients
+from src.inference.concurrency import provider_slot, provider_slot_async
+from src.inference.dedup import fingerprint, near_duplicates
+from src.inference.packing import packing_stats, split_packed_output
+from src.inference.preprocess import (
+    PreprocessedImage,
+    PreprocessOptions,
+    preprocess_image,
+    preprocess_image_async,
+)
+from src.inference.ratelimit import estimate_tokens, rate_limiter
+from src.inference.retry import RetryPolicy, retry_reason
+from src.inference.routing import model_route, model_router
+from src.inference.singleflight import single_flight
+from src.inference.streaming import AnnotationStreamParser
+from src.inference.telemetry import CallRecord, current_call, telemetry
+from src.inference.tiling import (
+    TileBox,
+    TilingOptions,
+    crop_tiles,
+    map_to_image,
+    merge_tile_annotations,
+    plan_tiles,
+    read_image_size,
+    region_tile,
+)
 from src.schemas import (
     AnnotationSchema,
     DetectionResult,
@@ -32,22 +68,37 @@ USER_PROMPT = (
     "Detect all of the prominent items in the image. The box_2d should be [ymin, xmin, ymax, xmax] normalized to 0-1000."
 )
 
-def detect_ui_elements(
-    *,
-    image_data: bytes,
-    image_type: str,
-) -> DetectionResult:
-    """Call a multimodal LLM via OpenRouter to detect UI elements."""
+# Prompts for several images sent in one request, each labelled with its index
+PACKED_SYSTEM_PROMPT = (
+    "You are a multimodal assistant that identifies user-interface elements in images. "
+    "You are given several images of web or mobile UIs, each preceded by a label 'Image <index>:'. "
+    "Detect all of the prominent items in every image independently. "
+    f"Focus on these element types: {', '.join(UI_ELEMENT_TYPES)}. "
+    "For every detected element, output a JSON object with the keys: box_2d, tag. "
+    "The box_2d should be [ymin, xmin, ymax, xmax] normalized to 0-1000 relative to its own image. "
+    f"The tag is one of: {', '.join(UI_ELEMENT_TYPES)}. "
+    "Return your response as a JSON object with an 'images' array holding one entry per image, "
+    "each with the image 'index' and its 'annotations' array. Use an empty array for an image without elements. "
+    "Example: {\"images\": [{\"index\": 0, \"annotations\": [{\"box_2d\": [100, 200, 150, 300], \"tag\": \"button\"}]}, "
+    "{\"index\": 1, \"annotations\": []}]}"
+)
+
+PACKED_USER_PROMPT = (
+    "Detect all of the prominent items in each of the {count} images. "
+    "Return exactly one entry for every index from 0 to {last}."
+)
+
 
-    # Use model from environment variable
-    model: str = config.openrouter_model
-    api_key: str = config.openrouter_api_key
-    base_url: str = "https://openrouter.ai/api/v1"
+# Sampling temperature for detection requests
+TEMPERATURE = 0.1
 
+
+def _build_messages(image_data: bytes, image_type: str) -> list[dict[str, Any]]:
+    """Build the chat messages for a single image detection request."""
     encoded_image = base64.b64encode(image_data).decode()
     data_uri = f"data:{image_type};base64,{encoded_image}"
 
-    messages = [
+    return [
         {
             "role": "system",
             "content": SYSTEM_PROMPT,
@@ -61,75 +112,1010 @@ def detect_ui_elements(
         },
     ]
 
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-    )
-    
-    # Retry logic for rate limits
-    max_retries = 3
-    retry_delay = 1.0
-    
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                response_format={"type": "json_object"},
-                temperature=0.1,
-            )
-            break
-        except RateLimitError as e:
-            if attempt < max_retries - 1:
-                logger.warning(f"Rate limit hit, retrying in {retry_delay}s: {e}")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logger.error(f"Rate limit exceeded after {max_retries} attempts")
-                raise
-        except APIError as e:
-            logger.error(f"API error: {e}")
-            raise
 
-    content = response.choices[0].message.content
+def _build_packed_messages(images: list[tuple[bytes, str]]) -> list[dict[str, Any]]:
+    """Build the chat messages for one request covering several images."""
+    content: list[dict[str, Any]] = [
+        {"type": "text", "text": PACKED_USER_PROMPT.format(count=len(images), last=len(images) - 1)},
+    ]
+    for index, (image_data, image_type) in enumerate(images):
+        encoded_image = base64.b64encode(image_data).decode()
+        content.append({"type": "text", "text": f"Image {index}:"})
+        content.append({"type": "image_url", "image_url": f"data:{image_type};base64,{encoded_image}"})
+
+    return [
+        {
+            "role": "system",
+            "content": PACKED_SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": content,
+        },
+    ]
+
+
+def _load_output(content: str | None) -> tuple[Any, bool]:
+    """Decode the model output as JSON, repairing it when it is malformed. Returns the data and whether it was repaired."""
     if not content:
         raise ValueError("Model returned empty response")
 
-    repaired_json = repair_json(content.strip())
-    data = json.loads(repaired_json)
+    try:
+        return json.loads(content), False
+    except json.JSONDecodeError:
+        record = current_call()
+        if record is not None:
+            record.json_repaired = True
+        return json.loads(repair_json(content.strip())), True
+
+
+def _annotations_from_items(items: list[Any]) -> list[AnnotationSchema]:
+    """Convert annotation objects from the model output, dropping invalid ones."""
+    record = current_call()
+    annotations = []
+    for ann in items:
+        # One malformed box should not discard the rest of the detection
+        try:
+            annotations.append(annotation_from_item(ann))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Dropping invalid annotation {ann}: {e}")
+            if record is not None:
+                record.dropped_annotations += 1
+    if record is not None:
+        record.annotations += len(annotations)
+    return annotations
+
+
+def parse_detection_content(content: str | None) -> DetectionResult:
+    """Parse the raw model output into a DetectionResult."""
+    data, repaired = _load_output(content)
 
     annotations = data.get("annotations", [])
     if not isinstance(annotations, list):
         raise ValueError("Annotations must be a list")
 
+    return DetectionResult(annotations=_annotations_from_items(annotations), json_repaired=repaired)
+
+
+def parse_packed_content(content: str | None, count: int) -> dict[int, DetectionResult]:
+    """Parse the output of a packed request into results by image index. Missing images are left out."""
+    data, repaired = _load_output(content)
+    arrays = split_packed_output(data, count)
+    return {
+        index: DetectionResult(annotations=_annotations_from_items(items), json_repaired=repaired)
+        for index, items in arrays.items()
+    }
+
+
+def annotation_from_item(ann: dict[str, Any]) -> AnnotationSchema:
+    """Convert one annotation object from the model output into an AnnotationSchema."""
     # Convert Gemini-style box_2d format to our x, y, width, height format
-    annotations_list = []
-    for ann in annotations:
-        if "box_2d" in ann and isinstance(ann["box_2d"], list) and len(ann["box_2d"]) == 4:
-            # box_2d is [ymin, xmin, ymax, xmax] normalized to 0-1000
-            ymin, xmin, ymax, xmax = ann["box_2d"]
-            
-            # Keep coordinates in normalized form (0-1000)
-            # The frontend will need to scale these based on actual image size
-            x = xmin
-            y = ymin
-            width = xmax - xmin
-            height = ymax - ymin
-            
-            annotation = AnnotationSchema(
-                x=x,
-                y=y,
-                width=width,
-                height=height,
-                tag=ann.get("tag", "button")
-            )
-            annotations_list.append(annotation)
-        else:
-            # Fallback to old format if box_2d is not present
-            annotations_list.append(AnnotationSchema(**ann))
-
-    return DetectionResult(annotations=annotations_list)
+    if "box_2d" in ann and isinstance(ann["box_2d"], list) and len(ann["box_2d"]) == 4:
+        # box_2d is [ymin, xmin, ymax, xmax] normalized to 0-1000
+        ymin, xmin, ymax, xmax = ann["box_2d"]
+
+        # Keep coordinates in normalized form (0-1000)
+        # The frontend will need to scale these based on actual image size
+        x = xmin
+        y = ymin
+        width = xmax - xmin
+        height = ymax - ymin
+
+        return AnnotationSchema(
+            x=x,
+            y=y,
+            width=width,
+            height=height,
+            tag=ann.get("tag", "button")
+        )
+
+    # Fallback to old format if box_2d is not present
+    return AnnotationSchema(**ann)
+
+
+def _cache_key(
+    image_data: bytes,
+    model: str,
+    preprocess: PreprocessOptions,
+    tiles: list[TileBox],
+    packed: bool = False,
+) -> str:
+    # Tile layout only matters when the image is actually split
+    tile_params = {"tiles": [astuple(tile) for tile in tiles]} if len(tiles) > 1 else {}
+    return PredictionCache.make_key(
+        image_data=image_data,
+        model=model,
+        system_prompt=PACKED_SYSTEM_PROMPT if packed else SYSTEM_PROMPT,
+        user_prompt=PACKED_USER_PROMPT if packed else USER_PROMPT,
+        temperature=TEMPERATURE,
+        **preprocess.cache_params(),
+        **tile_params,
+    )
+
+
+def _plan_tiles(image_data: bytes, tiling: TilingOptions) -> tuple[list[TileBox], int, int]:
+    """Tile layout for the image, empty when tiling is off."""
+    if not tiling.enabled:
+        return [], 0, 0
+    width, height = read_image_size(image_data)
+    return plan_tiles(width, height, tiling), width, height
+
+
+def detect_ui_elements(
+    *,
+    image_data: bytes,
+    image_type: str,
+    model: str | None = None,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+    retry: RetryPolicy | None = None,
+    cascade: CascadeOptions | None = None,
+) -> DetectionResult:
+    """
+    Call a multimodal LLM via OpenRouter to detect UI elements.
+
+    Every provider call made for the image, across tiles and fallback
+    models, draws on the one retry policy. Pass it in to share a budget
+    with the caller's own retries. With the cascade enabled, the fast
+    model is asked first and the route's models only when its result
+    looks weak.
+    """
+
+    # Fall back to the model from environment variable, followed by the configured fallbacks
+    route = model_route(model)
+    model = route[0]
+    preprocess = preprocess or PreprocessOptions.from_settings()
+    tiling = tiling or TilingOptions.from_settings()
+    retry = retry or RetryPolicy.from_settings()
+    cascade = cascade or CascadeOptions.from_settings()
+    cascading = cascade.enabled and cascade.fast_model != model
+    tiles, width, height = _plan_tiles(image_data, tiling)
+
+    # Same key for the cache and for coalescing identical in-flight requests
+    reuse_near_duplicates = use_cache and near_duplicates is not None
+    use_cache = use_cache and prediction_cache is not None
+    key_model = f"{cascade.fast_model}>{model}" if cascading else model
+    key = _cache_key(image_data, key_model, preprocess, tiles) if use_cache or single_flight else None
+
+    # Serve repeated images from the content-addressed cache
+    if use_cache:
+        cached = prediction_cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Reuse the annotations of a near-identical image predicted before
+    image_fingerprint = None
+    if reuse_near_duplicates:
+        image_fingerprint = fingerprint(image_data)
+        seed = near_duplicates.lookup(image_fingerprint, key_model)
+        if seed is not None:
+            return seed
+
+    def detect() -> DetectionResult:
+        detect_image = partial(_detect_cascade, cascade=cascade) if cascading else _detect_image
+        result = detect_image(
+            image_data=image_data,
+            image_type=image_type,
+            route=route,
+            preprocess=preprocess,
+            tiling=tiling,
+            tiles=tiles,
+            image_size=(width, height),
+            retry=retry,
+        )
+        if use_cache:
+            prediction_cache.set(key, result)
+        if image_fingerprint is not None:
+            near_duplicates.add(image_fingerprint, key_model, result)
+        return result
+
+    # Concurrent identical requests share one model call
+    return single_flight.do(key, detect) if single_flight else detect()
+
+
+def _detect_image(
+    *,
+    image_data: bytes,
+    image_type: str,
+    route: list[str],
+    preprocess: PreprocessOptions,
+    tiling: TilingOptions,
+    tiles: list[TileBox],
+    image_size: tuple[int, int],
+    retry: RetryPolicy,
+) -> DetectionResult:
+    """Run detection for a whole image, tile by tile when it was split."""
+    if len(tiles) <= 1:
+        return _detect_single(
+            image_data=image_data, image_type=image_type, route=route, preprocess=preprocess, retry=retry,
+        )
+
+    # Tall screenshot: detect overlapping tiles concurrently and merge
+    crops = crop_tiles(image_data, tiles)
+    with ThreadPoolExecutor(max_workers=len(crops)) as executor:
+        tile_results = list(executor.map(
+            lambda crop: _detect_single(
+                image_data=crop, image_type="image/png", route=route, preprocess=preprocess, retry=retry,
+            ),
+            crops,
+        ))
+    annotations = merge_tile_annotations(
+        [(tile, tile_result.annotations) for tile, tile_result in zip(tiles, tile_results, strict=True)],
+        *image_size, tiling,
+    )
+    return DetectionResult(
+        annotations=annotations,
+        model=tile_results[0].model,
+        json_repaired=any(tile_result.json_repaired for tile_result in tile_results),
+    )
+
+
+def _detect_cascade(
+    *,
+    image_data: bytes,
+    route: list[str],
+    image_size: tuple[int, int],
+    cascade: CascadeOptions,
+    **kwargs: Any,
+) -> DetectionResult:
+    """Detect with the fast model, then along the route when that result looks weak."""
+    if not image_size[0]:
+        # The size is only read up front for tiling
+        image_size = read_image_size(image_data)
+
+    start = time.perf_counter()
+    try:
+        result = _detect_image(image_data=image_data, route=[cascade.fast_model], image_size=image_size, **kwargs)
+        reasons = escalation_reasons(result, image_size, cascade)
+    except CircuitOpenError:
+        # The strong model is behind the same provider
+        raise
+    except Exception as e:
+        logger.warning(f"Fast model {cascade.fast_model} failed, escalating: {e}")
+        reasons = ["fast_model_error"]
+    cascade_stats.record_tier("fast", time.perf_counter() - start)
+
+    if reasons:
+        start = time.perf_counter()
+        try:
+            result = _detect_image(image_data=image_data, route=route, image_size=image_size, **kwargs)
+        finally:
+            cascade_stats.record_tier("strong", time.perf_counter() - start)
+    cascade_stats.record_outcome(reasons)
+    result.escalation_reasons = reasons
+    return result
+
+
+def detect_ui_elements_packed(
+    *,
+    images: list[tuple[bytes, str]],
+    model: str | None = None,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+    retry: RetryPolicy | list[RetryPolicy] | None = None,
+) -> list[DetectionResult | Exception]:
+    """
+    Detect UI elements for several (image_data, image_type) pairs with one request.
+
+    Meant for small screenshots, where the fixed cost of a request outweighs
+    the image itself. Images that need tiling, and images the packed request
+    failed on or left out, fall back to detect_ui_elements. Returns one entry
+    per image in order, the exception in place of the result when the
+    fallback failed as well. The packed request and each fallback get a
+    retry policy of their own unless one is passed in, either for all
+    images or one per image. With one per image, each fallback uses its
+    image's policy and the packed request the one closest to running out.
+    """
+    retries = retry if isinstance(retry, list) else [retry] * len(images)
+    route = model_route(model)
+    preprocess = preprocess or PreprocessOptions.from_settings()
+    tiling = tiling or TilingOptions.from_settings()
+    use_cache = use_cache and prediction_cache is not None
+
+    results: list[DetectionResult | Exception | None] = [None] * len(images)
+    pack: list[tuple[int, PreprocessedImage]] = []
+    keys: dict[int, str] = {}
+    for index, (image_data, image_type) in enumerate(images):
+        try:
+            tiles, _width, _height = _plan_tiles(image_data, tiling)
+            if len(tiles) > 1:
+                # Tall screenshots are tiled on the single-image path
+                continue
+            if use_cache:
+                # A single-image result for the same image is as good as a packed one
+                cached = prediction_cache.get(_cache_key(image_data, route[0], preprocess, []))
+                keys[index] = _cache_key(image_data, route[0], preprocess, [], packed=True)
+                cached = cached or prediction_cache.get(keys[index])
+                if cached is not None:
+                    results[index] = cached
+                    continue
+            # Downsize and re-encode before base64 to shrink the request payload
+            pack.append((index, preprocess_image(image_data, image_type, preprocess)))
+        except ValueError:
+            # Invalid image, the single-image path reports the error
+            continue
+
+    if len(pack) > 1:
+        pack_retries = [retries[index] for index, _prepared in pack if retries[index] is not None]
+        pack_retry = RetryPolicy.tightest(pack_retries) if pack_retries else RetryPolicy.from_settings()
+        packed = _detect_pack([prepared for _index, prepared in pack], route, pack_retry)
+        for position, (index, _prepared) in enumerate(pack):
+            if position in packed:
+                results[index] = packed[position]
+                if use_cache:
+                    prediction_cache.set(keys[index], packed[position])
+
+    # Everything without a result yet goes through the single-image path
+    missing = [index for index, result in enumerate(results) if result is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            futures = {
+                index: executor.submit(
+                    detect_ui_elements,
+                    image_data=images[index][0],
+                    image_type=images[index][1],
+                    model=model,
+                    use_cache=use_cache,
+                    preprocess=preprocess,
+                    tiling=tiling,
+                    retry=retries[index],
+                )
+                for index in missing
+            }
+        for index, future in futures.items():
+            results[index] = future.exception() or future.result()
+
+    return results
+
+
+def _detect_pack(images: list[PreprocessedImage], route: list[str], retry: RetryPolicy) -> dict[int, DetectionResult]:
+    """Run one packed request along the model route. Returns the results by position, empty when it failed."""
+    try:
+        results, _model = model_router.route(route, lambda model: _request_packed_detection(
+            images=images, model=model, retry=retry,
+        ))
+    except Exception as e:
+        logger.warning(f"Packed request for {len(images)} images failed, falling back to single-image calls: {e}")
+        packing_stats.record(len(images), 0, failed=True)
+        return {}
+
+    packing_stats.record(len(images), len(results))
+    if len(results) < len(images):
+        logger.warning(f"Packed request returned {len(results)} of {len(images)} images, detecting the rest one by one")
+    return results
+
+
+async def detect_ui_elements_async(
+    *,
+    image_data: bytes,
+    image_type: str,
+    model: str | None = None,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+    retry: RetryPolicy | None = None,
+    cascade: CascadeOptions | None = None,
+) -> DetectionResult:
+    """Async variant of detect_ui_elements that never blocks the event loop."""
+
+    # Fall back to the model from environment variable, followed by the configured fallbacks
+    route = model_route(model)
+    model = route[0]
+    preprocess = preprocess or PreprocessOptions.from_settings()
+    tiling = tiling or TilingOptions.from_settings()
+    retry = retry or RetryPolicy.from_settings()
+    cascade = cascade or CascadeOptions.from_settings()
+    cascading = cascade.enabled and cascade.fast_model != model
+    tiles, width, height = await asyncio.to_thread(_plan_tiles, image_data, tiling)
+
+    # Same key for the cache and for coalescing identical in-flight requests
+    reuse_near_duplicates = use_cache and near_duplicates is not None
+    use_cache = use_cache and prediction_cache is not None
+    key_model = f"{cascade.fast_model}>{model}" if cascading else model
+    key = None
+    if use_cache or single_flight:
+        # Hashing a multi-megabyte upload should not stall the event loop
+        key = await asyncio.to_thread(_cache_key, image_data, key_model, preprocess, tiles)
+
+    # Serve repeated images from the content-addressed cache
+    if use_cache:
+        cached = await prediction_cache.aget(key)
+        if cached is not None:
+            return cached
+
+    # Reuse the annotations of a near-identical image predicted before
+    image_fingerprint = None
+    if reuse_near_duplicates:
+        image_fingerprint = await asyncio.to_thread(fingerprint, image_data)
+        seed = near_duplicates.lookup(image_fingerprint, key_model)
+        if seed is not None:
+            return seed
+
+    async def detect() -> DetectionResult:
+        detect_image = partial(_detect_cascade_async, cascade=cascade) if cascading else _detect_image_async
+        result = await detect_image(
+            image_data=image_data,
+            image_type=image_type,
+            route=route,
+            preprocess=preprocess,
+            tiling=tiling,
+            tiles=tiles,
+            image_size=(width, height),
+            retry=retry,
+        )
+        if use_cache:
+            await prediction_cache.aset(key, result)
+        if image_fingerprint is not None:
+            await asyncio.to_thread(near_duplicates.add, image_fingerprint, key_model, result)
+        return result
+
+    # Concurrent identical requests share one model call
+    return await single_flight.ado(key, detect) if single_flight else await detect()
+
+
+async def _detect_image_async(
+    *,
+    image_data: bytes,
+    image_type: str,
+    route: list[str],
+    preprocess: PreprocessOptions,
+    tiling: TilingOptions,
+    tiles: list[TileBox],
+    image_size: tuple[int, int],
+    retry: RetryPolicy,
+) -> DetectionResult:
+    """Async variant of _detect_image."""
+    if len(tiles) <= 1:
+        return await _detect_single_async(
+            image_data=image_data,
+            image_type=image_type,
+            route=route,
+            preprocess=preprocess,
+            retry=retry,
+        )
+
+    # Tall screenshot: detect overlapping tiles concurrently and merge
+    crops = await asyncio.to_thread(crop_tiles, image_data, tiles)
+    tile_results = await asyncio.gather(*(
+        _detect_single_async(image_data=crop, image_type="image/png", route=route, preprocess=preprocess, retry=retry)
+        for crop in crops
+    ))
+    annotations = merge_tile_annotations(
+        [(tile, tile_result.annotations) for tile, tile_result in zip(tiles, tile_results, strict=True)],
+        *image_size, tiling,
+    )
+    return DetectionResult(
+        annotations=annotations,
+        model=tile_results[0].model,
+        json_repaired=any(tile_result.json_repaired for tile_result in tile_results),
+    )
+
 
+async def _detect_cascade_async(
+    *,
+    image_data: bytes,
+    route: list[str],
+    image_size: tuple[int, int],
+    cascade: CascadeOptions,
+    **kwargs: Any,
+) -> DetectionResult:
+    """Async variant of _detect_cascade."""
+    if not image_size[0]:
+        # The size is only read up front for tiling
+        image_size = await asyncio.to_thread(read_image_size, image_data)
+
+    start = time.perf_counter()
+    try:
+        result = await _detect_image_async(
+            image_data=image_data, route=[cascade.fast_model], image_size=image_size, **kwargs,
+        )
+        reasons = escalation_reasons(result, image_size, cascade)
+    except CircuitOpenError:
+        # The strong model is behind the same provider
+        raise
+    except Exception as e:
+        logger.warning(f"Fast model {cascade.fast_model} failed, escalating: {e}")
+        reasons = ["fast_model_error"]
+    cascade_stats.record_tier("fast", time.perf_counter() - start)
+
+    if reasons:
+        start = time.perf_counter()
+        try:
+            result = await _detect_image_async(image_data=image_data, route=route, image_size=image_size, **kwargs)
+        finally:
+            cascade_stats.record_tier("strong", time.perf_counter() - start)
+    cascade_stats.record_outcome(reasons)
+    result.escalation_reasons = reasons
+    return result
+
+
+async def stream_ui_elements(
+    *,
+    image_data: bytes,
+    image_type: str,
+    model: str | None = None,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    retry: RetryPolicy | None = None,
+) -> AsyncIterator[AnnotationSchema]:
+    """
+    Detect UI elements with a streamed completion, yielding each annotation once it is complete.
+
+    Annotations that fail validation are skipped. The full result is cached
+    like detect_ui_elements, and a cache hit yields the cached annotations at once.
+    A stream cannot be hedged, so only the first model of the route is used.
+    """
+
+    # Fall back to the model from environment variable
+    model = model_route(model)[0]
+    preprocess = preprocess or PreprocessOptions.from_settings()
+
+    cache_key = None
+    if use_cache and prediction_cache:
+        cache_key = await asyncio.to_thread(_cache_key, image_data, model, preprocess, [])
+        cached = await prediction_cache.aget(cache_key)
+        if cached is not None:
+            for annotation in cached.annotations:
+                yield annotation
+            return
+
+    # Downsize and re-encode before base64 to shrink the request payload
+    prepared = await preprocess_image_async(image_data, image_type, preprocess)
+    with telemetry.record_call(model, streamed=True, activate=False) as record:
+        stream, reserved_tokens = await _request_detection_stream(
+            image_data=prepared.data,
+            image_type=prepared.content_type,
+            image_size=(prepared.width, prepared.height),
+            model=model,
+            record=record,
+            retry=retry or RetryPolicy.from_settings(),
+        )
+
+        parser = AnnotationStreamParser()
+        annotations: list[AnnotationSchema] = []
+        used_tokens = None
+        async for chunk in stream:
+            if chunk.usage:
+                used_tokens = chunk.usage.total_tokens
+                record.set_usage(chunk.usage)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for item in parser.feed(chunk.choices[0].delta.content):
+                try:
+                    annotation = annotation_from_item(item)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"Skipping invalid streamed annotation {item}: {e}")
+                    record.dropped_annotations += 1
+                    continue
+                annotations.append(annotation)
+                yield annotation
+        rate_limiter.settle(model, reserved_tokens, used_tokens)
+        record.json_repaired = parser.repaired > 0
+        record.dropped_annotations += parser.dropped
+        record.annotations = len(annotations)
+
+        if not annotations:
+            # Output did not follow the expected layout, fall back to parsing it whole
+            with telemetry.activate(record):
+                fallback = parse_detection_content(parser.text)
+            for annotation in fallback.annotations:
+                annotations.append(annotation)
+                yield annotation
+
+    if cache_key:
+        await prediction_cache.aset(cache_key, DetectionResult(annotations=annotations, model=model))
+
+
+def detect_region(
+    *,
+    image_data: bytes,
+    region: tuple[float, float, float, float],
+    model: str | None = None,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+    retry: RetryPolicy | None = None,
+) -> DetectionResult:
+    """
+    Detect UI elements in one region of an image, given as normalized 0-1000 (x, y, width, height).
+
+    Only the crop is sent to the model. Boxes come back in full-image normalized coordinates.
+    """
+    width, height = read_image_size(image_data)
+    tile = region_tile(*region, width, height)
+    crop = crop_tiles(image_data, [tile])[0]
+    result = detect_ui_elements(
+        image_data=crop, image_type="image/png", model=model, use_cache=use_cache,
+        preprocess=preprocess, tiling=tiling, retry=retry,
+    )
+    return result.model_copy(update={
+        "annotations": [map_to_image(annotation, tile, width, height) for annotation in result.annotations],
+    })
+
+
+async def detect_region_async(
+    *,
+    image_data: bytes,
+    region: tuple[float, float, float, float],
+    model: str | None = None,
+    use_cache: bool = True,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+    retry: RetryPolicy | None = None,
+) -> DetectionResult:
+    """Async variant of detect_region."""
+    width, height = await asyncio.to_thread(read_image_size, image_data)
+    tile = region_tile(*region, width, height)
+    crop = (await asyncio.to_thread(crop_tiles, image_data, [tile]))[0]
+    result = await detect_ui_elements_async(
+        image_data=crop, image_type="image/png", model=model, use_cache=use_cache,
+        preprocess=preprocess, tiling=tiling, retry=retry,
+    )
+    return result.model_copy(update={
+        "annotations": [map_to_image(annotation, tile, width, height) for annotation in result.annotations],
+    })
+
+
+def prepare_batch_image(
+    *,
+    image_data: bytes,
+    image_type: str,
+    model: str | None = None,
+    preprocess: PreprocessOptions | None = None,
+    tiling: TilingOptions | None = None,
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """
+    Chat completion bodies for one image in an offline batch, one per tile when it is split.
+
+    Returns the bodies and a JSON-serializable plan, which assemble_batch_result
+    needs to put the answers back together.
+    """
+    model = model_route(model)[0]
+    preprocess = preprocess or PreprocessOptions.from_settings()
+    tiling = tiling or TilingOptions.from_settings()
+    tiles, width, height = _plan_tiles(image_data, tiling)
+
+    crops = [(crop, "image/png") for crop in crop_tiles(image_data, tiles)] if len(tiles) > 1 else [(image_data, image_type)]
+    bodies = []
+    for crop, crop_type in crops:
+        prepared = preprocess_image(crop, crop_type, preprocess)
+        bodies.append({
+            "model": model,
+            "messages": _build_messages(prepared.data, prepared.content_type),
+            "response_format": {"type": "json_object"},
+            "temperature": TEMPERATURE,
+        })
+    plan = {"requests": len(bodies), "tiles": [asdict(tile) for tile in tiles], "width": width, "height": height}
+    return bodies, plan
+
+
+def assemble_batch_result(
+    responses: list[dict[str, Any] | None],
+    plan: dict[str, Any],
+    tiling: TilingOptions | None = None,
+) -> DetectionResult:
+    """
+    Turn the batch output lines for one image, in request order, into a DetectionResult.
+
+    Raises ValueError when a line is missing, failed or cannot be parsed.
+    """
+    tiling = tiling or TilingOptions.from_settings()
+    results = []
+    for response in responses:
+        if response is None:
+            raise ValueError("No result returned for the batch request")
+        if response.get("error") or not response.get("response") or response["response"]["status_code"] != 200:
+            error = response.get("error") or (response.get("response") or {}).get("body", {}).get("error")
+            raise ValueError(f"Batch request failed: {error}")
+        body = response["response"]["body"]
+        result = parse_detection_content(body["choices"][0]["message"]["content"])
+        result.model = body.get("model")
+        results.append(result)
+
+    if len(results) == 1:
+        return results[0]
+
+    tiles = [TileBox(**tile) for tile in plan["tiles"]]
+    annotations = merge_tile_annotations(
+        [(tile, result.annotations) for tile, result in zip(tiles, results, strict=True)],
+        plan["width"], plan["height"], tiling,
+    )
+    return DetectionResult(
+        annotations=annotations,
+        model=results[0].model,
+        json_repaired=any(result.json_repaired for result in results),
+    )
+
+
+def _detect_single(
+    *,
+    image_data: bytes,
+    image_type: str,
+    route: list[str],
+    preprocess: PreprocessOptions,
+    retry: RetryPolicy,
+) -> DetectionResult:
+    """Preprocess one image and run a detection request along the model route."""
+    # Downsize and re-encode before base64 to shrink the request payload
+    prepared = preprocess_image(image_data, image_type, preprocess)
+    result, _model = model_router.route(route, lambda model: _request_detection(
+        image_data=prepared.data,
+        image_type=prepared.content_type,
+        image_size=(prepared.width, prepared.height),
+        model=model,
+        retry=retry,
+    ))
+    return result
+
+
+async def _detect_single_async(
+    *,
+    image_data: bytes,
+    image_type: str,
+    route: list[str],
+    preprocess: PreprocessOptions,
+    retry: RetryPolicy,
+) -> DetectionResult:
+    """Async variant of _detect_single."""
+    # Downsize and re-encode before base64 to shrink the request payload
+    prepared = await preprocess_image_async(image_data, image_type, preprocess)
+    result, _model = await model_router.route_async(route, lambda model: _request_detection_async(
+        image_data=prepared.data,
+        image_type=prepared.content_type,
+        image_size=(prepared.width, prepared.height),
+        model=model,
+        retry=retry,
+    ))
+    return result
+
+
+def _estimate_tokens(image_size: tuple[int, int]) -> int:
+    """Tokens to reserve from the rate limiter for one detection request."""
+    return estimate_tokens(*image_size, prompt_chars=len(SYSTEM_PROMPT) + len(USER_PROMPT))
+
+
+def _used_tokens(response: Any) -> int | None:
+    return response.usage.total_tokens if getattr(response, "usage", None) else None
+
+
+def _request_detection(
+    *,
+    image_data: bytes,
+    image_type: str,
+    image_size: tuple[int, int],
+    model: str,
+    retry: RetryPolicy | None = None,
+) -> DetectionResult:
+    """Send one detection request to the model, retrying transient errors within the retry policy."""
+    with telemetry.record_call(model) as record:
+        start = time.perf_counter()
+        messages = _build_messages(image_data, image_type)
+        record.encode_time = time.perf_counter() - start
+
+        content = _complete(
+            messages=messages,
+            model=model,
+            reserved_tokens=_estimate_tokens(image_size),
+            record=record,
+            retry=retry or RetryPolicy.from_settings(),
+        )
+        result = parse_detection_content(content)
+        result.model = model
+        return result
+
+
+def _request_packed_detection(
+    *,
+    images: list[PreprocessedImage],
+    model: str,
+    retry: RetryPolicy | None = None,
+) -> dict[int, DetectionResult]:
+    """Send several images in one detection request. Images the model did not answer for are left out."""
+    with telemetry.record_call(model) as record:
+        record.images = len(images)
+        start = time.perf_counter()
+        messages = _build_packed_messages([(image.data, image.content_type) for image in images])
+        record.encode_time = time.perf_counter() - start
+
+        reserved_tokens = sum(_estimate_tokens((image.width, image.height)) for image in images)
+        content = _complete(
+            messages=messages,
+            model=model,
+            reserved_tokens=reserved_tokens,
+            record=record,
+            retry=retry or RetryPolicy.from_settings(),
+        )
+        results = parse_packed_content(content, len(images))
+        for result in results.values():
+            result.model = model
+        return results
+
+
+def _guard():
+    """Circuit breaker around one provider call, if enabled."""
+    return circuit_breaker.guard() if circuit_breaker else nullcontext()
+
+
+def _guard_async():
+    """Async variant of _guard."""
+    return circuit_breaker.guard_async() if circuit_breaker else nullcontext()
+
+
+def _retry_delay(error: APIError, retry: RetryPolicy, record: CallRecord) -> float | None:
+    """Seconds to wait before calling the provider again after an error, or None to give up."""
+    delay = retry.next_delay(error, inline=True)
+    if delay is None:
+        logger.error(f"API error: {error}")
+        return None
+    record.retries += 1
+    record.retry_reasons.append(retry_reason(error))
+    return delay
+
+
+def _complete(
+    *,
+    messages: list[dict[str, Any]],
+    model: str,
+    reserved_tokens: int,
+    record: CallRecord,
+    retry: RetryPolicy,
+) -> str | None:
+    """Run a chat completion and return its text, retrying transient errors within the retry policy."""
+    # Reuse the process-wide pooled client to keep connections alive
+    client = llm_clients.get_client(
+        base_url=config.openrouter_base_url,
+        api_key=config.openrouter_api_key,
+        model=model,
+    )
+
+    while True:
+        try:
+            # Fail fast while the provider is down, before taking rate limit budget
+            with _guard():
+                # Wait for a slot in the budget shared by every process calling the provider
+                rate_limiter.acquire(model, reserved_tokens)
+                # In-flight slot around the request alone, so the limit learns from provider latency and 429s
+                with provider_slot():
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=TEMPERATURE,
+                    )
+            rate_limiter.settle(model, reserved_tokens, _used_tokens(response))
+            break
+        except APIError as e:
+            delay = _retry_delay(e, retry, record)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+    record.set_usage(response.usage)
+    return response.choices[0].message.content
+
+
+async def _request_detection_async(
+    *,
+    image_data: bytes,
+    image_type: str,
+    image_size: tuple[int, int],
+    model: str,
+    retry: RetryPolicy | None = None,
+) -> DetectionResult:
+    """Async variant of _request_detection."""
+    with telemetry.record_call(model) as record:
+        # Base64 encoding large payloads is CPU work, keep it off the event loop
+        start = time.perf_counter()
+        messages = await asyncio.to_thread(_build_messages, image_data, image_type)
+        record.encode_time = time.perf_counter() - start
+
+        content = await _complete_async(
+            messages=messages,
+            model=model,
+            reserved_tokens=_estimate_tokens(image_size),
+            record=record,
+            retry=retry or RetryPolicy.from_settings(),
+        )
+        result = parse_detection_content(content)
+        result.model = model
+        return result
+
+
+async def _complete_async(
+    *,
+    messages: list[dict[str, Any]],
+    model: str,
+    reserved_tokens: int,
+    record: CallRecord,
+    retry: RetryPolicy,
+) -> str | None:
+    """Async variant of _complete."""
+    # Pooled async client bound to the running event loop
+    client = llm_clients.get_async_client(
+        base_url=config.openrouter_base_url,
+        api_key=config.openrouter_api_key,
+        model=model,
+    )
+
+    while True:
+        try:
+            # Fail fast while the provider is down, before taking rate limit budget
+            async with _guard_async():
+                # Wait for a slot in the budget shared by every process calling the provider
+                await rate_limiter.acquire_async(model, reserved_tokens)
+                # In-flight slot around the request alone, so the limit learns from provider latency and 429s
+                async with provider_slot_async():
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=TEMPERATURE,
+                    )
+            rate_limiter.settle(model, reserved_tokens, _used_tokens(response))
+            break
+        except APIError as e:
+            delay = _retry_delay(e, retry, record)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+    record.set_usage(response.usage)
+    return response.choices[0].message.content
+
+
+async def _request_detection_stream(
+    *,
+    image_data: bytes,
+    image_type: str,
+    image_size: tuple[int, int],
+    model: str,
+    record: CallRecord,
+    retry: RetryPolicy,
+) -> tuple[AsyncStream[ChatCompletionChunk], int]:
+    """
+    Open a streamed detection request, retrying transient errors before the first chunk.
+
+    Returns the stream and the tokens reserved for it, to be settled once usage arrives.
+    """
+    # Base64 encoding large payloads is CPU work, keep it off the event loop
+    start = time.perf_counter()
+    messages = await asyncio.to_thread(_build_messages, image_data, image_type)
+    record.encode_time = time.perf_counter() - start
+
+    # Pooled async client bound to the running event loop
+    client = llm_clients.get_async_client(
+        base_url=config.openrouter_base_url,
+        api_key=config.openrouter_api_key,
+        model=model,
+    )
+
+    reserved_tokens = _estimate_tokens(image_size)
+
+    while True:
+        try:
+            # Only opening the stream counts towards the circuit, errors mid-stream do not
+            async with _guard_async():
+                # Wait for a slot in the budget shared by every process calling the provider
+                await rate_limiter.acquire_async(model, reserved_tokens)
+                # The caller is a generator, so the record is only current while the request is sent
+                with telemetry.activate(record):
+                    stream = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=TEMPERATURE,
+                        stream=True,
+                        # Final chunk carries token usage for settling the rate limiter
+                        stream_options={"include_usage": True},
+                    )
+            return stream, reserved_tokens
+        except APIError as e:
+            delay = _retry_delay(e, retry, record)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
 
 if __name__ == "__main__":
     import mimetypes
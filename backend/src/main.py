@@ -2,10 +2,22 @@ import asyncio
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.database.core import Base, engine
+from src.events import event_hub
+from src.inference.breaker import CLOSED, circuit_breaker
+from src.inference.cache import prediction_cache
+from src.inference.cascade import cascade_stats
+from src.inference.cassette import cassette
+from src.inference.clients import llm_clients
+from src.inference.dedup import near_duplicates
+from src.inference.preprocess import preprocess_stats
+from src.inference.ratelimit import rate_limiter
+from src.inference.routing import model_router
+from src.inference.singleflight import single_flight
+from src.inference.telemetry import PrometheusSink, telemetry
 
 # Import routers
 from src.base_router import base_router 
@@ -23,12 +35,23 @@ logging.basicConfig(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    yield
+    await event_hub.stop()
+    # Release pooled LLM connections on shutdown
+    await llm_clients.aclose()
+    llm_clients.close()
+
+
 app = FastAPI(
     title="UI Element Detection API",
     version=API_VERSION,
     description="Scalable API for UI element detection with asynchronous processing",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -49,4 +72,41 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    """Report the API as up, and degraded while the LLM provider circuit is not closed."""
+    if not circuit_breaker:
+        return {"status": "ok"}
+
+    state, retry_after = circuit_breaker.state()
+    return {
+        # Cached predictions and job status keep working, so this stays a 200
+        "status": "ok" if state == CLOSED else "degraded",
+        "llm_provider": {"circuit": state, "retry_after": round(retry_after, 1)},
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Expose in-process LLM inference counters."""
+    return {
+        "llm_clients": llm_clients.stats(),
+        "prediction_cache": prediction_cache.stats() if prediction_cache else None,
+        "near_duplicates": near_duplicates.stats() if near_duplicates else None,
+        "cassette": cassette.stats() if cassette else None,
+        "image_preprocess": preprocess_stats.to_dict(),
+        "rate_limiter": rate_limiter.stats(),
+        "model_router": model_router.stats(),
+        "single_flight": single_flight.stats() if single_flight else None,
+        "llm_calls": telemetry.stats(),
+        "circuit_breaker": circuit_breaker.stats() if circuit_breaker else None,
+        "cascade": cascade_stats.to_dict(),
+        "websocket": event_hub.stats(),
+    }
+
+@app.get("/metrics/prometheus")
+def prometheus_metrics():
+    """Expose LLM call metrics in Prometheus text format when the prometheus sink is enabled."""
+    if not any(isinstance(sink, PrometheusSink) for sink in telemetry.sinks):
+        raise HTTPException(status_code=404, detail="Prometheus telemetry sink is not enabled")
+
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -2,7 +2,17 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Enum, Float, Index, Integer, String, Text
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+)
 from sqlalchemy.dialects.postgresql import UUID
 
 from src.database.core import Base
@@ -10,12 +20,30 @@ from src.database.core import Base
 
 class JobStatus(str, enum.Enum):
     """Job status enumeration."""
+    AWAITING_UPLOAD = "awaiting_upload"  # Presigned, the client has not confirmed its direct S3 upload yet
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
 
 
+class Batch(Base):
+    """Images uploaded together, with job counts per status kept up to date as their jobs move."""
+
+    __tablename__ = "batches"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    completed_at = Column(DateTime)  # Set when the last job completes or fails
+
+    # Job counts, changed by single UPDATEs in the transaction that moves a job
+    total = Column(Integer, nullable=False)
+    pending = Column(Integer, nullable=False, default=0)  # Includes jobs awaiting their upload
+    processing = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+
+
 class Job(Base):
     """Job model for tracking image processing tasks."""
 
@@ -34,6 +62,8 @@ class Job(Base):
     original_filename = Column(String(500))
     content_type = Column(String(100))
     file_size = Column(Integer)  # Size in bytes
+    image_width = Column(Integer)  # Pixels, read from the image header
+    image_height = Column(Integer)
 
     # Timing information
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -51,6 +81,10 @@ class Job(Base):
     # Client callback (optional)
     callback_url = Column(String(1000))
 
+    # Batch the job was uploaded with (optional), and its position in the batch status bitmap
+    batch_id = Column(UUID(as_uuid=True), ForeignKey("batches.id"), index=True)
+    batch_index = Column(Integer)
+
     # Indexes for common queries
     __table_args__ = (
         Index('idx_created_status', 'created_at', 'status'),
@@ -68,5 +102,8 @@ class Job(Base):
             "started_at": self.started_at.isoformat() if self.started_at else None,
             "completed_at": self.completed_at.isoformat() if self.completed_at else None,
             "processing_time": self.processing_time,
+            "image_width": self.image_width,
+            "image_height": self.image_height,
+            "batch_id": str(self.batch_id) if self.batch_id else None,
             "error_message": self.error_message
         }
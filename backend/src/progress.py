@@ -0,0 +1,189 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.constants import JOB_RETENTION_DAYS
+from src.events import job_event_data, publish_job_events
+from src.models import Batch, Job, JobStatus
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Each job of a batch is STATUS_BITS bits of its status bitmap, at its batch_index
+STATUS_BITS = 2
+STATUS_CODES = {
+    JobStatus.AWAITING_UPLOAD: 0,
+    JobStatus.PENDING: 0,
+    JobStatus.PROCESSING: 1,
+    JobStatus.COMPLETED: 2,
+    JobStatus.FAILED: 3,
+}
+STATUS_NAMES = ["pending", "processing", "completed", "failed"]
+
+# Batch counter of each job status
+COUNTERS = {
+    JobStatus.AWAITING_UPLOAD: "pending",
+    JobStatus.PENDING: "pending",
+    JobStatus.PROCESSING: "processing",
+    JobStatus.COMPLETED: "completed",
+    JobStatus.FAILED: "failed",
+}
+
+FINISHED = {JobStatus.COMPLETED, JobStatus.FAILED}
+
+_redis_client = None
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+
+        _redis_client = redis.Redis.from_url(config.redis_url)
+    return _redis_client
+
+
+def bitmap_key(batch_id) -> str:
+    return f"batch-status:{batch_id}"
+
+
+def set_job_status(db: Session, job: Job, status: JobStatus) -> bool:
+    """
+    Move a job to a new status, keeping the counters and bitmap of its batch in step.
+
+    Batch jobs are only moved from the status they were read with, so a
+    transition raced by another worker is counted once. The counter
+    UPDATE joins the caller's transaction and lands with its commit, after
+    which the bitmap is updated and the move is published to WebSocket
+    subscribers.
+
+    Returns:
+        Whether the job moved
+    """
+    old_status = job.status
+    if old_status == status:
+        return False
+    if job.batch_id is None:
+        job.status = status
+        _moved_jobs(db).append(job)
+        return True
+
+    moved = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == old_status)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not moved:
+        # Moved by someone else since it was read
+        db.expire(job, ["status"])
+        return False
+    set_committed_value(job, "status", status)
+    _moved_jobs(db).append(job)
+
+    old_counter, new_counter = COUNTERS[old_status], COUNTERS[status]
+    if old_counter != new_counter:
+        db.execute(
+            update(Batch)
+            .where(Batch.id == job.batch_id)
+            .values({old_counter: getattr(Batch, old_counter) - 1, new_counter: getattr(Batch, new_counter) + 1})
+            .execution_options(synchronize_session=False)
+        )
+    if status in FINISHED:
+        db.execute(
+            update(Batch)
+            .where(Batch.id == job.batch_id, Batch.pending == 0, Batch.processing == 0, Batch.completed_at.is_(None))
+            .values(completed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    return True
+
+
+def _update_bitmaps(updates: list[tuple[str, int, int]]):
+    """Write (batch_id, batch_index, status code) updates to the batch status bitmaps in one round trip."""
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for batch_id, batch_index, code in updates:
+            key = bitmap_key(batch_id)
+            pipe.bitfield(key).set(f"u{STATUS_BITS}", f"#{batch_index}", code).execute()
+            pipe.expire(key, JOB_RETENTION_DAYS * 86400)
+        pipe.execute()
+    except Exception as e:
+        # The bitmap is rebuilt from the jobs when it is missing, drop it rather than leave it wrong
+        batch_ids = {batch_id for batch_id, _index, _code in updates}
+        logger.warning(f"Failed to update status bitmaps of batches {', '.join(batch_ids)}: {e}")
+        try:
+            _redis().delete(*(bitmap_key(batch_id) for batch_id in batch_ids))
+        except Exception:
+            pass
+
+
+def _moved_jobs(db: Session) -> list[Job]:
+    return db.info.setdefault("moved_jobs", [])
+
+
+@event.listens_for(Session, "before_commit")
+def _collect_job_events(session: Session):
+    # Read before the commit expires the jobs, so errors and times set after the move are included
+    jobs = session.info.pop("moved_jobs", None)
+    if jobs:
+        # Once per job, with its latest state
+        jobs = list({job.id: job for job in jobs}.values())
+        session.info["bitmap_updates"] = [
+            (str(job.batch_id), job.batch_index, STATUS_CODES[job.status]) for job in jobs if job.batch_id
+        ]
+        session.info["job_events"] = [
+            {
+                "job_id": str(job.id),
+                "batch_id": str(job.batch_id) if job.batch_id else None,
+                "data": job_event_data(
+                    job.status.value,
+                    error=job.error_message,
+                    processing_time=job.processing_time,
+                    batch_id=str(job.batch_id) if job.batch_id else None,
+                ),
+            }
+            for job in jobs
+        ]
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_job_events(session: Session):
+    # Only committed moves reach the bitmap, and subscribers that react by reading the job see the new state
+    updates = session.info.pop("bitmap_updates", None)
+    if updates:
+        _update_bitmaps(updates)
+    events = session.info.pop("job_events", None)
+    if events:
+        publish_job_events(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_job_events(session: Session):
+    session.info.pop("moved_jobs", None)
+    session.info.pop("bitmap_updates", None)
+    session.info.pop("job_events", None)
+
+
+def status_bitmap(db: Session, batch: Batch) -> bytes:
+    """
+    Status codes of the jobs of a batch, STATUS_BITS per job in batch_index order.
+
+    Read from Redis in one GET. Rebuilt from the jobs if Redis lost it.
+    """
+    size = (batch.total * STATUS_BITS + 7) // 8
+    key = bitmap_key(batch.id)
+    bitmap = _redis().get(key)
+    if bitmap is None:
+        value = 0
+        jobs = db.query(Job.batch_index, Job.status).filter(Job.batch_id == batch.id).all()
+        for index, status in jobs:
+            shift = (size * 8) - (index + 1) * STATUS_BITS
+            value |= STATUS_CODES[status] << shift
+        bitmap = value.to_bytes(size, "big")
+        _redis().set(key, bitmap, ex=JOB_RETENTION_DAYS * 86400, nx=True)
+    # Redis only stores up to the last bit set
+    return bitmap.ljust(size, b"\0")
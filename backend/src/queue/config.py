@@ -1,5 +1,7 @@
 from celery.schedules import crontab
 
+from src.settings import config
+
 # Celery beat schedule for periodic tasks
 beat_schedule = {
     'monitor-queue-size': {
@@ -10,6 +12,27 @@ beat_schedule = {
             'priority': 10
         }
     },
+    'resume-parked-jobs': {
+        'task': 'resume_parked_jobs',
+        'schedule': 10.0,  # Run every 10 seconds
+        'options': {
+            'queue': 'monitoring'
+        }
+    },
+    'submit-offline-batch': {
+        'task': 'submit_offline_batch',
+        'schedule': 60.0,  # Run every minute
+        'options': {
+            'queue': 'maintenance'
+        }
+    },
+    'poll-offline-batches': {
+        'task': 'poll_offline_batches',
+        'schedule': config.llm_batch_poll_interval,
+        'options': {
+            'queue': 'maintenance'
+        }
+    },
     'cleanup-old-jobs': {
         'task': 'cleanup_old_jobs',
         'schedule': crontab(hour=2, minute=0),  # Run daily at 2 AM
@@ -1,76 +1,354 @@
+import asyncio
+import base64
 import json
+import uuid
+from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile
+from celery import group
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket
+from sqlalchemy import insert, or_
 from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
 
-from src.database.core import get_db
-from src.models import Job, JobStatus
-from src.schemas import JobResponse, JobStatusResponse
-from src.queue.tasks import process_image_task
+from src.database.core import SessionLocal, get_db
+from src.events import event_hub, job_event_data
+from src.models import Batch, Job, JobStatus
+from src.schemas import (
+    BatchStatusResponse, BatchUploadItem, BatchUploadResponse, ImageDimensions, JobResponse, JobStatusResponse, PresignedUpload,
+    PresignRequest, PresignResponse
+)
+from src.progress import STATUS_BITS, STATUS_NAMES, set_job_status, status_bitmap
+from src.queue.tasks import process_image_task, queue_offline_job, queue_offline_jobs
 from src.settings import config
 from src.storage.s3 import storage
-from src.constants import MAX_UPLOAD_SIZE
+from src.storage.upload import RejectedImage, UploadedImage, UploadTooLarge, receive_image_upload, receive_image_uploads
+from src.constants import MAX_BATCH_UPLOAD_FILES, MAX_UPLOAD_SIZE
 
 router = APIRouter()
 
-@router.post("/upload", response_model=JobResponse)
+# The upload endpoints read their multipart bodies themselves, so the forms are described to OpenAPI by hand
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+BATCH_UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                    },
+                }
+            }
+        },
+    }
+}
+
+@router.post("/upload", response_model=JobResponse, openapi_extra=UPLOAD_FORM_SCHEMA)
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
     callback_url: str | None = Header(None, alias="X-Callback-URL"),
+    offline: bool = Query(False, description="Process with the next offline batch, cheaper but may take hours"),
     db: Session = Depends(get_db)
 ):
     """
     Upload an image for asynchronous UI element detection.
 
     Returns a job_id that can be used to check status and retrieve results.
-    """
-    # Validate file type
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    Offline jobs wait for the next batch submitted to the provider batch API.
 
-    # Validate file size
-    if file.size and file.size > MAX_UPLOAD_SIZE:
+    The image is streamed to S3 as it arrives, in multipart upload parts,
+    so the API never holds whole uploads in memory. Oversized uploads are
+    refused from their Content-Length, or as soon as the limit is passed.
+    """
+    content_length = request.headers.get("content-length")
+    try:
+        upload = await receive_image_upload(
+            request.stream(),
+            content_type=request.headers.get("content-type"),
+            content_length=int(content_length) if content_length and content_length.isdigit() else None,
+            start_upload=storage.start_upload,
+            max_size=MAX_UPLOAD_SIZE,
+        )
+    except UploadTooLarge:
         raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload interrupted")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    try:
+        # The database, the progress hooks run on commit and the broker all block
+        return await asyncio.to_thread(_create_job, db, upload, callback_url, offline)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+
+def _create_job(db: Session, upload: UploadedImage, callback_url: str | None, offline: bool) -> JobResponse:
+    """Record and queue the job of an uploaded image."""
+    job = Job(
+        model_name=config.openrouter_model,
+        s3_key=upload.s3_key,
+        s3_url=storage.url(upload.s3_key),
+        original_filename=upload.filename,
+        content_type=upload.content_type,
+        file_size=upload.size,
+        image_width=upload.image.width,
+        image_height=upload.image.height,
+        callback_url=callback_url
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    message = _queue_job(job, offline, db)
+    return JobResponse(
+        task_id=str(job.id),
+        status=job.status.value,
+        message=message,
+        created_at=job.created_at
+    )
+
+
+def _queue_job(job: Job, offline: bool, db: Session) -> str:
+    """Queue an uploaded image for detection. Returns the message for the client."""
+    if offline:
+        queue_offline_job(str(job.id), job.s3_key)
+        return "Image uploaded, queued for the next offline batch"
+
+    # Queue the task
+    task = process_image_task.delay(
+        job_id=str(job.id),
+        s3_key=job.s3_key
+    )
+
+    # Update job with worker ID
+    job.worker_id = task.id
+    db.commit()
+    return "Image uploaded successfully"
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse, openapi_extra=BATCH_UPLOAD_FORM_SCHEMA)
+async def upload_images(
+    request: Request,
+    callback_url: str | None = Header(None, alias="X-Callback-URL"),
+    offline: bool = Query(False, description="Process with the next offline batch, cheaper but may take hours"),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload many images in one multipart request, one job per image.
 
+    Images are streamed to S3 with several writes in flight, the jobs are
+    inserted in one statement and queued in one round trip. Files that are
+    not valid images are reported per file without failing the others.
+    """
+    content_length = request.headers.get("content-length")
     try:
-        # Read file content
-        file_data = await file.read()
-
-        # Upload to S3
-        s3_key, s3_url = storage.upload_image(
-            file_data=file_data,
-            content_type=file.content_type,
-            original_filename=file.filename
+        results = await receive_image_uploads(
+            request.stream(),
+            content_type=request.headers.get("content-type"),
+            content_length=int(content_length) if content_length and content_length.isdigit() else None,
+            start_upload=storage.start_upload,
+            max_size=MAX_UPLOAD_SIZE,
+            max_files=MAX_BATCH_UPLOAD_FILES,
+            concurrency=config.s3_upload_concurrency,
         )
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail=f"Upload exceeds {MAX_BATCH_UPLOAD_FILES} files of 10MB")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload interrupted")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    created_at = datetime.utcnow()
+    batch_id = uuid.uuid4()
+    rows = []
+    items = []
+    for result in results:
+        if isinstance(result, RejectedImage):
+            items.append(BatchUploadItem(filename=result.filename, error=str(result.error)))
+            continue
+        # Ids are set here so the jobs need no refresh after the insert
+        row = {
+            "id": uuid.uuid4(),
+            "batch_id": batch_id,
+            "batch_index": len(rows),
+            "status": JobStatus.PENDING,
+            "model_name": config.openrouter_model,
+            "s3_key": result.s3_key,
+            "s3_url": storage.url(result.s3_key),
+            "original_filename": result.filename,
+            "content_type": result.content_type,
+            "file_size": result.size,
+            "image_width": result.image.width,
+            "image_height": result.image.height,
+            "worker_id": None if offline else str(uuid.uuid4()),
+            "callback_url": callback_url,
+            "created_at": created_at,
+        }
+        rows.append(row)
+        items.append(BatchUploadItem(filename=result.filename, task_id=str(row["id"])))
+
+    try:
+        if rows:
+            # The inserts, the progress hooks run on commit and the broker round trip all block
+            await asyncio.to_thread(_create_batch_jobs, db, batch_id, created_at, rows, offline)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    message = f"{len(rows)} of {len(results)} images uploaded"
+    if offline:
+        message += ", queued for the next offline batch"
+    return BatchUploadResponse(
+        batch_id=str(batch_id) if rows else None, jobs=items, message=message, created_at=created_at
+    )
+
+
+def _create_batch_jobs(db: Session, batch_id: uuid.UUID, created_at: datetime, rows: list[dict], offline: bool):
+    """Insert a batch and its jobs in one transaction, then queue the jobs."""
+    db.execute(insert(Batch).values(
+        id=batch_id, total=len(rows), pending=len(rows), processing=0, completed=0, failed=0,
+        created_at=created_at
+    ))
+    db.execute(insert(Job), rows)
+    db.commit()
+
+    if offline:
+        queue_offline_jobs([(str(row["id"]), row["s3_key"]) for row in rows])
+    else:
+        # Task ids were stored as worker ids with the jobs
+        group(
+            process_image_task.signature(
+                kwargs={"job_id": str(row["id"]), "s3_key": row["s3_key"]},
+                task_id=row["worker_id"]
+            )
+            for row in rows
+        ).apply_async()
+
+
+@router.post("/upload/presign", response_model=PresignResponse)
+def presign_uploads(
+    request: PresignRequest,
+    callback_url: str | None = Header(None, alias="X-Callback-URL"),
+    db: Session = Depends(get_db)
+):
+    """
+    Create direct-to-S3 upload URLs, one pending job per image, in one batch.
+
+    Clients POST each image to its URL, then call /upload/{task_id}/confirm
+    to queue it, so image bytes never pass through the API.
+    """
+    for file in request.files:
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail=f"{file.filename} must be an image")
+        if file.size and file.size > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=400, detail=f"{file.filename} exceeds the 10MB limit")
 
-        # Create job record
-        job = Job(
-            model_name=config.openrouter_model,
-            s3_key=s3_key,
-            s3_url=s3_url,
-            original_filename=file.filename,
-            content_type=file.content_type,
-            file_size=len(file_data),
-            callback_url=callback_url
+    created_at = datetime.utcnow()
+    batch_id = uuid.uuid4()
+    # Ids are set here so the jobs need no refresh after the insert
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "batch_id": batch_id,
+            "batch_index": index,
+            "status": JobStatus.AWAITING_UPLOAD,
+            "model_name": config.openrouter_model,
+            "s3_key": storage.new_key(file.filename),
+            "original_filename": file.filename,
+            "content_type": file.content_type,
+            "callback_url": callback_url,
+            "created_at": created_at,
+        }
+        for index, file in enumerate(request.files)
+    ]
+    db.execute(insert(Batch).values(
+        id=batch_id, total=len(rows), pending=len(rows), processing=0, completed=0, failed=0, created_at=created_at
+    ))
+    db.execute(insert(Job), rows)
+    db.commit()
+
+    # Signed locally, no S3 request
+    expires_at = created_at + timedelta(seconds=config.s3_presign_expiration)
+    uploads = []
+    for row in rows:
+        post = storage.presign_upload(
+            row["s3_key"],
+            content_type=row["content_type"],
+            max_size=MAX_UPLOAD_SIZE,
+            expiration=config.s3_presign_expiration
         )
-        db.add(job)
+        uploads.append(PresignedUpload(task_id=str(row["id"]), url=post["url"], fields=post["fields"], expires_at=expires_at))
+    return PresignResponse(batch_id=str(batch_id), uploads=uploads)
+
+
+@router.post("/upload/{job_id}/confirm", response_model=JobResponse)
+def confirm_upload(
+    job_id: str,
+    offline: bool = Query(False, description="Process with the next offline batch, cheaper but may take hours"),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue an image uploaded directly to S3 with a presigned URL.
+
+    The stored object is checked from its size and header bytes only.
+    Invalid uploads are deleted and their job fails.
+    """
+    job = db.query(Job).filter(Job.id == job_id).first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != JobStatus.AWAITING_UPLOAD:
+        raise HTTPException(status_code=409, detail=f"Upload already confirmed. Current status: {job.status.value}")
+
+    try:
+        size, image_info = storage.inspect_upload(job.s3_key, max_size=MAX_UPLOAD_SIZE)
+    except FileNotFoundError:
+        raise HTTPException(status_code=400, detail="Image has not been uploaded yet")
+    except ValueError as e:
+        # Includes UploadTooLarge
+        storage.delete_image(job.s3_key)
+        set_job_status(db, job, JobStatus.FAILED)
+        job.error_message = str(e)
+        job.completed_at = datetime.utcnow()
         db.commit()
-        db.refresh(job)
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Queue the task
-        task = process_image_task.delay(
-            job_id=str(job.id),
-            s3_key=s3_key
-        )
+    if not set_job_status(db, job, JobStatus.PENDING):
+        raise HTTPException(status_code=409, detail="Upload already confirmed")
 
-        # Update job with worker ID
-        job.worker_id = task.id
+    try:
+        job.s3_url = storage.url(job.s3_key)
+        job.content_type = image_info.content_type
+        job.file_size = size
+        job.image_width = image_info.width
+        job.image_height = image_info.height
         db.commit()
 
+        message = _queue_job(job, offline, db)
         return JobResponse(
             task_id=str(job.id),
             status=job.status.value,
-            message="Image uploaded successfully",
+            message=message,
             created_at=job.created_at
         )
 
@@ -78,6 +356,46 @@ async def upload_image(
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@router.get("/batches/{batch_id}", response_model=BatchStatusResponse)
+def get_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    """
+    Check the progress of a batch.
+
+    One row and one Redis read whatever the batch size, instead of a
+    /status call per job. The bitmap gives each job's status in upload order.
+    """
+    batch = db.query(Batch).filter(Batch.id == batch_id).first()
+
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    finished = batch.completed + batch.failed
+    remaining = batch.total - finished
+    eta_seconds = None
+    if remaining == 0:
+        eta_seconds = 0.0
+    elif finished:
+        # Jobs run in parallel, so extrapolate the batch throughput rather than per-job times
+        elapsed = (datetime.utcnow() - batch.created_at).total_seconds()
+        eta_seconds = round(elapsed / finished * remaining, 1)
+
+    return BatchStatusResponse(
+        batch_id=str(batch.id),
+        total=batch.total,
+        pending=batch.pending,
+        processing=batch.processing,
+        completed=batch.completed,
+        failed=batch.failed,
+        progress=round(finished / batch.total, 4) if batch.total else 1.0,
+        eta_seconds=eta_seconds,
+        created_at=batch.created_at,
+        completed_at=batch.completed_at,
+        status_bitmap=base64.b64encode(status_bitmap(db, batch)).decode(),
+        status_bits=STATUS_BITS,
+        status_codes=STATUS_NAMES
+    )
+
+
 @router.get("/status/{job_id}", response_model=JobStatusResponse)
 def get_job_status(job_id: str, db: Session = Depends(get_db)):
     """
@@ -95,8 +413,12 @@ def get_job_status(job_id: str, db: Session = Depends(get_db)):
         status=job.status.value,
         created_at=job.created_at
     )
+    if job.image_width and job.image_height:
+        response.image_dimensions = ImageDimensions(width=job.image_width, height=job.image_height)
 
-    if job.status == JobStatus.PROCESSING:
+    if job.status == JobStatus.AWAITING_UPLOAD:
+        response.progress = "Waiting for the image upload"
+    elif job.status == JobStatus.PROCESSING:
         response.progress = "AI analyzing image..."
         response.started_at = job.started_at
     elif job.status == JobStatus.COMPLETED:
@@ -110,6 +432,63 @@ def get_job_status(job_id: str, db: Session = Depends(get_db)):
     return response
 
 
+@router.websocket("/ws")
+async def job_events(websocket: WebSocket):
+    """
+    Push job status changes instead of having clients poll /status.
+
+    Subscribe with {"type": "subscribe", "job_ids": [...], "batch_ids": [...]}
+    and receive {"type": "job_update", "job_id", "data", "event_id"} messages.
+    Pass the last event_id seen when resubscribing after a reconnect to get
+    the updates missed meanwhile, otherwise the current status is sent.
+    """
+    await websocket.accept()
+    await event_hub.serve(websocket, _job_snapshot)
+
+
+async def _job_snapshot(job_ids: list[str], batch_ids: list[str]) -> list[dict]:
+    return await asyncio.to_thread(_read_job_snapshot, job_ids, batch_ids)
+
+
+def _read_job_snapshot(job_ids: list[str], batch_ids: list[str]) -> list[dict]:
+    """Current status of jobs and of the jobs of batches, as job events, in one query."""
+    job_uuids = [_uuid_or_none(job_id) for job_id in job_ids]
+    batch_uuids = [_uuid_or_none(batch_id) for batch_id in batch_ids]
+    job_uuids = [value for value in job_uuids if value]
+    batch_uuids = [value for value in batch_uuids if value]
+    if not job_uuids and not batch_uuids:
+        return []
+
+    db = SessionLocal()
+    try:
+        rows = db.query(Job.id, Job.batch_id, Job.status, Job.error_message, Job.processing_time).filter(
+            or_(Job.id.in_(job_uuids), Job.batch_id.in_(batch_uuids))
+        ).all()
+    finally:
+        db.close()
+
+    return [
+        {
+            "job_id": str(job_id),
+            "batch_id": str(batch_id) if batch_id else None,
+            "data": job_event_data(
+                status.value,
+                error=error_message,
+                processing_time=processing_time,
+                batch_id=str(batch_id) if batch_id else None,
+            ),
+        }
+        for job_id, batch_id, status, error_message, processing_time in rows
+    ]
+
+
+def _uuid_or_none(value: str) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
 @router.get("/results/{job_id}")
 def get_job_results(job_id: str, db: Session = Depends(get_db)):
     """
@@ -1,37 +1,204 @@
 import json
 import logging
+import os
 import time
+import uuid
 from datetime import datetime
+from pathlib import Path
 from typing import Any
 
 import requests
+from celery.signals import worker_init
+from openai import APIError
+from sqlalchemy import and_, exists, or_
+
+from src.inference.batch import (
+    build_batch_backend,
+    read_batch_results,
+    write_batch_file,
+)
+from src.inference.breaker import HALF_OPEN, OPEN, CircuitOpenError, circuit_breaker
+from src.inference.concurrency import build_concurrency_limiter, use_concurrency_limiter
+from src.inference.packing import MicroBatcher
+from src.inference.ratelimit import RateLimitExceeded
+from src.inference.retry import RetryPolicy
+from src.models import Batch, Job, JobStatus
+from src.progress import set_job_status
 
 logger = logging.getLogger(__name__)
 
 from src.database.core import SessionLocal, get_db
-from src.llm import detect_ui_elements
-from openai import RateLimitError
-from src.models import Job, JobStatus
+from src.llm import assemble_batch_result, detect_ui_elements, detect_ui_elements_packed, prepare_batch_image
 from src.queue.app import celery_app
 from src.settings import config
 from src.storage.s3 import storage
 from src.constants import JOB_RETENTION_DAYS, QUEUE_SCALE_UP_THRESHOLD, QUEUE_SCALE_DOWN_THRESHOLD, MIN_WORKERS, MAX_WORKERS
 
 
-@celery_app.task(bind=True, name="process_image", max_retries=3, default_retry_delay=60)
-def process_image_task(self, job_id: str, s3_key: str) -> dict[str, Any]:
+def _detect_pack(items: list[tuple[bytes, str, RetryPolicy]]) -> list:
+    # Each job keeps its own retry budget and deadline
+    return detect_ui_elements_packed(
+        images=[(image_data, image_type) for image_data, image_type, _retry in items],
+        retry=[retry for _image_data, _image_type, retry in items],
+    )
+
+
+# Jobs waiting for the LLM provider circuit to close, as JSON {"job_id", "s3_key", "retry_state"}
+PARKED_JOBS_KEY = "parked-jobs"
+
+_redis_client = None
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+
+        _redis_client = redis.Redis.from_url(config.redis_url)
+    return _redis_client
+
+
+def _park_job(job_id: str, s3_key: str, retry: RetryPolicy):
+    """Set a job aside until the provider recovers, instead of spending its retries."""
+    _redis().rpush(PARKED_JOBS_KEY, json.dumps({"job_id": job_id, "s3_key": s3_key, "retry_state": retry.to_dict()}))
+
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job:
+            # Back to waiting, it has not been processed
+            set_job_status(db, job, JobStatus.PENDING)
+            job.started_at = None
+            job.worker_id = None
+            db.commit()
+    finally:
+        db.close()
+
+
+# Concurrent tasks of a threaded worker share packed detection requests
+detection_batcher = MicroBatcher(
+    flush=_detect_pack,
+    max_size=config.worker_pack_size,
+    max_wait=config.worker_pack_wait,
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=detection_batcher._reset_after_fork)
+
+
+@worker_init.connect
+def _install_concurrency_limiter(**_kwargs):
+    # Only workers take provider slots from the shared limit, the API imports this module too
+    use_concurrency_limiter(build_concurrency_limiter())
+
+
+def _send_webhook(callback_url: str, webhook_data: dict[str, Any]):
+    """Post a job update to the client's callback URL. Failures are logged, they never fail the job."""
+    try:
+        response = requests.post(
+            callback_url,
+            json=webhook_data,
+            timeout=10
+        )
+        logger.info(f"Webhook sent to {callback_url}, status: {response.status_code}")
+    except Exception as webhook_error:
+        logger.warning(f"Failed to send webhook: {webhook_error}")
+
+
+def _fail_job(job_id: str, error: Exception, retry: RetryPolicy):
+    """Mark a job as failed and send the failure webhook."""
+    error_message = str(error)
+    reasons = retry.reasons()
+    if reasons:
+        error_message += f" (after {len(reasons)} retries: {', '.join(reasons)})"
+
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job:
+            set_job_status(db, job, JobStatus.FAILED)
+            job.error_message = error_message
+            job.completed_at = datetime.utcnow()
+            db.commit()
+
+        # Send webhook callback for failure
+        if job and job.callback_url:
+            _send_webhook(job.callback_url, {
+                "job_id": job_id,
+                "status": "failed",
+                "error": error_message
+            })
+    finally:
+        db.close()
+
+
+def _complete_job(job_id: str, results: dict[str, Any]):
+    """Store a job's results and send the completion webhook."""
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            # Removed by cleanup while it was processed
+            logger.warning(f"Job {job_id} no longer exists, dropping its results")
+            return
+        if job.status == JobStatus.COMPLETED:
+            # Collected by an earlier attempt, e.g. of an offline batch
+            return
+        if job.image_width and job.image_height:
+            # Lets clients convert the normalized coordinates to pixels without opening the image
+            results["image_dimensions"] = {"width": job.image_width, "height": job.image_height}
+        set_job_status(db, job, JobStatus.COMPLETED)
+        job.completed_at = datetime.utcnow()
+        job.result_data = json.dumps(results)
+        job.processing_time = results["processing_time"]
+        db.commit()
+
+        # Send webhook callback if configured
+        if job.callback_url:
+            _send_webhook(job.callback_url, {
+                "job_id": job_id,
+                "status": "completed",
+                "results": results
+            })
+    finally:
+        db.close()
+
+
+def _job_results(job_id: str, s3_key: str, detection_result, processing_time: float, retries: list) -> dict[str, Any]:
+    """Result data stored for a completed job."""
+    return {
+        "task_id": job_id,
+        "image": s3_key,
+        "analysis": {
+            "annotations": [ann.model_dump() for ann in detection_result.annotations],
+            "ui_elements": [ann.tag for ann in detection_result.annotations],
+            "total_elements": len(detection_result.annotations)
+        },
+        "model_used": detection_result.model or config.openrouter_model,
+        "processing_time": processing_time,
+        "retries": retries,
+        "completed_at": datetime.utcnow().isoformat()
+    }
+
+
+# Retries are bounded by the job's RetryPolicy, which travels with the task in retry_state
+@celery_app.task(bind=True, name="process_image", max_retries=None)
+def process_image_task(self, job_id: str, s3_key: str, retry_state: dict[str, Any] | None = None) -> dict[str, Any]:
     """
     Process a single image for UI element detection.
 
     Args:
         job_id: Unique job identifier
         s3_key: S3 key where the image is stored
+        retry_state: Retry budget left over from earlier attempts of this job
 
     Returns:
         Dictionary with detection results
     """
     start_time = time.time()
     logger.info(f"Starting processing job {job_id}")
+    # One budget and deadline for the whole job, however many times it is requeued
+    retry = RetryPolicy.from_dict(retry_state) if retry_state else RetryPolicy.from_settings()
 
     # Update job status to processing
     db = SessionLocal()
@@ -40,7 +207,7 @@ def process_image_task(self, job_id: str, s3_key: str) -> dict[str, Any]:
         if not job:
             raise ValueError(f"Job {job_id} not found")
 
-        job.status = JobStatus.PROCESSING
+        set_job_status(db, job, JobStatus.PROCESSING)
         job.started_at = datetime.utcnow()
         job.worker_id = self.request.id
         db.commit()
@@ -49,101 +216,241 @@ def process_image_task(self, job_id: str, s3_key: str) -> dict[str, Any]:
         db.close()
 
     try:
+        # Don't download the image for a provider that is known to be down
+        if circuit_breaker:
+            circuit_breaker.check()
+
         # Download image from S3
         response = storage.client.get_object(Bucket=config.s3_bucket_name, Key=s3_key)
         image_data = response['Body'].read()
         content_type = response.get('ContentType', 'image/png')
 
         # Detect UI elements
-        detection_result = detect_ui_elements(
-            image_data=image_data,
-            image_type=content_type
-        )
-
-        # Prepare results
-        results = {
-            "task_id": job_id,
-            "image": s3_key,
-            "analysis": {
-                "annotations": [ann.model_dump() for ann in detection_result.annotations],
-                "ui_elements": [ann.tag for ann in detection_result.annotations],
-                "total_elements": len(detection_result.annotations)
-            },
-            "model_used": config.openrouter_model,
-            "processing_time": time.time() - start_time,
-            "completed_at": datetime.utcnow().isoformat()
-        }
+        if config.worker_pack_size > 1:
+            detection_result = detection_batcher.submit((image_data, content_type, retry))
+        else:
+            detection_result = detect_ui_elements(
+                image_data=image_data,
+                image_type=content_type,
+                retry=retry,
+            )
 
         # Store results in database
-        db = SessionLocal()
-        try:
-            job = db.query(Job).filter(Job.id == job_id).first()
-            job.status = JobStatus.COMPLETED
-            job.completed_at = datetime.utcnow()
-            job.result_data = json.dumps(results)
-            job.processing_time = results["processing_time"]
-            db.commit()
-
-            # Send webhook callback if configured
-            if job.callback_url:
-                try:
-                    webhook_data = {
-                        "job_id": job_id,
-                        "status": "completed",
-                        "results": results
-                    }
-                    response = requests.post(
-                        job.callback_url,
-                        json=webhook_data,
-                        timeout=10
-                    )
-                    logger.info(f"Webhook sent to {job.callback_url}, status: {response.status_code}")
-                except Exception as webhook_error:
-                    logger.warning(f"Failed to send webhook: {webhook_error}")
-                    # Don't fail the job if webhook fails
-        finally:
-            db.close()
+        results = _job_results(job_id, s3_key, detection_result, time.time() - start_time, retry.history)
+        _complete_job(job_id, results)
 
         logger.info(f"Successfully completed job {job_id} in {results['processing_time']:.2f}s")
         return results
 
-    except (RateLimitError, requests.exceptions.RequestException) as e:
-        logger.warning(f"Retryable error for job {job_id}: {str(e)}")
-        # Retry the task with exponential backoff
-        raise self.retry(exc=e, countdown=60 * (self.request.retries + 1))
-    
+    except CircuitOpenError as e:
+        try:
+            _park_job(job_id, s3_key, retry)
+        except Exception as park_error:
+            logger.warning(f"Failed to park job {job_id}, retrying it instead: {park_error}")
+            raise self.retry(exc=e, countdown=max(1, int(e.retry_after)), kwargs={"retry_state": retry.to_dict()})
+        logger.warning(f"Parked job {job_id} while the LLM provider is unavailable: {str(e)}")
+        return {"task_id": job_id, "status": "parked"}
+
+    except (APIError, RateLimitExceeded, requests.exceptions.RequestException) as e:
+        reason = "network" if isinstance(e, requests.exceptions.RequestException) else None
+        delay = retry.next_delay(e, reason=reason)
+        if delay is None:
+            logger.error(f"Error processing job {job_id}, not retrying: {str(e)}")
+            _fail_job(job_id, e, retry)
+            raise
+        logger.warning(f"Retryable error for job {job_id}, retrying in {delay:.1f}s: {str(e)}")
+        raise self.retry(exc=e, countdown=delay, kwargs={"retry_state": retry.to_dict()})
+
     except Exception as e:
         logger.error(f"Error processing job {job_id}: {str(e)}", exc_info=True)
-        # Update job status to failed
-        db = SessionLocal()
-        try:
-            job = db.query(Job).filter(Job.id == job_id).first()
-            if job:
-                job.status = JobStatus.FAILED
-                job.error_message = str(e)
-                job.completed_at = datetime.utcnow()
-                db.commit()
-
-            # Send webhook callback for failure
-            if job.callback_url:
-                try:
-                    webhook_data = {
-                        "job_id": job_id,
-                        "status": "failed",
-                        "error": str(e)
-                    }
-                    response = requests.post(
-                        job.callback_url,
-                        json=webhook_data,
-                        timeout=10
-                    )
-                    logger.info(f"Webhook sent to {job.callback_url}, status: {response.status_code}")
-                except Exception as webhook_error:
-                    logger.warning(f"Failed to send webhook: {webhook_error}")
-        finally:
-            db.close()
+        _fail_job(job_id, e, retry)
+        raise
+
+
+@celery_app.task(name="resume_parked_jobs")
+def resume_parked_jobs_task():
+    """
+    Requeue jobs parked while the LLM provider circuit was open.
+    While the circuit is half-open only a few go out, so they can serve as probes.
+    """
+    if not circuit_breaker:
+        state = "closed"
+    else:
+        state, _retry_after = circuit_breaker.state()
+    if state == OPEN:
+        return {"state": state, "resumed": 0}
+
+    limit = config.llm_breaker_half_open_calls if state == HALF_OPEN else config.llm_breaker_resume_batch
+    client = _redis()
+    resumed = 0
+    while resumed < limit:
+        entry = client.lpop(PARKED_JOBS_KEY)
+        if entry is None:
+            break
+        parked = json.loads(entry)
+        process_image_task.delay(parked["job_id"], parked["s3_key"], retry_state=parked.get("retry_state"))
+        resumed += 1
+
+    return {
+        "state": state,
+        "resumed": resumed,
+        "parked": client.llen(PARKED_JOBS_KEY),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+# Jobs uploaded for offline processing, as JSON {"job_id", "s3_key"}, until the next batch is submitted
+OFFLINE_JOBS_KEY = "offline-jobs"
+# Submitted batches by batch id, as JSON {"submitted_at", "jobs": {job_id: {"s3_key", "plan"}}}
+OFFLINE_BATCHES_KEY = "offline-batches"
+# Claim of a poll collecting a batch, followed by the batch id. It expires, so
+# a batch whose collection crashed is picked up again by a later poll
+OFFLINE_BATCH_CLAIM_PREFIX = "offline-batch-claim:"
+OFFLINE_BATCH_CLAIM_TTL = 600
+
+_batch_backend = None
+
+
+def _get_batch_backend():
+    # One per worker process, the local backend tracks the batches it is running
+    global _batch_backend
+    if _batch_backend is None:
+        _batch_backend = build_batch_backend()
+    return _batch_backend
+
+
+def queue_offline_job(job_id: str, s3_key: str):
+    """Hold a job for the next offline batch instead of running it right away."""
+    queue_offline_jobs([(job_id, s3_key)])
+
+
+def queue_offline_jobs(jobs: list[tuple[str, str]]):
+    """Hold (job_id, s3_key) pairs for the next offline batch, in one Redis call."""
+    _redis().rpush(OFFLINE_JOBS_KEY, *(json.dumps({"job_id": job_id, "s3_key": s3_key}) for job_id, s3_key in jobs))
+
 
+@celery_app.task(name="submit_offline_batch")
+def submit_offline_batch_task():
+    """
+    Submit the jobs queued for offline processing as one batch file.
+    Each job is one request line, or one per tile for tall screenshots.
+    """
+    client = _redis()
+    entries = []
+    while len(entries) < config.llm_batch_max_jobs:
+        entry = client.lpop(OFFLINE_JOBS_KEY)
+        if entry is None:
+            break
+        entries.append(json.loads(entry))
+    if not entries:
+        return {"submitted": 0}
+
+    batch_requests = []
+    jobs = {}
+    for entry in entries:
+        job_id, s3_key = entry["job_id"], entry["s3_key"]
+        try:
+            response = storage.client.get_object(Bucket=config.s3_bucket_name, Key=s3_key)
+            bodies, plan = prepare_batch_image(
+                image_data=response['Body'].read(),
+                image_type=response.get('ContentType', 'image/png'),
+            )
+        except Exception as e:
+            logger.error(f"Error preparing offline job {job_id}: {str(e)}")
+            _fail_job(job_id, e, RetryPolicy())
+            continue
+        batch_requests.extend((f"{job_id}:{tile}", body) for tile, body in enumerate(bodies))
+        jobs[job_id] = {"s3_key": s3_key, "plan": plan}
+    if not jobs:
+        return {"submitted": 0}
+
+    input_path = Path(config.llm_batch_dir) / "queue" / f"{uuid.uuid4().hex}.jsonl"
+    write_batch_file(input_path, batch_requests)
+    try:
+        batch_id = _get_batch_backend().submit(input_path)
+    except Exception:
+        # Put the jobs back for the next attempt, in their original order
+        for job_id in reversed(list(jobs)):
+            client.lpush(OFFLINE_JOBS_KEY, json.dumps({"job_id": job_id, "s3_key": jobs[job_id]["s3_key"]}))
         raise
+    client.hset(OFFLINE_BATCHES_KEY, batch_id, json.dumps({"submitted_at": time.time(), "jobs": jobs}))
+
+    db = SessionLocal()
+    try:
+        for job in db.query(Job).filter(Job.id.in_(list(jobs))).all():
+            set_job_status(db, job, JobStatus.PROCESSING)
+            job.started_at = datetime.utcnow()
+            job.worker_id = f"batch:{batch_id}"
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"Submitted offline batch {batch_id} with {len(jobs)} jobs, {len(batch_requests)} requests")
+    return {"batch_id": batch_id, "submitted": len(jobs), "requests": len(batch_requests)}
+
+
+@celery_app.task(name="poll_offline_batches")
+def poll_offline_batches_task():
+    """
+    Collect the results of finished offline batches into their jobs.
+    Jobs of a batch that failed or expired as a whole are run through the regular queue instead.
+    """
+    client = _redis()
+    backend = _get_batch_backend()
+    finished = 0
+    for batch_id, entry in client.hgetall(OFFLINE_BATCHES_KEY).items():
+        batch_id = batch_id.decode()
+        try:
+            status = backend.status(batch_id)
+        except Exception as e:
+            logger.warning(f"Failed to check offline batch {batch_id}: {str(e)}")
+            continue
+        # The claim keeps a concurrent poll from collecting the batch twice
+        claim_key = f"{OFFLINE_BATCH_CLAIM_PREFIX}{batch_id}"
+        if not status.done or not client.set(claim_key, 1, nx=True, ex=OFFLINE_BATCH_CLAIM_TTL):
+            continue
+
+        try:
+            _collect_offline_batch(backend, batch_id, status.state, json.loads(entry))
+        except Exception as e:
+            # Jobs already completed are skipped when the batch is collected again
+            logger.error(f"Failed to collect offline batch {batch_id}, retrying on the next poll: {str(e)}", exc_info=True)
+            client.delete(claim_key)
+            continue
+        # The claim is left to expire, a poll that listed the batch before this must not collect it again
+        client.hdel(OFFLINE_BATCHES_KEY, batch_id)
+        finished += 1
+
+    return {
+        "finished": finished,
+        "pending": client.hlen(OFFLINE_BATCHES_KEY),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+def _collect_offline_batch(backend, batch_id: str, state: str, batch: dict[str, Any]):
+    """Complete the jobs of a finished offline batch, or requeue them if it failed as a whole."""
+    if state != "completed":
+        logger.warning(f"Offline batch {batch_id} ended {state}, requeueing its jobs")
+        for job_id, job in batch["jobs"].items():
+            process_image_task.delay(job_id, job["s3_key"])
+        return
+
+    output_path = Path(config.llm_batch_dir) / "queue" / f"{batch_id}.output.jsonl"
+    backend.download_results(batch_id, output_path)
+    lines = read_batch_results(output_path)
+    processing_time = time.time() - batch["submitted_at"]
+    for job_id, job in batch["jobs"].items():
+        plan = job["plan"]
+        try:
+            detection_result = assemble_batch_result(
+                [lines.get(f"{job_id}:{tile}") for tile in range(plan["requests"])], plan,
+            )
+        except Exception as e:
+            logger.error(f"Offline job {job_id} failed: {str(e)}")
+            _fail_job(job_id, e, RetryPolicy())
+            continue
+        _complete_job(job_id, _job_results(job_id, job["s3_key"], detection_result, processing_time, []))
 
 
 @celery_app.task(name="check_queue_size")
@@ -198,11 +505,11 @@ def cleanup_old_jobs_task():
     cutoff_date = datetime.utcnow() - timedelta(days=JOB_RETENTION_DAYS)
 
     with next(get_db()) as db:
-        # Find old completed/failed jobs
-        old_jobs = db.query(Job).filter(
-            Job.completed_at < cutoff_date,
-            Job.status.in_([JobStatus.COMPLETED, JobStatus.FAILED])
-        ).all()
+        # Find old completed/failed jobs, and presigned uploads that were never confirmed
+        old_jobs = db.query(Job).filter(or_(
+            and_(Job.completed_at < cutoff_date, Job.status.in_([JobStatus.COMPLETED, JobStatus.FAILED])),
+            and_(Job.created_at < cutoff_date, Job.status == JobStatus.AWAITING_UPLOAD),
+        )).all()
 
         s3_client = storage.client
         deleted_count = 0
@@ -226,8 +533,16 @@ def cleanup_old_jobs_task():
 
         db.commit()
 
+        # Batches whose jobs are all gone
+        deleted_batches = db.query(Batch).filter(
+            Batch.created_at < cutoff_date,
+            ~exists().where(Job.batch_id == Batch.id)
+        ).delete(synchronize_session=False)
+        db.commit()
+
         return {
             "deleted_jobs": deleted_count,
+            "deleted_batches": deleted_batches,
             "cutoff_date": cutoff_date.isoformat(),
             "timestamp": datetime.utcnow().isoformat()
         }
@@ -20,15 +20,38 @@ class AnnotationSchema(BaseModel):
     tag: TagType
 
 
+class ImageDimensions(BaseModel):
+    """Pixel size of an image, for converting normalized 0-1000 coordinates to pixels."""
+    width: int
+    height: int
+
+
 class DetectionResult(BaseModel):
     """Result from LLM UI element detection."""
     annotations: list[AnnotationSchema]
+    model: str | None = None
+    json_repaired: bool = False  # Model output was not valid JSON and had to be repaired
+    # Set by the model cascade: why the fast model's answer was escalated, empty when it was kept
+    escalation_reasons: list[str] | None = None
+    # Set when the result was reused from a near-duplicate image: Hamming distance of their perceptual hashes
+    near_duplicate_distance: int | None = None
 
 
 class PredictionResponse(BaseModel):
     """Response from LLM prediction."""
     annotations: list[AnnotationSchema]
     processing_time: float | None = None
+    # Annotations were reused from a near-identical earlier image, a seed to review rather than a fresh prediction
+    near_duplicate_distance: int | None = None
+    image_dimensions: ImageDimensions | None = None
+
+
+class PredictionStreamSummary(BaseModel):
+    """Final event of a streamed prediction."""
+    total: int
+    processing_time: float
+    time_to_first_annotation: float | None = None
+    image_dimensions: ImageDimensions | None = None
 
 
 class JobResponse(BaseModel):
@@ -39,6 +62,65 @@ class JobResponse(BaseModel):
     created_at: datetime
 
 
+class BatchUploadItem(BaseModel):
+    """Outcome of one file of a batch upload: its job, or why it was rejected."""
+    filename: str
+    task_id: str | None = None
+    error: str | None = None
+
+
+class BatchUploadResponse(BaseModel):
+    """Response when creating jobs for many images at once, in the order of the uploaded files."""
+    batch_id: str | None = None  # None when no file was accepted
+    jobs: list[BatchUploadItem]
+    message: str
+    created_at: datetime
+
+
+class PresignFile(BaseModel):
+    """An image a client is about to upload directly to S3."""
+    filename: str
+    content_type: str
+    size: int | None = Field(default=None, gt=0)
+
+
+class PresignRequest(BaseModel):
+    """Images to create direct upload URLs for."""
+    files: list[PresignFile] = Field(min_length=1, max_length=100)
+
+
+class PresignedUpload(BaseModel):
+    """Presigned S3 POST for one image: send the fields, then the file as the last field, to the URL."""
+    task_id: str
+    url: str
+    fields: dict[str, str]
+    expires_at: datetime
+
+
+class PresignResponse(BaseModel):
+    """Direct upload URLs, in the order of the requested files."""
+    batch_id: str
+    uploads: list[PresignedUpload]
+
+
+class BatchStatusResponse(BaseModel):
+    """Progress of a batch of jobs, read without touching its jobs."""
+    batch_id: str
+    total: int
+    pending: int
+    processing: int
+    completed: int
+    failed: int
+    progress: float  # Share of jobs that completed or failed
+    eta_seconds: float | None = None  # From the rate jobs finished at so far
+    created_at: datetime
+    completed_at: datetime | None = None
+    # Base64 of STATUS_BITS per job in upload order, the value indexing status_codes
+    status_bitmap: str
+    status_bits: int
+    status_codes: list[str]
+
+
 class JobStatusResponse(BaseModel):
     """Response for job status check."""
     task_id: str
@@ -50,3 +132,4 @@ class JobStatusResponse(BaseModel):
     started_at: datetime | None = None
     completed_at: datetime | None = None
     processing_time: float | None = None
+    image_dimensions: ImageDimensions | None = None
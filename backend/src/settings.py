@@ -41,6 +41,18 @@ class Settings(BaseSettings):
         default="us-east-1",
         description="AWS region"
     )
+    s3_upload_part_size: int = Field(
+        default=5 * 1024 * 1024,
+        description="Bytes per part of streamed multipart uploads, at least 5MB. Bounds API memory per upload"
+    )
+    s3_upload_concurrency: int = Field(
+        default=8,
+        description="S3 writes run in parallel per batch upload request"
+    )
+    s3_presign_expiration: int = Field(
+        default=900,
+        description="Seconds a presigned direct upload URL stays valid"
+    )
 
     # Database configuration
     database_url: str = Field(
@@ -67,8 +79,398 @@ class Settings(BaseSettings):
         default="openai/gpt-4o",
         description="OpenRouter model to use for UI detection"
     )
+    openrouter_base_url: str = Field(
+        default="https://openrouter.ai/api/v1",
+        description="OpenRouter API base URL"
+    )
+    openrouter_fallback_models: list[str] = Field(
+        default_factory=list,
+        description="Models tried after openrouter_model, in order, as a JSON list"
+    )
+
+    # LLM HTTP client configuration
+    llm_max_connections: int = Field(
+        default=100,
+        description="Maximum open connections per pooled LLM client"
+    )
+    llm_max_keepalive_connections: int = Field(
+        default=20,
+        description="Maximum idle keep-alive connections per pooled LLM client"
+    )
+    llm_keepalive_expiry: float = Field(
+        default=60.0,
+        description="Seconds an idle LLM connection is kept open"
+    )
+    llm_connect_timeout: float = Field(
+        default=10.0,
+        description="Timeout in seconds for establishing an LLM connection"
+    )
+    llm_request_timeout: float = Field(
+        default=120.0,
+        description="Timeout in seconds for a single LLM request"
+    )
+
+    # Prediction cache configuration
+    prediction_cache_backend: str = Field(
+        default="memory",
+        description="Prediction cache backend: memory, disk, redis or none"
+    )
+    prediction_cache_ttl: int = Field(
+        default=7 * 24 * 3600,
+        description="Seconds a cached prediction stays valid"
+    )
+    prediction_cache_max_entries: int = Field(
+        default=10000,
+        description="Maximum cached predictions for the memory and disk backends"
+    )
+    prediction_cache_dir: str = Field(
+        default=".cache/predictions",
+        description="Directory used by the disk prediction cache"
+    )
+
+    # Image preprocessing configuration
+    image_preprocess_enabled: bool = Field(
+        default=True,
+        description="Resize and re-encode images before sending them to the model"
+    )
+    image_max_edge: int = Field(
+        default=2048,
+        description="Longest image side in pixels sent to the model, 0 disables resizing"
+    )
+    image_format: str = Field(
+        default="webp",
+        description="Encoding for preprocessed images: webp, jpeg or png"
+    )
+    image_quality: int = Field(
+        default=85,
+        description="Encoder quality for webp and jpeg output"
+    )
+
+    # Tiled inference configuration
+    tiling_enabled: bool = Field(
+        default=False,
+        description="Split tall screenshots into overlapping tiles by default"
+    )
+    tile_height: int = Field(
+        default=1600,
+        description="Tile height in source image pixels"
+    )
+    tile_overlap: float = Field(
+        default=0.15,
+        description="Fraction of each tile shared with the next one"
+    )
+
+    # LLM rate limiting configuration
+    llm_rate_limit_backend: str = Field(
+        default="redis",
+        description="Where rate limit buckets live: redis (shared) or memory (per process)"
+    )
+    llm_requests_per_minute: int = Field(
+        default=0,
+        description="Provider request limit per model per minute, 0 disables"
+    )
+    llm_tokens_per_minute: int = Field(
+        default=0,
+        description="Provider token limit per model per minute, 0 disables"
+    )
+    llm_model_rate_limits: dict[str, dict[str, int]] = Field(
+        default_factory=dict,
+        description="Per-model overrides as JSON, e.g. {\"openai/gpt-4o\": {\"requests_per_minute\": 500}}"
+    )
+    llm_rate_limit_headroom: float = Field(
+        default=0.9,
+        description="Fraction of the provider limit to use, keeps callers just under it"
+    )
+    llm_rate_limit_max_wait: float = Field(
+        default=60.0,
+        description="Longest time in seconds a request waits for a rate limit slot"
+    )
+    llm_estimated_output_tokens: int = Field(
+        default=1500,
+        description="Output tokens reserved per request before the actual usage is known"
+    )
+
+    # Hedged request configuration
+    llm_hedging_enabled: bool = Field(
+        default=True,
+        description="Start a backup request when the first one is slower than usual. Fallback models are tried on provider errors either way"
+    )
+    llm_hedge_percentile: float = Field(
+        default=0.95,
+        description="Latency percentile of the waited-on model that triggers a hedge"
+    )
+    llm_hedge_min_samples: int = Field(
+        default=20,
+        description="Latency samples needed before the percentile replaces the default delay"
+    )
+    llm_hedge_default_delay: float = Field(
+        default=15.0,
+        description="Hedge delay in seconds until enough latency samples are collected"
+    )
+    llm_hedge_min_delay: float = Field(
+        default=1.0,
+        description="Lower bound in seconds for the adaptive hedge delay"
+    )
+    llm_hedge_max_delay: float = Field(
+        default=60.0,
+        description="Upper bound in seconds for the adaptive hedge delay"
+    )
+    llm_hedge_max_ratio: float = Field(
+        default=0.1,
+        description="Maximum hedged requests as a fraction of all routed requests"
+    )
+
+    # Single-flight coalescing configuration
+    singleflight_backend: str = Field(
+        default="redis",
+        description="Coalesce identical in-flight predictions: redis (across processes), memory (per process) or none"
+    )
+    singleflight_lock_ttl: float = Field(
+        default=300.0,
+        description="Seconds a prediction leader holds its lock"
+    )
+    singleflight_wait_timeout: float = Field(
+        default=60.0,
+        description="Seconds followers wait for a leader in another process before running the prediction themselves, keep it under the task soft time limit"
+    )
+    singleflight_result_ttl: int = Field(
+        default=60,
+        description="Seconds a finished leader's result stays available to late followers"
+    )
+
+    # LLM call telemetry configuration
+    llm_telemetry_sinks: str = Field(
+        default="log",
+        description="Comma-separated sinks for per-call LLM records: log, jsonl, prometheus. Empty disables them"
+    )
+    llm_telemetry_jsonl_path: str = Field(
+        default=".cache/llm_calls.jsonl",
+        description="File the jsonl telemetry sink appends call records to"
+    )
+
+    # Multi-image packing configuration
+    worker_pack_size: int = Field(
+        default=1,
+        description="Images a worker sends in one packed request. 1 disables packing; needs a threads pool with at least this concurrency"
+    )
+    worker_pack_wait: float = Field(
+        default=0.5,
+        description="Seconds a worker waits for concurrent tasks to fill a pack"
+    )
+
+    # Adaptive concurrency configuration
+    llm_concurrency_backend: str = Field(
+        default="redis",
+        description="Adaptive limit on concurrent LLM provider requests: redis (shared by the Celery workers), memory (per process) or none. The API does not use it"
+    )
+    llm_concurrency_initial: float = Field(
+        default=4,
+        description="In-flight LLM call limit to start from"
+    )
+    llm_concurrency_min: float = Field(
+        default=1,
+        description="Lowest in-flight limit the controller cuts down to"
+    )
+    llm_concurrency_max: float = Field(
+        default=32,
+        description="Highest in-flight limit the controller grows to"
+    )
+    llm_concurrency_decrease: float = Field(
+        default=0.5,
+        description="Factor applied to the limit on a 429, timeout or latency spike"
+    )
+    llm_concurrency_latency_tolerance: float = Field(
+        default=2.0,
+        description="Latency above this multiple of the running average counts as overload"
+    )
+    llm_concurrency_max_wait: float = Field(
+        default=120.0,
+        description="Seconds a worker waits for an in-flight slot before retrying the task later"
+    )
+
+    # Circuit breaker configuration
+    llm_breaker_backend: str = Field(
+        default="redis",
+        description="Circuit breaker around the LLM provider: redis (shared by the API and workers), memory (per process) or none"
+    )
+    llm_breaker_failure_threshold: float = Field(
+        default=0.5,
+        description="Fraction of provider calls failing with errors, timeouts, 5xx or 429 that opens the circuit"
+    )
+    llm_breaker_min_calls: int = Field(
+        default=10,
+        description="Calls needed in the window before the circuit can open"
+    )
+    llm_breaker_window: float = Field(
+        default=60.0,
+        description="Seconds of recent calls the failure rate is computed over"
+    )
+    llm_breaker_open_duration: float = Field(
+        default=30.0,
+        description="Seconds calls fail fast before the circuit lets probe calls through"
+    )
+    llm_breaker_half_open_calls: int = Field(
+        default=3,
+        description="Probe calls that must all succeed to close the circuit again"
+    )
+    llm_breaker_resume_batch: int = Field(
+        default=50,
+        description="Parked jobs requeued per beat tick once the circuit is closed"
+    )
+
+    # Retry policy configuration
+    llm_retry_max: int = Field(
+        default=4,
+        description="Retries allowed for one prediction in total, across inline retries, fallback models and Celery retries"
+    )
+    llm_retry_base_delay: float = Field(
+        default=1.0,
+        description="Backoff for the first retry in seconds, doubling with each retry and fully jittered"
+    )
+    llm_retry_max_delay: float = Field(
+        default=60.0,
+        description="Cap on the backoff in seconds. A longer Retry-After from the provider is still honored"
+    )
+    llm_retry_max_inline_delay: float = Field(
+        default=10.0,
+        description="Longest delay waited out inside a call. Workers hand longer ones to a Celery retry"
+    )
+    llm_retry_deadline: float = Field(
+        default=1800.0,
+        description="Seconds from the first attempt after which a prediction is no longer retried, 0 for no deadline"
+    )
+
+    # Model cascade configuration
+    cascade_enabled: bool = Field(
+        default=False,
+        description="Ask a fast model first and escalate to OPENROUTER_MODEL only when its result looks weak"
+    )
+    cascade_fast_model: str = Field(
+        default="openai/gpt-4o-mini",
+        description="Cheap, fast model tried first in the cascade"
+    )
+    cascade_min_elements: int = Field(
+        default=1,
+        description="Escalate when the fast model finds fewer elements than this"
+    )
+    cascade_min_elements_per_megapixel: float = Field(
+        default=2.0,
+        description="Escalate when the fast model finds fewer elements than this per megapixel of the image"
+    )
+    cascade_escalate_on_repair: bool = Field(
+        default=True,
+        description="Escalate when the fast model's output was not valid JSON and had to be repaired"
+    )
+    cascade_max_overlap: float = Field(
+        default=0.25,
+        description="Escalate when more than this fraction of the fast model's boxes overlap another box"
+    )
 
+    # Offline batch inference configuration
+    llm_batch_backend: str = Field(
+        default="local",
+        description="Batch backend for offline predictions: 'local' (runs the batch file against OpenRouter) or 'openai' (provider batch API)"
+    )
+    llm_batch_dir: str = Field(
+        default=".cache/batches",
+        description="Directory for batch input and output files. Workers must share it when the backend is 'local'"
+    )
+    llm_batch_base_url: str = Field(
+        default="https://api.openai.com/v1",
+        description="Base URL of the provider batch API for the 'openai' backend"
+    )
+    llm_batch_api_key: str = Field(
+        default="",
+        description="API key for the provider batch API, OPENROUTER_API_KEY when empty"
+    )
+    llm_batch_completion_window: str = Field(
+        default="24h",
+        description="Completion window requested from the provider batch API"
+    )
+    llm_batch_poll_interval: float = Field(
+        default=30.0,
+        description="Seconds between batch status checks"
+    )
+    llm_batch_max_jobs: int = Field(
+        default=1000,
+        description="Most queued offline jobs submitted together in one batch"
+    )
+    llm_batch_local_concurrency: int = Field(
+        default=2,
+        description="Requests the local batch backend sends at a time"
+    )
 
+    # Near-duplicate reuse configuration
+    near_duplicate_enabled: bool = Field(
+        default=False,
+        description="Reuse the annotations of a near-identical, previously predicted image instead of calling the model"
+    )
+    near_duplicate_max_distance: int = Field(
+        default=4,
+        description="Most differing bits (of 64) between perceptual hashes for images to count as near-duplicates"
+    )
+    near_duplicate_max_entries: int = Field(
+        default=100000,
+        description="Most predicted images kept in the near-duplicate index, oldest are forgotten first"
+    )
+    near_duplicate_index_path: str = Field(
+        default=".cache/near_duplicates.jsonl",
+        description="File the near-duplicate index is persisted to and loaded from at startup, empty to keep it in memory only"
+    )
+
+    # Image validation configuration
+    image_max_pixels: int = Field(
+        default=60_000_000,
+        description="Most pixels an uploaded image may declare, larger ones are rejected as decompression bombs"
+    )
+    image_max_dimension: int = Field(
+        default=32768,
+        description="Longest side in pixels an uploaded image may declare"
+    )
+
+    # LLM cassette configuration
+    llm_cassette_mode: str = Field(
+        default="off",
+        description="Record/replay of LLM calls: off, record (store provider responses), replay (serve stored responses only) or auto (replay, record on a miss)"
+    )
+    llm_cassette_dir: str = Field(
+        default=".cache/cassettes/default",
+        description="Directory holding the recorded responses"
+    )
+    llm_cassette_latency: str = Field(
+        default="recorded",
+        description="Latency simulated on replay: none, recorded (as measured when recording) or lognormal"
+    )
+    llm_cassette_latency_median: float = Field(
+        default=2.0,
+        description="Median seconds of the lognormal replay latency"
+    )
+    llm_cassette_latency_sigma: float = Field(
+        default=0.5,
+        description="Spread (sigma of the log) of the lognormal replay latency"
+    )
+    llm_cassette_error_rate: float = Field(
+        default=0.0,
+        description="Fraction of replayed calls answered with a simulated 429, 500 or 503"
+    )
+    llm_cassette_seed: int | None = Field(
+        default=None,
+        description="Seed for simulated latencies and errors, set it for repeatable runs"
+    )
+
+    # Job event push configuration
+    job_events_stream_maxlen: int = Field(
+        default=100000,
+        description="Job status events kept in the Redis stream, how far back reconnecting clients can resume"
+    )
+    ws_heartbeat_interval: float = Field(
+        default=25.0,
+        description="Seconds without messages after which a WebSocket gets a ping, keeps idle connections open through proxies"
+    )
+    ws_send_queue_size: int = Field(
+        default=1000,
+        description="Messages queued per WebSocket before a slow client is disconnected to resume later"
+    )
 
 
 # Create global settings instance
@@ -1,12 +1,14 @@
 import logging
 import uuid
-from typing import BinaryIO
+from typing import Any, BinaryIO
 
 import boto3
 from botocore.client import Config as BotoConfig
 from botocore.exceptions import ClientError
 
+from src.inference.image_info import ImageInfo
 from src.settings import config
+from src.storage.upload import StreamingUpload, inspect_uploaded_image
 
 logger = logging.getLogger(__name__)
 
@@ -96,8 +98,7 @@ class S3Storage:
             Tuple of (s3_key, s3_url)
         """
         # Generate unique key
-        file_extension = original_filename.split('.')[-1] if '.' in original_filename else 'png'
-        s3_key = f"uploads/{uuid.uuid4()}.{file_extension}"
+        s3_key = self.new_key(original_filename)
 
         # Upload to S3
         try:
@@ -106,10 +107,7 @@ class S3Storage:
                 Key=s3_key,
                 Body=file_data,
                 ContentType=content_type,
-                Metadata={
-                    'original_filename': original_filename,
-                    'upload_timestamp': str(uuid.uuid4())
-                }
+                Metadata=self._metadata(original_filename)
             )
         except ClientError as e:
             error_code = e.response['Error']['Code']
@@ -126,10 +124,34 @@ class S3Storage:
             else:
                 raise
 
-        # Generate AWS S3 URL
-        s3_url = f"https://{self.bucket_name}.s3.{config.s3_region}.amazonaws.com/{s3_key}"
+        return s3_key, self.url(s3_key)
+
+    def start_upload(self, content_type: str, original_filename: str) -> StreamingUpload:
+        """Start an upload that is fed in chunks, see StreamingUpload."""
+        return StreamingUpload(
+            client=self.client,
+            bucket_name=self.bucket_name,
+            s3_key=self.new_key(original_filename),
+            content_type=content_type,
+            metadata=self._metadata(original_filename),
+            part_size=config.s3_upload_part_size,
+        )
+
+    @staticmethod
+    def new_key(original_filename: str) -> str:
+        file_extension = original_filename.split('.')[-1] if '.' in original_filename else 'png'
+        return f"uploads/{uuid.uuid4()}.{file_extension}"
+
+    def url(self, s3_key: str) -> str:
+        """AWS S3 URL of an object."""
+        return f"https://{self.bucket_name}.s3.{config.s3_region}.amazonaws.com/{s3_key}"
 
-        return s3_key, s3_url
+    @staticmethod
+    def _metadata(original_filename: str) -> dict[str, str]:
+        return {
+            'original_filename': original_filename,
+            'upload_timestamp': str(uuid.uuid4())
+        }
 
     def download_image(self, s3_key: str) -> bytes:
         """
@@ -148,6 +170,36 @@ class S3Storage:
         """Delete an image from S3."""
         self.client.delete_object(Bucket=self.bucket_name, Key=s3_key)
 
+    def presign_upload(self, s3_key: str, content_type: str, max_size: int, expiration: int) -> dict[str, Any]:
+        """
+        Generate a presigned POST for uploading an image directly from a client.
+
+        S3 enforces the content type and size limit of the upload.
+
+        Args:
+            s3_key: S3 object key to upload to
+            content_type: Content type the upload must have
+            max_size: Most bytes allowed
+            expiration: URL expiration time in seconds
+
+        Returns:
+            Dict with the "url" to POST to and the form "fields" to send before the file
+        """
+        return self.client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_size],
+            ],
+            ExpiresIn=expiration
+        )
+
+    def inspect_upload(self, s3_key: str, max_size: int) -> tuple[int, ImageInfo]:
+        """Size and image header of a direct upload, see inspect_uploaded_image."""
+        return inspect_uploaded_image(self.client, self.bucket_name, s3_key, max_size)
+
     def get_presigned_url(self, s3_key: str, expiration: int = 3600) -> str:
         """
         Generate a presigned URL for downloading.
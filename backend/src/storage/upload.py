@@ -0,0 +1,399 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from botocore.exceptions import ClientError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from src.inference.image_info import ImageInfo, validate_image
+
+logger = logging.getLogger(__name__)
+
+# Room for the multipart boundaries, part headers and small form fields around the file
+FORM_OVERHEAD = 64 * 1024
+
+# Image bytes buffered before the header is checked. JPEG frame headers may
+# follow large EXIF segments, so a header not found in the first SNIFF_MIN
+# bytes is retried as more data arrives, up to SNIFF_MAX
+SNIFF_MIN = 64 * 1024
+SNIFF_MAX = 256 * 1024
+
+
+class StreamingUpload:
+    """
+    S3 upload fed chunk by chunk from an async handler.
+
+    At most one part is held in memory. Data that fits in one part is
+    stored with a single put_object, larger uploads switch to a multipart
+    upload. boto3 calls run in worker threads so the event loop keeps
+    serving other requests meanwhile.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket_name: str,
+        s3_key: str,
+        content_type: str,
+        metadata: dict[str, str],
+        part_size: int,
+    ):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.content_type = content_type
+        self.metadata = metadata
+        self.part_size = part_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[dict[str, Any]] = []
+
+    async def write(self, data: bytes):
+        self._buffer.extend(data)
+        self.size += len(data)
+        # Keep the last part in memory, it may be the only one
+        while len(self._buffer) > self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._upload_part(part)
+
+    async def complete(self) -> str:
+        """Finish the upload. Returns the S3 key."""
+        try:
+            if self._upload_id is None:
+                await asyncio.to_thread(
+                    self.client.put_object,
+                    Bucket=self.bucket_name,
+                    Key=self.s3_key,
+                    Body=bytes(self._buffer),
+                    ContentType=self.content_type,
+                    Metadata=self.metadata,
+                )
+            else:
+                await self._upload_part(bytes(self._buffer))
+                await asyncio.to_thread(
+                    self.client.complete_multipart_upload,
+                    Bucket=self.bucket_name,
+                    Key=self.s3_key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts},
+                )
+        except ClientError:
+            await self.abort()
+            raise
+        self._buffer.clear()
+        return self.s3_key
+
+    async def abort(self):
+        """Drop the parts uploaded so far. S3 keeps, and bills, unfinished multipart uploads otherwise."""
+        self._buffer.clear()
+        if self._upload_id is None:
+            return
+        upload_id, self._upload_id = self._upload_id, None
+        try:
+            await asyncio.to_thread(
+                self.client.abort_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=self.s3_key,
+                UploadId=upload_id,
+            )
+        except ClientError as e:
+            logger.warning(f"Failed to abort multipart upload of {self.s3_key}: {e}")
+
+    async def _upload_part(self, part: bytes):
+        if self._upload_id is None:
+            response = await asyncio.to_thread(
+                self.client.create_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=self.s3_key,
+                ContentType=self.content_type,
+                Metadata=self.metadata,
+            )
+            self._upload_id = response["UploadId"]
+        part_number = len(self._parts) + 1
+        response = await asyncio.to_thread(
+            self.client.upload_part,
+            Bucket=self.bucket_name,
+            Key=self.s3_key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=part,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+
+class UploadTooLarge(ValueError):
+    """The request body is over the upload size limit."""
+
+
+@dataclass
+class UploadedImage:
+    """An image streamed from a multipart form to storage."""
+    s3_key: str
+    filename: str
+    content_type: str
+    size: int
+    image: ImageInfo
+
+
+@dataclass
+class RejectedImage:
+    """A file of a multipart form that was not stored."""
+    filename: str
+    error: ValueError
+
+
+class _ImagePart:
+    """A file part being streamed: its header is checked before the storage upload starts."""
+
+    def __init__(self, filename: str, start_upload: Callable[[str, str], StreamingUpload], max_size: int):
+        self.filename = filename
+        self.start_upload = start_upload
+        self.max_size = max_size
+        self.size = 0
+        self.sniffed = bytearray()
+        self.image: ImageInfo | None = None
+        self.upload: StreamingUpload | None = None
+        self.error: ValueError | None = None
+
+    async def write(self, data: bytes, last: bool = False):
+        if self.error is not None:
+            # Rejected, the rest of the file is skipped
+            return
+        self.size += len(data)
+        try:
+            if self.size > self.max_size:
+                raise UploadTooLarge(f"File is over the {self.max_size} byte limit")
+            if self.upload is not None:
+                await self.upload.write(data)
+                return
+            self.sniffed.extend(data)
+            if not last and len(self.sniffed) < SNIFF_MIN:
+                return
+            try:
+                self.image = validate_image(bytes(self.sniffed))
+            except ValueError:
+                if not last and len(self.sniffed) < SNIFF_MAX:
+                    return
+                raise
+            self.upload = self.start_upload(self.image.content_type, self.filename)
+            await self.upload.write(bytes(self.sniffed))
+            self.sniffed.clear()
+        except ValueError as e:
+            self.error = e
+            await self.abort()
+
+    async def abort(self):
+        self.sniffed.clear()
+        if self.upload is not None:
+            await self.upload.abort()
+
+    async def complete(self) -> UploadedImage:
+        s3_key = await self.upload.complete()
+        return UploadedImage(
+            s3_key=s3_key,
+            filename=self.filename,
+            content_type=self.image.content_type,
+            size=self.size,
+            image=self.image,
+        )
+
+
+async def receive_image_uploads(
+    stream: AsyncIterator[bytes],
+    content_type: str | None,
+    content_length: int | None,
+    start_upload: Callable[[str, str], StreamingUpload],
+    max_size: int,
+    max_files: int = 1,
+    field_name: str = "file",
+    concurrency: int = 8,
+) -> list[UploadedImage | RejectedImage]:
+    """
+    Stream the images of a multipart/form-data request body to storage.
+
+    The body is parsed as it arrives and is never held in memory as a
+    whole. Uploads are refused from the Content-Length header when it is
+    over the limit, before anything is read, and otherwise as soon as the
+    bytes received pass it. Each image header is checked before anything
+    is written to storage. A file that fails is rejected on its own and
+    the rest of it skipped. The last write of each file, usually the
+    only one for screenshots, runs in the background while the next files
+    are read, up to concurrency at a time.
+
+    Args:
+        stream: Request body chunks
+        content_type: Content-Type header of the request
+        content_length: Content-Length header of the request, if sent
+        start_upload: Starts the storage upload given the image content type and filename
+        max_size: Most bytes allowed per image
+        max_files: Most images allowed in the form
+        field_name: Form field of the images
+        concurrency: Most storage writes running in the background
+
+    Returns:
+        UploadedImage or RejectedImage per file, in form order
+
+    Raises:
+        UploadTooLarge: The body is over max_files images of max_size
+        ValueError: The body is not a form with max_files images or less
+    """
+    max_body = max_files * (max_size + FORM_OVERHEAD)
+    if content_length is not None and content_length > max_body:
+        raise UploadTooLarge(f"Upload of {content_length} bytes is over the {max_body} byte limit")
+
+    form_type, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if form_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Request must be multipart/form-data")
+
+    # The parser reports events through callbacks, handled after each chunk since handling awaits
+    events: list[tuple[str, bytes]] = []
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_data(name: str):
+        def callback(data: bytes, start: int, end: int):
+            events.append((name, data[start:end]))
+        return callback
+
+    def on_event(name: str):
+        return lambda: events.append((name, b""))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_event("part_begin"),
+        "on_part_data": on_data("part_data"),
+        "on_part_end": on_event("part_end"),
+        "on_header_field": on_data("header_field"),
+        "on_header_value": on_data("header_value"),
+        "on_header_end": on_event("header_end"),
+        "on_headers_finished": on_event("headers_finished"),
+    })
+
+    headers: dict[bytes, bytes] = {}
+    results: list[RejectedImage | asyncio.Task] = []
+    part: _ImagePart | None = None
+    received = 0
+    # Bounds the parts held in memory by background completions
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def complete(image_part: _ImagePart) -> UploadedImage:
+        try:
+            return await image_part.complete()
+        finally:
+            semaphore.release()
+
+    try:
+        async for chunk in stream:
+            received += len(chunk)
+            if received > max_body:
+                raise UploadTooLarge(f"Upload is over the {max_body} byte limit")
+            parser.write(chunk)
+
+            for event, data in events:
+                if event == "part_begin":
+                    headers.clear()
+                elif event == "header_field":
+                    header_field.extend(data)
+                elif event == "header_value":
+                    header_value.extend(data)
+                elif event == "header_end":
+                    headers[bytes(header_field).lower()] = bytes(header_value)
+                    header_field.clear()
+                    header_value.clear()
+                elif event == "headers_finished":
+                    _, disposition = parse_options_header(headers.get(b"content-disposition"))
+                    if disposition.get(b"name") != field_name.encode():
+                        continue
+                    if len(results) >= max_files:
+                        raise ValueError(f"At most {max_files} files per upload")
+                    filename = disposition.get(b"filename", b"").decode("utf-8", errors="replace")
+                    part = _ImagePart(filename, start_upload, max_size)
+                    if not headers.get(b"content-type", b"").startswith(b"image/"):
+                        part.error = ValueError("File must be an image")
+                elif event == "part_data" and part is not None:
+                    await part.write(data)
+                elif event == "part_end" and part is not None:
+                    await part.write(b"", last=True)
+                    if part.error is not None:
+                        if max_files == 1:
+                            raise part.error
+                        results.append(RejectedImage(part.filename, part.error))
+                    else:
+                        await semaphore.acquire()
+                        results.append(asyncio.create_task(complete(part)))
+                    part = None
+                if part is not None and part.error is not None and max_files == 1:
+                    # Nothing else to store, stop reading
+                    raise part.error
+            events.clear()
+        parser.finalize()
+
+        if part is not None:
+            raise ValueError("Upload ended before the end of the file")
+        if not results:
+            raise ValueError(f"Form has no '{field_name}' file")
+        tasks = [result for result in results if isinstance(result, asyncio.Task)]
+        await asyncio.gather(*tasks)
+    except BaseException:
+        if part is not None:
+            await part.abort()
+        # Let background completions finish, their uploads abort themselves on errors
+        await asyncio.gather(*(result for result in results if isinstance(result, asyncio.Task)), return_exceptions=True)
+        raise
+
+    return [result.result() if isinstance(result, asyncio.Task) else result for result in results]
+
+
+async def receive_image_upload(
+    stream: AsyncIterator[bytes],
+    content_type: str | None,
+    content_length: int | None,
+    start_upload: Callable[[str, str], StreamingUpload],
+    max_size: int,
+    field_name: str = "file",
+) -> UploadedImage:
+    """
+    Stream the image of a single-file multipart/form-data request body to storage.
+
+    See receive_image_uploads. Reading stops at the first error.
+
+    Raises:
+        UploadTooLarge: The image is over max_size
+        ValueError: The body is not a form with a valid image
+    """
+    results = await receive_image_uploads(stream, content_type, content_length, start_upload, max_size,
+                                          max_files=1, field_name=field_name)
+    return results[0]
+
+
+def inspect_uploaded_image(client: Any, bucket_name: str, s3_key: str, max_size: int) -> tuple[int, ImageInfo]:
+    """
+    Check an image a client uploaded directly to S3, without downloading it.
+
+    Reads the object size and only the first bytes, enough for the image
+    header.
+
+    Returns:
+        Tuple of (size in bytes, ImageInfo)
+
+    Raises:
+        FileNotFoundError: Nothing was uploaded to the key
+        UploadTooLarge: The object is over max_size
+        ValueError: The object is not a valid image
+    """
+    try:
+        head = client.head_object(Bucket=bucket_name, Key=s3_key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            raise FileNotFoundError(f"Nothing uploaded to {s3_key}")
+        raise
+    size = head["ContentLength"]
+    if size > max_size:
+        raise UploadTooLarge(f"File of {size} bytes is over the {max_size} byte limit")
+
+    response = client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes=0-{SNIFF_MAX - 1}")
+    return size, validate_image(response["Body"].read())
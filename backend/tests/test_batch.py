@@ -0,0 +1,105 @@
+"""Test offline batch inference."""
+
+import io
+import json
+
+from PIL import Image
+
+from src import llm
+from src.cli.batch_predict import processor
+from src.cli.batch_predict.processor import BatchProcessor
+from src.inference.batch import (
+    LocalBatchBackend,
+    read_batch_results,
+    wait_for_batch,
+    write_batch_file,
+)
+from src.inference.preprocess import PreprocessOptions
+from src.inference.tiling import TilingOptions
+from src.settings import config
+
+
+def make_png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def completion(model: str, annotations: list[dict]) -> dict:
+    return {
+        "id": "1", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{
+            "index": 0, "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps({"annotations": annotations})},
+        }],
+    }
+
+
+def button_handler(body: dict) -> tuple[int, dict]:
+    return 200, completion(body["model"], [{"x": 10, "y": 10, "width": 100, "height": 40, "tag": "button"}])
+
+
+def test_local_backend_writes_one_line_per_request(tmp_path):
+    """Test that the local backend answers every request line and records failures without stopping."""
+    def handler(body):
+        if body["n"] == 2:
+            return 500, {"error": {"message": "upstream error"}}
+        return 200, {"n": body["n"]}
+
+    backend = LocalBatchBackend(tmp_path / "batches", handler=handler)
+    write_batch_file(tmp_path / "input.jsonl", [(f"req-{n}", {"n": n}) for n in range(4)])
+
+    batch_id = backend.submit(tmp_path / "input.jsonl")
+    status = wait_for_batch(backend, batch_id, poll_interval=0.01, timeout=5)
+    backend.download_results(batch_id, tmp_path / "output.jsonl")
+    lines = read_batch_results(tmp_path / "output.jsonl")
+
+    assert (status.state, status.completed, status.failed) == ("completed", 3, 1)
+    assert lines["req-1"]["response"]["body"] == {"n": 1}
+    assert lines["req-2"]["error"]["message"] == "upstream error"
+
+
+def test_tiled_image_round_trips_through_a_batch(tmp_path):
+    """Test that a tall screenshot becomes one request per tile and the answers merge back into one result."""
+    tiling = TilingOptions(enabled=True, tile_height=1000, overlap=0.1)
+    bodies, plan = llm.prepare_batch_image(
+        image_data=make_png(500, 2500), image_type="image/png", model="model-a",
+        preprocess=PreprocessOptions(enabled=False), tiling=tiling,
+    )
+    backend = LocalBatchBackend(tmp_path, handler=button_handler)
+    write_batch_file(tmp_path / "input.jsonl", [(f"job:{tile}", body) for tile, body in enumerate(bodies)])
+
+    batch_id = backend.submit(tmp_path / "input.jsonl")
+    wait_for_batch(backend, batch_id, poll_interval=0.01, timeout=5)
+    backend.download_results(batch_id, tmp_path / "output.jsonl")
+    lines = read_batch_results(tmp_path / "output.jsonl")
+    result = llm.assemble_batch_result([lines.get(f"job:{tile}") for tile in range(plan["requests"])], plan, tiling)
+
+    assert len(bodies) == len(plan["tiles"]) == 3
+    assert result.model == "model-a"
+    assert len(result.annotations) == 3
+
+
+def test_cli_offline_mode(tmp_path, monkeypatch):
+    """Test that offline mode submits one batch for all images and reports failed lines per image."""
+    def handler(body):
+        if body["model"] == "broken-model":
+            return 400, {"error": {"message": "bad request"}}
+        return button_handler(body)
+
+    backend = LocalBatchBackend(tmp_path / "batches", handler=handler)
+    monkeypatch.setattr(processor, "build_batch_backend", lambda: backend)
+    monkeypatch.setattr(config, "llm_batch_dir", str(tmp_path))
+    images = []
+    for name in ("a.png", "b.png"):
+        (tmp_path / name).write_bytes(make_png(300, 200))
+        images.append(tmp_path / name)
+    batch = BatchProcessor(model_name="model-a", adaptive=False, tiling=TilingOptions(enabled=False))
+
+    results = batch.process_offline(images, poll_interval=0.01)
+    failed = BatchProcessor(model_name="broken-model", adaptive=False).process_offline(images[:1], poll_interval=0.01)
+
+    assert [result["status"] for result in results] == ["completed", "completed"]
+    assert results[0]["annotations"][0]["tag"] == "button"
+    assert len(list((tmp_path / "batches").iterdir())) == 2
+    assert failed[0]["status"] == "failed" and "bad request" in failed[0]["error"]
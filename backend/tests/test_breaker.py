@@ -0,0 +1,157 @@
+"""Test the circuit breaker around the LLM provider."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from celery.exceptions import SoftTimeLimitExceeded
+from openai import APIConnectionError, InternalServerError
+
+from src.inference.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerPolicy,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from src.inference.ratelimit import RateLimitExceeded
+
+REQUEST = httpx.Request("POST", "https://provider.test/v1/chat/completions")
+
+
+def make_breaker(**overrides) -> CircuitBreaker:
+    params = {"failure_threshold": 0.5, "min_calls": 4, "open_duration": 0.05, "half_open_calls": 2}
+    params.update(overrides)
+    return CircuitBreaker(backend=None, policy=BreakerPolicy(**params), name="provider")
+
+
+def call(breaker: CircuitBreaker, error: BaseException | None = None):
+    with breaker.guard():
+        if error is not None:
+            raise error
+
+
+def server_error() -> InternalServerError:
+    return InternalServerError("Bad gateway", response=httpx.Response(502, request=REQUEST), body=None)
+
+
+def test_opens_on_failure_rate_and_fails_fast():
+    """Test that the circuit opens once enough calls fail, then rejects calls without making them."""
+    breaker = make_breaker(open_duration=60)
+    call(breaker)
+    call(breaker)
+    with pytest.raises(APIConnectionError):
+        call(breaker, APIConnectionError(request=REQUEST))
+    assert breaker.state()[0] == CLOSED
+
+    with pytest.raises(InternalServerError):
+        call(breaker, server_error())
+    assert breaker.state()[0] == OPEN
+
+    made = []
+    with pytest.raises(CircuitOpenError) as excinfo:
+        with breaker.guard():
+            made.append(True)
+    assert made == []
+    assert 0 < excinfo.value.retry_after <= 60
+    assert breaker.stats()["opened"] == 1
+
+
+def test_bad_requests_and_own_rate_limit_do_not_open():
+    """Test that errors which say nothing about provider health leave the circuit closed."""
+    breaker = make_breaker()
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            call(breaker, ValueError("Annotations must be a list"))
+        with pytest.raises(RateLimitExceeded):
+            call(breaker, RateLimitExceeded("model", 1.0))
+
+    assert breaker.state()[0] == CLOSED
+
+
+def test_half_open_probes_close_the_circuit():
+    """Test that after the open duration a limited number of probes succeed and close the circuit."""
+    breaker = make_breaker()
+    for _ in range(4):
+        with pytest.raises(InternalServerError):
+            call(breaker, server_error())
+    time.sleep(0.06)
+
+    with breaker.guard():
+        # The probe quota is taken by in-flight probes
+        with breaker.guard():
+            assert breaker.state()[0] == HALF_OPEN
+            with pytest.raises(CircuitOpenError):
+                call(breaker)
+
+    assert breaker.state()[0] == CLOSED
+    assert breaker.stats()["probes"] == 2
+
+
+def test_failed_probe_reopens_the_circuit():
+    """Test that one failing probe sends the circuit back to open."""
+    breaker = make_breaker()
+    for _ in range(4):
+        with pytest.raises(APIConnectionError):
+            call(breaker, APIConnectionError(request=REQUEST))
+    time.sleep(0.06)
+
+    with pytest.raises(APIConnectionError):
+        call(breaker, APIConnectionError(request=REQUEST))
+
+    assert breaker.state()[0] == OPEN
+    with pytest.raises(CircuitOpenError):
+        call(breaker)
+
+
+def test_cancelled_probe_frees_its_permit():
+    """Test that a cancelled probe, e.g. a losing hedge, lets another probe through."""
+    breaker = make_breaker(half_open_calls=1)
+    for _ in range(4):
+        with pytest.raises(InternalServerError):
+            call(breaker, server_error())
+    time.sleep(0.06)
+
+    async def cancelled_probe():
+        async with breaker.guard_async():
+            raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancelled_probe())
+
+    call(breaker)
+    assert breaker.state()[0] == CLOSED
+
+
+def test_unsettled_probes_are_reissued():
+    """Test that probes taken by callers that never report back are handed out again after the open duration."""
+    breaker = make_breaker(half_open_calls=1)
+    for _ in range(4):
+        with pytest.raises(InternalServerError):
+            call(breaker, server_error())
+    time.sleep(0.06)
+
+    # A worker killed mid-probe never records its outcome
+    assert breaker._allow()
+    with pytest.raises(CircuitOpenError):
+        call(breaker)
+    time.sleep(0.06)
+
+    call(breaker)
+    assert breaker.state()[0] == CLOSED
+
+
+def test_time_limit_counts_as_failure():
+    """Test that a probe killed by the task time limit while the provider hangs reopens the circuit."""
+    breaker = make_breaker()
+    for _ in range(4):
+        with pytest.raises(InternalServerError):
+            call(breaker, server_error())
+    time.sleep(0.06)
+
+    with pytest.raises(SoftTimeLimitExceeded):
+        call(breaker, SoftTimeLimitExceeded())
+
+    assert breaker.state()[0] == OPEN
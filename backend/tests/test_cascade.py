@@ -0,0 +1,86 @@
+"""Test the cheap-then-expensive model cascade."""
+
+import io
+import json
+
+from click.testing import CliRunner
+from PIL import Image
+
+from src import llm
+from src.cli.main import cli
+from src.inference.cascade import CascadeOptions, CascadeStats, escalation_reasons
+from src.schemas import AnnotationSchema, DetectionResult
+
+CASCADE = CascadeOptions(enabled=True, fast_model="fast-model", min_elements_per_megapixel=2.0)
+
+
+def make_png(width: int = 1000, height: int = 1000) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def boxes(count: int, step: float = 100) -> list[AnnotationSchema]:
+    return [AnnotationSchema(x=i * step, y=10, width=50, height=20, tag="button") for i in range(count)]
+
+
+def test_escalation_heuristics():
+    """Test that sparse, repaired and overlapping results are flagged and a plain one is kept."""
+    size = (1000, 2000)
+
+    assert escalation_reasons(DetectionResult(annotations=boxes(5)), size, CASCADE) == []
+    assert escalation_reasons(DetectionResult(annotations=boxes(3)), size, CASCADE) == ["few_elements"]
+    assert "json_repaired" in escalation_reasons(DetectionResult(annotations=boxes(5), json_repaired=True), size, CASCADE)
+    assert "overlapping_boxes" in escalation_reasons(DetectionResult(annotations=boxes(5, step=5)), size, CASCADE)
+
+
+def test_cascade_escalates_only_weak_results(monkeypatch):
+    """Test that the strong model is only called when the fast model's result looks weak."""
+    calls = []
+    answers = {"fast-model": boxes(3), "strong-model": boxes(4)}
+
+    def detect_single(*, route, **_kwargs):
+        calls.append(route[0])
+        return DetectionResult(annotations=answers[route[0]], model=route[0])
+
+    monkeypatch.setattr(llm, "_detect_single", detect_single)
+    monkeypatch.setattr(llm, "cascade_stats", CascadeStats())
+    image = make_png()
+
+    kept = llm.detect_ui_elements(image_data=image, image_type="image/png", model="strong-model", use_cache=False, cascade=CASCADE)
+    answers["fast-model"] = []
+    escalated = llm.detect_ui_elements(image_data=image, image_type="image/png", model="strong-model", use_cache=False, cascade=CASCADE)
+
+    assert (kept.model, kept.escalation_reasons) == ("fast-model", [])
+    assert (escalated.model, escalated.escalation_reasons) == ("strong-model", ["few_elements"])
+    assert calls == ["fast-model", "fast-model", "strong-model"]
+    stats = llm.cascade_stats.to_dict()
+    assert stats["escalation_rate"] == 0.5
+    assert stats["tiers"]["strong"]["calls"] == 1
+
+
+def test_evaluate_by_tier(tmp_path):
+    """Test that cli evaluate scores kept and escalated images separately."""
+    gt_dir, pred_dir = tmp_path / "gt", tmp_path / "pred"
+    gt_dir.mkdir()
+    pred_dir.mkdir()
+    box = {"x": 10, "y": 10, "width": 100, "height": 40, "tag": "button"}
+    for name, tier, predicted in [("kept.png", "fast", box), ("escalated.png", "strong", {**box, "x": 500})]:
+        (gt_dir / f"{name}.json").write_text(json.dumps({
+            "imageName": name, "annotations": [{**box, "id": "gt-1", "source": "user"}],
+        }))
+        (pred_dir / f"{name}.json").write_text(json.dumps({
+            "imageName": name,
+            "annotations": [{**predicted, "id": "pred-1", "source": "prediction"}],
+            "metadata": {"cascade": {"tier": tier, "escalationReasons": [] if tier == "fast" else ["few_elements"]}},
+        }))
+    output = tmp_path / "results.json"
+
+    result = CliRunner().invoke(cli, ["evaluate", str(gt_dir), str(pred_dir), "--by-tier", "--output", str(output)])
+
+    assert result.exit_code == 0, result.output
+    assert "TIER: fast (1 images)" in result.output
+    assert "Escalation rate: 1/2 (50%)" in result.output
+    per_tier = json.loads(output.read_text())["per_tier_metrics"]
+    assert per_tier["fast"]["f1_score"] == 1.0
+    assert per_tier["strong"]["f1_score"] == 0.0
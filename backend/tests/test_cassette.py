@@ -0,0 +1,92 @@
+"""Test record/replay of LLM calls."""
+
+import json
+
+import httpx
+import pytest
+from openai import NotFoundError, OpenAI, RateLimitError
+
+from src.inference.cassette import (
+    AUTO,
+    LATENCY_NONE,
+    RECORD,
+    REPLAY,
+    Cassette,
+    CassetteTransport,
+)
+
+
+def completion(content: str) -> dict:
+    return {
+        "id": "1", "object": "chat.completion", "created": 0, "model": "model-a",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    }
+
+
+def client(cassette: Cassette, handler=None) -> OpenAI:
+    provider = httpx.MockTransport(handler or (lambda request: pytest.fail("Provider called on replay")))
+    return OpenAI(
+        base_url="https://provider.test/v1", api_key="test", max_retries=0,
+        http_client=httpx.Client(transport=CassetteTransport(cassette, provider)),
+    )
+
+
+def ask(llm: OpenAI, image: str = "image-1") -> str:
+    response = llm.chat.completions.create(model="model-a", messages=[{"role": "user", "content": image}])
+    return response.choices[0].message.content
+
+
+def test_replay_serves_recorded_responses_without_the_provider(tmp_path):
+    """Test that a recorded completion is replayed for the same request and unknown requests get a 404."""
+    calls = []
+
+    def provider(request):
+        calls.append(json.loads(request.content)["messages"][0]["content"])
+        return httpx.Response(200, json=completion('{"annotations": []}'))
+
+    ask(client(Cassette(tmp_path, mode=RECORD), provider))
+    replay = client(Cassette(tmp_path, mode=REPLAY, latency=LATENCY_NONE))
+
+    assert ask(replay) == '{"annotations": []}'
+    assert calls == ["image-1"]
+    with pytest.raises(NotFoundError):
+        ask(replay, "image-2")
+
+
+def test_auto_mode_records_misses_once(tmp_path):
+    """Test that auto mode calls the provider only for requests it has not seen."""
+    calls = []
+
+    def provider(_request):
+        calls.append(1)
+        return httpx.Response(200, json=completion("ok"))
+
+    cassette = Cassette(tmp_path, mode=AUTO, latency=LATENCY_NONE)
+    llm = client(cassette, provider)
+    for _ in range(3):
+        ask(llm)
+
+    assert len(calls) == 1
+    assert (cassette.stats()["hits"], cassette.stats()["recorded"]) == (2, 1)
+
+
+def test_simulated_errors_are_repeatable_with_a_seed(tmp_path):
+    """Test that the same seed gives the same sequence of simulated provider errors."""
+    ask(client(Cassette(tmp_path, mode=RECORD), lambda request: httpx.Response(200, json=completion("ok"))))
+
+    def outcomes(seed):
+        llm = client(Cassette(tmp_path, mode=REPLAY, latency=LATENCY_NONE, error_rate=0.5, seed=seed))
+        results = []
+        for _ in range(20):
+            try:
+                results.append(ask(llm))
+            except RateLimitError as e:
+                assert e.response.headers["retry-after"] == "1"
+                results.append(429)
+            except Exception as e:
+                results.append(e.status_code)
+        return results
+
+    first = outcomes(7)
+    assert first == outcomes(7)
+    assert "ok" in first and any(result != "ok" for result in first)
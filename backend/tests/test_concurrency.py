@@ -0,0 +1,220 @@
+"""Test the adaptive (AIMD) concurrency limiter."""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from src import llm
+from src.cli.batch_predict.processor import BatchProcessor
+from src.inference import concurrency
+from src.inference.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    ConcurrencyLimitExceeded,
+    ConcurrencyPolicy,
+)
+from src.inference.ratelimit import RateLimitExceeded
+from src.inference.retry import RetryPolicy
+from src.inference.telemetry import CallRecord
+
+
+def make_limiter(initial: float = 4, **overrides) -> AdaptiveConcurrencyLimiter:
+    params = {"max_wait": 1.0, "poll_interval": 0.01}
+    params.update(overrides)
+    return AdaptiveConcurrencyLimiter(
+        backend=None,
+        policy=ConcurrencyPolicy(initial=initial, min_limit=1, max_limit=8),
+        **params,
+    )
+
+
+def test_limit_grows_while_calls_succeed():
+    """Test that steady successful calls raise the limit additively, up to the maximum."""
+    # Empty calls take microseconds, so scheduler jitter alone would look like a latency spike
+    limiter = make_limiter(initial=2, latency_tolerance=1000)
+
+    for _ in range(4):
+        with limiter.slot():
+            pass
+    assert 3 < limiter.limit < 4
+
+    for _ in range(200):
+        with limiter.slot():
+            pass
+    assert limiter.limit == 8
+
+
+def test_overload_burst_cuts_limit_once():
+    """Test that overloads from one round of requests halve the limit only once."""
+    limiter = make_limiter(initial=4)
+    in_flight = threading.Barrier(3)
+
+    def rate_limited_call():
+        with pytest.raises(RateLimitExceeded):
+            with limiter.slot():
+                in_flight.wait()
+                raise RateLimitExceeded("model", 1.0)
+
+    threads = [threading.Thread(target=rate_limited_call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.limit == 2
+    assert limiter.stats()["overloads"] == 3
+
+
+def test_other_errors_leave_limit_unchanged():
+    """Test that a bad response does not count as provider overload."""
+    limiter = make_limiter(initial=4)
+
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError("Annotations must be a list")
+
+    assert limiter.limit == 4
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_latency_spike_counts_as_overload():
+    """Test that a call far slower than the running average cuts the limit."""
+    limiter = make_limiter(initial=4, min_samples=3, latency_tolerance=3.0)
+    for _ in range(3):
+        with limiter.slot():
+            time.sleep(0.01)
+    before = limiter.limit
+
+    with limiter.slot():
+        time.sleep(0.1)
+
+    assert limiter.limit == pytest.approx(before / 2)
+    assert limiter.stats()["latency_spikes"] == 1
+
+
+def test_slot_waits_for_capacity():
+    """Test that callers beyond the limit wait, and give up after the maximum wait."""
+    limiter = make_limiter(initial=1, max_wait=0.05)
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            acquired.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    acquired.wait()
+    try:
+        with pytest.raises(ConcurrencyLimitExceeded):
+            with limiter.slot():
+                pass
+    finally:
+        release.set()
+        holder.join()
+
+    with limiter.slot():
+        pass
+
+
+class FlakyCompletions:
+    """Chat completions that answer with a 429 before succeeding."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+
+    def create(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            request = httpx.Request("POST", "https://provider.test/v1/chat/completions")
+            raise RateLimitError("Too many requests", response=httpx.Response(429, request=request), body=None)
+        message = SimpleNamespace(content='{"annotations": []}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_retried_rate_limit_cuts_limit(monkeypatch):
+    """Test that a 429 retried inside a provider call still reaches the limiter and halves the limit."""
+    limiter = make_limiter(initial=4)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FlakyCompletions(failures=1)))
+    monkeypatch.setattr(concurrency, "concurrency_limiter", limiter)
+    monkeypatch.setattr(llm.llm_clients, "get_client", lambda **kwargs: client)
+    monkeypatch.setattr(llm, "circuit_breaker", None)
+    monkeypatch.setattr(llm, "rate_limiter", SimpleNamespace(acquire=lambda *args: None, settle=lambda *args: None))
+
+    content = llm._complete(
+        messages=[], model="model-a", reserved_tokens=1, record=CallRecord(model="model-a"),
+        retry=RetryPolicy(base_delay=0.01, max_delay=0.01),
+    )
+
+    assert content == '{"annotations": []}'
+    assert limiter.stats()["overloads"] == 1 and limiter.stats()["acquired"] == 2
+    assert limiter.limit < 4
+
+
+def test_async_slot_waits_without_blocking_the_loop():
+    """Test that async slots queue on the event loop and feed the same limit."""
+    limiter = make_limiter(initial=1)
+
+    async def call(fail: bool):
+        async with limiter.slot_async():
+            await asyncio.sleep(0.02)
+            if fail:
+                raise RateLimitExceeded("model", 1.0)
+
+    async def main():
+        return await asyncio.gather(call(False), call(True), return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert results[0] is None and isinstance(results[1], RateLimitExceeded)
+    assert limiter.stats()["waited"] == 1 and limiter.stats()["overloads"] == 1
+
+
+def test_release_wakes_waiters_without_polling():
+    """Test that sync and async callers waiting for a slot get it as soon as it is released."""
+    # Pinned to one slot, so every caller after the holder has to wait
+    limiter = AdaptiveConcurrencyLimiter(
+        backend=None, policy=ConcurrencyPolicy(initial=1, min_limit=1, max_limit=1), poll_interval=30.0,
+    )
+    acquired = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            acquired.set()
+            time.sleep(0.05)
+
+    def wait_sync():
+        with limiter.slot():
+            pass
+
+    async def wait_async():
+        async with limiter.slot_async():
+            pass
+
+    for wait in (wait_sync, lambda: asyncio.run(wait_async())):
+        acquired.clear()
+        holder = threading.Thread(target=hold)
+        holder.start()
+        acquired.wait()
+        start = time.monotonic()
+        wait()
+        assert time.monotonic() - start < 1.0
+        holder.join()
+
+    assert limiter.stats()["waited"] == 2
+
+
+def test_batch_processor_leaves_process_limiter_alone(monkeypatch):
+    """Test that constructing a batch processor does not replace or disable the process-wide limiter."""
+    limiter = make_limiter()
+    monkeypatch.setattr(concurrency, "concurrency_limiter", limiter)
+
+    BatchProcessor(model_name="model-a", adaptive=False)
+    BatchProcessor(model_name="model-a", adaptive=True)
+
+    assert concurrency.concurrency_limiter is limiter
@@ -0,0 +1,82 @@
+"""Test near-duplicate screenshot reuse."""
+
+import io
+import random
+import time
+
+from PIL import Image, ImageDraw
+
+from src import llm
+from src.inference.dedup import ImageFingerprint, NearDuplicateIndex, fingerprint
+from src.schemas import AnnotationSchema, DetectionResult
+
+
+def screenshot(clock: str = "12:00", size: tuple[int, int] = (1280, 800), shade: int = 40) -> bytes:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, size[0], 60), fill=(shade, shade, 120))
+    draw.rectangle((100, 200, 600, 260), fill=(200, 200, 200))
+    draw.rectangle((700, 300, 1100, 700), fill=(90, 160, 90))
+    draw.text((size[0] - 60, 20), clock, fill="white")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+RESULT = DetectionResult(annotations=[AnnotationSchema(x=80, y=250, width=390, height=75, tag="input")], model="model-a")
+
+
+def test_near_identical_screenshots_hit_and_different_ones_miss():
+    """Test that a changed clock still matches, while another layout, model or aspect ratio does not."""
+    index = NearDuplicateIndex(max_distance=4)
+    index.add(fingerprint(screenshot("12:00")), "model-a", RESULT)
+
+    hit = index.lookup(fingerprint(screenshot("12:01")), "model-a")
+    other_layout = Image.new("RGB", (1280, 800), "black")
+    ImageDraw.Draw(other_layout).rectangle((0, 400, 640, 800), fill="white")
+    buffer = io.BytesIO()
+    other_layout.save(buffer, format="PNG")
+
+    assert hit.annotations == RESULT.annotations
+    assert hit.near_duplicate_distance <= 4
+    assert index.lookup(fingerprint(buffer.getvalue()), "model-a") is None
+    assert index.lookup(fingerprint(screenshot("12:01")), "model-b") is None
+    assert index.lookup(fingerprint(screenshot("12:01", size=(1280, 2400))), "model-a") is None
+    assert index.stats()["hit_rate"] == 0.25
+
+
+def test_lookup_finds_every_hash_within_distance_at_scale():
+    """Test that multi-index probing finds all matches a linear scan would, and stays fast with many entries."""
+    rng = random.Random(0)
+    index = NearDuplicateIndex(max_distance=6, max_entries=100000)
+    hashes = [rng.getrandbits(64) for _ in range(100000)]
+    for value in hashes:
+        index._insert(ImageFingerprint(value, 100, 100), "model-a", RESULT.model_dump_json().encode())
+
+    start_time = time.perf_counter()
+    for value in hashes[:200]:
+        near = value ^ sum(1 << bit for bit in rng.sample(range(64), 6))
+        assert index.lookup(ImageFingerprint(near, 100, 100), "model-a").near_duplicate_distance <= 6
+    elapsed = (time.perf_counter() - start_time) / 200
+
+    assert elapsed < 0.005
+
+
+def test_persisted_index_is_reused_by_detection(tmp_path, monkeypatch):
+    """Test that a near-duplicate of an image predicted in an earlier run is served without a model call."""
+    calls = []
+
+    def detect_image(**_kwargs):
+        calls.append(1)
+        return RESULT
+
+    monkeypatch.setattr(llm, "_detect_image", detect_image)
+    monkeypatch.setattr(llm, "prediction_cache", None)
+    monkeypatch.setattr(llm, "near_duplicates", NearDuplicateIndex(path=tmp_path / "index.jsonl"))
+    llm.detect_ui_elements(image_data=screenshot("12:00"), image_type="image/png", model="model-a")
+
+    monkeypatch.setattr(llm, "near_duplicates", NearDuplicateIndex(path=tmp_path / "index.jsonl"))
+    reused = llm.detect_ui_elements(image_data=screenshot("12:05"), image_type="image/png", model="model-a")
+
+    assert len(calls) == 1
+    assert reused.annotations == RESULT.annotations and reused.near_duplicate_distance is not None
@@ -0,0 +1,147 @@
+"""Test the job event WebSocket channel."""
+
+import asyncio
+import time
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from src.events import CLOSE_TRY_AGAIN, EventHub, job_event_data
+
+
+class FakeEventSource:
+    """An in-memory event stream, with history trimmed before trimmed_before."""
+
+    def __init__(self):
+        self.events = []
+        self.trimmed_before = 0
+
+    def add(self, job_id: str, status: str, batch_id: str | None = None) -> str:
+        event_id = f"{len(self.events) + 1}-0"
+        data = job_event_data(status, batch_id=batch_id)
+        self.events.append((event_id, {"job_id": job_id, "batch_id": batch_id, "data": data}))
+        return event_id
+
+    def _after(self, after_id: str):
+        position = int(after_id.split("-")[0])
+        return self.events[position:]
+
+    async def latest_id(self) -> str:
+        return self.events[-1][0] if self.events else "0-0"
+
+    async def read(self, last_id: str, block: float):
+        for _ in range(int(block / 0.01)):
+            if self._after(last_id):
+                return self._after(last_id)
+            await asyncio.sleep(0.01)
+        return []
+
+    async def history(self, after_id: str):
+        if int(after_id.split("-")[0]) < self.trimmed_before:
+            return None
+        return self._after(after_id)
+
+
+def make_client(source: FakeEventSource, snapshot_events=(), **kwargs) -> tuple[TestClient, EventHub]:
+    hub = EventHub(source, block=0.05, **kwargs)
+    app = FastAPI()
+
+    async def snapshot(job_ids, batch_ids):
+        return [event for event in snapshot_events if event["job_id"] in job_ids or event["batch_id"] in batch_ids]
+
+    @app.websocket("/ws")
+    async def job_events(websocket: WebSocket):
+        await websocket.accept()
+        await hub.serve(websocket, snapshot)
+
+    return TestClient(app), hub
+
+
+def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+def test_updates_are_pushed_to_job_and_batch_subscribers():
+    """Test that an event reaches the connections subscribed to its job or its batch, and no others."""
+    source = FakeEventSource()
+    client, hub = make_client(source)
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "subscribe", "job_ids": ["job-1"], "batch_ids": ["batch-1"]})
+        websocket.send_json({"type": "ping"})
+        assert websocket.receive_json()["type"] == "pong"
+        wait_for(lambda: hub.last_id is not None)
+
+        source.add("job-2", "processing")
+        source.add("job-1", "processing")
+        event_id = source.add("job-3", "completed", batch_id="batch-1")
+
+        first, second = websocket.receive_json(), websocket.receive_json()
+        assert (first["type"], first["job_id"], first["data"]["status"]) == ("job_update", "job-1", "processing")
+        assert (second["job_id"], second["event_id"]) == ("job-3", event_id)
+        assert hub.stats()["subscribed_batches"] == 1
+
+    wait_for(lambda: not hub.connections)
+    assert hub.stats()["subscribed_jobs"] == 0
+
+
+def test_reconnecting_client_resumes_from_last_event():
+    """Test that a subscribe with last_event_id replays the missed events instead of the snapshot."""
+    source = FakeEventSource()
+    seen = source.add("job-1", "pending")
+    source.add("job-1", "processing")
+    source.add("job-2", "processing")
+    source.add("job-1", "completed")
+    client, hub = make_client(source, snapshot_events=[{"job_id": "job-1", "batch_id": None, "data": {}}])
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "ping"})
+        websocket.receive_json()
+        wait_for(lambda: hub.last_id == "4-0")
+        websocket.send_json({"type": "subscribe", "job_ids": ["job-1"], "last_event_id": seen})
+
+        replayed = [websocket.receive_json(), websocket.receive_json()]
+        assert [(message["event_id"], message["data"]["status"]) for message in replayed] == [
+            ("2-0", "processing"), ("4-0", "completed"),
+        ]
+
+
+def test_snapshot_is_sent_when_history_is_unavailable():
+    """Test that a new client, or one whose last event was trimmed, gets the current state from the snapshot."""
+    source = FakeEventSource()
+    source.add("job-1", "processing")
+    source.trimmed_before = 5
+    current = {"job_id": "job-1", "batch_id": None, "data": job_event_data("completed")}
+    client, hub = make_client(source, snapshot_events=[current])
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "subscribe", "job_ids": ["job-1"]})
+        message = websocket.receive_json()
+        assert (message["event_id"], message["data"]["status"]) == (None, "completed")
+
+        websocket.send_json({"type": "subscribe", "job_ids": ["job-1"], "last_event_id": "1-0"})
+        assert websocket.receive_json()["data"]["status"] == "completed"
+
+
+def test_lagging_connection_is_closed_to_resume():
+    """Test that a connection whose send queue overflows is dropped and closed with try-again."""
+    source = FakeEventSource()
+    client, hub = make_client(source, queue_size=2)
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "subscribe", "job_ids": ["job-1"]})
+        websocket.send_json({"type": "ping"})
+        websocket.receive_json()
+        wait_for(lambda: hub.last_id is not None)
+        connection = next(iter(hub.connections))
+
+        # Read in one go, so they are queued before the sender can take any
+        source.events += [(f"{n}-0", {"job_id": "job-1", "batch_id": None, "data": {}}) for n in (1, 2, 3)]
+
+        message = websocket.receive()
+        assert (message["type"], message["code"]) == ("websocket.close", CLOSE_TRY_AGAIN)
+        assert connection.lagging and hub.stats()["dropped"] == 1
@@ -0,0 +1,47 @@
+"""Test header-only image validation."""
+
+import io
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from src.inference.image_info import read_image_info, validate_image
+
+
+def encode(image_format: str, size: tuple[int, int], **params) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("image_format,params", [
+    ("PNG", {}),
+    ("JPEG", {"progressive": True}),
+    ("GIF", {}),
+    ("WEBP", {"lossless": False}),
+    ("WEBP", {"lossless": True}),
+])
+def test_reads_size_from_header(image_format, params):
+    """Test that format and size match what Pillow decodes, for every supported format."""
+    info = read_image_info(encode(image_format, (321, 123), **params))
+
+    assert (info.format, info.width, info.height) == (image_format.lower(), 321, 123)
+
+
+def test_rejects_non_images_and_truncated_headers():
+    """Test that text, unsupported formats and cut-off headers are refused."""
+    for data in (b"<html></html>", encode("BMP", (10, 10)), encode("PNG", (10, 10))[:20], b"\xff\xd8\xff\xe0"):
+        with pytest.raises(ValueError):
+            read_image_info(data)
+
+
+def test_rejects_decompression_bomb_before_decoding():
+    """Test that a tiny PNG declaring a huge canvas is rejected from its header alone."""
+    header = struct.pack(">IIBBBBB", 100000, 100000, 8, 2, 0, 0, 0)
+    bomb = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + header + struct.pack(">I", zlib.crc32(b"IHDR" + header))
+
+    with pytest.raises(ValueError, match="100000x100000"):
+        validate_image(bomb, max_pixels=60_000_000, max_edge=200000)
+    assert validate_image(encode("PNG", (1280, 5000))).height == 5000
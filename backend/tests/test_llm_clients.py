@@ -0,0 +1,55 @@
+"""Test the pooled LLM client registry."""
+
+import os
+
+from src.inference.clients import LLMClientRegistry
+
+
+def test_same_key_reuses_client():
+    """Test that identical endpoints share one client."""
+    registry = LLMClientRegistry()
+
+    first = registry.get_client(base_url="http://llm.local/v1", api_key="key", model="model-a")
+    second = registry.get_client(base_url="http://llm.local/v1", api_key="key", model="model-a")
+
+    assert first is second
+    registry.close()
+
+
+def test_different_model_gets_own_client():
+    """Test that clients are keyed by model."""
+    registry = LLMClientRegistry()
+
+    first = registry.get_client(base_url="http://llm.local/v1", api_key="key", model="model-a")
+    second = registry.get_client(base_url="http://llm.local/v1", api_key="key", model="model-b")
+
+    assert first is not second
+    assert len(registry.stats()) == 2
+    registry.close()
+
+
+def test_clients_rebuilt_after_fork():
+    """Test that a forked child does not reuse the parent's clients."""
+    registry = LLMClientRegistry()
+    parent_client = registry.get_client(base_url="http://llm.local/v1", api_key="key", model="model-a")
+
+    # Simulate running in a forked child
+    registry._pid = os.getpid() + 1
+    child_client = registry.get_client(base_url="http://llm.local/v1", api_key="key", model="model-a")
+
+    assert child_client is not parent_client
+    assert parent_client in registry._inherited
+    registry.close()
+
+
+def test_stats_do_not_expose_api_key():
+    """Test that exported counters never contain credentials."""
+    registry = LLMClientRegistry()
+    registry.get_client(base_url="http://llm.local/v1", api_key="secret-key", model="model-a")
+
+    stats = registry.stats()
+
+    assert stats[0]["requests"] == 0
+    assert stats[0]["reused_connections"] == 0
+    assert "secret-key" not in str(stats)
+    registry.close()
@@ -0,0 +1,130 @@
+"""Test multi-image packed detection and the micro-batcher."""
+
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from src import llm
+from src.inference.packing import MicroBatcher, split_packed_output
+from src.inference.retry import RetryPolicy
+from src.schemas import AnnotationSchema, DetectionResult
+
+
+def make_png(width: int = 40, height: int = 80) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_split_leaves_out_missing_and_repeated_images():
+    """Test that only images with exactly one valid entry are returned."""
+    data = {"images": [
+        {"index": 0, "annotations": [{"box_2d": [0, 0, 10, 10], "tag": "button"}]},
+        {"index": 2, "annotations": []},
+        {"index": 2, "annotations": []},
+        {"index": 7, "annotations": []},
+        {"index": 3},
+    ]}
+
+    assert list(split_packed_output(data, 4)) == [0]
+    with pytest.raises(ValueError):
+        split_packed_output({"annotations": []}, 4)
+
+
+def test_parse_packed_content_splits_per_image():
+    """Test that a packed completion becomes one DetectionResult per image."""
+    content = (
+        '{"images": [{"index": 1, "annotations": [{"box_2d": [0, 0, 10, 20], "tag": "input"}]}, '
+        '{"index": 0, "annotations": []}]}'
+    )
+
+    results = llm.parse_packed_content(content, 2)
+
+    assert results[0].annotations == []
+    assert results[1].annotations[0].tag == "input"
+    assert results[1].annotations[0].width == 20
+
+
+def test_incomplete_pack_falls_back_to_single_calls(monkeypatch):
+    """Test that images missing from the packed answer are detected one by one."""
+    answered = DetectionResult(annotations=[AnnotationSchema(x=0, y=0, width=5, height=5, tag="button")])
+    single_calls = []
+
+    def packed_request(**_kwargs):
+        return {0: answered}
+
+    def single(*, image_data, **_kwargs):
+        single_calls.append(image_data)
+        if image_data == images[2][0]:
+            raise ValueError("bad output")
+        return DetectionResult(annotations=[])
+
+    monkeypatch.setattr(llm, "_request_packed_detection", packed_request)
+    monkeypatch.setattr(llm, "detect_ui_elements", single)
+    images = [(make_png(40, 80 + i), "image/png") for i in range(3)]
+
+    results = llm.detect_ui_elements_packed(images=images, use_cache=False)
+
+    assert results[0] is answered
+    assert results[1].annotations == []
+    assert isinstance(results[2], ValueError)
+    assert len(single_calls) == 2
+
+
+def test_packed_jobs_keep_their_own_retry_policies(monkeypatch):
+    """Test that the packed request runs under the tightest policy and each fallback under its image's own."""
+    packed_retries, single_retries = [], []
+
+    def packed_request(*, retry, **_kwargs):
+        packed_retries.append(retry)
+        return {0: DetectionResult(annotations=[])}
+
+    def single(*, retry, **_kwargs):
+        single_retries.append(retry)
+        return DetectionResult(annotations=[])
+
+    monkeypatch.setattr(llm, "_request_packed_detection", packed_request)
+    monkeypatch.setattr(llm, "detect_ui_elements", single)
+    policies = [RetryPolicy(deadline=2e9), RetryPolicy(deadline=1e9), RetryPolicy()]
+    images = [(make_png(40, 80 + i), "image/png") for i in range(3)]
+
+    llm.detect_ui_elements_packed(images=images, use_cache=False, retry=policies)
+
+    assert packed_retries == [policies[1]]
+    assert set(map(id, single_retries)) == {id(policies[1]), id(policies[2])}
+
+
+def test_micro_batcher_flushes_concurrent_items_together():
+    """Test that concurrent submissions share one flush and get their own results."""
+    flushed = []
+    lock = threading.Lock()
+
+    def flush(items):
+        with lock:
+            flushed.append(list(items))
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+
+    batcher = MicroBatcher(flush=flush, max_size=4, max_wait=1.0)
+
+    def submit(item):
+        try:
+            return batcher.submit(item)
+        except ValueError as e:
+            return f"error: {e}"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(submit, ["a", "b", "bad", "c"]))
+
+    assert results == ["A", "B", "error: bad", "C"]
+    assert len(flushed) == 1
+
+
+def test_micro_batcher_flushes_partial_batch_after_wait():
+    """Test that a lone item is not held longer than max_wait."""
+    batcher = MicroBatcher(flush=lambda items: [item * 2 for item in items], max_size=8, max_wait=0.05)
+
+    assert batcher.submit(21) == 42
+    assert batcher.stats()["batches"] == 1
@@ -0,0 +1,114 @@
+"""Test the content-addressed prediction cache."""
+
+import os
+import time
+
+from src.inference.cache import (
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    PredictionCache,
+)
+from src.schemas import AnnotationSchema, DetectionResult
+
+
+def make_result(tag: str = "button") -> DetectionResult:
+    return DetectionResult(annotations=[AnnotationSchema(x=10, y=20, width=30, height=40, tag=tag)])
+
+
+def make_key(image_data: bytes = b"image", **overrides) -> str:
+    params = {
+        "image_data": image_data,
+        "model": "model-a",
+        "system_prompt": "system",
+        "user_prompt": "user",
+        "temperature": 0.1,
+    }
+    params.update(overrides)
+    return PredictionCache.make_key(**params)
+
+
+def test_key_depends_on_every_input():
+    """Test that changing any request input changes the key."""
+    base = make_key()
+
+    assert make_key() == base
+    assert make_key(image_data=b"other") != base
+    assert make_key(model="model-b") != base
+    assert make_key(system_prompt="changed") != base
+    assert make_key(user_prompt="changed") != base
+    assert make_key(temperature=0.2) != base
+    assert make_key(max_edge=1024) != base
+
+
+def test_memory_backend_hit_and_miss_counters():
+    """Test round trip through the memory backend and hit/miss accounting."""
+    cache = PredictionCache(MemoryCacheBackend(max_entries=10, ttl=60))
+    key = make_key()
+
+    assert cache.get(key) is None
+    cache.set(key, make_result())
+    assert cache.get(key) == make_result()
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_memory_backend_evicts_least_recently_used():
+    """Test size-based LRU eviction."""
+    backend = MemoryCacheBackend(max_entries=2, ttl=60)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    backend.get("a")
+    backend.set("c", b"3")
+
+    assert backend.get("a") == b"1"
+    assert backend.get("b") is None
+    assert backend.get("c") == b"3"
+
+
+def test_memory_backend_expires_entries():
+    """Test TTL expiry."""
+    backend = MemoryCacheBackend(max_entries=10, ttl=0)
+    backend.set("a", b"1")
+    time.sleep(0.01)
+
+    assert backend.get("a") is None
+
+
+def test_disk_backend_round_trip_and_expiry(tmp_path):
+    """Test the disk backend persists entries and honours TTL."""
+    cache = PredictionCache(DiskCacheBackend(directory=tmp_path, max_entries=10, ttl=60))
+    key = make_key()
+    cache.set(key, make_result("input"))
+
+    # A fresh cache over the same directory sees the entry
+    reopened = PredictionCache(DiskCacheBackend(directory=tmp_path, max_entries=10, ttl=60))
+    assert reopened.get(key) == make_result("input")
+
+    # Age the file past the TTL
+    path = tmp_path / f"{key}.json"
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert reopened.get(key) is None
+    assert not path.exists()
+
+
+def test_broken_backend_counts_as_miss():
+    """Test that backend failures never surface to callers."""
+
+    class BrokenBackend:
+        blocking = False
+
+        def get(self, key):
+            raise ConnectionError("down")
+
+        def set(self, key, value):
+            raise ConnectionError("down")
+
+    cache = PredictionCache(BrokenBackend())
+    cache.set("key", make_result())
+
+    assert cache.get("key") is None
+    assert cache.stats()["errors"] == 2
@@ -0,0 +1,61 @@
+"""Test image preprocessing before the LLM call."""
+
+import io
+
+import pytest
+from PIL import Image
+
+from src.inference.preprocess import PreprocessOptions, preprocess_image
+
+
+def make_png(width: int, height: int, mode: str = "RGB") -> bytes:
+    image = Image.new(mode, (width, height), (30, 120, 200, 128) if mode == "RGBA" else (30, 120, 200))
+    # Draw some structure so the encoders have something to compress
+    for x in range(0, width, 10):
+        for y in range(0, height, 10):
+            image.putpixel((x, y), (255, 255, 255, 255) if mode == "RGBA" else (255, 255, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_resize_preserves_aspect_ratio():
+    """Test that the longest edge is capped and proportions are kept."""
+    original = make_png(4000, 2000)
+    result = preprocess_image(original, "image/png", PreprocessOptions(max_edge=1000, format="jpeg"))
+
+    assert (result.width, result.height) == (1000, 500)
+    assert result.content_type == "image/jpeg"
+    assert result.bytes_before == len(original)
+    assert result.bytes_after == len(result.data)
+    assert Image.open(io.BytesIO(result.data)).size == (1000, 500)
+
+
+def test_small_image_is_not_upscaled():
+    """Test that images under the limit keep their size."""
+    result = preprocess_image(make_png(300, 200), "image/png", PreprocessOptions(max_edge=1000, format="webp"))
+
+    assert (result.width, result.height) == (300, 200)
+
+
+def test_jpeg_output_flattens_alpha():
+    """Test that transparent images can be encoded as JPEG."""
+    result = preprocess_image(make_png(800, 600, mode="RGBA"), "image/png", PreprocessOptions(max_edge=400, format="jpeg"))
+
+    assert Image.open(io.BytesIO(result.data)).mode == "RGB"
+
+
+def test_disabled_passes_image_through():
+    """Test that disabling preprocessing sends the original bytes."""
+    original = make_png(500, 500)
+    result = preprocess_image(original, "image/png", PreprocessOptions(enabled=False))
+
+    assert result.data == original
+    assert result.content_type == "image/png"
+    assert PreprocessOptions(enabled=False).cache_params() == {}
+
+
+def test_invalid_image_raises_value_error():
+    """Test that non-image payloads are rejected."""
+    with pytest.raises(ValueError):
+        preprocess_image(b"not an image", "image/png", PreprocessOptions())
@@ -0,0 +1,137 @@
+"""Test batch progress counters and status bitmaps."""
+
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src import progress
+from src.database.core import Base
+from src.models import Batch, Job, JobStatus
+from src.progress import set_job_status, status_bitmap
+
+
+class FakeRedis:
+    """Just enough of a Redis client to hold one bitmap, with BITFIELD failing like an unreachable server."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if not (nx and key in self.values):
+            self.values[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        raise ConnectionError("Redis is down")
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(progress, "_redis", lambda: fake_redis)
+    # Job events are not under test
+    monkeypatch.setattr(progress, "publish_job_events", lambda events: None)
+    return fake_redis
+
+
+@pytest.fixture
+def sessions():
+    # One shared connection, so every session sees the same in-memory database
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def db(sessions):
+    session = sessions()
+    yield session
+    session.close()
+
+
+def make_batch(db, size: int) -> tuple[Batch, list[Job]]:
+    batch = Batch(id=uuid.uuid4(), total=size, pending=size, processing=0, completed=0, failed=0)
+    jobs = [
+        Job(id=uuid.uuid4(), batch_id=batch.id, batch_index=index, model_name="model-a", s3_key=f"uploads/{index}.png")
+        for index in range(size)
+    ]
+    db.add(batch)
+    db.add_all(jobs)
+    db.commit()
+    return batch, jobs
+
+
+def test_counters_follow_job_transitions(db):
+    """Test that counters move with each job and the batch completes when its last job finishes."""
+    batch, jobs = make_batch(db, 3)
+
+    for job in jobs:
+        set_job_status(db, job, JobStatus.PROCESSING)
+    set_job_status(db, jobs[0], JobStatus.COMPLETED)
+    set_job_status(db, jobs[1], JobStatus.FAILED)
+    db.commit()
+    db.refresh(batch)
+    assert (batch.pending, batch.processing, batch.completed, batch.failed) == (0, 1, 1, 1)
+    assert batch.completed_at is None
+
+    set_job_status(db, jobs[2], JobStatus.COMPLETED)
+    db.commit()
+    db.refresh(batch)
+    assert (batch.processing, batch.completed) == (0, 2)
+    assert batch.completed_at is not None
+
+
+def test_raced_transition_is_counted_once(db, sessions):
+    """Test that a job moved by another worker since it was read does not move the counters again."""
+    batch, jobs = make_batch(db, 1)
+    other = sessions()
+    stale = other.get(Job, jobs[0].id)
+
+    assert set_job_status(db, jobs[0], JobStatus.PROCESSING)
+    db.commit()
+    assert not set_job_status(other, stale, JobStatus.PROCESSING)
+    other.commit()
+
+    db.refresh(batch)
+    assert (batch.pending, batch.processing) == (0, 1)
+    other.close()
+
+
+def test_bitmap_is_rebuilt_from_jobs(db):
+    """Test that a bitmap missing from Redis is rebuilt with two bits per job in upload order."""
+    batch, jobs = make_batch(db, 5)
+    set_job_status(db, jobs[1], JobStatus.PROCESSING)
+    set_job_status(db, jobs[2], JobStatus.PROCESSING)
+    set_job_status(db, jobs[2], JobStatus.COMPLETED)
+    set_job_status(db, jobs[4], JobStatus.FAILED)
+    db.commit()
+
+    bitmap = status_bitmap(db, batch)
+
+    assert len(bitmap) == 2
+    # 00 01 10 00 | 11 000000
+    assert bitmap == bytes([0b00011000, 0b11000000])
+
+
+def test_rolled_back_move_leaves_bitmap_alone(db, fake_redis):
+    """Test that the bitmap only hears of a move once it is committed."""
+    batch, jobs = make_batch(db, 2)
+    fake_redis.values[progress.bitmap_key(batch.id)] = b"\x40"
+
+    set_job_status(db, jobs[0], JobStatus.PROCESSING)
+    db.rollback()
+    assert fake_redis.values[progress.bitmap_key(batch.id)] == b"\x40"
+
+    set_job_status(db, jobs[1], JobStatus.PROCESSING)
+    db.commit()
+    # Writing it failed, so it is dropped to be rebuilt
+    assert progress.bitmap_key(batch.id) not in fake_redis.values
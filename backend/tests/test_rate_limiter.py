@@ -0,0 +1,80 @@
+"""Test the LLM provider rate limiter."""
+
+import asyncio
+
+import pytest
+
+from src.inference.ratelimit import (
+    LLMRateLimiter,
+    RateLimit,
+    RateLimitExceeded,
+    estimate_tokens,
+)
+
+
+def make_limiter(backend=None, **limit) -> LLMRateLimiter:
+    return LLMRateLimiter(backend=backend, default_limit=RateLimit(**limit), max_wait=1.0)
+
+
+def test_unlimited_never_waits():
+    """Test that a zero limit disables limiting."""
+    limiter = make_limiter()
+
+    for _ in range(100):
+        assert limiter.acquire("model", tokens=10_000) == 0.0
+    assert limiter.stats()["models"] == {}
+
+
+def test_waits_for_request_refill():
+    """Test that requests beyond the burst wait for the bucket to refill."""
+    # 600 rpm refills one request every 0.1s
+    limiter = make_limiter(requests_per_minute=600)
+    limiter.fallback.take("model", limiter.limit_for("model"), 0)
+    limiter.fallback._buckets["model"][0] = 0
+
+    waited = limiter.acquire("model", tokens=0)
+
+    assert 0.05 < waited < 0.5
+    assert limiter.stats()["models"]["model"]["waited"] == 1
+
+
+def test_rejects_when_wait_exceeds_maximum():
+    """Test that a wait longer than max_wait raises instead of sleeping."""
+    limiter = make_limiter(tokens_per_minute=1000)
+    limiter.acquire("model", tokens=1000)
+
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire("model", tokens=1000)
+    assert error.value.retry_after > 1.0
+    assert limiter.stats()["models"]["model"]["rejected"] == 1
+
+
+def test_settle_refunds_unused_tokens():
+    """Test that over-reserved tokens are returned to the bucket."""
+    limiter = make_limiter(tokens_per_minute=1000)
+    limiter.acquire("model", tokens=900)
+    limiter.settle("model", reserved=900, used=100)
+
+    assert limiter.acquire("model", tokens=800) == 0.0
+
+
+def test_broken_backend_falls_back_to_local():
+    """Test that shared backend failures use local buckets."""
+
+    class BrokenBackend:
+        def take(self, key, limit, tokens):
+            raise ConnectionError("down")
+
+        def adjust(self, key, tokens):
+            raise ConnectionError("down")
+
+    limiter = make_limiter(backend=BrokenBackend(), requests_per_minute=60)
+
+    assert asyncio.run(limiter.acquire_async("model", tokens=0)) == 0.0
+    assert limiter.stats()["models"]["model"]["fallbacks"] == 1
+
+
+def test_token_estimate_grows_with_image_size():
+    """Test that larger images reserve more tokens."""
+    assert estimate_tokens(512, 512, 0) < estimate_tokens(1920, 941, 0)
+    assert estimate_tokens(512, 512, 400) > estimate_tokens(512, 512, 0)
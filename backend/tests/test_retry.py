@@ -0,0 +1,121 @@
+"""Test the end-to-end retry policy."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from openai import BadRequestError, RateLimitError
+
+from src import llm
+from src.inference.retry import RetryPolicy
+from src.inference.telemetry import CallRecord, LLMTelemetry
+from src.settings import config
+
+REQUEST = httpx.Request("POST", "https://provider.test/v1/chat/completions")
+
+
+def rate_limited(retry_after: str | None = None) -> RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return RateLimitError("Too many requests", response=httpx.Response(429, headers=headers, request=REQUEST), body=None)
+
+
+def test_delay_honors_retry_after():
+    """Test that a retry never comes sooner than the provider's Retry-After."""
+    policy = RetryPolicy(base_delay=0.5, max_delay=1.0)
+
+    delay = policy.next_delay(rate_limited("7"))
+
+    assert 7 <= delay <= 7.5
+    assert policy.history[0]["reason"] == "rate_limited"
+
+
+def test_budget_is_shared_and_only_spent_on_retryable_errors():
+    """Test that retries stop once the budget is spent, and that bad requests never use it."""
+    policy = RetryPolicy(max_retries=2, base_delay=0.01)
+    bad_request = BadRequestError("Invalid image", response=httpx.Response(400, request=REQUEST), body=None)
+
+    assert policy.next_delay(bad_request) is None
+    assert policy.next_delay(rate_limited()) is not None
+    assert policy.next_delay(rate_limited()) is not None
+    assert policy.next_delay(rate_limited()) is None
+    assert policy.reasons() == ["rate_limited", "rate_limited"]
+
+
+def test_long_delays_are_left_to_the_caller():
+    """Test that an inline retry declines a long wait without spending budget."""
+    policy = RetryPolicy(max_retries=1, max_inline_delay=5)
+
+    assert policy.next_delay(rate_limited("30"), inline=True) is None
+    assert policy.retries == 0
+    assert policy.next_delay(rate_limited("30")) >= 30
+
+
+def test_state_survives_celery_round_trip():
+    """Test that retries and the deadline carry over through to_dict, and that the deadline stops retries."""
+    policy = RetryPolicy(max_retries=5, base_delay=0.01, deadline=time.time() + 0.5)
+    policy.next_delay(rate_limited())
+
+    restored = RetryPolicy.from_dict(json.loads(json.dumps(policy.to_dict())))
+
+    assert restored.retries == 1 and restored.reasons() == ["rate_limited"]
+    assert restored.next_delay(rate_limited("1")) is None
+
+
+class ListSink:
+    def __init__(self):
+        self.records: list[CallRecord] = []
+
+    def emit(self, record: CallRecord) -> None:
+        self.records.append(record)
+
+
+class FlakyCompletionHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        type(self).requests += 1
+        if type(self).requests == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({
+            "id": "1", "object": "chat.completion", "created": 0, "model": "model-a",
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": '{"annotations": []}'},
+            }],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_request_retries_once_per_policy_not_per_layer(monkeypatch):
+    """Test that a 429 costs one retry from the policy and no hidden SDK retries."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sink = ListSink()
+    monkeypatch.setattr(config, "openrouter_base_url", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(llm, "telemetry", LLMTelemetry([sink]))
+    policy = RetryPolicy(base_delay=0.01)
+
+    try:
+        llm._request_detection(
+            image_data=b"\x89PNG" * 10, image_type="image/png", image_size=(10, 10), model="model-a", retry=policy,
+        )
+    finally:
+        server.shutdown()
+
+    assert FlakyCompletionHandler.requests == 2
+    assert sink.records[0].retry_reasons == ["rate_limited"]
+    assert policy.retries == 1
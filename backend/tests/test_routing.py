@@ -0,0 +1,170 @@
+"""Test hedged multi-model routing."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from openai import BadRequestError, InternalServerError
+
+from src.inference.routing import ModelRouter
+
+REQUEST = httpx.Request("POST", "https://provider.test/v1/chat/completions")
+
+
+def server_error() -> InternalServerError:
+    return InternalServerError("Bad gateway", response=httpx.Response(502, request=REQUEST), body=None)
+
+
+def bad_request() -> BadRequestError:
+    return BadRequestError("Bad request", response=httpx.Response(400, request=REQUEST), body=None)
+
+
+def make_router(**overrides) -> ModelRouter:
+    params = {"default_delay": 0.05, "min_delay": 0.01, "min_samples": 5}
+    params.update(overrides)
+    return ModelRouter(**params)
+
+
+def test_fast_primary_is_not_hedged():
+    """Test that a primary answering within the hedge delay is used alone."""
+    router = make_router()
+    calls = []
+
+    result, model = router.route(["primary", "backup"], lambda model: calls.append(model) or model)
+
+    assert (result, model) == ("primary", "primary")
+    assert calls == ["primary"]
+    assert router.stats()["hedges"] == 0
+
+
+def test_slow_primary_is_hedged():
+    """Test that the backup wins when the primary exceeds the hedge delay."""
+    router = make_router()
+
+    def call(model):
+        time.sleep(1.0 if model == "primary" else 0.01)
+        return model
+
+    start = time.monotonic()
+    result, model = router.route(["primary", "backup"], call)
+
+    assert model == "backup"
+    assert time.monotonic() - start < 0.5
+    assert router.stats()["models"]["backup"]["hedge_wins"] == 1
+
+
+def test_failure_moves_to_next_model_immediately():
+    """Test that a provider error starts the next model without waiting for the hedge delay or using the budget."""
+    router = make_router(default_delay=10.0, max_hedge_ratio=0.0)
+
+    def call(model):
+        if model == "primary":
+            raise server_error()
+        return model
+
+    start = time.monotonic()
+    _result, model = router.route(["primary", "backup"], call)
+
+    assert model == "backup"
+    assert time.monotonic() - start < 1.0
+    assert router.stats()["models"]["primary"]["errors"] == 1
+    assert router.stats()["hedges"] == 0
+
+
+@pytest.mark.parametrize("hedging", [True, False])
+def test_bad_request_is_not_sent_again(hedging):
+    """Test that a single-model route making a bad request calls the model once, hedged or not."""
+    router = make_router(hedging=hedging)
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        raise bad_request()
+
+    async def call_async(model):
+        calls.append(model)
+        raise bad_request()
+
+    with pytest.raises(BadRequestError):
+        router.route(["primary"], call)
+    with pytest.raises(BadRequestError):
+        asyncio.run(router.route_async(["primary"], call_async))
+    assert calls == ["primary", "primary"]
+
+
+def test_failed_single_model_is_left_to_the_retry_policy():
+    """Test that a provider error on a single-model route is raised instead of calling the same model again."""
+    router = make_router()
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        raise server_error()
+
+    with pytest.raises(InternalServerError):
+        router.route(["primary"], call)
+    assert calls == ["primary"]
+
+
+def test_all_failures_raise_last_error():
+    """Test that the route fails only when every attempt failed."""
+    router = make_router()
+
+    def call(_model):
+        raise server_error()
+
+    with pytest.raises(InternalServerError):
+        router.route(["primary", "backup"], call)
+
+
+def test_fallbacks_are_tried_in_turn_without_hedging():
+    """Test that with hedging disabled a slow model is waited on, and a failing one falls back to the next."""
+    router = make_router(hedging=False)
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        if model == "primary":
+            time.sleep(0.1)
+            raise server_error()
+        return model
+
+    result, model = router.route(["primary", "backup", "last"], call)
+
+    assert (result, calls) == ("backup", ["primary", "backup"])
+    assert asyncio.run(router.route_async(["only"], lambda model: asyncio.sleep(0, model))) == ("only", "only")
+
+
+def test_async_loser_is_cancelled():
+    """Test that the slower async attempt is cancelled once a winner returns."""
+    router = make_router()
+    cancelled = []
+
+    async def call(model):
+        try:
+            await asyncio.sleep(1.0 if model == "primary" else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return model
+
+    _result, model = asyncio.run(router.route_async(["primary", "backup"], call))
+
+    assert model == "backup"
+    assert cancelled == ["primary"]
+
+
+def test_hedge_delay_tracks_percentile():
+    """Test that the hedge delay follows observed latency once enough samples exist."""
+    router = make_router(hedging=False, default_delay=5.0, percentile=0.95, min_samples=20)
+    latencies = iter([0.01] * 19 + [0.05] * 10)
+
+    def call(_model):
+        time.sleep(next(latencies))
+
+    assert router.hedge_delay("primary") == 5.0
+    for _ in range(29):
+        router.route(["primary"], call)
+
+    assert 0.04 < router.hedge_delay("primary") < 0.1
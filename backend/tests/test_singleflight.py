@@ -0,0 +1,128 @@
+"""Test single-flight coalescing of identical in-flight predictions."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.inference.singleflight import SingleFlight
+
+
+def make_single_flight() -> SingleFlight[str]:
+    return SingleFlight(encode=str.encode, decode=bytes.decode)
+
+
+def test_threads_share_one_call():
+    """Test that concurrent identical calls from threads run once."""
+    flight = make_single_flight()
+    calls = []
+    started = threading.Event()
+
+    def fn():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flight.do, "key", fn)
+        started.wait()
+        followers = [executor.submit(flight.do, "key", fn) for _ in range(4)]
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 4
+
+
+def test_tasks_share_one_call():
+    """Test that concurrent identical calls from asyncio tasks run once."""
+    flight = make_single_flight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", fn) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_different_keys_are_not_coalesced():
+    """Test that only identical keys share a call."""
+    flight = make_single_flight()
+
+    async def run():
+        async def fn(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.ado("a", lambda: fn("a")), flight.ado("b", lambda: fn("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert flight.stats()["leaders"] == 2
+
+
+def test_followers_receive_leader_error():
+    """Test that a failed call fails its concurrent duplicates too."""
+    flight = make_single_flight()
+
+    async def fn():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad image")
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", fn) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_follower_takes_over_when_leader_cancelled():
+    """Test that cancelling the leader's caller does not fail the followers."""
+    flight = make_single_flight()
+
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        leader = asyncio.create_task(flight.ado("key", fn))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.ado("key", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "result"
+    assert flight.stats()["leaders"] == 2
+
+
+def test_thread_follower_takes_over_when_async_leader_cancelled():
+    """Test that a thread waiting on a cancelled async leader runs the call itself instead of failing."""
+    flight = make_single_flight()
+
+    async def fn():
+        await asyncio.sleep(1.0)
+        return "async result"
+
+    async def run():
+        leader = asyncio.create_task(flight.ado("key", fn))
+        await asyncio.sleep(0.01)
+        follower = asyncio.get_running_loop().run_in_executor(None, flight.do, "key", lambda: "thread result")
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "thread result"
+    assert flight.stats()["leaders"] == 2
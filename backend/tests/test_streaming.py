@@ -0,0 +1,43 @@
+"""Test the incremental annotations parser used for streamed predictions."""
+
+import json
+
+from src.inference.streaming import AnnotationStreamParser
+
+DOCUMENT = json.dumps({
+    "notes": ["{not an item}"],
+    "annotations": [
+        {"box_2d": [100, 200, 150, 300], "tag": "button", "label": "Save {draft}"},
+        {"box_2d": [400, 10, 450, 90], "tag": "input", "label": "say \"hi\""},
+    ],
+})
+
+
+def test_items_emitted_as_soon_as_complete():
+    """Test that each item is returned by the chunk that closes it."""
+    parser = AnnotationStreamParser()
+    first_end = DOCUMENT.index('"}') + 2
+
+    assert parser.feed(DOCUMENT[:first_end - 1]) == []
+    first = parser.feed(DOCUMENT[first_end - 1:first_end])
+    assert [item["tag"] for item in first] == ["button"]
+
+    rest = parser.feed(DOCUMENT[first_end:])
+    assert [item["tag"] for item in rest] == ["input"]
+
+
+def test_character_by_character_feed():
+    """Test that arbitrary chunk boundaries, braces and escapes inside strings are handled."""
+    parser = AnnotationStreamParser()
+    items = [item for char in DOCUMENT for item in parser.feed(char)]
+
+    assert [item["label"] for item in items] == ["Save {draft}", 'say "hi"']
+    assert parser.text == DOCUMENT
+
+
+def test_trailing_content_ignored():
+    """Test that nothing after the annotations array is parsed as an item."""
+    parser = AnnotationStreamParser()
+    items = parser.feed('{"annotations": [{"box_2d": [1, 2, 3, 4], "tag": "radio"}], "extra": [{"tag": "x"}]}')
+
+    assert [item["tag"] for item in items] == ["radio"]
@@ -0,0 +1,108 @@
+"""Test per-call LLM telemetry records and sinks."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import llm
+from src.inference.telemetry import CallRecord, JsonlSink, LLMTelemetry, current_call
+from src.settings import config
+
+
+class ListSink:
+    def __init__(self):
+        self.records: list[CallRecord] = []
+
+    def emit(self, record: CallRecord) -> None:
+        self.records.append(record)
+
+
+def test_record_call_emits_on_success_and_failure():
+    """Test that every call is emitted with its duration and outcome."""
+    sink = ListSink()
+    telemetry = LLMTelemetry([sink])
+
+    with telemetry.record_call("model-a") as record:
+        assert current_call() is record
+    with pytest.raises(ValueError):
+        with telemetry.record_call("model-a"):
+            raise ValueError("bad output")
+
+    assert current_call() is None
+    assert [record.status for record in sink.records] == ["ok", "error"]
+    assert all(record.total_time is not None for record in sink.records)
+    assert telemetry.stats()["errors"] == 1
+
+
+def test_jsonl_sink_appends_records(tmp_path):
+    """Test that the JSONL sink writes one record per line."""
+    path = tmp_path / "calls.jsonl"
+    sink = JsonlSink(path)
+
+    sink.emit(CallRecord(model="model-a", prompt_tokens=100))
+    sink.emit(CallRecord(model="model-b", retries=2))
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["model"] for line in lines] == ["model-a", "model-b"]
+    assert lines[1]["retries"] == 2
+    assert "_request_started" not in lines[0]
+
+
+def test_parse_records_repair_and_dropped_annotations():
+    """Test that parsing flags repaired JSON and drops invalid annotations instead of failing."""
+    telemetry = LLMTelemetry([])
+
+    with telemetry.record_call("model-a") as valid:
+        llm.parse_detection_content('{"annotations": [{"box_2d": [0, 0, 10, 10], "tag": "button"}]}')
+    with telemetry.record_call("model-a") as broken:
+        result = llm.parse_detection_content(
+            '{"annotations": [{"box_2d": [0, 0, 10, 10], "tag": "button"}, {"box_2d": "oops"}, '
+        )
+
+    assert not valid.json_repaired
+    assert broken.json_repaired
+    assert len(result.annotations) == 1
+    assert broken.dropped_annotations == 1
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({
+            "id": "1", "object": "chat.completion", "created": 0, "model": "model-a",
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": '{"annotations": []}'},
+            }],
+            "usage": {"prompt_tokens": 800, "completion_tokens": 12, "total_tokens": 812},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_request_records_payload_ttfb_and_usage(monkeypatch):
+    """Test that a real HTTP call fills in request bytes, time to first byte and token usage."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sink = ListSink()
+    monkeypatch.setattr(config, "openrouter_base_url", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(llm, "telemetry", LLMTelemetry([sink]))
+
+    try:
+        llm._request_detection(image_data=b"\x89PNG" * 100, image_type="image/png", image_size=(10, 10), model="model-a")
+    finally:
+        server.shutdown()
+
+    record = sink.records[0]
+    assert record.request_bytes > 400
+    assert 0 < record.ttfb <= record.total_time
+    assert (record.prompt_tokens, record.completion_tokens) == (800, 12)
+    assert record.encode_time is not None and record.retries == 0
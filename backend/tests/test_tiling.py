@@ -0,0 +1,98 @@
+"""Test tiled inference for tall screenshots."""
+
+import io
+from itertools import pairwise
+
+from PIL import Image
+
+from src.inference.tiling import (
+    TileBox,
+    TilingOptions,
+    crop_tiles,
+    map_to_image,
+    merge_tile_annotations,
+    plan_tiles,
+)
+from src.schemas import AnnotationSchema
+
+
+def test_short_image_is_a_single_tile():
+    """Test that images that fit in one tile are not split."""
+    assert plan_tiles(1920, 941, TilingOptions()) == [TileBox(0, 0, 1920, 941)]
+
+
+def test_tiles_cover_tall_image_with_overlap():
+    """Test that tiles cover every row and consecutive tiles overlap."""
+    options = TilingOptions(tile_height=1000, overlap=0.2)
+    tiles = plan_tiles(1280, 5300, options)
+
+    assert tiles[0].top == 0
+    assert tiles[-1].top + tiles[-1].height == 5300
+    for previous, current in pairwise(tiles):
+        assert current.top + 200 <= previous.top + previous.height
+
+
+def test_crop_tiles_matches_plan():
+    """Test that crops have the planned tile size."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 900), "white").save(buffer, format="PNG")
+    tiles = plan_tiles(300, 900, TilingOptions(tile_height=400, overlap=0.1))
+
+    crops = crop_tiles(buffer.getvalue(), tiles)
+
+    assert [Image.open(io.BytesIO(crop)).size for crop in crops] == [(300, 400)] * len(tiles)
+
+
+def test_map_to_image_rescales_coordinates():
+    """Test conversion from tile-local to full-image normalized coordinates."""
+    tile = TileBox(0, 1000, 1000, 1000)
+    annotation = AnnotationSchema(x=100, y=500, width=200, height=100, tag="button")
+
+    mapped = map_to_image(annotation, tile, image_width=1000, image_height=4000)
+
+    assert (mapped.x, mapped.y, mapped.width, mapped.height) == (100, 375, 200, 25)
+
+
+def test_merge_drops_duplicates_from_overlap():
+    """Test that an element seen by two tiles is reported once, keeping the complete box."""
+    options = TilingOptions(tile_height=1000, overlap=0.2)
+    top_tile = TileBox(0, 0, 1000, 1000)
+    bottom_tile = TileBox(0, 800, 1000, 1000)
+
+    # Element at rows 850-950: complete in both tiles
+    top_copy = AnnotationSchema(x=100, y=850, width=300, height=100, tag="button")
+    bottom_copy = AnnotationSchema(x=102, y=50, width=298, height=100, tag="button")
+    # Element at rows 950-1050: cut off by the bottom edge of the first tile
+    cut_off = AnnotationSchema(x=500, y=950, width=200, height=50, tag="input")
+    complete = AnnotationSchema(x=500, y=150, width=200, height=100, tag="input")
+
+    merged = merge_tile_annotations(
+        [(top_tile, [top_copy, cut_off]), (bottom_tile, [bottom_copy, complete])],
+        image_width=1000,
+        image_height=1800,
+        options=options,
+    )
+
+    assert [annotation.tag for annotation in merged] == ["button", "input"]
+    assert merged[1].height == complete.height * 1000 / 1800
+
+
+def test_region_prediction_sends_only_the_crop(monkeypatch):
+    """Test that a region re-prediction sends the cropped pixels and returns boxes in full-image coordinates."""
+    from src import llm
+
+    sent = []
+
+    def detect(*, image_data, **_kwargs):
+        sent.append(Image.open(io.BytesIO(image_data)).size)
+        return llm.DetectionResult(annotations=[AnnotationSchema(x=0, y=0, width=500, height=500, tag="button")])
+
+    monkeypatch.setattr(llm, "detect_ui_elements", detect)
+    buffer = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "white").save(buffer, format="PNG")
+
+    result = llm.detect_region(image_data=buffer.getvalue(), region=(500, 200, 250, 400))
+
+    assert sent == [(500, 400)]
+    box = result.annotations[0]
+    assert (box.x, box.y, box.width, box.height) == (500, 200, 125, 200)
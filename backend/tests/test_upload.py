@@ -0,0 +1,183 @@
+"""Test streaming and direct uploads to S3."""
+
+import asyncio
+import io
+
+import pytest
+from botocore.exceptions import ClientError
+from PIL import Image
+
+from src.storage.upload import (
+    RejectedImage,
+    StreamingUpload,
+    UploadTooLarge,
+    inspect_uploaded_image,
+    receive_image_upload,
+    receive_image_uploads,
+)
+
+BOUNDARY = "test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+class FakeS3:
+    """Records the S3 calls of an upload."""
+
+    def __init__(self):
+        self.calls = []
+        self.parts = []
+
+    def put_object(self, **kwargs):
+        self.calls.append("put_object")
+        self.parts.append(kwargs["Body"])
+
+    def create_multipart_upload(self, **kwargs):
+        self.calls.append("create_multipart_upload")
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, **kwargs):
+        self.calls.append("upload_part")
+        self.parts.append(kwargs["Body"])
+        return {"ETag": f"etag-{kwargs['PartNumber']}"}
+
+    def complete_multipart_upload(self, **kwargs):
+        self.calls.append("complete_multipart_upload")
+
+    def abort_multipart_upload(self, **kwargs):
+        self.calls.append("abort_multipart_upload")
+
+    def head_object(self, **kwargs):
+        self.calls.append("head_object")
+        if not self.parts:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ContentLength": len(b"".join(self.parts))}
+
+    def get_object(self, **kwargs):
+        self.calls.append("get_object")
+        end = int(kwargs["Range"].split("-")[1])
+        return {"Body": io.BytesIO(b"".join(self.parts)[:end + 1])}
+
+
+def make_png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    # Noise does not compress, so the file size follows the pixel count
+    Image.effect_noise((width, height), 64).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def form(data: bytes, content_type: str = "image/png") -> bytes:
+    return form_files([("shot.png", data, content_type)])
+
+
+def form_files(files: list[tuple[str, bytes, str]]) -> bytes:
+    body = b""
+    for filename, data, content_type in files:
+        body += (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def chunks(body: bytes, size: int = 8192):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def receive(s3: FakeS3, body: bytes, max_size: int = 10 * 1024 * 1024, part_size: int = 64 * 1024, **kwargs):
+    def start_upload(content_type, _filename):
+        return StreamingUpload(s3, "bucket", "uploads/key.png", content_type, {}, part_size=part_size)
+
+    return asyncio.run(receive_image_upload(
+        chunks(body), CONTENT_TYPE, kwargs.pop("content_length", len(body)), start_upload, max_size, **kwargs,
+    ))
+
+
+def test_large_image_is_uploaded_in_parts():
+    """Test that an image larger than a part goes up as a multipart upload whose parts add up to the file."""
+    s3 = FakeS3()
+    image = make_png(400, 400)
+
+    upload = receive(s3, form(image))
+
+    assert s3.calls[0] == "create_multipart_upload" and s3.calls[-1] == "complete_multipart_upload"
+    assert all(len(part) == 64 * 1024 for part in s3.parts[:-1])
+    assert b"".join(s3.parts) == image
+    assert (upload.size, upload.filename, upload.image.width) == (len(image), "shot.png", 400)
+
+
+def test_small_image_is_put_in_one_request():
+    """Test that an image that fits in one part is stored with a single put_object."""
+    s3 = FakeS3()
+    image = make_png(20, 20)
+
+    upload = receive(s3, form(image))
+
+    assert s3.calls == ["put_object"]
+    assert s3.parts == [image] and upload.content_type == "image/png"
+
+
+def test_oversized_upload_is_aborted():
+    """Test that an upload passing the limit is refused, early from Content-Length, and its parts dropped."""
+    s3 = FakeS3()
+    body = form(make_png(400, 400))
+
+    with pytest.raises(UploadTooLarge):
+        receive(s3, body, max_size=100 * 1024, content_length=None)
+    assert s3.calls[0] == "create_multipart_upload" and s3.calls[-1] == "abort_multipart_upload"
+
+    untouched = FakeS3()
+    with pytest.raises(UploadTooLarge):
+        receive(untouched, body, max_size=100, content_length=10 * 1024 * 1024)
+    assert untouched.calls == []
+
+
+def test_invalid_image_is_never_stored():
+    """Test that a file with an image content type but no image header is refused before any S3 call."""
+    s3 = FakeS3()
+
+    with pytest.raises(ValueError, match="not a supported image"):
+        receive(s3, form(b"<html></html>" * 100))
+    with pytest.raises(ValueError, match="must be an image"):
+        receive(s3, form(make_png(20, 20), content_type="text/plain"))
+    assert s3.calls == []
+
+
+def test_batch_upload_rejects_files_individually():
+    """Test that a multi-file form stores every valid image and reports the others without failing the batch."""
+    s3 = FakeS3()
+    keys = iter(range(10))
+
+    def start_upload(content_type, _filename):
+        return StreamingUpload(s3, "bucket", f"uploads/{next(keys)}.png", content_type, {}, part_size=64 * 1024)
+
+    body = form_files([
+        ("a.png", make_png(20, 20), "image/png"),
+        ("notes.txt", b"hello", "text/plain"),
+        ("big.png", make_png(400, 400), "image/png"),
+        ("b.png", make_png(30, 30), "image/png"),
+    ])
+    results = asyncio.run(receive_image_uploads(
+        chunks(body), CONTENT_TYPE, len(body), start_upload, max_size=100 * 1024, max_files=10, concurrency=2,
+    ))
+
+    assert [result.filename for result in results] == ["a.png", "notes.txt", "big.png", "b.png"]
+    assert isinstance(results[1], RejectedImage) and isinstance(results[2].error, UploadTooLarge)
+    assert [results[0].s3_key, results[3].s3_key] == ["uploads/0.png", "uploads/2.png"]
+    assert s3.calls.count("put_object") == 2
+    assert "abort_multipart_upload" in s3.calls
+
+
+def test_direct_upload_is_inspected_from_its_header():
+    """Test that a presigned upload is checked from its size and first bytes, and missing or oversized ones refused."""
+    s3 = FakeS3()
+    with pytest.raises(FileNotFoundError):
+        inspect_uploaded_image(s3, "bucket", "uploads/key.png", max_size=1024 * 1024)
+
+    s3.put_object(Body=make_png(400, 300))
+    size, image = inspect_uploaded_image(s3, "bucket", "uploads/key.png", max_size=1024 * 1024)
+
+    assert (size, image.width, image.height) == (len(s3.parts[0]), 400, 300)
+    with pytest.raises(UploadTooLarge):
+        inspect_uploaded_image(s3, "bucket", "uploads/key.png", max_size=1024)
@@ -1,9 +1,14 @@
 import type { 
+  BatchStatusResponse,
+  BatchUploadResponse,
   HealthResponse, 
+  PredictionRegion,
   PredictionResponse,
   JobResponse,
   JobStatusResponse,
-  JobResultResponse 
+  JobResultResponse,
+  PresignedUpload,
+  PresignResponse
 } from './types';
 import { ApiError } from './types';
 
@@ -99,6 +104,25 @@ class ApiClient {
     });
   }
 
+  // Re-predict UI elements in one region of an image, boxes come back in full-image coordinates
+  async predictRegion(
+    imageFile: File,
+    region: PredictionRegion
+  ): Promise<PredictionResponse> {
+    const formData = new FormData();
+    formData.append('file', imageFile);
+    formData.append('x', String(region.x));
+    formData.append('y', String(region.y));
+    formData.append('width', String(region.width));
+    formData.append('height', String(region.height));
+
+    return this.request('/api/v1/predict/region', {
+      method: 'POST',
+      body: formData,
+      headers: {},
+    });
+  }
+
   // Upload image for async processing
   async uploadImageForProcessing(
     imageFile: File
@@ -113,6 +137,63 @@ class ApiClient {
     });
   }
 
+  // Upload many images for async processing in one request, one job per image
+  async uploadImagesForProcessing(
+    imageFiles: File[]
+  ): Promise<BatchUploadResponse> {
+    const formData = new FormData();
+    imageFiles.forEach((file) => formData.append('file', file));
+
+    return this.request('/api/v1/upload/batch', {
+      method: 'POST',
+      body: formData,
+      headers: {},
+    });
+  }
+
+  // Create direct-to-S3 upload URLs, one pending job per file
+  async presignUploads(imageFiles: File[]): Promise<PresignResponse> {
+    return this.request('/api/v1/upload/presign', {
+      method: 'POST',
+      body: JSON.stringify({
+        files: imageFiles.map((file) => ({
+          filename: file.name,
+          content_type: file.type,
+          size: file.size,
+        })),
+      }),
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }
+
+  // Upload a file straight to S3 with a presigned POST, then queue its job
+  async uploadToPresignedUrl(
+    imageFile: File,
+    upload: PresignedUpload
+  ): Promise<JobResponse> {
+    const formData = new FormData();
+    Object.entries(upload.fields).forEach(([name, value]) => formData.append(name, value));
+    // S3 ignores fields after the file
+    formData.append('file', imageFile);
+
+    const response = await fetch(upload.url, { method: 'POST', body: formData });
+    if (!response.ok) {
+      throw new ApiError(`Upload to storage failed: ${response.status}`, response.status, response.statusText);
+    }
+
+    return this.confirmUpload(upload.task_id);
+  }
+
+  // Queue a job whose image was uploaded directly to S3
+  async confirmUpload(jobId: string): Promise<JobResponse> {
+    return this.request(`/api/v1/upload/${jobId}/confirm`, { method: 'POST' });
+  }
+
+  // Check the progress of a whole batch in one request
+  async getBatchStatus(batchId: string): Promise<BatchStatusResponse> {
+    return this.request(`/api/v1/batches/${batchId}`);
+  }
+
   // Check job status
   async checkJobStatus(jobId: string): Promise<JobStatusResponse> {
     return this.request(`/api/v1/status/${jobId}`);
@@ -1,11 +1,12 @@
 import { useMutation, useQuery } from '@tanstack/react-query';
 import { apiClient } from './client';
-import type { PredictionResponse } from './types';
+import type { BatchStatusResponse, PredictionRegion, PredictionResponse } from './types';
 
 // Query Keys
 export const apiKeys = {
   all: ['api'] as const,
   health: () => [...apiKeys.all, 'health'] as const,
+  batch: (batchId: string) => [...apiKeys.all, 'batch', batchId] as const,
 };
 
 // Hook to predict UI elements
@@ -20,6 +21,29 @@ export function usePredictUIElements() {
   });
 }
 
+// Hook to re-predict UI elements in a selected region
+export function usePredictRegion() {
+  return useMutation<
+    PredictionResponse,
+    Error,
+    { imageFile: File; region: PredictionRegion }
+  >({
+    mutationFn: ({ imageFile, region }) =>
+      apiClient.predictRegion(imageFile, region),
+  });
+}
+
+// Hook to poll the progress of a batch until all its jobs finished
+export function useBatchStatus(batchId: string | null, refetchInterval = 2000) {
+  return useQuery<BatchStatusResponse>({
+    queryKey: apiKeys.batch(batchId ?? ''),
+    queryFn: () => apiClient.getBatchStatus(batchId!),
+    enabled: !!batchId,
+    refetchInterval: (query) =>
+      query.state.data?.completed_at ? false : refetchInterval,
+  });
+}
+
 // Hook for health check
 export function useHealthCheck() {
   return useQuery({
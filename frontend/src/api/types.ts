@@ -10,6 +10,16 @@ export interface PredictionResponse {
     tag: AnnotationTag;
   }>;
   processing_time: number;
+  // Pixel size read from the image header, for converting the normalized coordinates
+  image_dimensions?: { width: number; height: number } | null;
+}
+
+// Region of the image in normalized 0-1000 coordinates, like the annotations
+export interface PredictionRegion {
+  x: number;
+  y: number;
+  width: number;
+  height: number;
 }
 
 export interface HealthResponse {
@@ -24,7 +34,63 @@ export interface JobResponse {
   created_at: string;
 }
 
-export type JobStatus = 'pending' | 'processing' | 'completed' | 'failed';
+export type JobStatus = 'awaiting_upload' | 'pending' | 'processing' | 'completed' | 'failed';
+
+// Batch upload: a job per file, or why the file was rejected
+export interface BatchUploadResponse {
+  batch_id?: string | null;
+  jobs: Array<{
+    filename: string;
+    task_id?: string | null;
+    error?: string | null;
+  }>;
+  message: string;
+  created_at: string;
+}
+
+// Presigned S3 POST: send the fields, then the file as the last field, to the URL
+export interface PresignedUpload {
+  task_id: string;
+  url: string;
+  fields: Record<string, string>;
+  expires_at: string;
+}
+
+export interface PresignResponse {
+  batch_id: string;
+  uploads: PresignedUpload[];
+}
+
+// Progress of a batch in one read, whatever its size
+export interface BatchStatusResponse {
+  batch_id: string;
+  total: number;
+  pending: number;
+  processing: number;
+  completed: number;
+  failed: number;
+  progress: number;
+  eta_seconds?: number | null;
+  created_at: string;
+  completed_at?: string | null;
+  // Base64 of status_bits per job in upload order, each value indexing status_codes
+  status_bitmap: string;
+  status_bits: number;
+  status_codes: JobStatus[];
+}
+
+// Status of every job of a batch, in upload order, decoded from its bitmap
+export function decodeBatchStatuses(batch: BatchStatusResponse): JobStatus[] {
+  const bytes = Uint8Array.from(atob(batch.status_bitmap), (c) => c.charCodeAt(0));
+  const mask = (1 << batch.status_bits) - 1;
+  const statuses: JobStatus[] = [];
+  for (let index = 0; index < batch.total; index++) {
+    const bit = index * batch.status_bits;
+    const shift = 8 - batch.status_bits - (bit % 8);
+    statuses.push(batch.status_codes[(bytes[bit >> 3] >> shift) & mask]);
+  }
+  return statuses;
+}
 
 export interface JobStatusResponse {
   task_id: string;
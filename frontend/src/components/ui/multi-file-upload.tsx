@@ -1,8 +1,10 @@
 import { apiClient } from "@/api/client";
-import type { JobResultResponse, JobStatus } from "@/api/types";
+import type { JobResultResponse, JobStatus, PresignedUpload } from "@/api/types";
 import { Alert, AlertDescription } from "@/components/ui/alert";
 import { Button } from "@/components/ui/button";
 import { Progress } from "@/components/ui/progress";
+import { useWebSocket } from "@/hooks/use-web-socket";
+import { websocketService } from "@/services/websocket";
 import { AlertCircle, FileImage, Upload, X } from "lucide-react";
 import React, { useCallback, useEffect, useRef, useState } from "react";
 
@@ -104,6 +106,88 @@ export const MultiFileUpload: React.FC<MultiFileUploadProps> = ({
     }
   }, [files, isProcessing, checkAllJobsComplete]);
 
+  // Apply a job status from the WebSocket or from polling, once per finished job
+  const applyJobStatus = useCallback(
+    async (jobId: string, status: JobStatus, error?: string | null, progress?: string | null) => {
+      if (processedJobsRef.current.has(jobId)) {
+        return;
+      }
+
+      // Always update the UI with the current status first
+      setFiles((prev) =>
+        prev.map((file) => {
+          if (file.jobId === jobId) {
+            if (status === "processing" && file.status !== "processing") {
+              return {
+                ...file,
+                status: "processing" as const,
+                progress: progress || "Processing...",
+              };
+            }
+          }
+          return file;
+        })
+      );
+
+      if (status === "completed" || status === "failed") {
+        // Mark as processed immediately to prevent duplicate updates
+        processedJobsRef.current.add(jobId);
+        pendingJobsRef.current.delete(jobId);
+
+        if (status === "completed") {
+          // Fetch full results
+          const results = await apiClient.getJobResults(jobId);
+
+          // Update files state
+          setFiles((prev) => {
+            const newFiles = prev.map((file) => {
+              if (file.jobId === jobId && file.status !== "completed") {
+                return {
+                  ...file,
+                  status: "completed" as const,
+                  result: results,
+                };
+              }
+              return file;
+            });
+            return newFiles;
+          });
+        } else {
+          setFiles((prev) =>
+            prev.map((file) => {
+              if (file.jobId === jobId && file.status !== "failed") {
+                return {
+                  ...file,
+                  status: "failed" as const,
+                  error: error || "Processing failed",
+                };
+              }
+              return file;
+            })
+          );
+        }
+      }
+    },
+    []
+  );
+
+  // Status changes pushed by the server, polling only covers the time the socket is down
+  const handleJobUpdate = useCallback(
+    (jobId: string, data: any) => {
+      if (!pendingJobsRef.current.has(jobId)) {
+        return;
+      }
+      applyJobStatus(jobId, data.status, data.error).catch((error) => {
+        console.error(`Error applying update for job ${jobId}:`, error);
+      });
+    },
+    [applyJobStatus]
+  );
+
+  const { subscribeToJobs, unsubscribeFromJobs } = useWebSocket({
+    onJobUpdate: handleJobUpdate,
+  });
+
    // Function to check status of pending jobs
    const checkPendingJobsStatus = async () => {
     const pendingJobs = Array.from(pendingJobsRef.current);
@@ -128,60 +212,7 @@ export const MultiFileUpload: React.FC<MultiFileUploadProps> = ({
         const status = await apiClient.checkJobStatus(jobId);
         console.log(`Status for job ${jobId}:`, status);
         
-        // Always update the UI with the current status first
-        setFiles((prev) =>
-          prev.map((file) => {
-            if (file.jobId === jobId) {
-              if (status.status === "processing" && file.status !== "processing") {
-                return {
-                  ...file,
-                  status: "processing" as const,
-                  progress: status.progress || "Processing...",
-                };
-              }
-            }
-            return file;
-          })
-        );
-
-        if (status.status === "completed" || status.status === "failed") {
-          // Mark as processed immediately to prevent duplicate updates
-          processedJobsRef.current.add(jobId);
-          pendingJobsRef.current.delete(jobId);
-
-          if (status.status === "completed") {
-            // Fetch full results
-            const results = await apiClient.getJobResults(jobId);
-
-            // Update files state
-            setFiles((prev) => {
-              const newFiles = prev.map((file) => {
-                if (file.jobId === jobId && file.status !== "completed") {
-                  return {
-                    ...file,
-                    status: "completed" as const,
-                    result: results,
-                  };
-                }
-                return file;
-              });
-              return newFiles;
-            });
-          } else {
-            setFiles((prev) =>
-              prev.map((file) => {
-                if (file.jobId === jobId && file.status !== "failed") {
-                  return {
-                    ...file,
-                    status: "failed" as const,
-                    error: status.error || "Processing failed",
-                  };
-                }
-                return file;
-              })
-            );
-          }
-        }
+        await applyJobStatus(jobId, status.status, status.error, status.progress);
       } catch (error) {
         console.error(`Error checking job ${jobId}:`, error);
         // Mark as failed if we can't check status after multiple attempts
@@ -250,12 +281,32 @@ export const MultiFileUpload: React.FC<MultiFileUploadProps> = ({
     processedJobsRef.current.clear();
     pendingJobsRef.current.clear();
 
+    // Get direct-to-S3 upload URLs for all files in one request, so image bytes skip the API
+    let presigned: PresignedUpload[];
+    try {
+      presigned = (
+        await apiClient.presignUploads(files.map((f) => f.file))
+      ).uploads;
+    } catch (error) {
+      console.error("Failed to create upload URLs:", error);
+      setFiles((prev) =>
+        prev.map((f) => ({
+          ...f,
+          status: "failed" as const,
+          error: error instanceof Error ? error.message : "Upload failed",
+        }))
+      );
+      setIsProcessing(false);
+      return;
+    }
+
     // Upload all files
     const uploadPromises = files.map(async (fileStatus, index) => {
       try {
         console.log(`Uploading file ${index}: ${fileStatus.file.name}`);
-        const response = await apiClient.uploadImageForProcessing(
-          fileStatus.file
+        const response = await apiClient.uploadToPresignedUrl(
+          fileStatus.file,
+          presigned[index]
         );
         console.log(
           `Upload successful for file ${index}, got task_id: ${response.task_id}`
@@ -302,10 +353,11 @@ export const MultiFileUpload: React.FC<MultiFileUploadProps> = ({
       const jobIds = successfulUploads
         .map((r) => r.jobId)
         .filter((id): id is string => !!id);
-      console.log("Starting to poll for job updates:", jobIds);
+      console.log("Subscribing to job updates:", jobIds);
 
       // Track pending jobs
       jobIds.forEach((id) => pendingJobsRef.current.add(id));
+      subscribeToJobs(jobIds);
       
       // Set processing state to true to enable polling
       setIsProcessing(true);
@@ -338,7 +390,7 @@ export const MultiFileUpload: React.FC<MultiFileUploadProps> = ({
       
       console.log(`Polling check - isProcessing: ${currentIsProcessing}, pending jobs: ${currentPendingJobs}`);
       
-      if (currentPendingJobs > 0 && currentIsProcessing) {
+      if (currentPendingJobs > 0 && currentIsProcessing && !websocketService.isConnected) {
         console.log("Executing job status check...");
         await checkPendingJobsStatus();
       } else if (currentPendingJobs === 0) {
@@ -362,8 +414,9 @@ export const MultiFileUpload: React.FC<MultiFileUploadProps> = ({
     return () => {
       // Stop polling
       stopPolling();
+      unsubscribeFromJobs(Array.from(pendingJobsRef.current));
     };
-  }, []);
+  }, [unsubscribeFromJobs]);
 
   return (
     <div className={`space-y-4 ${className || ""}`}>
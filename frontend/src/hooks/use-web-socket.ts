@@ -49,9 +49,19 @@ export const useWebSocket = (options: UseWebSocketOptions = {}) => {
     websocketService.unsubscribeFromJobs(jobIds);
   }, []);
 
+  const subscribeToBatches = useCallback((batchIds: string[]) => {
+    websocketService.subscribeToBatches(batchIds);
+  }, []);
+
+  const unsubscribeFromBatches = useCallback((batchIds: string[]) => {
+    websocketService.unsubscribeFromBatches(batchIds);
+  }, []);
+
   return {
     isConnected,
     subscribeToJobs,
     unsubscribeFromJobs,
+    subscribeToBatches,
+    unsubscribeFromBatches,
   };
 };
\ No newline at end of file
@@ -9,6 +9,9 @@ class WebSocketService {
   private ws: WebSocket | null = null;
   private reconnectTimeout: NodeJS.Timeout | null = null;
   private subscribedJobs: Set<string> = new Set();
+  private subscribedBatches: Set<string> = new Set();
+  // Last event seen, so a reconnect only receives what was missed
+  private lastEventId: string | null = null;
   private messageHandlers: Set<MessageHandler> = new Set();
   private connectHandlers: Set<ConnectionHandler> = new Set();
   private disconnectHandlers: Set<ConnectionHandler> = new Set();
@@ -32,13 +35,16 @@ class WebSocketService {
       console.log('WebSocket connected');
       this.isConnecting = false;
       
-      // Re-subscribe to any jobs we were tracking
-      if (this.subscribedJobs.size > 0) {
+      // Re-subscribe to any jobs and batches we were tracking
+      if (this.subscribedJobs.size > 0 || this.subscribedBatches.size > 0) {
         const jobIds = Array.from(this.subscribedJobs);
-        console.log('Re-subscribing to jobs:', jobIds);
+        const batchIds = Array.from(this.subscribedBatches);
+        console.log('Re-subscribing to jobs:', jobIds, 'batches:', batchIds);
         this.ws!.send(JSON.stringify({
           type: 'subscribe',
-          job_ids: jobIds
+          job_ids: jobIds,
+          batch_ids: batchIds,
+          last_event_id: this.lastEventId
         }));
       }
       
@@ -50,6 +56,11 @@ class WebSocketService {
       try {
         const message = JSON.parse(event.data);
         console.log('WebSocket message:', message);
+
+        // Updates from a snapshot and pings during a catch-up carry no id
+        if (message.event_id) {
+          this.lastEventId = message.event_id;
+        }
         
         if (message.type === 'job_update' && message.job_id && message.data) {
           // Notify all registered handlers
@@ -113,6 +124,29 @@ class WebSocketService {
     }
   }
 
+  subscribeToBatches(batchIds: string[]) {
+    batchIds.forEach(id => this.subscribedBatches.add(id));
+
+    if (this.ws?.readyState === WebSocket.OPEN) {
+      console.log('Subscribing to batches:', batchIds);
+      this.ws.send(JSON.stringify({
+        type: 'subscribe',
+        batch_ids: batchIds
+      }));
+    }
+  }
+
+  unsubscribeFromBatches(batchIds: string[]) {
+    batchIds.forEach(id => this.subscribedBatches.delete(id));
+
+    if (this.ws?.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({
+        type: 'unsubscribe',
+        batch_ids: batchIds
+      }));
+    }
+  }
+
   unsubscribeFromJobs(jobIds: string[]) {
     jobIds.forEach(id => this.subscribedJobs.delete(id));
     